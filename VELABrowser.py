@@ -169,6 +169,10 @@ PROFILE_PATH         = STATE_DIR / "profile"
 INCOGNITO_CACHE_PATH = CACHE_DIR / "incognito"
 INCOGNITO_STATE_PATH = STATE_DIR / "incognito_storage"
 
+# 新しいタブページ用のファビコンキャッシュ（ホストごとの PNG）
+FAVICON_CACHE_DIR = CACHE_DIR / "favicons"
+FAVICON_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
 # =====================================================================
 # ロガー設定
 # =====================================================================
@@ -501,16 +505,16 @@ STYLES = {
             background-color: #4a90d9;
         }
 
-        QTableWidget, QTreeWidget {
+        QTableWidget, QTreeView {
             border: 1px solid #dcdfe3;
             alternate-background-color: #f7f9fc;
             gridline-color: #e2e5ea;
         }
-        QTableWidget::item:selected, QTreeWidget::item:selected {
+        QTableWidget::item:selected, QTreeView::item:selected {
             background-color: #4a90d9;
             color: #ffffff;
         }
-        QTableWidget::item:hover, QTreeWidget::item:hover {
+        QTableWidget::item:hover, QTreeView::item:hover {
             background-color: #eaf2fb;
         }
 
@@ -907,6 +911,9 @@ def main():
     # sys.argv への追加は QApplication(sys.argv) より前に行う必要がある
     from browser import apply_chromium_flags_from_settings
     apply_chromium_flags_from_settings()
+    # 内部スキーム（vela://）の登録も QApplication 生成前に行う必要がある
+    from browser import register_internal_scheme
+    register_internal_scheme()
 
     app = QApplication(sys.argv)
 
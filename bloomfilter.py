@@ -0,0 +1,64 @@
+"""
+VELA Browser - Bloom フィルタ
+大量の URL について「含まれていないこと」を定数時間・小さなメモリで判定する
+
+誤判定は「含まれている」側にだけ起こる（偽陽性）。陽性のときは呼び出し側で
+DB などの正確な情報源で確かめる。要素の削除はできない。
+1 件あたりのビット数は -ln(誤判定率) / ln(2)^2（0.1% で約 14.4 ビット）。
+"""
+
+import hashlib
+import math
+
+
+class BloomFilter:
+    """文字列の Bloom フィルタ（blake2b の 128 ビットを 2 つに分けた二重ハッシュ）"""
+
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(int(capacity), 1)
+        self.capacity = capacity
+        self.num_bits = max(64, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        num_bits = self.num_bits
+        return [(h1 + i * h2) % num_bits for i in range(self.num_hashes)]
+
+    def add(self, item):
+        bits = self._bits
+        for pos in self._positions(item):
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def update(self, items):
+        """まとめて追加する（起動時の一括構築用。add() の呼び出しを省いて速くする）"""
+        bits = self._bits
+        num_bits = self.num_bits
+        hashes = range(self.num_hashes)
+        blake2b = hashlib.blake2b
+        added = 0
+        for item in items:
+            digest = blake2b(item.encode("utf-8"), digest_size=16).digest()
+            h1 = int.from_bytes(digest[:8], "little")
+            h2 = int.from_bytes(digest[8:], "little") | 1
+            for i in hashes:
+                pos = (h1 + i * h2) % num_bits
+                bits[pos >> 3] |= 1 << (pos & 7)
+            added += 1
+        self.count += added
+
+    def __contains__(self, item):
+        bits = self._bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def is_full(self):
+        """想定件数を超えた（誤判定率が設計値より悪くなっている）"""
+        return self.count > self.capacity
+
+    def memory_bytes(self):
+        return len(self._bits)
@@ -0,0 +1,525 @@
+"""
+VELA Browser - ブックマークの読み込み・書き出し形式
+Netscape Bookmark File Format（Chrome / Firefox の HTML エクスポート）の逐次パーサーと、
+HTML / Chromium の Bookmarks（JSON）形式への逐次書き出し、
+Chromium の Bookmarks と Firefox の places.sqlite からの直接の読み込み
+
+ファイルは一定サイズずつ読んで HTMLParser に渡し、完成したレコードから順に返す。
+メモリに載るのは読み込み中のチャンクと未処理のレコードだけなので、
+100 MB 級のエクスポートでも使用量は一定に収まる。
+書き出しも BookmarkNode の列を受け取って文字列を順に生成し、一時ファイルへ書いてから
+置き換える（write_atomic）。途中で失敗しても書きかけのファイルは残らない。
+"""
+
+import codecs
+import hashlib
+import json
+import os
+import sqlite3
+import stat
+import tempfile
+from collections import namedtuple
+from html import escape
+from html.parser import HTMLParser
+from json.encoder import encode_basestring
+from pathlib import Path
+
+# folders はルートからのフォルダ名の並び（ルート直下は空）
+# add_date は UNIX 時刻（秒）、icon は data: URI（どちらも無ければ None）
+BookmarkRecord = namedtuple("BookmarkRecord", "title url folders add_date icon")
+
+# 書き出し用のツリーのたどり順（深さ優先）。kind は "folder"（フォルダの開始）、
+# "end"（直前に開始したフォルダの終了）、"bookmark" のいずれか。
+# add_date は UNIX 時刻（秒）、icon は data: URI（どちらも無ければ None）
+BookmarkNode = namedtuple("BookmarkNode", "kind title url add_date icon")
+
+READ_CHUNK_BYTES = 1024 * 1024
+WRITE_BUFFER_BYTES = 256 * 1024
+
+# 入れ子のフォルダを 1 つの名前で表すときの区切り（旧版の folder 列・フォルダの選択欄）
+FOLDER_PATH_SEPARATOR = " / "
+
+
+def folder_path_name(folders):
+    """フォルダの並びを 1 つの表示名にする（ルート直下は 'root'）"""
+    return FOLDER_PATH_SEPARATOR.join(folders) if folders else 'root'
+
+
+def split_folder_path(name):
+    """folder_path_name() の逆変換（'root' と空はルート）"""
+    if not name or name == 'root':
+        return ()
+    return tuple(part for part in name.split(FOLDER_PATH_SEPARATOR) if part)
+
+
+def _parse_timestamp(value):
+    """ADD_DATE を秒にする（ミリ秒・マイクロ秒で書く実装もあるため桁で判定する）"""
+    try:
+        stamp = int(value)
+    except (TypeError, ValueError):
+        return None
+    if stamp <= 0:
+        return None
+    while stamp > 100_000_000_000:
+        stamp //= 1000
+    return stamp
+
+
+class NetscapeBookmarkParser(HTMLParser):
+    """
+    Netscape 形式のブックマーク HTML を解析する。
+    <H3> の直後の <DL> をそのフォルダの中身としてフォルダのスタックを積み、
+    <A> ごとに BookmarkRecord を records に追加する。
+    1 行に複数のタグがある、閉じタグが省略されているといった崩れた出力にも対応する。
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.records = []
+        # <DL> ごとに 1 要素。フォルダの <DL> はフォルダ名、それ以外は None
+        self._stack = []
+        self._folders = ()
+        self._pending_folder = None  # 直前の </H3> で閉じたフォルダ名
+        self._text = None            # <H3> / <A> の中身を集めている間だけリスト
+        self._link = None            # 解析中の <A> の属性
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            self._finish_link()
+            attrs = dict(attrs)
+            self._link = attrs
+            self._text = []
+        elif tag == "h3":
+            self._finish_link()
+            self._text = []
+            self._pending_folder = None
+        elif tag == "dl":
+            self._finish_link()
+            self._stack.append(self._pending_folder)
+            self._pending_folder = None
+            self._update_folders()
+        elif tag in ("dt", "hr"):
+            self._finish_link()
+            self._pending_folder = None
+
+    def handle_endtag(self, tag):
+        if tag == "a":
+            self._finish_link()
+        elif tag == "h3" and self._text is not None and self._link is None:
+            self._pending_folder = "".join(self._text).strip() or "無題のフォルダ"
+            self._text = None
+        elif tag == "dl":
+            self._finish_link()
+            if self._stack:
+                self._stack.pop()
+                self._update_folders()
+
+    def handle_data(self, data):
+        if self._text is not None:
+            self._text.append(data)
+
+    def _update_folders(self):
+        self._folders = tuple(name for name in self._stack if name is not None)
+
+    def _finish_link(self):
+        if self._link is None:
+            return
+        attrs, text = self._link, self._text
+        self._link = None
+        self._text = None
+        url = (attrs.get("href") or "").strip()
+        # ブックマークレットと Firefox の place: クエリは取り込まない
+        if not url or url.lower().startswith(("javascript:", "place:")):
+            return
+        icon = attrs.get("icon") or None
+        if icon and not icon.startswith("data:"):
+            icon = None
+        self.records.append(BookmarkRecord(
+            title="".join(text or ()).strip() or url,
+            url=url,
+            folders=self._folders,
+            add_date=_parse_timestamp(attrs.get("add_date")),
+            icon=icon,
+        ))
+
+    def close(self):
+        super().close()
+        self._finish_link()
+
+
+class NetscapeBookmarkReader:
+    """
+    ファイルを READ_CHUNK_BYTES ずつ読んで BookmarkRecord を順に返す反復子。
+    bytes_read / total_bytes で読み込みの進み具合がわかる。
+    """
+
+    def __init__(self, filepath, chunk_bytes=READ_CHUNK_BYTES):
+        self.filepath = filepath
+        self.chunk_bytes = chunk_bytes
+        self.total_bytes = os.path.getsize(filepath)
+        self.bytes_read = 0
+
+    def __iter__(self):
+        parser = NetscapeBookmarkParser()
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        with open(self.filepath, "rb") as f:
+            # UTF-8 の BOM があれば読み飛ばす
+            head = f.read(3)
+            if head != codecs.BOM_UTF8:
+                f.seek(0)
+            while True:
+                chunk = f.read(self.chunk_bytes)
+                self.bytes_read = f.tell()
+                if not chunk:
+                    break
+                parser.feed(decoder.decode(chunk))
+                yield from self._drain(parser)
+        parser.feed(decoder.decode(b"", final=True))
+        parser.close()
+        yield from self._drain(parser)
+
+    @staticmethod
+    def _drain(parser):
+        records, parser.records = parser.records, []
+        return records
+
+
+# =====================================================================
+# 書き出し
+# =====================================================================
+
+def _target_mode(filepath):
+    """書き出したファイルのパーミッション（既存のファイルと同じ。無ければ umask に従う 0666）"""
+    try:
+        return stat.S_IMODE(os.stat(filepath).st_mode)
+    except OSError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def write_atomic(filepath, chunks, buffer_bytes=WRITE_BUFFER_BYTES):
+    """
+    文字列の反復を同じフォルダの一時ファイルに書き、完了してから filepath に置き換える。
+    途中で例外が起きたら一時ファイルを消して例外を送出する（既存のファイルはそのまま）。
+    mkstemp の一時ファイルは 0600 で作られるため、置き換える前に _target_mode() に合わせる。
+    """
+    directory = os.path.dirname(os.path.abspath(filepath))
+    mode = _target_mode(filepath)
+    fd, temp_path = tempfile.mkstemp(prefix=".bookmarks-", suffix=".tmp", dir=directory)
+    try:
+        with open(fd, "w", encoding="utf-8", newline="\n", buffering=buffer_bytes) as f:
+            for chunk in chunks:
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, filepath)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def netscape_html_chunks(nodes, title="Bookmarks"):
+    """BookmarkNode の列を Netscape Bookmark File Format（入れ子の <DL>）の行として返す"""
+    yield ("<!DOCTYPE NETSCAPE-Bookmark-file-1>\n"
+           "<!-- This is an automatically generated file.\n"
+           "     It will be read and overwritten.\n"
+           "     DO NOT EDIT! -->\n"
+           '<META HTTP-EQUIV="Content-Type" CONTENT="text/html; charset=UTF-8">\n'
+           f"<TITLE>{escape(title)}</TITLE>\n"
+           "<H1>Bookmarks</H1>\n"
+           "<DL><p>\n")
+    depth = 1
+    for node in nodes:
+        indent = "    " * depth
+        if node.kind == "folder":
+            add_date = f' ADD_DATE="{node.add_date}"' if node.add_date else ""
+            yield f"{indent}<DT><H3{add_date}>{escape(node.title)}</H3>\n{indent}<DL><p>\n"
+            depth += 1
+        elif node.kind == "end":
+            depth -= 1
+            yield f"{indent[:-4]}</DL><p>\n"
+        else:
+            attrs = f'HREF="{escape(node.url)}"'
+            if node.add_date:
+                attrs += f' ADD_DATE="{node.add_date}"'
+            if node.icon:
+                attrs += f' ICON="{escape(node.icon)}"'
+            yield f"{indent}<DT><A {attrs}>{escape(node.title)}</A>\n"
+    yield "</DL><p>\n"
+
+
+# Chromium の固定ノード（id と GUID は Chromium 自身が使う値）
+_CHROMIUM_ROOTS = (
+    ("bookmark_bar", "1", "0bc5d13f-2cba-5d74-951f-3f233fe6c908", "Bookmarks bar"),
+    ("other", "2", "82b081ec-3dd3-529c-8475-ab6c344590dd", "Other bookmarks"),
+    ("synced", "3", "4cf2e351-0e85-532b-bb37-df045d8f8d0f", "Mobile bookmarks"),
+)
+# 1601-01-01 から 1970-01-01 までの秒数（Chromium の時刻はこの基点からのマイクロ秒）
+_CHROMIUM_EPOCH_OFFSET = 11644473600
+
+
+def _chromium_time(unix_seconds):
+    return str((unix_seconds + _CHROMIUM_EPOCH_OFFSET) * 1_000_000) if unix_seconds else "0"
+
+
+def _new_guid():
+    """ランダムな GUID（uuid.uuid4() と同じ形式。件数が多いので直接組み立てる）"""
+    raw = bytearray(os.urandom(16))
+    raw[6] = (raw[6] & 0x0F) | 0x40
+    raw[8] = (raw[8] & 0x3F) | 0x80
+    h = raw.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+
+def chromium_json_chunks(nodes):
+    """
+    BookmarkNode の列を Chromium のプロファイルにある Bookmarks ファイルの形式で返す。
+    ツリーはすべて「ブックマーク バー」の下に置く。checksum は Chromium と同じ
+    MD5（id・タイトル（UTF-16LE）・種類・URL の順）を書きながら計算し、最後に書く
+    （JSON のキーの順序は読み込みに影響しない）。
+    """
+    checksum = hashlib.md5()
+
+    def update(node_id, title, kind, url=None):
+        checksum.update(node_id.encode("ascii"))
+        checksum.update(title.encode("utf-16-le"))
+        checksum.update(kind.encode("ascii"))
+        if url is not None:
+            checksum.update(url.encode("utf-8"))
+
+    def folder_head(node_id, guid, title, add_date):
+        update(node_id, title, "folder")
+        return (f'{{"children": [', {
+            "date_added": _chromium_time(add_date), "date_last_used": "0",
+            "date_modified": "0", "guid": guid, "id": node_id,
+            "name": title, "type": "folder",
+        })
+
+    def folder_tail(fields):
+        # children の後ろに残りのキーを書く
+        return "], " + json.dumps(fields, ensure_ascii=False)[1:]
+
+    yield '{\n   "roots": {\n'
+    next_id = len(_CHROMIUM_ROOTS) + 1
+    for root_index, (key, root_id, root_guid, root_title) in enumerate(_CHROMIUM_ROOTS):
+        head, root_fields = folder_head(root_id, root_guid, root_title, None)
+        yield f'      "{key}": {head}'
+        if root_index == 0:
+            # 各フォルダの (フィールド, 先頭の子か) のスタック
+            stack = [[root_fields, True]]
+            for node in nodes:
+                if node.kind == "end":
+                    fields, _first = stack.pop()
+                    yield folder_tail(fields)
+                    continue
+                separator = "" if stack[-1][1] else ", "
+                stack[-1][1] = False
+                node_id = str(next_id)
+                next_id += 1
+                if node.kind == "folder":
+                    head, fields = folder_head(node_id, _new_guid(), node.title, node.add_date)
+                    stack.append([fields, True])
+                    yield separator + head
+                else:
+                    update(node_id, node.title, "url", node.url)
+                    yield (f'{separator}{{"date_added": "{_chromium_time(node.add_date)}", '
+                           f'"date_last_used": "0", "guid": "{_new_guid()}", "id": "{node_id}", '
+                           f'"name": {encode_basestring(node.title)}, "type": "url", '
+                           f'"url": {encode_basestring(node.url)}}}')
+        yield folder_tail(root_fields)
+        yield ",\n" if root_index < len(_CHROMIUM_ROOTS) - 1 else "\n"
+    yield f'   }},\n   "checksum": "{checksum.hexdigest()}",\n   "version": 1\n}}\n'
+
+
+# =====================================================================
+# 他のブラウザのプロファイルからの読み込み
+# =====================================================================
+
+SQLITE_HEADER = b"SQLite format 3\x00"
+
+
+def detect_bookmark_format(filepath):
+    """
+    ファイルの先頭から形式を判別する。
+    "firefox"（places.sqlite）、"chromium"（Bookmarks の JSON）、"html" のいずれかを返す。
+    """
+    with open(filepath, "rb") as f:
+        head = f.read(64)
+    if head.startswith(SQLITE_HEADER):
+        return "firefox"
+    if head.lstrip(codecs.BOM_UTF8).lstrip().startswith(b"{"):
+        return "chromium"
+    return "html"
+
+
+def _from_chromium_time(value):
+    """Chromium の時刻（1601 年基点のマイクロ秒、文字列）を UNIX 時刻（秒）にする"""
+    try:
+        stamp = int(value) // 1_000_000 - _CHROMIUM_EPOCH_OFFSET
+    except (TypeError, ValueError):
+        return None
+    return stamp if stamp > 0 else None
+
+
+class ChromiumBookmarkReader:
+    """
+    Chromium 系のプロファイルの Bookmarks（JSON）から BookmarkRecord を順に返す反復子。
+    ブックマーク バーの中身はルート直下に、その他・モバイルはそれぞれのフォルダに取り込む
+    （export_json() で書き出したファイルを読み込むと元のツリーに戻る）。
+    ファイルはブラウザ自身が 1 つの JSON として書くもので、標準ライブラリに逐次の
+    JSON パーサーが無いため全体を読んでから返す。done / total で進み具合がわかる。
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.done = 0
+        self.total = 0
+
+    def __iter__(self):
+        with open(self.filepath, encoding="utf-8-sig") as f:
+            roots = json.load(f).get("roots") or {}
+        starts = []
+        for key, _root_id, _guid, default_title in _CHROMIUM_ROOTS:
+            node = roots.get(key)
+            if not isinstance(node, dict):
+                continue
+            folders = () if key == "bookmark_bar" else (node.get("name") or default_title,)
+            starts.append((folders, node.get("children") or []))
+        self.total = sum(self._count_urls(children) for _folders, children in starts)
+        for folders, children in starts:
+            yield from self._walk(folders, children)
+
+    @staticmethod
+    def _count_urls(children):
+        count = 0
+        stack = [children]
+        while stack:
+            for node in stack.pop():
+                if node.get("type") == "folder":
+                    stack.append(node.get("children") or [])
+                elif node.get("type") == "url":
+                    count += 1
+        return count
+
+    def _walk(self, folders, children):
+        stack = [(folders, iter(children))]
+        while stack:
+            folders, nodes = stack[-1]
+            node = next(nodes, None)
+            if node is None:
+                stack.pop()
+                continue
+            kind = node.get("type")
+            if kind == "folder":
+                name = (node.get("name") or "").strip() or "無題のフォルダ"
+                stack.append((folders + (name,), iter(node.get("children") or [])))
+                continue
+            if kind != "url":
+                continue
+            self.done += 1
+            url = (node.get("url") or "").strip()
+            if not url or url.lower().startswith("javascript:"):
+                continue
+            yield BookmarkRecord(
+                title=(node.get("name") or "").strip() or url,
+                url=url,
+                folders=folders,
+                add_date=_from_chromium_time(node.get("date_added")),
+                icon=None,
+            )
+
+
+def open_firefox_places(filepath):
+    """
+    Firefox の places.sqlite を読み取り専用で開く。
+    immutable=1 でロックも -wal ファイルも見ないため、起動中の Firefox のプロファイルでも
+    待たずに開ける（まだチェックポイントされていない直近の変更は読まれない）。
+    """
+    uri = Path(filepath).resolve().as_uri() + "?mode=ro&immutable=1"
+    return sqlite3.connect(uri, uri=True)
+
+
+# Firefox の固定フォルダ（GUID）と取り込み先。ツールバーの中身はルート直下に置く。
+# タグ（tags________）はフォルダではないので取り込まない
+_FIREFOX_ROOTS = (
+    ("toolbar_____", ()),
+    ("menu________", ("Bookmarks Menu",)),
+    ("unfiled_____", ("Other Bookmarks",)),
+    ("mobile______", ("Mobile Bookmarks",)),
+)
+
+# moz_bookmarks.type
+_FIREFOX_TYPE_BOOKMARK = 1
+_FIREFOX_TYPE_FOLDER = 2
+
+
+class FirefoxBookmarkReader:
+    """
+    Firefox の places.sqlite（moz_bookmarks / moz_places）から BookmarkRecord を順に返す反復子。
+    フォルダごとに position 順で子を読み、深さ優先でたどる（全件をメモリに載せない）。
+    done / total で進み具合がわかる。
+    """
+
+    _CHILDREN_SQL = '''
+        SELECT b.id, b.type, b.title, p.url, b.dateAdded
+        FROM moz_bookmarks b LEFT JOIN moz_places p ON p.id = b.fk
+        WHERE b.parent = ? ORDER BY b.position
+    '''
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.done = 0
+        self.total = 0
+
+    def __iter__(self):
+        conn = open_firefox_places(self.filepath)
+        try:
+            guids = [guid for guid, _folders in _FIREFOX_ROOTS]
+            marks = ", ".join("?" * len(guids))
+            root_ids = dict(conn.execute(
+                f"SELECT guid, id FROM moz_bookmarks WHERE guid IN ({marks})", guids))
+            # タグ付けはタグ名のフォルダの下のブックマークとして記録されるため数えない
+            self.total = conn.execute('''
+                SELECT COUNT(*) FROM moz_bookmarks
+                WHERE type = ? AND parent NOT IN (
+                    SELECT id FROM moz_bookmarks WHERE parent = (
+                        SELECT id FROM moz_bookmarks WHERE guid = 'tags________'))
+            ''', (_FIREFOX_TYPE_BOOKMARK,)).fetchone()[0]
+            for guid, folders in _FIREFOX_ROOTS:
+                if guid in root_ids:
+                    yield from self._walk(conn, root_ids[guid], folders)
+        finally:
+            conn.close()
+
+    def _walk(self, conn, folder_id, folders):
+        stack = [(folders, conn.execute(self._CHILDREN_SQL, (folder_id,)))]
+        while stack:
+            folders, rows = stack[-1]
+            row = rows.fetchone()
+            if row is None:
+                stack.pop()
+                continue
+            item_id, kind, title, url, date_added = row
+            if kind == _FIREFOX_TYPE_FOLDER:
+                name = (title or "").strip() or "無題のフォルダ"
+                stack.append((folders + (name,), conn.execute(self._CHILDREN_SQL, (item_id,))))
+                continue
+            if kind != _FIREFOX_TYPE_BOOKMARK:
+                continue
+            self.done += 1
+            url = (url or "").strip()
+            # ブックマークレットと place: クエリ（スマートブックマーク）は取り込まない
+            if not url or url.lower().startswith(("javascript:", "place:")):
+                continue
+            yield BookmarkRecord(
+                title=(title or "").strip() or url,
+                url=url,
+                folders=folders,
+                add_date=date_added // 1_000_000 if date_added and date_added > 0 else None,
+                icon=None,
+            )
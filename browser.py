@@ -8,6 +8,7 @@ import sys
 import os
 from pathlib import Path
 from urllib.parse import quote_plus
+from html import escape
 
 # =====================================================================
 # Chromium フラグ設定（QApplication より前に設定する必要がある）
@@ -63,7 +64,25 @@ def apply_chromium_flags_from_settings():
         print("[INFO] Chromium flags: all disabled")
 
 
-from PySide6.QtCore import Qt, QUrl, QSettings, QTimer, QStringListModel
+# 内部スキーム（新しいタブページなど）
+INTERNAL_SCHEME = b"vela"
+NEW_TAB_URL = "vela://newtab"
+
+
+def register_internal_scheme():
+    """
+    vela:// スキームを登録する。
+    QApplication 生成前に VELABrowser.py の main() から呼ぶこと。
+    LocalScheme にして、通常の Web ページからは読み込めないようにする。
+    """
+    from PySide6.QtWebEngineCore import QWebEngineUrlScheme
+    scheme = QWebEngineUrlScheme(INTERNAL_SCHEME)
+    scheme.setSyntax(QWebEngineUrlScheme.Syntax.Host)
+    scheme.setFlags(QWebEngineUrlScheme.SecureScheme | QWebEngineUrlScheme.LocalScheme)
+    QWebEngineUrlScheme.registerScheme(scheme)
+
+
+from PySide6.QtCore import Qt, QUrl, QSettings, QTimer, QStringListModel, QBuffer, QIODevice
 from PySide6.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
     QLineEdit, QListWidget, QSplitter, QToolBar, QMessageBox,
@@ -71,15 +90,21 @@ from PySide6.QtWidgets import (
 )
 from PySide6.QtWebEngineWidgets import QWebEngineView
 from PySide6.QtWebEngineCore import (
-    QWebEngineProfile, QWebEngineSettings, QWebEngineUrlRequestInterceptor
+    QWebEngineProfile, QWebEngineSettings, QWebEngineUrlRequestInterceptor,
+    QWebEngineUrlSchemeHandler, QWebEngineUrlRequestJob
 )
 from PySide6.QtGui import QFont, QAction, QShortcut, QKeySequence
 import qtawesome as qta
 
 from constants import STYLES, BROWSER_FULL_NAME, BROWSER_VERSION_SEMANTIC, DOWNLOADS_DIR, USER_AGENT_PRESETS, \
-    PROFILE_PATH, INCOGNITO_CACHE_PATH, INCOGNITO_STATE_PATH, CACHE_DIR, CHECK_FOR_UPDATES
+    PROFILE_PATH, INCOGNITO_CACHE_PATH, INCOGNITO_STATE_PATH, CACHE_DIR, CHECK_FOR_UPDATES, \
+    FAVICON_CACHE_DIR
 from theme import STYLES as _theme_STYLES  # noqa: F811
-from managers import HistoryManager, BookmarkManager, DownloadManager, SessionManager, UpdateChecker
+from managers import (
+    HistoryManager, BookmarkManager, DownloadManager, SessionManager, UpdateChecker,
+    BOOKMARK_SUGGEST_BOOST, DOWNLOAD_MAX_ACTIVE
+)
+from urlcanon import DEFAULT_TRACKING_PARAMS, canonicalize_url, parse_tracking_params, set_tracking_params
 from dialogs import AddBookmarkDialog, MainDialog, FindDialog, SavePageDialog
 
 
@@ -110,6 +135,89 @@ class DntRequestInterceptor(QWebEngineUrlRequestInterceptor):
         info.setHttpHeader(b"DNT", b"1" if self._enabled else b"0")
 
 
+# =====================================================================
+# 内部ページ（vela://）
+# =====================================================================
+
+_NEW_TAB_TEMPLATE = """<!DOCTYPE html>
+<html lang="ja"><head><meta charset="utf-8"><title>新しいタブ</title>
+<style>
+:root { color-scheme: light dark; }
+body { font-family: sans-serif; margin: 0; display: flex; justify-content: center; }
+main { margin-top: 12vh; display: grid; grid-template-columns: repeat(auto-fill, 120px);
+       gap: 16px; width: min(90vw, 816px); justify-content: center; }
+.tile { display: flex; flex-direction: column; align-items: center; padding: 12px 6px;
+        border-radius: 8px; text-decoration: none; color: inherit; }
+.tile:hover { background: rgba(128, 128, 128, 0.15); }
+.tile img, .letter { width: 32px; height: 32px; margin-bottom: 8px; }
+.letter { display: flex; align-items: center; justify-content: center; border-radius: 50%;
+          background: rgba(128, 128, 128, 0.3); font-weight: bold; }
+.label, .host { max-width: 108px; overflow: hidden; text-overflow: ellipsis; white-space: nowrap;
+                font-size: 12px; }
+.host { opacity: 0.6; font-size: 10px; }
+.empty { grid-column: 1 / -1; text-align: center; opacity: 0.6; }
+</style></head>
+<body><main><!--TILES--></main></body></html>
+"""
+
+
+def favicon_cache_path(host):
+    """ホストのファビコンキャッシュのパス（ホスト名として不正なら None）"""
+    if not host or not re.fullmatch(r'[A-Za-z0-9.\-]+', host):
+        return None
+    return FAVICON_CACHE_DIR / f"{host.lower()}.png"
+
+
+class InternalSchemeHandler(QWebEngineUrlSchemeHandler):
+    """
+    vela:// の内部ページを返すハンドラー。
+      vela://newtab         : よく見るサイト（hosts 集計の上位）を並べた新しいタブページ
+      vela://favicon/<host> : キャッシュ済みのファビコン
+    どちらもローカルのデータだけで生成し、ネットワークには出ない。
+    """
+
+    TOP_SITES = 12
+
+    def __init__(self, history_manager, parent=None):
+        super().__init__(parent)
+        self.history_manager = history_manager
+
+    def requestStarted(self, job):
+        url = job.requestUrl()
+        if url.host() == "newtab":
+            self._reply(job, b"text/html", self.render_new_tab().encode("utf-8"))
+            return
+        if url.host() == "favicon":
+            path = favicon_cache_path(url.path().lstrip("/"))
+            if path is not None and path.exists():
+                self._reply(job, b"image/png", path.read_bytes())
+                return
+        job.fail(QWebEngineUrlRequestJob.UrlNotFound)
+
+    @staticmethod
+    def _reply(job, mime_type, data):
+        buffer = QBuffer(job)
+        buffer.setData(data)
+        buffer.open(QIODevice.ReadOnly)
+        job.reply(mime_type, buffer)
+
+    def render_new_tab(self):
+        tiles = []
+        for host, url, title in self.history_manager.top_sites(self.TOP_SITES):
+            path = favicon_cache_path(host)
+            if path is not None and path.exists():
+                icon = f'<img src="vela://favicon/{escape(host)}" alt="">'
+            else:
+                icon = f'<span class="letter">{escape(host[:1].upper())}</span>'
+            tiles.append(
+                f'<a class="tile" href="{escape(url)}" title="{escape(url)}">{icon}'
+                f'<span class="label">{escape(title or host)}</span>'
+                f'<span class="host">{escape(host)}</span></a>'
+            )
+        body = "".join(tiles) or '<p class="empty">よく見るサイトがここに表示されます</p>'
+        return _NEW_TAB_TEMPLATE.replace("<!--TILES-->", body)
+
+
 
 
 
@@ -269,6 +377,8 @@ class VerticalTabBrowser(QMainWindow):
         self.tabs = []
         self._closed_tab_stack = []  # 閉じたタブのURLスタック（複数対応）
         self._zoom_levels = {}  # タブごとのズーム倍率 {web_view: float}
+        self._typed_views = set()  # URLバー入力で遷移中の WebView（frecency の入力ボーナス用）
+        self._last_visit_urls = {}  # タブごとに直前に履歴へ記録した URL {web_view: url}（訪問の参照元）
         
         # 永続化プロファイルを作成（Cookie、LocalStorageなどが保存される）
         self.profile = QWebEngineProfile("VELAProfile")
@@ -289,8 +399,16 @@ class VerticalTabBrowser(QMainWindow):
         self.incognito_profile.setUrlRequestInterceptor(self._dnt_interceptor_incognito)
         
         self.history_manager = HistoryManager()
+        # 新しいタブページ（vela://newtab）は通常プロファイルでだけ提供する
+        self._scheme_handler = InternalSchemeHandler(self.history_manager, self)
+        self.profile.installUrlSchemeHandler(INTERNAL_SCHEME, self._scheme_handler)
         self.bookmark_manager = BookmarkManager()
+        # URL バーの補完候補にブックマークも含める
+        self.history_manager.attach_bookmarks(self.bookmark_manager.db_path, self.bookmark_manager.fts_enabled)
         self.download_manager = DownloadManager()
+        # 前回の起動時のダウンロードはプロファイルから取り直す（Cookie・認証・プロキシを引き継ぐ）
+        self._redownload_page = None
+        self.download_manager.set_redownloader(self._redownload)
         self.session_manager = SessionManager()
         self.settings = QSettings("VELABrowser", "Praxis")
         
@@ -299,6 +417,10 @@ class VerticalTabBrowser(QMainWindow):
         self.setup_shortcuts()
         self.check_for_updates()
         self.restore_session()
+        # URL バー補完用のインデックスは最初の描画を妨げないよう起動後に構築する
+        QTimer.singleShot(3000, self.history_manager.load_url_index)
+        # 前回までに中断したダウンロードを取り直す
+        QTimer.singleShot(5000, self.download_manager.resume_interrupted)
     
     def apply_settings(self):
         """設定を適用"""
@@ -346,6 +468,27 @@ class VerticalTabBrowser(QMainWindow):
         self._dnt_interceptor_incognito.set_enabled(self.do_not_track)
         print(f"[INFO] DNT header set to: {'1' if self.do_not_track else '0'}")
 
+        # 履歴・ブックマークへの書き込み前に URL から除去するトラッキングパラメータ
+        set_tracking_params(parse_tracking_params(
+            self.settings.value("tracking_params", ", ".join(DEFAULT_TRACKING_PARAMS))))
+
+        # URL バー補完でブックマークの候補に加える点数
+        self.history_manager.set_bookmark_boost(
+            self.settings.value("completer_bookmark_boost", BOOKMARK_SUGGEST_BOOST, type=int))
+
+        # 同時に転送するダウンロード数
+        self.download_manager.set_max_active(
+            self.settings.value("max_concurrent_downloads", DOWNLOAD_MAX_ACTIVE, type=int))
+        self.download_manager.set_verify_checksums(
+            self.settings.value("verify_download_checksums", True, type=bool))
+
+        # 履歴の保持ポリシー（0 は無制限）
+        self.history_manager.set_retention_policy(
+            max_age_days=self.settings.value("history_max_age_days", 0, type=int),
+            max_urls=self.settings.value("history_max_urls", 0, type=int),
+            max_size_mb=self.settings.value("history_max_size_mb", 0, type=int),
+        )
+
         # downloadRequested の重複接続を防ぐために一度切断してから接続
         # 初回起動時は未接続のため RuntimeWarning が出るが無害なので抑制する
         import warnings
@@ -363,8 +506,18 @@ class VerticalTabBrowser(QMainWindow):
         self.incognito_profile.downloadRequested.connect(self.on_download_requested)
         print("[INFO] Settings applied")
     
+    def _redownload(self, url, filename):
+        """DownloadManager が取り直すダウンロードを通常プロファイルで始める"""
+        if self._redownload_page is None:
+            self._redownload_page = QWebEnginePage(self.profile, self)
+        self._redownload_page.download(QUrl(url), filename)
+    
     def on_download_requested(self, download):
         """ダウンロード要求時の処理"""
+        # 取り直しを要求したものは元の行・保存先のまま受け持つ
+        if self.download_manager.adopt_redownload(download):
+            self.show_download_dialog()
+            return
         filename = download.downloadFileName()
         print(f"[INFO] Download requested: {filename}")
 
@@ -455,7 +608,13 @@ class VerticalTabBrowser(QMainWindow):
             homepage = self.settings.value("homepage", "https://www.google.com")
             self.add_new_tab(homepage)
         else:
-            self.add_new_tab("https://www.google.com")
+            self.add_new_tab(self.new_tab_url())
+    
+    def new_tab_url(self):
+        """新しいタブで開く URL（新しいタブページを無効にしている場合はホームページ）"""
+        if self.settings.value("new_tab_page", True, type=bool):
+            return NEW_TAB_URL
+        return self.settings.value("homepage", "https://www.google.com")
     
     def save_current_session(self):
         """現在のセッションを保存"""
@@ -497,7 +656,7 @@ class VerticalTabBrowser(QMainWindow):
         """キーボードショートカットを設定"""
         # Ctrl+T: 新しいタブ
         QShortcut(QKeySequence("Ctrl+T"), self).activated.connect(
-            lambda: self.add_new_tab(self.settings.value("homepage", "https://www.google.com")))
+            lambda: self.add_new_tab(self.new_tab_url()))
         # Ctrl+W: 現在のタブを閉じる
         QShortcut(QKeySequence("Ctrl+W"), self).activated.connect(self.close_current_tab)
         # Ctrl+Tab: 次のタブ（下）
@@ -654,7 +813,7 @@ class VerticalTabBrowser(QMainWindow):
         
         # 新しいタブ
         new_tab_action = QAction(qta.icon('fa5s.plus', color=STYLES['icon_color_accent']), "新しいタブ", self)
-        new_tab_action.triggered.connect(lambda: self.add_new_tab(self.settings.value("homepage", "https://www.google.com")))
+        new_tab_action.triggered.connect(lambda: self.add_new_tab(self.new_tab_url()))
         menu.addAction(new_tab_action)
         
         # シークレットタブ
@@ -736,6 +895,7 @@ class VerticalTabBrowser(QMainWindow):
             current_url=current_url, current_title=current_title
         )
         dialog.open_url.connect(lambda url: self.add_new_tab(url, activate=True))
+        dialog.finished.connect(lambda _result: self.update_bookmark_star())
         dialog.tab_widget.setCurrentIndex(3)  # ブックマークタブを選択
         dialog.exec()
     
@@ -751,6 +911,7 @@ class VerticalTabBrowser(QMainWindow):
             self.history_manager, self.bookmark_manager, self.download_manager, self,
             current_url=current_url, current_title=current_title)
         dialog.open_url.connect(lambda url: self.add_new_tab(url, activate=True))
+        dialog.finished.connect(lambda _result: self.update_bookmark_star())
         dialog.tab_widget.setCurrentIndex(2)  # 履歴タブを選択
         dialog.exec()
     
@@ -795,6 +956,7 @@ class VerticalTabBrowser(QMainWindow):
             self.history_manager, self.bookmark_manager, self.download_manager, self,
             current_url=current_url, current_title=current_title)
         dialog.open_url.connect(lambda url: self.add_new_tab(url, activate=True))
+        dialog.finished.connect(lambda _result: self.update_bookmark_star())
         dialog.show_settings_tab()
         dialog.exec()
         
@@ -818,6 +980,8 @@ class VerticalTabBrowser(QMainWindow):
             )
             if reply == QMessageBox.Yes:
                 self.save_current_session()
+                self.history_manager.close()
+                self.download_manager.close()
                 QApplication.quit()
             else:
                 self.apply_settings()
@@ -834,6 +998,7 @@ class VerticalTabBrowser(QMainWindow):
             self.history_manager, self.bookmark_manager, self.download_manager, self,
             current_url=current_url, current_title=current_title)
         dialog.open_url.connect(lambda url: self.add_new_tab(url, activate=True))
+        dialog.finished.connect(lambda _result: self.update_bookmark_star())
         dialog.show_about_tab()
         dialog.exec()
     
@@ -852,6 +1017,7 @@ class VerticalTabBrowser(QMainWindow):
             self.history_manager, self.bookmark_manager, self.download_manager, self,
             current_url=current_url, current_title=current_title)
         dialog.open_url.connect(lambda url: self.add_new_tab(url, activate=True))
+        dialog.finished.connect(lambda _result: self.update_bookmark_star())
         dialog.show_download_tab()
         dialog.exec()
     
@@ -876,11 +1042,18 @@ class VerticalTabBrowser(QMainWindow):
             if dialog.exec():
                 result = dialog.get_result()
                 if result:
-                    self.bookmark_manager.add_bookmark(
+                    added = self.bookmark_manager.add_bookmark(
                         result["title"], 
                         result["url"], 
-                        result["folder"]
+                        result["folder"],
+                        result["folder_id"]
                     )
+                    if not added:
+                        QMessageBox.information(
+                            self, "ブックマーク",
+                            "このページは既にこのフォルダのブックマークに登録されています。"
+                        )
+                    self.update_bookmark_star()
     
     def create_tab_list(self):
         """タブリスト作成"""
@@ -896,7 +1069,7 @@ class VerticalTabBrowser(QMainWindow):
         new_tab_btn.setToolTip("新規タブ")
         new_tab_btn.setMinimumHeight(36)
         new_tab_btn.setStyleSheet(STYLES['button_secondary'])
-        new_tab_btn.clicked.connect(lambda: self.add_new_tab(self.settings.value("homepage", "https://www.google.com")))
+        new_tab_btn.clicked.connect(lambda: self.add_new_tab(self.new_tab_url()))
         layout.addWidget(new_tab_btn)
         
         self.tab_list = QListWidget()
@@ -959,16 +1132,25 @@ class VerticalTabBrowser(QMainWindow):
         self._url_completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
         self.url_bar.setCompleter(self._url_completer)
         self.url_bar.textEdited.connect(self._update_url_completer)
+        self._last_url_bar_text = ""  # インライン補完の判定用（前回ユーザーが入力した文字列）
         # 「🔍〇〇を検索」が選択された瞬間に即ナビゲートする
         self._url_completer.activated.connect(self._on_completer_activated)
+        # 候補の DB 検索は検索ワーカーで行う（入力中も描画を止めない）
+        self._completer_generation = 0
+        self.history_manager.search_worker.results_ready.connect(self._on_history_search_results)
         toolbar.addWidget(self.url_bar)
         
-        bookmark_add_btn = QPushButton()
-        bookmark_add_btn.setIcon(qta.icon('fa5s.star', color=STYLES['icon_color_bookmark']))
-        bookmark_add_btn.setToolTip("ブックマーク")
-        bookmark_add_btn.setFixedSize(32, 32)
-        bookmark_add_btn.clicked.connect(self.show_bookmarks_dialog)
-        toolbar.addWidget(bookmark_add_btn)
+        # 表示中のページがブックマーク済みなら塗りつぶしの星にする（update_bookmark_star）
+        self._bookmark_star_icons = (
+            qta.icon('fa5.star', color=STYLES['icon_color_default']),
+            qta.icon('fa5s.star', color=STYLES['icon_color_bookmark']),
+        )
+        self.bookmark_star_btn = QPushButton()
+        self.bookmark_star_btn.setIcon(self._bookmark_star_icons[0])
+        self.bookmark_star_btn.setToolTip("ブックマーク")
+        self.bookmark_star_btn.setFixedSize(32, 32)
+        self.bookmark_star_btn.clicked.connect(self.show_bookmarks_dialog)
+        toolbar.addWidget(self.bookmark_star_btn)
         
         menu_btn = QPushButton()
         menu_btn.setIcon(qta.icon('fa5s.ellipsis-h', color=STYLES['icon_color_default']))
@@ -1074,6 +1256,8 @@ class VerticalTabBrowser(QMainWindow):
         web_view.loadFinished.connect(lambda: self.on_load_finished(web_view, incognito))
         web_view.loadStarted.connect(lambda: self.on_load_started(web_view))
         web_view.loadProgress.connect(lambda p: self.on_load_progress(web_view, p))
+        if not incognito:
+            web_view.iconChanged.connect(lambda icon: self._cache_favicon(web_view, icon))
 
         tab_item = TabItem("新しいタブ", web_view, incognito=incognito)
 
@@ -1094,6 +1278,16 @@ class VerticalTabBrowser(QMainWindow):
         if _return_view:
             return web_view
     
+    def _cache_favicon(self, web_view, icon):
+        """新しいタブページ用にファビコンをホスト単位でキャッシュする（既にあれば何もしない）"""
+        if icon.isNull():
+            return
+        path = favicon_cache_path(web_view.url().host())
+        if path is None or path.exists():
+            return
+        if not icon.pixmap(32, 32).save(str(path), "PNG"):
+            print(f"[WARN] Failed to cache favicon: {path.name}")
+    
     def handle_fullscreen_request(self, request):
         """全画面表示リクエスト処理"""
         if request.toggleOn():
@@ -1108,8 +1302,12 @@ class VerticalTabBrowser(QMainWindow):
         url = web_view.url().toString()
         title = web_view.title()
         # シークレットタブは履歴に記録しない
+        typed = web_view in self._typed_views
+        self._typed_views.discard(web_view)
         if not incognito:
-            self.history_manager.add_history(url, title)
+            referrer = self._last_visit_urls.get(web_view)
+            self._last_visit_urls[web_view] = url
+            self.history_manager.add_history(url, title, typed=typed, referrer=referrer)
         self._stop_progress_bar()
     
     def on_load_started(self, web_view):
@@ -1186,12 +1384,13 @@ class VerticalTabBrowser(QMainWindow):
         self.web_layout.addWidget(web_view)
         web_view.show()
 
-        self.url_bar.setText(web_view.url().toString())
+        self.url_bar.setText(self._display_url(web_view.url()))
         if not self.url_bar.hasFocus():
             self.url_bar.home(False)
         zoom = self._zoom_levels.get(web_view, 1.0)
         web_view.setZoomFactor(zoom)
         self.update_window_title(web_view.title())
+        self.update_bookmark_star()
 
         # ロード進捗バーをリセット
         self._stop_progress_bar()
@@ -1215,10 +1414,26 @@ class VerticalTabBrowser(QMainWindow):
         current_item = self.tab_list.currentItem()
         if current_item and isinstance(current_item, TabItem):
             if current_item.web_view == web_view:
-                self.url_bar.setText(url.toString())
+                self.url_bar.setText(self._display_url(url))
                 # フォーカスがURLバーにない場合は先頭を表示
                 if not self.url_bar.hasFocus():
                     self.url_bar.home(False)
+                self.update_bookmark_star()
+    
+    def update_bookmark_star(self):
+        """ツールバーの星を表示中のページのブックマーク状態に合わせる（DB は通常引かない）"""
+        current_item = self.tab_list.currentItem()
+        bookmarked = False
+        if current_item and isinstance(current_item, TabItem):
+            bookmarked = self.bookmark_manager.is_bookmarked(current_item.web_view.url().toString())
+        self.bookmark_star_btn.setIcon(self._bookmark_star_icons[bookmarked])
+        self.bookmark_star_btn.setToolTip("ブックマーク済み" if bookmarked else "ブックマーク")
+    
+    @staticmethod
+    def _display_url(url):
+        """URL バーに表示する文字列（新しいタブページではすぐ入力できるよう空にする）"""
+        text = url.toString()
+        return "" if text == NEW_TAB_URL else text
     
     def update_window_title(self, page_title):
         """ウィンドウタイトルを更新"""
@@ -1250,18 +1465,49 @@ class VerticalTabBrowser(QMainWindow):
         return False
 
     def _update_url_completer(self, text):
-        """URLバー入力中に履歴を検索してオートコンプリート候補を更新"""
+        """URLバー入力中に履歴・ブックマークを検索してオートコンプリート候補を更新（frecency 順）"""
+        appended = len(text) > len(self._last_url_bar_text) and text.startswith(self._last_url_bar_text)
+        self._last_url_bar_text = text
         if len(text) < 1:
+            self._completer_generation = 0
             self._completer_model.setStringList([])
             return
 
-        results = self.history_manager.search_history(text, limit=10)
-        # URL と タイトル 両方を候補に（重複排除）
+        # 前方一致はメモリ内インデックスで即時に求め、タイトル等の一致は
+        # 検索ワーカーの結果が届いたら補う（_on_history_search_results）
+        self._set_completer_candidates(text, [])
+        self._completer_generation = self.history_manager.request_suggestions(text, limit=10)
+
+        # 末尾に文字を追加したときだけホスト名をインライン補完する（削除中は補完しない）
+        if appended and self.url_bar.cursorPosition() == len(text):
+            completion = self.history_manager.autofill(text)
+            if completion and completion != text:
+                self.url_bar.setText(completion)
+                self.url_bar.setSelection(len(text), len(completion) - len(text))
+
+    def _on_history_search_results(self, kind, generation, results):
+        """検索ワーカーから補完候補が届いたとき（古い入力の結果は捨てる）"""
+        if kind != "suggest" or generation != self._completer_generation:
+            return
+        self._set_completer_candidates(self._last_url_bar_text, results)
+        if (self.url_bar.hasFocus() and self._completer_model.rowCount()
+                and not self._url_completer.popup().isVisible()):
+            self._url_completer.complete()
+
+    def _set_completer_candidates(self, text, results):
+        prefix_urls = self.history_manager.prefix_suggest(text, limit=10)
+        # URL と タイトル 両方を候補に（URL は正規形で重複排除）
         seen = set()
         candidates = []
+        for url in prefix_urls:
+            key = canonicalize_url(url)
+            if key not in seen:
+                seen.add(key)
+                candidates.append(url)
         for url, title, _, _ in results:
-            if url not in seen:
-                seen.add(url)
+            key = canonicalize_url(url)
+            if key not in seen:
+                seen.add(key)
                 candidates.append(url)
             if title and title not in seen:
                 seen.add(title)
@@ -1282,6 +1528,7 @@ class VerticalTabBrowser(QMainWindow):
             current_item = self.tab_list.currentItem()
             if current_item and isinstance(current_item, TabItem):
                 url = self.process_url_or_search(query)
+                self._typed_views.add(current_item.web_view)
                 current_item.web_view.setUrl(QUrl(url))
                 # QCompleter が activated の後に候補テキストを LineEdit へ
                 # 書き戻すため、次のイベントループで上書きして打ち消す
@@ -1293,6 +1540,7 @@ class VerticalTabBrowser(QMainWindow):
         if current_item and isinstance(current_item, TabItem):
             text = self.url_bar.text()
             url = self.process_url_or_search(text)
+            self._typed_views.add(current_item.web_view)
             current_item.web_view.setUrl(QUrl(url))
     
     def go_back(self):
@@ -1380,6 +1628,8 @@ class VerticalTabBrowser(QMainWindow):
                             self._closed_tab_stack.pop(0)
                 self.tab_list.takeItem(i)
                 self._zoom_levels.pop(item.web_view, None)
+                self._typed_views.discard(item.web_view)
+                self._last_visit_urls.pop(item.web_view, None)
                 item.web_view.deleteLater()
                 if item.web_view in self.tabs:
                     self.tabs.remove(item.web_view)
@@ -1415,11 +1665,18 @@ class VerticalTabBrowser(QMainWindow):
             if dialog.exec():
                 result = dialog.get_result()
                 if result:
-                    self.bookmark_manager.add_bookmark(
+                    added = self.bookmark_manager.add_bookmark(
                         result["title"], 
                         result["url"], 
-                        result["folder"]
+                        result["folder"],
+                        result["folder_id"]
                     )
+                    if not added:
+                        QMessageBox.information(
+                            self, "ブックマーク",
+                            "このページは既にこのフォルダのブックマークに登録されています。"
+                        )
+                    self.update_bookmark_star()
     
     def toggle_mute(self, item):
         """タブのミュート状態を切り替え"""
@@ -1440,7 +1697,11 @@ class VerticalTabBrowser(QMainWindow):
         """終了時の処理"""
         self.save_current_session()
         
+        # 遅延書き込み中の履歴を確定させる
+        self.history_manager.flush()
         if self.settings.value("clear_on_exit", False, type=bool):
             self.history_manager.clear_history()
+        self.history_manager.close()
+        self.download_manager.close()
         
         event.accept()
\ No newline at end of file
@@ -0,0 +1,127 @@
+"""
+VELA Browser - ダウンロードしたファイルの SHA-256
+ファイルを大きなバッファで順に読んでハッシュを計算し、期待値と照らし合わせる。
+
+hashlib は大きなデータを渡すと計算中に GIL を手放すので、ワーカースレッドで
+計算しても GUI は止まらない。読み込み用のバッファは 1 つを使い回すため、
+10 GB のファイルでもメモリは HASH_CHUNK_SIZE 分しか使わない。
+
+期待値は次の順に探す:
+  1. ダウンロード元 URL のフラグメント（#sha256=<16 進数>）
+  2. 同じフォルダの "<ファイル名>.sha256"
+  3. 同じフォルダの SHA256SUMS / sha256sums.txt（sha256sum の出力形式）
+"""
+
+import hashlib
+import os
+import re
+from urllib.parse import urlsplit
+
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+# 期待値として読むファイルの大きさの上限（これより大きければ一覧ではないとみなす）
+CHECKSUM_FILE_MAX_BYTES = 1024 * 1024
+SUMS_FILENAMES = ("SHA256SUMS", "sha256sums.txt")
+
+_HEX = re.compile(r"[0-9a-fA-F]{64}")
+# sha256sum の形式 "<hash>  <name>"（バイナリは "<hash> *<name>"）
+_GNU_LINE = re.compile(r"^([0-9a-fA-F]{64})(?:\s+\*?(.+?))?\s*$")
+# BSD の形式 "SHA256 (<name>) = <hash>"
+_BSD_LINE = re.compile(r"^SHA256\s*\((.+)\)\s*=\s*([0-9a-fA-F]{64})\s*$")
+
+
+class ChecksumCancelled(Exception):
+    """should_stop() で止めた"""
+
+
+def sha256_file(path, on_progress=None, should_stop=None, chunk_size=HASH_CHUNK_SIZE):
+    """
+    ファイルの SHA-256 を 16 進数の小文字で返す。
+    on_progress(読んだバイト数, 全体のバイト数) はチャンクごとに呼ぶ。
+    """
+    digest = hashlib.sha256()
+    total = os.path.getsize(path)
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    done = 0
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            if should_stop is not None and should_stop():
+                raise ChecksumCancelled()
+            size = f.readinto(buffer)
+            if not size:
+                break
+            digest.update(view[:size])
+            done += size
+            if on_progress is not None:
+                on_progress(done, total)
+    return digest.hexdigest()
+
+
+def parse_checksum_text(text, filename=None, require_name=False):
+    """
+    sha256sum（GNU / BSD）形式の文字列から filename の期待値を探す。
+    ファイル名の無い行（ハッシュだけ）は、require_name が False なら filename に
+    かかわらず使う。見つからなければ None
+    """
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        match = _BSD_LINE.match(line)
+        if match is not None:
+            name, value = match.group(1), match.group(2)
+        else:
+            match = _GNU_LINE.match(line)
+            if match is None:
+                continue
+            value, name = match.group(1), match.group(2)
+        if name is None:
+            if not require_name:
+                return value.lower()
+        elif filename is None or os.path.basename(name.strip()) == filename:
+            return value.lower()
+    return None
+
+
+def expected_from_url(url):
+    """URL のフラグメント "sha256=<16 進数>"（"sha256:" も可）から期待値を取り出す"""
+    fragment = urlsplit(url or "").fragment
+    for part in fragment.split("&"):
+        key, sep, value = part.replace(":", "=", 1).partition("=")
+        if sep and key.lower() == "sha256" and _HEX.fullmatch(value):
+            return value.lower()
+    return None
+
+
+def _read_small(path):
+    try:
+        if os.path.getsize(path) > CHECKSUM_FILE_MAX_BYTES:
+            return None
+        with open(path, encoding="utf-8", errors="replace") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def find_expected_sha256(path, url=None):
+    """
+    ダウンロードしたファイルの期待値と、その出どころ（"url" / 読んだファイルのパス）を返す。
+    見つからなければ (None, None)
+    """
+    value = expected_from_url(url)
+    if value is not None:
+        return value, "url"
+    directory, filename = os.path.split(path)
+    # "<name>.sha256" はハッシュだけのこともある。一覧のファイルは名前が一致する行だけを使う
+    candidates = [(path + ".sha256", False)] + [
+        (os.path.join(directory, name), True) for name in SUMS_FILENAMES]
+    for candidate, require_name in candidates:
+        if not os.path.isfile(candidate):
+            continue
+        text = _read_small(candidate)
+        if text is None:
+            continue
+        value = parse_checksum_text(text, filename, require_name)
+        if value is not None:
+            return value, candidate
+    return None, None
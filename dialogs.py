@@ -4,18 +4,19 @@ VELA Browser - ダイアログ類
 """
 
 import sys
+from datetime import datetime, timedelta
 from pathlib import Path
 
-from PySide6.QtCore import Qt, Signal, QTimer
+from PySide6.QtCore import Qt, Signal, QDateTime, QUrl
 from PySide6.QtWidgets import (
     QDialog, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLineEdit,
     QLabel, QComboBox, QFrame, QMessageBox, QTabWidget,
     QTextEdit, QCheckBox, QRadioButton, QSpinBox, QGroupBox, QScrollArea,
-    QFormLayout, QFileDialog, QTableWidget, QTableWidgetItem,
-    QHeaderView, QAbstractItemView, QTreeWidget, QTreeWidgetItem,
-    QProgressBar
+    QFormLayout, QFileDialog, QTableView,
+    QHeaderView, QAbstractItemView, QTreeView,
+    QProgressBar, QDateTimeEdit, QStyledItemDelegate, QStyleOptionProgressBar,
+    QStyle, QApplication
 )
-from PySide6.QtWebEngineCore import QWebEngineDownloadRequest
 
 from constants import (
     STYLES, BROWSER_NAME, BROWSER_FULL_NAME, BROWSER_TARGET_Architecture,
@@ -23,6 +24,14 @@ from constants import (
     THEMES_DIR
 )
 from theme import theme_engine
+from models import (
+    HistoryTableModel, BookmarkTreeModel, DownloadTableModel, DOWNLOAD_PROGRESS_ROLE,
+    DOWNLOAD_PRIORITY_LABELS, DOWNLOAD_COMPLETED
+)
+from managers import (
+    BookmarkImportWorker, DownloadManager, BOOKMARK_SUGGEST_BOOST, DOWNLOAD_MAX_ACTIVE
+)
+from urlcanon import DEFAULT_TRACKING_PARAMS
 from browser import CHROMIUM_FLAGS
 
 
@@ -38,7 +47,8 @@ class AddBookmarkDialog(QDialog):
         self.setWindowTitle("ブックマークに追加")
         self.setMinimumWidth(500)
         self.result_data = None
-        self.init_ui(title, url, folders or ['root'])
+        # folders: [(フォルダ id, パス名), ...]（BookmarkManager.get_folders()）
+        self.init_ui(title, url, folders or [(None, 'root')])
     
     def init_ui(self, title, url, folders):
         self.setStyleSheet(STYLES['dialog'])
@@ -64,7 +74,8 @@ class AddBookmarkDialog(QDialog):
         form_layout.addRow("URL:", self.url_input)
         
         self.folder_combo = QComboBox()
-        self.folder_combo.addItems(folders)
+        for folder_id, name in folders:
+            self.folder_combo.addItem(name, folder_id)
         form_layout.addRow("フォルダ:", self.folder_combo)
         
         layout.addLayout(form_layout)
@@ -110,7 +121,8 @@ class AddBookmarkDialog(QDialog):
     def add_new_folder(self):
         folder_name = self.new_folder_input.text().strip()
         if folder_name and folder_name not in [self.folder_combo.itemText(i) for i in range(self.folder_combo.count())]:
-            self.folder_combo.addItem(folder_name)
+            # 新しいフォルダは id を持たず、保存時にパス名から作成される
+            self.folder_combo.addItem(folder_name, None)
             self.folder_combo.setCurrentText(folder_name)
             self.new_folder_input.clear()
     
@@ -118,9 +130,10 @@ class AddBookmarkDialog(QDialog):
         title = self.title_input.text().strip()
         url = self.url_input.text().strip()
         folder = self.folder_combo.currentText()
+        folder_id = self.folder_combo.currentData()
         
         if title and url:
-            self.result_data = {"title": title, "url": url, "folder": folder}
+            self.result_data = {"title": title, "url": url, "folder": folder, "folder_id": folder_id}
             self.accept()
         else:
             QMessageBox.warning(self, "入力エラー", "タイトルとURLを入力してください。")
@@ -129,6 +142,149 @@ class AddBookmarkDialog(QDialog):
         return self.result_data
 
 
+# =====================================================================
+# 履歴の期間・サイト指定削除ダイアログ
+# =====================================================================
+
+class DeleteHistoryDialog(QDialog):
+    """期間またはサイトを指定して履歴を削除するダイアログ（進捗表示付き）"""
+    
+    # (表示名, さかのぼる時間)。None は期間を指定
+    RANGE_PRESETS = (
+        ("過去1時間", timedelta(hours=1)),
+        ("過去24時間", timedelta(days=1)),
+        ("過去7日間", timedelta(days=7)),
+        ("過去4週間", timedelta(weeks=4)),
+        ("期間を指定", None),
+    )
+    
+    def __init__(self, history_manager, host="", parent=None):
+        super().__init__(parent)
+        self.history_manager = history_manager
+        self.task = None
+        self.setWindowTitle("履歴を削除")
+        self.setMinimumWidth(460)
+        self.init_ui(host)
+    
+    def init_ui(self, host):
+        self.setStyleSheet(STYLES['dialog'])
+        layout = QVBoxLayout(self)
+        layout.setSpacing(12)
+        layout.setContentsMargins(20, 20, 20, 20)
+        
+        # 期間指定
+        self.range_radio = QRadioButton("期間を指定して削除")
+        self.range_radio.setChecked(not host)
+        layout.addWidget(self.range_radio)
+        
+        range_form = QFormLayout()
+        self.range_combo = QComboBox()
+        self.range_combo.addItems([label for label, _ in self.RANGE_PRESETS])
+        self.range_combo.currentIndexChanged.connect(self.update_enabled)
+        range_form.addRow("期間:", self.range_combo)
+        now = QDateTime.currentDateTime()
+        self.start_edit = QDateTimeEdit(now.addDays(-1))
+        self.start_edit.setCalendarPopup(True)
+        self.start_edit.setDisplayFormat("yyyy/MM/dd HH:mm")
+        range_form.addRow("開始:", self.start_edit)
+        self.end_edit = QDateTimeEdit(now)
+        self.end_edit.setCalendarPopup(True)
+        self.end_edit.setDisplayFormat("yyyy/MM/dd HH:mm")
+        range_form.addRow("終了:", self.end_edit)
+        layout.addLayout(range_form)
+        
+        # サイト指定
+        self.host_radio = QRadioButton("サイトを指定して削除")
+        self.host_radio.setChecked(bool(host))
+        layout.addWidget(self.host_radio)
+        
+        host_form = QFormLayout()
+        self.host_input = QLineEdit(host)
+        self.host_input.setPlaceholderText("example.com")
+        host_form.addRow("ホスト:", self.host_input)
+        self.subdomain_check = QCheckBox("サブドメインも含める")
+        self.subdomain_check.setChecked(True)
+        host_form.addRow("", self.subdomain_check)
+        layout.addLayout(host_form)
+        
+        self.range_radio.toggled.connect(self.update_enabled)
+        
+        # 進捗
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setVisible(False)
+        layout.addWidget(self.progress_bar)
+        
+        # ボタン
+        button_layout = QHBoxLayout()
+        button_layout.addStretch()
+        
+        self.cancel_btn = QPushButton("キャンセル")
+        self.cancel_btn.setMinimumWidth(100)
+        self.cancel_btn.setStyleSheet(STYLES['button_secondary'])
+        self.cancel_btn.clicked.connect(self.reject)
+        button_layout.addWidget(self.cancel_btn)
+        
+        self.delete_btn = QPushButton("削除")
+        self.delete_btn.setMinimumWidth(100)
+        self.delete_btn.setStyleSheet(STYLES['button_primary'])
+        self.delete_btn.clicked.connect(self.start_deletion)
+        self.delete_btn.setDefault(True)
+        button_layout.addWidget(self.delete_btn)
+        
+        layout.addLayout(button_layout)
+        self.update_enabled()
+    
+    def update_enabled(self):
+        by_range = self.range_radio.isChecked()
+        custom = self.RANGE_PRESETS[self.range_combo.currentIndex()][1] is None
+        self.range_combo.setEnabled(by_range)
+        self.start_edit.setEnabled(by_range and custom)
+        self.end_edit.setEnabled(by_range and custom)
+        self.host_input.setEnabled(not by_range)
+        self.subdomain_check.setEnabled(not by_range)
+    
+    def start_deletion(self):
+        if self.range_radio.isChecked():
+            span = self.RANGE_PRESETS[self.range_combo.currentIndex()][1]
+            if span is None:
+                start = self.start_edit.dateTime().toPython().astimezone()
+                end = self.end_edit.dateTime().toPython().astimezone()
+            else:
+                end = datetime.now().astimezone()
+                start = end - span
+            if start >= end:
+                QMessageBox.warning(self, "入力エラー", "開始日時は終了日時より前にしてください。")
+                return
+            # 終了時刻ちょうどの訪問も含める
+            self.task = self.history_manager.delete_range(start, end + timedelta(seconds=1), self)
+        else:
+            host = self.host_input.text().strip()
+            if not host:
+                QMessageBox.warning(self, "入力エラー", "ホストを入力してください。")
+                return
+            self.task = self.history_manager.delete_host(host, self.subdomain_check.isChecked(), self)
+        
+        for w in (self.range_radio, self.host_radio, self.range_combo, self.start_edit,
+                  self.end_edit, self.host_input, self.subdomain_check, self.delete_btn):
+            w.setEnabled(False)
+        self.progress_bar.setVisible(True)
+        self.progress_bar.setRange(0, max(self.task.total, 1))
+        self.progress_bar.setValue(0)
+        self.task.progress.connect(self.on_progress)
+        self.task.finished.connect(self.accept)
+    
+    def on_progress(self, deleted, total):
+        self.progress_bar.setValue(deleted)
+        self.progress_bar.setFormat(f"{deleted} / {total} 件")
+    
+    def reject(self):
+        # 削除中なら残りを取りやめる（ここまでに削除した分は戻らない）
+        if self.task is not None:
+            self.task.finished.disconnect(self.accept)
+            self.task.cancel()
+        super().reject()
+
+
 # =====================================================================
 # メインダイアログ（統合）
 # =====================================================================
@@ -146,6 +302,7 @@ class MainDialog(QDialog):
         self.download_manager = download_manager
         self.current_url = current_url      # 呼び出し元から渡された現在ページのURL
         self.current_title = current_title  # 呼び出し元から渡された現在ページのタイトル
+        self._bookmark_import_worker = None
         self.setWindowTitle(f"{BROWSER_NAME}について")
         self.setMinimumSize(600, 500)
 
@@ -314,6 +471,10 @@ class MainDialog(QDialog):
         self.save_session_check.setChecked(self.settings.value("save_session", True, type=bool))
         general_layout.addWidget(self.save_session_check)
 
+        self.new_tab_page_check = QCheckBox("新しいタブでよく見るサイトを表示（オフの場合はホームページ）")
+        self.new_tab_page_check.setChecked(self.settings.value("new_tab_page", True, type=bool))
+        general_layout.addWidget(self.new_tab_page_check)
+
         theme_select_layout = QHBoxLayout()
         theme_select_layout.addWidget(QLabel("テーマ:"))
         self.theme_combo = QComboBox()
@@ -342,6 +503,23 @@ class MainDialog(QDialog):
         self.search_engine_combo.setCurrentIndex(self.settings.value("search_engine", 0, type=int))
         engine_layout.addWidget(self.search_engine_combo)
         search_layout.addLayout(engine_layout)
+
+        # URL バーの補完候補でブックマークを優先する度合い（frecency に加える点数）
+        boost_layout = QHBoxLayout()
+        boost_layout.addWidget(QLabel("補完でのブックマークの優先度:"))
+        self.bookmark_boost_spin = QSpinBox()
+        self.bookmark_boost_spin.setRange(0, 10000)
+        self.bookmark_boost_spin.setSingleStep(50)
+        self.bookmark_boost_spin.setSuffix(" 点")
+        self.bookmark_boost_spin.setToolTip(
+            "URL バーの補完候補で、ブックマークしたページの順位を上げる点数です。\n"
+            "最近の訪問 1 回がおよそ 100 点に相当します（0 で履歴と同じ扱い）。"
+        )
+        self.bookmark_boost_spin.setValue(
+            self.settings.value("completer_bookmark_boost", BOOKMARK_SUGGEST_BOOST, type=int))
+        boost_layout.addWidget(self.bookmark_boost_spin)
+        boost_layout.addStretch()
+        search_layout.addLayout(boost_layout)
         
         search_group.setLayout(search_layout)
         layout.addWidget(search_group)
@@ -354,6 +532,45 @@ class MainDialog(QDialog):
         self.clear_on_exit_check.setChecked(self.settings.value("clear_on_exit", False, type=bool))
         privacy_layout.addWidget(self.clear_on_exit_check)
 
+        # 履歴の保持ポリシー（0 は無制限）
+        self.history_max_age_spin = QSpinBox()
+        self.history_max_age_spin.setRange(0, 3650)
+        self.history_max_age_spin.setSpecialValueText("無制限")
+        self.history_max_age_spin.setSuffix(" 日")
+        self.history_max_age_spin.setValue(self.settings.value("history_max_age_days", 0, type=int))
+        self.history_max_urls_spin = QSpinBox()
+        self.history_max_urls_spin.setRange(0, 10000000)
+        self.history_max_urls_spin.setSingleStep(1000)
+        self.history_max_urls_spin.setSpecialValueText("無制限")
+        self.history_max_urls_spin.setSuffix(" 件")
+        self.history_max_urls_spin.setValue(self.settings.value("history_max_urls", 0, type=int))
+        self.history_max_size_spin = QSpinBox()
+        self.history_max_size_spin.setRange(0, 100000)
+        self.history_max_size_spin.setSingleStep(10)
+        self.history_max_size_spin.setSpecialValueText("無制限")
+        self.history_max_size_spin.setSuffix(" MB")
+        self.history_max_size_spin.setValue(self.settings.value("history_max_size_mb", 0, type=int))
+        for label, spin in (("履歴の保存期間:", self.history_max_age_spin),
+                            ("履歴の最大件数:", self.history_max_urls_spin),
+                            ("履歴の最大サイズ:", self.history_max_size_spin)):
+            retention_layout = QHBoxLayout()
+            retention_layout.addWidget(QLabel(label))
+            retention_layout.addWidget(spin)
+            retention_layout.addStretch()
+            privacy_layout.addLayout(retention_layout)
+
+        # 履歴・ブックマークの URL から除去するクエリパラメータ（末尾 * は前方一致）
+        tracking_layout = QHBoxLayout()
+        tracking_layout.addWidget(QLabel("除去するトラッキングパラメータ:"))
+        self.tracking_params_input = QLineEdit(
+            self.settings.value("tracking_params", ", ".join(DEFAULT_TRACKING_PARAMS)))
+        self.tracking_params_input.setToolTip(
+            "履歴とブックマークに保存する URL から取り除くクエリパラメータです。\n"
+            "カンマ区切りで指定し、末尾の * は前方一致になります（例: utm_*）。"
+        )
+        tracking_layout.addWidget(self.tracking_params_input)
+        privacy_layout.addLayout(tracking_layout)
+
         self.do_not_track_check = QCheckBox("Do Not Track (DNT) を送信する")
         self.do_not_track_check.setToolTip(
             "HTTP ヘッダー 'DNT: 1' を全リクエストに付加します。\n"
@@ -385,6 +602,30 @@ class MainDialog(QDialog):
         self.ask_download_check.setChecked(self.settings.value("ask_download", True, type=bool))
         download_layout.addWidget(self.ask_download_check)
         
+        # 同時に転送する数（超えた分は待ち行列で順番を待つ）
+        max_active_layout = QHBoxLayout()
+        max_active_layout.addWidget(QLabel("同時にダウンロードする数:"))
+        self.max_downloads_spin = QSpinBox()
+        self.max_downloads_spin.setRange(1, 20)
+        self.max_downloads_spin.setToolTip(
+            "これを超えたダウンロードは一時停止して待機し、転送が終わるたびに\n"
+            "優先度の高いものから順に始まります。"
+        )
+        self.max_downloads_spin.setValue(
+            self.settings.value("max_concurrent_downloads", DOWNLOAD_MAX_ACTIVE, type=int))
+        max_active_layout.addWidget(self.max_downloads_spin)
+        max_active_layout.addStretch()
+        download_layout.addLayout(max_active_layout)
+        
+        self.verify_checksums_check = QCheckBox("完了したダウンロードの SHA-256 を計算する")
+        self.verify_checksums_check.setToolTip(
+            "バックグラウンドで計算して一覧に表示します。URL の #sha256=… や\n"
+            "同じフォルダの .sha256 / SHA256SUMS に期待値があれば照合します。"
+        )
+        self.verify_checksums_check.setChecked(
+            self.settings.value("verify_download_checksums", True, type=bool))
+        download_layout.addWidget(self.verify_checksums_check)
+        
         download_group.setLayout(download_layout)
         layout.addWidget(download_group)
         
@@ -476,6 +717,11 @@ class MainDialog(QDialog):
         self.history_search_input.textChanged.connect(self.search_history)
         search_layout.addWidget(self.history_search_input)
         
+        delete_history_btn = QPushButton("期間・サイトを指定して削除")
+        delete_history_btn.setStyleSheet(STYLES['button_secondary'])
+        delete_history_btn.clicked.connect(self.delete_history)
+        search_layout.addWidget(delete_history_btn)
+        
         clear_history_btn = QPushButton("履歴を全削除")
         clear_history_btn.setStyleSheet(STYLES['button_secondary'])
         clear_history_btn.clicked.connect(self.clear_history)
@@ -483,19 +729,21 @@ class MainDialog(QDialog):
         
         layout.addLayout(search_layout)
         
-        # 履歴テーブル
-        self.history_table = QTableWidget()
-        self.history_table.setColumnCount(4)
-        self.history_table.setHorizontalHeaderLabels(["タイトル", "URL", "訪問日時", "訪問回数"])
+        # 履歴テーブル（スクロールに応じてページ単位で読み込む）
+        self.history_model = HistoryTableModel(self.history_manager, self)
+        self.history_table = QTableView()
+        self.history_table.setModel(self.history_model)
         self.history_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
         self.history_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        self.history_table.verticalHeader().setDefaultSectionSize(
+            self.history_table.fontMetrics().height() + 8)
         self.history_table.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.history_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.history_table.setSortingEnabled(True)
+        self.history_table.sortByColumn(2, Qt.DescendingOrder)
         self.history_table.doubleClicked.connect(self.on_history_item_double_clicked)
         layout.addWidget(self.history_table)
         
-        self.load_history()
-        
         return widget
     
     def create_bookmarks_tab(self):
@@ -526,18 +774,25 @@ class MainDialog(QDialog):
         export_btn.clicked.connect(self.export_bookmarks)
         toolbar_layout.addWidget(export_btn)
 
-        import_btn = QPushButton("インポート")
-        import_btn.setStyleSheet(STYLES['button_secondary'])
-        import_btn.clicked.connect(self.import_bookmarks)
-        toolbar_layout.addWidget(import_btn)
+        self.import_btn = QPushButton("インポート")
+        self.import_btn.setStyleSheet(STYLES['button_secondary'])
+        self.import_btn.clicked.connect(self.import_bookmarks)
+        toolbar_layout.addWidget(self.import_btn)
 
         layout.addLayout(toolbar_layout)
 
-        # ブックマークツリー
-        self.bookmark_tree = QTreeWidget()
-        self.bookmark_tree.setHeaderLabels(["タイトル", "URL"])
+        # インポートの進捗（インポート中だけ表示）
+        self.bookmark_import_progress = QProgressBar()
+        self.bookmark_import_progress.setVisible(False)
+        layout.addWidget(self.bookmark_import_progress)
+
+        # ブックマークツリー（フォルダの中身は展開したときに読み込む）
+        self.bookmark_model = BookmarkTreeModel(self.bookmark_manager, self)
+        self.bookmark_tree = QTreeView()
+        self.bookmark_tree.setModel(self.bookmark_model)
+        self.bookmark_tree.setUniformRowHeights(True)
         self.bookmark_tree.setColumnWidth(0, 300)
-        self.bookmark_tree.itemDoubleClicked.connect(self.on_bookmark_item_double_clicked)
+        self.bookmark_tree.doubleClicked.connect(self.on_bookmark_item_double_clicked)
         layout.addWidget(self.bookmark_tree)
 
         self.load_bookmarks()
@@ -563,11 +818,19 @@ class MainDialog(QDialog):
         self.settings.setValue("homepage", self.homepage_input.text())
         self.settings.setValue("startup_action", self.startup_combo.currentIndex())
         self.settings.setValue("save_session", self.save_session_check.isChecked())
+        self.settings.setValue("new_tab_page", self.new_tab_page_check.isChecked())
         self.settings.setValue("search_engine", self.search_engine_combo.currentIndex())
+        self.settings.setValue("completer_bookmark_boost", self.bookmark_boost_spin.value())
         self.settings.setValue("clear_on_exit", self.clear_on_exit_check.isChecked())
+        self.settings.setValue("history_max_age_days", self.history_max_age_spin.value())
+        self.settings.setValue("history_max_urls", self.history_max_urls_spin.value())
+        self.settings.setValue("history_max_size_mb", self.history_max_size_spin.value())
+        self.settings.setValue("tracking_params", self.tracking_params_input.text())
         self.settings.setValue("do_not_track", self.do_not_track_check.isChecked())
         self.settings.setValue("download_dir", self.download_dir_input.text())
         self.settings.setValue("ask_download", self.ask_download_check.isChecked())
+        self.settings.setValue("max_concurrent_downloads", self.max_downloads_spin.value())
+        self.settings.setValue("verify_download_checksums", self.verify_checksums_check.isChecked())
         self.settings.setValue("enable_javascript", self.javascript_check.isChecked())
         self.settings.setValue("allow_fullscreen", self.fullscreen_check.isChecked())
         self.settings.setValue("auto_load_images", self.images_check.isChecked())
@@ -640,11 +903,19 @@ class MainDialog(QDialog):
             self.homepage_input.setText("https://www.google.com")
             self.startup_combo.setCurrentIndex(0)
             self.save_session_check.setChecked(True)
+            self.new_tab_page_check.setChecked(True)
             self.search_engine_combo.setCurrentIndex(0)
+            self.bookmark_boost_spin.setValue(BOOKMARK_SUGGEST_BOOST)
             self.clear_on_exit_check.setChecked(False)
+            self.history_max_age_spin.setValue(0)
+            self.history_max_urls_spin.setValue(0)
+            self.history_max_size_spin.setValue(0)
+            self.tracking_params_input.setText(", ".join(DEFAULT_TRACKING_PARAMS))
             self.do_not_track_check.setChecked(True)
             self.download_dir_input.setText(str(DOWNLOADS_DIR))
             self.ask_download_check.setChecked(True)
+            self.max_downloads_spin.setValue(DOWNLOAD_MAX_ACTIVE)
+            self.verify_checksums_check.setChecked(True)
             self.javascript_check.setChecked(True)
             self.fullscreen_check.setChecked(True)
             self.images_check.setChecked(True)
@@ -663,29 +934,26 @@ class MainDialog(QDialog):
             self.save_settings()
 
     def load_history(self):
-        history = self.history_manager.get_history(500)
-        self.display_history(history)
+        self.history_model.refresh()
     
     def search_history(self, query):
-        if query:
-            history = self.history_manager.search_history(query)
-        else:
-            history = self.history_manager.get_history(500)
-        self.display_history(history)
-    
-    def display_history(self, history):
-        self.history_table.setRowCount(len(history))
-        for i, (url, title, visit_time, visit_count) in enumerate(history):
-            self.history_table.setItem(i, 0, QTableWidgetItem(title or ""))
-            self.history_table.setItem(i, 1, QTableWidgetItem(url))
-            self.history_table.setItem(i, 2, QTableWidgetItem(visit_time))
-            self.history_table.setItem(i, 3, QTableWidgetItem(str(visit_count)))
+        self.history_model.set_filter(query)
     
     def on_history_item_double_clicked(self, index):
-        row = index.row()
-        url = self.history_table.item(row, 1).text()
-        self.open_url.emit(url)
-        self.close()
+        url = self.history_model.url_at(index.row())
+        if url:
+            self.open_url.emit(url)
+            self.close()
+    
+    def delete_history(self):
+        # 選択中の行があればそのサイトを初期値にする
+        host = ""
+        index = self.history_table.currentIndex()
+        if index.isValid():
+            host = QUrl(self.history_model.url_at(index.row()) or "").host()
+        dialog = DeleteHistoryDialog(self.history_manager, host, self)
+        dialog.exec()
+        self.load_history()
     
     def clear_history(self):
         reply = QMessageBox.question(
@@ -697,21 +965,8 @@ class MainDialog(QDialog):
             self.load_history()
     
     def load_bookmarks(self):
-        self.bookmark_tree.clear()
-        folders = {}
-        
-        bookmarks = self.bookmark_manager.get_bookmarks()
-        
-        for bm_id, title, url, folder in bookmarks:
-            if folder not in folders:
-                folder_item = QTreeWidgetItem(self.bookmark_tree, [folder, ""])
-                folder_item.setData(0, Qt.UserRole, {"type": "folder", "name": folder})
-                folders[folder] = folder_item
-            
-            bookmark_item = QTreeWidgetItem(folders[folder], [title, url])
-            bookmark_item.setData(0, Qt.UserRole, {"type": "bookmark", "id": bm_id, "url": url})
-        
-        self.bookmark_tree.expandAll()
+        """ツリーをルート直下の先頭ページから読み直す"""
+        self.bookmark_model.refresh()
     
     def _on_tab_widget_changed(self, index):
         """タブ切り替え時の処理"""
@@ -742,13 +997,23 @@ class MainDialog(QDialog):
         if dialog.exec():
             result = dialog.get_result()
             title, url, folder = result["title"], result["url"], result["folder"]
-            self.bookmark_manager.add_bookmark(title, url, folder)
-            self.load_bookmarks()  # ツリーを更新
+            bookmark_id = self.bookmark_manager.add_bookmark(title, url, folder, result["folder_id"])
+            if bookmark_id is None:
+                QMessageBox.information(
+                    self, "ブックマーク",
+                    "このページは既にこのフォルダのブックマークに登録されています。"
+                )
+            elif result["folder_id"] is None:
+                # 新しいフォルダを作った。ツリーに現れるよう読み直す
+                self.load_bookmarks()
+            else:
+                self.bookmark_model.insert_bookmark(
+                    result["folder_id"], bookmark_id, title, url)
 
     def delete_selected_bookmark(self):
-        current_item = self.bookmark_tree.currentItem()
-        if current_item:
-            data = current_item.data(0, Qt.UserRole)
+        index = self.bookmark_tree.currentIndex()
+        if index.isValid():
+            data = self.bookmark_model.item_data(index)
             if data and data["type"] == "bookmark":
                 reply = QMessageBox.question(
                     self, "確認", "このブックマークを削除しますか？",
@@ -756,36 +1021,88 @@ class MainDialog(QDialog):
                 )
                 if reply == QMessageBox.Yes:
                     self.bookmark_manager.delete_bookmark(data["id"])
-                    self.load_bookmarks()
+                    self.bookmark_model.remove_index(index)
+            elif data and data["type"] == "folder":
+                count = self.bookmark_manager.count_bookmarks(data["id"])
+                reply = QMessageBox.question(
+                    self, "確認",
+                    f"フォルダ「{data['name']}」と、その中の {count} 件のブックマークを削除しますか？",
+                    QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+                )
+                if reply == QMessageBox.Yes:
+                    self.bookmark_manager.delete_folder(data["id"])
+                    self.bookmark_model.remove_index(index)
     
-    def on_bookmark_item_double_clicked(self, item, column):
-        data = item.data(0, Qt.UserRole)
+    def on_bookmark_item_double_clicked(self, index):
+        data = self.bookmark_model.item_data(index)
         if data and data["type"] == "bookmark":
             self.open_url.emit(data["url"])
             self.close()
     
     def export_bookmarks(self):
-        filepath, _ = QFileDialog.getSaveFileName(
+        json_filter = "Chromium Bookmarks (*.json)"
+        filepath, selected_filter = QFileDialog.getSaveFileName(
             self, "ブックマークをエクスポート", 
             str(DATA_DIR / "bookmarks.html"),
-            "HTML Files (*.html)"
+            f"HTML Files (*.html);;{json_filter}"
         )
-        if filepath:
-            self.bookmark_manager.export_html(filepath)
+        if not filepath:
+            return
+        if selected_filter == json_filter or filepath.lower().endswith(".json"):
+            ok = self.bookmark_manager.export_json(filepath)
+        else:
+            ok = self.bookmark_manager.export_html(filepath)
+        if ok:
             QMessageBox.information(self, "完了", "ブックマークをエクスポートしました。")
+        else:
+            QMessageBox.warning(self, "エラー", "ブックマークのエクスポートに失敗しました。")
     
     def import_bookmarks(self):
         filepath, _ = QFileDialog.getOpenFileName(
             self, "ブックマークをインポート",
             str(Path.home()),
-            "HTML Files (*.html)"
+            "ブックマーク (*.html *.htm *.json Bookmarks places.sqlite);;"
+            "HTML Files (*.html *.htm);;"
+            "Chromium Bookmarks (Bookmarks *.json);;"
+            "Firefox places.sqlite (places.sqlite)"
         )
-        if filepath:
-            if self.bookmark_manager.import_html(filepath):
-                self.load_bookmarks()
-                QMessageBox.information(self, "完了", "ブックマークをインポートしました。")
-            else:
-                QMessageBox.warning(self, "エラー", "ブックマークのインポートに失敗しました。")
+        if not filepath or self._bookmark_import_worker is not None:
+            return
+        # 解析と一括挿入はワーカースレッドで行い、ダイアログは操作できるままにする
+        self.import_btn.setEnabled(False)
+        self.bookmark_import_progress.setRange(0, 0)
+        self.bookmark_import_progress.setVisible(True)
+        # Firefox の places.sqlite からは訪問履歴もあわせて取り込む
+        self._bookmark_import_worker = BookmarkImportWorker(
+            self.bookmark_manager, filepath, self, history_manager=self.history_manager)
+        self._bookmark_import_worker.progress.connect(self._on_bookmark_import_progress)
+        self._bookmark_import_worker.imported.connect(self._on_bookmarks_imported)
+        self._bookmark_import_worker.start()
+    
+    def _on_bookmark_import_progress(self, done, total):
+        self.bookmark_import_progress.setRange(0, max(total, 1))
+        self.bookmark_import_progress.setValue(done)
+    
+    def _on_bookmarks_imported(self, ok):
+        self._bookmark_import_worker.wait()
+        imported_history = self._bookmark_import_worker.imported_history
+        self._bookmark_import_worker = None
+        if imported_history:
+            self.history_manager.reload_url_index()
+            self.load_history()
+        self.import_btn.setEnabled(True)
+        self.bookmark_import_progress.setVisible(False)
+        if ok:
+            self.load_bookmarks()
+            QMessageBox.information(self, "完了", "ブックマークをインポートしました。")
+        else:
+            QMessageBox.warning(self, "エラー", "ブックマークのインポートに失敗しました。")
+    
+    def done(self, result):
+        # インポート中のスレッドを残したままダイアログを破棄しない
+        if self._bookmark_import_worker is not None:
+            self._bookmark_import_worker.wait()
+        super().done(result)
     
     def create_downloads_tab(self):
         """ダウンロードタブ"""
@@ -796,21 +1113,27 @@ class MainDialog(QDialog):
         info_label = QLabel("現在のダウンロードと過去のダウンロード履歴を表示します。")
         layout.addWidget(info_label)
 
-        # テーブル（5列：ファイル名・URL・保存先・サイズ・進捗）
-        self.download_table = QTableWidget()
-        self.download_table.setColumnCount(5)
-        self.download_table.setHorizontalHeaderLabels([
-            "ファイル名", "URL", "保存先", "サイズ", "進捗"
-        ])
+        # テーブル（9列：ファイル名・URL・保存先・サイズ・進捗・速度・残り時間・状態・SHA-256）
+        # 進捗はモデルがダウンロードのシグナルで変わったセルだけ更新する（定期的な読み直しはしない）
+        self.download_model = DownloadTableModel(self.download_manager, parent=self)
+        self.download_table = QTableView()
+        self.download_table.setModel(self.download_model)
+        self.download_table.setItemDelegateForColumn(
+            DownloadTableModel.COLUMN_PROGRESS, DownloadProgressDelegate(self.download_table))
+        self.download_table.verticalHeader().setVisible(False)
         hh = self.download_table.horizontalHeader()
         # 全列をInteractiveにして手動リサイズ可能に
-        for i in range(5):
+        for i in range(DownloadTableModel.COLUMN_SHA256 + 1):
             hh.setSectionResizeMode(i, QHeaderView.Interactive)
         self.download_table.setColumnWidth(0, 90)  # ファイル名
         self.download_table.setColumnWidth(1, 160)  # URL
         self.download_table.setColumnWidth(2, 220)  # 保存先
         self.download_table.setColumnWidth(3, 40)   # サイズ
         self.download_table.setColumnWidth(4, 40)   # 進捗
+        self.download_table.setColumnWidth(5, 70)   # 速度
+        self.download_table.setColumnWidth(6, 60)   # 残り時間
+        self.download_table.setColumnWidth(7, 70)   # 状態
+        self.download_table.setColumnWidth(8, 150)  # SHA-256
         self.download_table.setSelectionBehavior(QAbstractItemView.SelectItems)  # セル単位選択
         self.download_table.setSelectionMode(QAbstractItemView.SingleSelection)
         self.download_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
@@ -830,32 +1153,18 @@ class MainDialog(QDialog):
         button_layout.addWidget(clear_history_btn)
         button_layout.addStretch()
         layout.addLayout(button_layout)
-
-        # 自動更新タイマー（0.5秒ごと）
-        self._download_refresh_timer = QTimer(self)
-        self._download_refresh_timer.setInterval(500)
-        self._download_refresh_timer.timeout.connect(self.load_downloads)
-        self._download_refresh_timer.start()
-
-        self.load_downloads()
         return widget
 
     def _download_context_menu(self, pos):
-        """ダウンロードテーブルの右クリックメニュー（コピー）"""
+        """ダウンロードテーブルの右クリックメニュー（コピー・待ち行列の操作）"""
         row = self.download_table.rowAt(pos.y())
-        if row < 0:
-            return
-
-        file_item = self.download_table.item(row, 0)
-        url_item  = self.download_table.item(row, 1)
-        path_item = self.download_table.item(row, 2)
-        if not file_item:
+        row_data = self.download_model.row_data(row)
+        if row_data is None:
             return
+        download_id = self.download_model.download_id(row)
 
         import os
-        filename  = file_item.text() if file_item else ""
-        url_text  = url_item.text()  if url_item  else ""
-        dir_text  = path_item.text() if path_item else ""
+        filename, url_text, dir_text = row_data
         full_path = os.path.join(dir_text, filename) if dir_text else filename
 
         from PySide6.QtWidgets import QMenu as _QMenu
@@ -865,12 +1174,51 @@ class MainDialog(QDialog):
         copy_name_action = menu.addAction(f"ファイル名をコピー")
         copy_url_action  = menu.addAction(f"URLをコピー")
         copy_path_action = menu.addAction(f"絶対パスをコピー")
+        sha256, _expected = self.download_model.checksum(row)
+        copy_sha256_action = menu.addAction("SHA-256をコピー")
+        copy_sha256_action.setEnabled(bool(sha256))
 
         # URLが空の場合はグレーアウト
         if not url_text:
             copy_url_action.setEnabled(False)
 
+        # 進行中のダウンロードは一時停止・再開・優先度・先頭へ移動を操作できる
+        queue_actions = {}
+        status = self.download_manager.queue_status(download_id)
+        if status is not None:
+            menu.addSeparator()
+            if status == "paused":
+                queue_actions[menu.addAction("再開")] = self.download_manager.resume_download
+            else:
+                queue_actions[menu.addAction("一時停止")] = self.download_manager.pause_download
+            front_action = menu.addAction("先頭へ移動")
+            front_action.setEnabled(status != "active")
+            queue_actions[front_action] = self.download_manager.move_to_front
+            priority_menu = menu.addMenu("優先度")
+            current = self.download_manager.priority(download_id)
+            for priority in (DownloadManager.PRIORITY_HIGH, DownloadManager.PRIORITY_NORMAL,
+                             DownloadManager.PRIORITY_LOW):
+                priority_action = priority_menu.addAction(DOWNLOAD_PRIORITY_LABELS[priority])
+                priority_action.setCheckable(True)
+                priority_action.setChecked(priority == current)
+                queue_actions[priority_action] = (
+                    lambda download_id, priority=priority:
+                    self.download_manager.set_priority(download_id, priority))
+        elif self.download_manager.can_retry(download_id):
+            # 中断・未完了のまま残ったダウンロードは保存先のファイルの続きから取り直せる
+            menu.addSeparator()
+            queue_actions[menu.addAction("再試行")] = self.download_manager.retry_download
+        elif (self.download_manager.checksum_progress(download_id) is None
+              and self.download_model.state(row) == DOWNLOAD_COMPLETED
+              and os.path.isfile(full_path)):
+            # 完了したダウンロードは SHA-256 を計算し直せる（後から置いた .sha256 とも照合する）
+            menu.addSeparator()
+            queue_actions[menu.addAction("SHA-256を計算")] = self.download_manager.verify_download
+
         action = menu.exec(self.download_table.viewport().mapToGlobal(pos))
+        if action in queue_actions:
+            queue_actions[action](download_id)
+            return
 
         from PySide6.QtWidgets import QApplication as _QApp
         if action == copy_name_action:
@@ -879,63 +1227,12 @@ class MainDialog(QDialog):
             _QApp.clipboard().setText(url_text)
         elif action == copy_path_action:
             _QApp.clipboard().setText(full_path)
+        elif action == copy_sha256_action:
+            _QApp.clipboard().setText(sha256)
 
     def load_downloads(self):
-        """ダウンロードデータを読み込み（DBから一本化・進捗はメモリ側で補完）"""
-        from PySide6.QtWebEngineCore import QWebEngineDownloadRequest
-
-        # メモリ上の進行中ダウンロードをURLでインデックス化
-        live_by_url = {}
-        for dl in self.download_manager.get_downloads():
-            live_by_url[dl.url().toString()] = dl
-
-        download_history = self.download_manager.get_download_history(100)
-
-        # スクロール位置を保持
-        scrollbar = self.download_table.verticalScrollBar()
-        scroll_pos = scrollbar.value()
-
-        self.download_table.setRowCount(0)
-
-        for filename, url, download_path, total_bytes, received_bytes, state, start_time, finish_time in download_history:
-            row = self.download_table.rowCount()
-            self.download_table.insertRow(row)
-
-            self.download_table.setItem(row, 0, QTableWidgetItem(filename))
-            self.download_table.setItem(row, 1, QTableWidgetItem(url or ""))
-            self.download_table.setItem(row, 2, QTableWidgetItem(download_path or ""))
-
-            # サイズ
-            if total_bytes and total_bytes > 0:
-                self.download_table.setItem(
-                    row, 3, QTableWidgetItem(f"{total_bytes / (1024*1024):.2f} MB"))
-            else:
-                self.download_table.setItem(row, 3, QTableWidgetItem("不明"))
-
-            # 進捗（列4）
-            live = live_by_url.get(url)
-            if live and live.state().value == 1:  # DownloadInProgress
-                live_total = live.totalBytes()
-                live_recv  = live.receivedBytes()
-                pct = int(live_recv / live_total * 100) if live_total > 0 else 0
-                progress_bar = QProgressBar()
-                progress_bar.setValue(pct)
-                self.download_table.setCellWidget(row, 4, progress_bar)
-            else:
-                # DB値で表示。100% or 完了(state==2) なら「完了」テキスト
-                if total_bytes and total_bytes > 0:
-                    pct = int((received_bytes or 0) / total_bytes * 100)
-                else:
-                    pct = 100 if state == 2 else 0
-
-                if pct >= 100 or state == 2:
-                    item = QTableWidgetItem("完了")
-                    item.setForeground(__import__('PySide6.QtGui', fromlist=['QColor']).QColor('#2e7d32'))
-                    self.download_table.setItem(row, 4, item)
-                else:
-                    self.download_table.setItem(row, 4, QTableWidgetItem(f"{pct}%"))
-
-        scrollbar.setValue(scroll_pos)
+        """ダウンロード一覧を DB から読み直す"""
+        self.download_model.refresh()
     
     def clear_download_history(self):
         """ダウンロード履歴をクリア"""
@@ -960,6 +1257,35 @@ class MainDialog(QDialog):
         self.tab_widget.setCurrentIndex(0)
 
 
+# =====================================================================
+# ダウンロードの進捗表示
+# =====================================================================
+
+class DownloadProgressDelegate(QStyledItemDelegate):
+    """
+    進行中のダウンロードの進捗セルをスタイルの進捗バーで描く。
+    行ごとに QProgressBar を置かず、描画のたびに DOWNLOAD_PROGRESS_ROLE の値から描く。
+    値が None のセル（完了・中断など）は通常の文字として描く。
+    """
+
+    def paint(self, painter, option, index):
+        percent = index.data(DOWNLOAD_PROGRESS_ROLE)
+        if percent is None:
+            super().paint(painter, option, index)
+            return
+        bar = QStyleOptionProgressBar()
+        bar.rect = option.rect.adjusted(2, 2, -2, -2)
+        bar.state = option.state | QStyle.State_Enabled | QStyle.State_Horizontal
+        bar.minimum = 0
+        bar.maximum = 100
+        bar.progress = percent
+        bar.text = f"{percent}%"
+        bar.textVisible = True
+        bar.textAlignment = Qt.AlignCenter
+        style = option.widget.style() if option.widget is not None else QApplication.style()
+        style.drawControl(QStyle.CE_ProgressBar, bar, painter, option.widget)
+
+
 # =====================================================================
 # ダウンロードマネージャーダイアログ
 # =====================================================================
@@ -978,11 +1304,19 @@ class DownloadDialog(QDialog):
         self.setStyleSheet(STYLES['dialog'])
         layout = QVBoxLayout(self)
         
-        self.download_table = QTableWidget()
-        self.download_table.setColumnCount(4)
-        self.download_table.setHorizontalHeaderLabels(["ファイル名", "URL", "進捗", "状態"])
-        self.download_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
-        self.download_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        # 列：ファイル名・URL・進捗・速度・残り時間・状態（保存先とサイズは隠す）
+        self.download_model = DownloadTableModel(self.download_manager, session_only=True, parent=self)
+        self.download_table = QTableView()
+        self.download_table.setModel(self.download_model)
+        self.download_table.setItemDelegateForColumn(
+            DownloadTableModel.COLUMN_PROGRESS, DownloadProgressDelegate(self.download_table))
+        self.download_table.setColumnHidden(DownloadTableModel.COLUMN_PATH, True)
+        self.download_table.setColumnHidden(DownloadTableModel.COLUMN_SIZE, True)
+        self.download_table.verticalHeader().setVisible(False)
+        self.download_table.horizontalHeader().setSectionResizeMode(
+            DownloadTableModel.COLUMN_FILENAME, QHeaderView.Stretch)
+        self.download_table.horizontalHeader().setSectionResizeMode(
+            DownloadTableModel.COLUMN_URL, QHeaderView.Stretch)
         self.download_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
         layout.addWidget(self.download_table)
         
@@ -1001,30 +1335,9 @@ class DownloadDialog(QDialog):
         button_layout.addWidget(close_btn)
         
         layout.addLayout(button_layout)
-        
-        self.refresh_downloads()
     
     def refresh_downloads(self):
-        downloads = self.download_manager.get_downloads()
-        self.download_table.setRowCount(len(downloads))
-        
-        for i, download in enumerate(downloads):
-            self.download_table.setItem(i, 0, QTableWidgetItem(download.downloadFileName()))
-            self.download_table.setItem(i, 1, QTableWidgetItem(download.url().toString()))
-            
-            progress = QProgressBar()
-            progress.setValue(int(download.receivedBytes() / max(download.totalBytes(), 1) * 100))
-            self.download_table.setCellWidget(i, 2, progress)
-            
-            state_map = {
-                QWebEngineDownloadRequest.DownloadRequested: "要求中",
-                QWebEngineDownloadRequest.DownloadInProgress: "ダウンロード中",
-                QWebEngineDownloadRequest.DownloadCompleted: "完了",
-                QWebEngineDownloadRequest.DownloadCancelled: "キャンセル",
-                QWebEngineDownloadRequest.DownloadInterrupted: "中断"
-            }
-            state = state_map.get(download.state(), "不明")
-            self.download_table.setItem(i, 3, QTableWidgetItem(state))
+        self.download_model.refresh()
 
 
 # =====================================================================
@@ -0,0 +1,192 @@
+"""
+VELA Browser - 中断したダウンロードの再開
+失敗したら RetryPolicy の指数バックオフで待ってから試し直す。
+1 回の試行で少しでも進んだら、失敗回数は数え直す（途中で切れるサーバーでも最後まで進む）。
+
+取り直し自体は DownloadManager がプロファイル経由で行う（同じセッションなら
+QWebEngineDownloadRequest.resume()、前回の起動のものはプロファイルからの再ダウンロード）。
+fetch_resume() はプロファイルを使えないとき（検証用のスクリプトなど）の代わりで、
+QtWebEngine と同じ途中までのファイル（<保存先>.download）の続きを HTTP の Range 要求で取り、
+終わったら保存先へ移す。サーバーが Range に応じなければ（200 が返れば）最初から書き直す。
+"""
+
+import os
+import random
+import re
+from http.client import HTTPException
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+READ_TIMEOUT = 15          # 秒。応答が止まったサーバーをあきらめるまでの時間
+CHUNK_SIZE = 256 * 1024
+USER_AGENT = "Mozilla/5.0 (VELABrowser download resume)"
+# 受信中のファイルに付ける拡張子（QtWebEngine は保存先に .download を付けた名前で受信する）
+PARTIAL_SUFFIX = ".download"
+
+# 試し直す価値のある HTTP ステータス（それ以外の 4xx は何度要求しても同じ）
+RETRYABLE_HTTP_STATUS = (408, 425, 429)
+
+_CONTENT_RANGE = re.compile(r"bytes\s+(\d+)-(\d+)/(\d+|\*)")
+
+
+class ResumeError(Exception):
+    """再開できなかった（retryable が False なら試し直さない）"""
+
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class ResumeCancelled(ResumeError):
+    """should_stop() で止めた（途中までのファイルは残す）"""
+
+    def __init__(self):
+        super().__init__("cancelled", retryable=False)
+
+
+class RetryPolicy:
+    """
+    指数バックオフ。attempt 回目（1 から）の失敗の後に
+    base_delay * factor^(attempt-1) 秒（max_delay まで）待つ。
+    待ち時間は ±jitter の割合でずらし、同時に切れたダウンロードが一斉に再接続しないようにする。
+    """
+
+    def __init__(self, max_attempts=6, base_delay=2.0, factor=2.0, max_delay=300.0, jitter=0.2):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.factor = factor
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def delay(self, attempt):
+        """attempt 回目の失敗の後に待つ秒数"""
+        delay = min(self.max_delay, self.base_delay * self.factor ** max(attempt - 1, 0))
+        return delay * random.uniform(1.0 - self.jitter, 1.0 + self.jitter)
+
+    def exhausted(self, attempt):
+        return attempt >= self.max_attempts
+
+
+class ResumeJob:
+    """DownloadManager が再開を受け持つダウンロード 1 件"""
+
+    def __init__(self, url, path, received=0, total=-1):
+        self.url = url
+        self.path = path
+        self.received = received
+        self.total = total
+        self.start_received = received  # 今回の試行を始めたときの受信済みバイト数
+        self.attempts = 0       # 続けて失敗した回数（進んだら 0 に戻す）
+        self.retry_at = None    # 次に試す時刻（time.monotonic()）。待っていなければ None
+        self.worker = None      # 実行中の DownloadResumeWorker
+        self.restart = False    # 止めている途中で再開を求められた
+        self.last_error = None
+        self.download = None    # resume() で再開する QWebEngineDownloadRequest（このセッションのもの）
+        self.requested = False  # プロファイルに再ダウンロードを要求し、downloadRequested を待っている
+        self.deadline = None    # その要求をあきらめる時刻（time.monotonic()）
+
+
+def partial_path(path):
+    """path を受信している途中のファイル"""
+    return path + PARTIAL_SUFFIX
+
+
+def partial_size(path):
+    """path の途中までのファイルの大きさ（無ければ 0）"""
+    try:
+        return os.path.getsize(partial_path(path))
+    except OSError:
+        return 0
+
+
+def is_retryable(error):
+    """例外が一時的なもの（試し直せば成功しうる）か"""
+    if isinstance(error, ResumeError):
+        return error.retryable
+    if isinstance(error, HTTPError):
+        return error.code >= 500 or error.code in RETRYABLE_HTTP_STATUS
+    # 接続の失敗・切断・タイムアウト（URLError と socket.timeout は OSError）
+    return isinstance(error, (OSError, HTTPException))
+
+
+def _parse_content_range(value):
+    """Content-Range から (開始位置, 全体のバイト数)。全体が不明なら -1"""
+    match = _CONTENT_RANGE.match(value or "")
+    if match is None:
+        return None
+    total = match.group(3)
+    return int(match.group(1)), (-1 if total == "*" else int(total))
+
+
+def _unsatisfied_total(value):
+    """416 の Content-Range（bytes */全体）から全体のバイト数。無ければ None"""
+    match = re.match(r"bytes\s+\*/(\d+)", value or "")
+    return int(match.group(1)) if match else None
+
+
+def fetch_resume(url, path, on_progress=None, should_stop=None,
+                 timeout=READ_TIMEOUT, chunk_size=CHUNK_SIZE):
+    """
+    url を path の途中までのファイル（partial_path()）の続きから 1 回だけ取得し、
+    最後まで受信したら path へ移す。成功したら (受信済み, 全体) を返す（全体が不明なら -1）。
+    途中で切れたら例外を送出し、それまでに書いた分は途中までのファイルに残す。
+    サーバーが返した Content-Range の開始位置が途中までのファイルの大きさと違えば書き足さない。
+    on_progress(受信済み, 全体) は書き込むたびに呼ぶ。
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    partial = partial_path(path)
+    offset = partial_size(path)
+    headers = {"User-Agent": USER_AGENT, "Accept-Encoding": "identity"}
+    if offset > 0:
+        headers["Range"] = f"bytes={offset}-"
+    try:
+        response = urlopen(Request(url, headers=headers), timeout=timeout)
+    except HTTPError as e:
+        if e.code == 416 and offset > 0:
+            total = _unsatisfied_total(e.headers.get("Content-Range"))
+            if total == offset:
+                # 前回の時点で最後まで受信していた
+                os.replace(partial, path)
+                return offset, total
+            if total is not None and offset > total:
+                # 途中までのファイルがサーバー上のものより大きい（別物）。最初から取り直す
+                os.truncate(partial, 0)
+                return fetch_resume(url, path, on_progress, should_stop, timeout, chunk_size)
+        raise
+
+    with response:
+        total = -1
+        if response.status == 206:
+            content_range = _parse_content_range(response.headers.get("Content-Range"))
+            if content_range is None:
+                raise ResumeError("invalid Content-Range")
+            start, total = content_range
+            if start != offset:
+                raise ResumeError(f"server resumed at {start}, expected {offset}")
+            mode = "ab"
+        else:
+            # Range を無視して全体が返ってきた
+            offset = 0
+            mode = "wb"
+            length = response.headers.get("Content-Length")
+            if length is not None and length.isdigit():
+                total = int(length)
+
+        received = offset
+        with open(partial, mode) as f:
+            while True:
+                if should_stop is not None and should_stop():
+                    raise ResumeCancelled()
+                # read1 は届いている分だけ返すので、遅い回線でも止める要求にすぐ応じられる
+                chunk = response.read1(chunk_size)
+                if not chunk:
+                    break
+                f.write(chunk)
+                received += len(chunk)
+                if on_progress is not None:
+                    on_progress(received, total)
+
+    if 0 <= total != received:
+        raise ResumeError(f"connection closed at {received} of {total} bytes")
+    os.replace(partial, path)
+    return received, received if total < 0 else total
@@ -4,14 +4,36 @@ VELA Browser - データ管理クラス群
 """
 
 import sqlite3
+import heapq
 import json
+import os
 import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from itertools import islice
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
 from urllib.request import urlopen
 from urllib.error import URLError
 from packaging import version
-from html import escape, unescape
 
-from PySide6.QtCore import QThread, Signal
+from PySide6.QtCore import QObject, QRunnable, QThread, QThreadPool, QTimer, Signal
+
+from urlindex import UrlPrefixIndex
+from urlcanon import CANONICAL_VERSION, canonicalize_url, canonicalize_host
+from bookmarkio import (
+    BookmarkNode, NetscapeBookmarkReader, folder_path_name, split_folder_path,
+    write_atomic, netscape_html_chunks, chromium_json_chunks,
+    ChromiumBookmarkReader, FirefoxBookmarkReader, detect_bookmark_format, open_firefox_places
+)
+from bloomfilter import BloomFilter
+from throughput import ThroughputSampler
+from downloadresume import (
+    ResumeJob, ResumeCancelled, RetryPolicy, fetch_resume, is_retryable, partial_size
+)
+from checksum import ChecksumCancelled, find_expected_sha256, sha256_file
 
 from constants import (
     HISTORY_DB, BOOKMARKS_DB, SESSION_FILE, DOWNLOADS_DB,
@@ -25,95 +47,1754 @@ from constants import (
 # 履歴管理
 # =====================================================================
 
+# 訪問の遷移種別（visits.transition）
+TRANSITION_LINK = 0     # リンク・その他
+TRANSITION_TYPED = 1    # URL バーへの入力
+TRANSITION_RELOAD = 2   # 同じ URL の再読み込み
+
+# frecency（頻度 × 新しさ）のスコア計算
+# 訪問からの経過日数ごとの重み。どれにも当たらなければ FRECENCY_OLD_WEIGHT。
+FRECENCY_BUCKETS = ((4, 100), (14, 70), (31, 50), (90, 30))
+FRECENCY_OLD_WEIGHT = 10
+# URL バーに入力して開いた訪問は、リンク経由の訪問の何倍に数えるか
+FRECENCY_TYPED_BONUS = 2
+# スコア計算に使う直近の訪問数
+FRECENCY_SAMPLE_VISITS = 10
+# URL バー補完でブックマークの候補に加える点数の既定値（直近の訪問 2 回分）
+BOOKMARK_SUGGEST_BOOST = 200
+# 同時に転送するダウンロード数の既定値
+DOWNLOAD_MAX_ACTIVE = 3
+# 完了したダウンロードの SHA-256 を同時に計算する数（ディスクの読み込みが律速になる）
+CHECKSUM_WORKERS = 2
+
+
+def visit_points(transition, age_days=0):
+    """1 回の訪問の点数（経過日数のバケット重み × 遷移種別のボーナス）"""
+    weight = FRECENCY_OLD_WEIGHT
+    for max_age, bucket_weight in FRECENCY_BUCKETS:
+        if age_days <= max_age:
+            weight = bucket_weight
+            break
+    return weight * (FRECENCY_TYPED_BONUS if transition == TRANSITION_TYPED else 1)
+
+
+def _frecency_sql():
+    """
+    urls の行の frecency を計算する SQL 式。
+    直近 FRECENCY_SAMPLE_VISITS 件の訪問の平均点 × 総訪問回数。
+    """
+    cases = " ".join(
+        f"WHEN julianday('now') - julianday(v.visit_time) <= {max_age} THEN {weight}"
+        for max_age, weight in FRECENCY_BUCKETS
+    )
+    return (f"CAST(urls.visit_count * COALESCE(("
+            f"SELECT AVG((CASE {cases} ELSE {FRECENCY_OLD_WEIGHT} END) * "
+            f"(CASE v.transition WHEN {TRANSITION_TYPED} THEN {FRECENCY_TYPED_BONUS} ELSE 1 END)) "
+            f"FROM (SELECT visit_time, transition FROM visits "
+            f"WHERE visits.url_id = urls.id "
+            f"ORDER BY visit_time DESC LIMIT {FRECENCY_SAMPLE_VISITS}) v), 0) AS INTEGER)")
+
+
+# hosts（ホスト単位の集計）への反映。代表 URL・タイトルは訪問回数が最も多い URL のもの。
+# パラメーター: (増やす訪問回数, url)。urls を更新した後に実行する。
+HOSTS_UPSERT_SQL = '''
+    INSERT INTO hosts (host, url, title, visit_count, best_visit_count, last_visit_time)
+    SELECT host, url, title, ?, visit_count, last_visit_time
+    FROM urls WHERE url = ? AND host != ''
+    ON CONFLICT(host) DO UPDATE SET
+        visit_count = hosts.visit_count + excluded.visit_count,
+        last_visit_time = MAX(COALESCE(hosts.last_visit_time, ''), excluded.last_visit_time),
+        url = CASE WHEN excluded.best_visit_count >= hosts.best_visit_count
+                   THEN excluded.url ELSE hosts.url END,
+        title = CASE WHEN excluded.best_visit_count >= hosts.best_visit_count
+                          AND COALESCE(excluded.title, '') != ''
+                     THEN excluded.title ELSE hosts.title END,
+        best_visit_count = MAX(hosts.best_visit_count, excluded.best_visit_count)
+'''
+
+
+_FTS_TOKEN = re.compile(r'[^\W_]+')
+
+
+def _fts_fold(text):
+    """FTS5 の unicode61 トークナイザー（remove_diacritics 2）と同じく小文字にしてダイアクリティカルマークを除く"""
+    text = text.lower()
+    if not text.isascii():
+        text = ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+    return text
+
+
+def _fts_prefix_match(terms, text):
+    """
+    text（_fts_fold 済み）のいずれかの語が、terms の各語で始まるか（urls_fts の "語"* AND ... と同じ条件）。
+    補完候補を frecency 順にたどりながら FTS を使わずに照合するのに使う
+    """
+    if not all(term in text for term in terms):
+        return False
+    tokens = _FTS_TOKEN.findall(text)
+    return all(any(token.startswith(term) for token in tokens) for term in terms)
+
+
+def _url_host(url):
+    """URL のホスト名（SQL 関数 vela_host として登録する）"""
+    try:
+        return urlsplit(url).hostname or ''
+    except ValueError:
+        return ''
+
+
+class HistoryWriter(QObject):
+    """
+    履歴の遅延書き込み（write-behind）クラス。
+
+    loadFinished のたびに DB へコミットすると fsync が UI スレッドを止めるため、
+    訪問はメモリ上のキューに積み、タイマー満了時またはキューが一杯になった時点で
+    1 トランザクションで書き出す。
+    urls は URL ごとに 1 回の UPSERT、visits は訪問ごとに 1 行を追記する。
+    """
+
+    FLUSH_INTERVAL_MS = 2000   # 最初の訪問からフラッシュまでの最大遅延
+    MAX_PENDING = 64           # キュー内 URL 数がこれに達したら即フラッシュ
+    MAX_FLUSH_RETRIES = 5      # 一時的なエラー（SQLITE_BUSY など）で続けて試し直す回数
+
+    def __init__(self, conn, parent=None):
+        super().__init__(parent)
+        self._conn = conn
+        # url -> [title, [(訪問時刻, 遷移種別, 参照元 URL), ...]]（dict は挿入順を保持する）
+        self._pending = {}
+        self._retries = 0  # 一時的なエラーで続けて失敗した回数
+
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(self.FLUSH_INTERVAL_MS)
+        self._flush_timer.timeout.connect(self.flush)
+
+        # 計測用カウンター
+        self.flush_count = 0
+        self.flushed_visits = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    def enqueue(self, url, title, transition=TRANSITION_LINK, referrer=None):
+        """訪問をキューに積む（同一 URL はタイトルをまとめる）"""
+        now = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        entry = self._pending.get(url)
+        if entry:
+            entry[0] = title or entry[0]
+            entry[1].append((now, transition, referrer))
+        else:
+            self._pending[url] = [title, [(now, transition, referrer)]]
+
+        if len(self._pending) >= self.MAX_PENDING:
+            self.flush()
+        elif not self._flush_timer.isActive():
+            self._flush_timer.start()
+
+    def queue_depth(self) -> int:
+        """未書き込みの URL 数"""
+        return len(self._pending)
+
+    def discard(self):
+        """未書き込みの訪問を破棄する（履歴の全削除時に使用）"""
+        self._flush_timer.stop()
+        self._pending = {}
+        self._retries = 0
+
+    def flush(self):
+        """
+        キューの内容を 1 トランザクションで DB に書き出す。
+        DB がロック中（SQLITE_BUSY / SQLITE_LOCKED）なら訪問をキューに戻し、
+        MAX_FLUSH_RETRIES 回までタイマーで試し直す。それ以外のエラーではその分を破棄する。
+        """
+        self._flush_timer.stop()
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+
+        started = time.perf_counter()
+        try:
+            with self._conn:
+                self.write_batch(self._conn.cursor(), batch)
+        except sqlite3.Error as e:
+            if not self._is_transient(e):
+                print(f"[ERROR] HistoryWriter flush failed, {len(batch)} urls dropped: {e}")
+                self._retries = 0
+                return
+            self._requeue(batch)
+            self._retries += 1
+            if self._retries <= self.MAX_FLUSH_RETRIES:
+                print(f"[WARN] HistoryWriter flush deferred ({len(batch)} urls, "
+                      f"retry {self._retries}/{self.MAX_FLUSH_RETRIES}): {e}")
+                self._flush_timer.start()
+            else:
+                # キューは残し、次の訪問か終了時のフラッシュでまた試す
+                print(f"[WARN] HistoryWriter flush gave up retrying ({len(batch)} urls kept): {e}")
+                self._retries = 0
+            return
+
+        self._retries = 0
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.flush_count += 1
+        self.flushed_visits += sum(len(visits) for _title, visits in batch.values())
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self.total_flush_ms += elapsed_ms
+
+    @staticmethod
+    def _is_transient(error):
+        """試し直せば書き込めるエラー（他の接続がロックしている）か"""
+        code = getattr(error, 'sqlite_errorcode', None)
+        if code is not None:
+            return code & 0xff in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+        return isinstance(error, sqlite3.OperationalError) and 'locked' in str(error)
+
+    def _requeue(self, batch):
+        """書けなかった batch をキューの先頭に戻す（URL ごとの訪問は古い順を保つ）"""
+        for url, (title, visits) in self._pending.items():
+            entry = batch.get(url)
+            if entry:
+                entry[0] = title or entry[0]
+                entry[1].extend(visits)
+            else:
+                batch[url] = [title, visits]
+        self._pending = batch
+
+    @staticmethod
+    def write_batch(cursor, batch):
+        """
+        {url: [title, [(visit_time, transition, referrer), ...]]} を書き込む（トランザクション内で呼ぶ）。
+        URL ごとの訪問は古い順に並べておく。
+        """
+        visit_rows = [
+            (visit_time, transition, referrer, url)
+            for url, (_title, visits) in batch.items()
+            for visit_time, transition, referrer in visits
+        ]
+        cursor.executemany('''
+            INSERT INTO urls (url, host, title, visit_count, typed_count, last_visit_time)
+            VALUES (?, vela_host(?), ?, ?, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET
+                title = COALESCE(NULLIF(excluded.title, ''), urls.title),
+                visit_count = urls.visit_count + excluded.visit_count,
+                typed_count = urls.typed_count + excluded.typed_count,
+                last_visit_time = MAX(COALESCE(urls.last_visit_time, ''),
+                                      excluded.last_visit_time)
+        ''', [
+            (url, url, title, len(visits),
+             sum(1 for _, transition, _ in visits if transition == TRANSITION_TYPED),
+             visits[-1][0])
+            for url, (title, visits) in batch.items()
+        ])
+        # 参照元は直前に記録されたその URL の最新の訪問
+        cursor.executemany('''
+            INSERT INTO visits (url_id, visit_time, transition, from_visit)
+            SELECT id, ?, ?, COALESCE((
+                SELECT MAX(v.id) FROM visits v JOIN urls r ON r.id = v.url_id
+                WHERE r.url = ?
+            ), 0)
+            FROM urls WHERE url = ?
+        ''', visit_rows)
+        cursor.executemany(
+            f'UPDATE urls SET frecency = {_frecency_sql()} WHERE url = ?',
+            [(url,) for url in batch]
+        )
+        # ホスト集計（トップサイト用）を訪問数の増分で更新する
+        cursor.executemany(HOSTS_UPSERT_SQL, [
+            (len(visits), url) for url, (_title, visits) in batch.items()
+        ])
+
+    def stats(self) -> dict:
+        """キュー深さとフラッシュ時間の統計を返す"""
+        return {
+            "queue_depth": self.queue_depth(),
+            "flush_count": self.flush_count,
+            "flushed_visits": self.flushed_visits,
+            "last_flush_ms": self.last_flush_ms,
+            "max_flush_ms": self.max_flush_ms,
+            "avg_flush_ms": self.total_flush_ms / self.flush_count if self.flush_count else 0.0,
+        }
+
+
+class UrlIndexLoader(QThread):
+    """history.db から URL 前方一致インデックスを構築するスレッド（専用の読み取り接続を使う）"""
+    loaded = Signal(object)
+    
+    def __init__(self, db_path, parent=None):
+        super().__init__(parent)
+        self.db_path = db_path
+    
+    def run(self):
+        started = time.perf_counter()
+        try:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+            try:
+                index = UrlPrefixIndex.build(conn.execute('SELECT url, frecency FROM urls'))
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"[ERROR] URL index load failed: {e}")
+            return
+        print(f"[INFO] URL index loaded: {len(index)} urls, "
+              f"{index.memory_bytes() / (1024 * 1024):.1f} MB, "
+              f"{(time.perf_counter() - started) * 1000:.0f} ms")
+        self.loaded.emit(index)
+
+
+class HistorySearchWorker(QThread):
+    """
+    履歴検索の専用スレッド（読み取り専用の接続を 1 本持つ）。
+
+    request() は種類（"suggest" など）ごとに入力を約 120 ms デバウンスしてから
+    スレッドに渡す。同じ種類の新しい依頼が来たら、待機中の古い依頼は捨て、
+    実行中なら interrupt() で打ち切る。結果は依頼時に返した世代番号付きで
+    results_ready から届くので、受け手は最新の世代以外を無視すればよい。
+    """
+    results_ready = Signal(str, int, object)
+    
+    DEBOUNCE_MS = 120
+    
+    def __init__(self, db_path, parent=None):
+        super().__init__(parent)
+        self.db_path = db_path
+        self._cond = threading.Condition()
+        self._queue = {}            # 種類 -> (世代, 関数, 引数)
+        self._current = None        # 実行中の (種類, 世代)
+        self._latest = {}           # 種類 -> 最新の世代
+        self._generation = 0
+        self._stopping = False
+        self._conn = None
+        self._debounce_timers = {}  # 種類 -> QTimer（GUI スレッド側）
+        self._debounced = {}        # 種類 -> デバウンス中の (世代, 関数, 引数)
+    
+    def request(self, kind, func, args, debounce_ms=DEBOUNCE_MS):
+        """
+        func(conn, *args) の実行を依頼して世代番号を返す（GUI スレッドから呼ぶ）。
+        debounce_ms の間に同じ種類の依頼が続いた場合は最後の 1 件だけを実行する。
+        """
+        self._generation += 1
+        generation = self._generation
+        self._latest[kind] = generation
+        if debounce_ms <= 0:
+            self._post(kind, (generation, func, args))
+            return generation
+        self._debounced[kind] = (generation, func, args)
+        timer = self._debounce_timers.get(kind)
+        if timer is None:
+            timer = QTimer(self)
+            timer.setSingleShot(True)
+            timer.timeout.connect(lambda: self._post(kind, self._debounced.pop(kind, None)))
+            self._debounce_timers[kind] = timer
+        timer.start(debounce_ms)
+        return generation
+    
+    def latest_generation(self, kind):
+        return self._latest.get(kind, 0)
+    
+    def _post(self, kind, job):
+        if job is None:
+            return
+        with self._cond:
+            self._queue[kind] = job
+            # 同じ種類の古い検索が実行中なら打ち切る
+            if self._current and self._current[0] == kind and self._conn is not None:
+                self._conn.interrupt()
+            self._cond.notify()
+    
+    def stop(self):
+        """スレッドを止める（実行中の検索は打ち切る）"""
+        for timer in self._debounce_timers.values():
+            timer.stop()
+        with self._cond:
+            self._stopping = True
+            if self._current and self._conn is not None:
+                self._conn.interrupt()
+            self._cond.notify()
+        self.wait()
+    
+    def run(self):
+        try:
+            self._conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        except sqlite3.Error as e:
+            print(f"[ERROR] History search worker failed to open database: {e}")
+            return
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopping:
+                    self._cond.wait()
+                if self._stopping:
+                    break
+                kind, (generation, func, args) = next(iter(self._queue.items()))
+                del self._queue[kind]
+                self._current = (kind, generation)
+            try:
+                results = func(self._conn, *args)
+            except sqlite3.OperationalError as e:
+                if "interrupted" not in str(e):
+                    print(f"[ERROR] History search ({kind}) failed: {e}")
+                results = None
+            except sqlite3.Error as e:
+                print(f"[ERROR] History search ({kind}) failed: {e}")
+                results = None
+            with self._cond:
+                self._current = None
+            if results is not None and self._latest.get(kind) == generation:
+                self.results_ready.emit(kind, generation, results)
+        self._conn.close()
+
+
+class HistoryDeletion(QObject):
+    """
+    履歴の期間・ホスト指定削除の 1 回分。
+    HistoryManager.delete_range() / delete_host() が作成して開始する。
+    1 チャンクずつ短いトランザクションで削除し、チャンクの間にイベントループへ戻るため、
+    大量の削除中もブラウザは止まらない。
+    """
+    progress = Signal(int, int)  # (削除済みの訪問数, 対象の訪問数)
+    finished = Signal(int)       # 削除した訪問数
+    
+    CHUNK_INTERVAL_MS = 10
+    
+    def __init__(self, step, total, parent=None):
+        super().__init__(parent)
+        self._step = step  # 1 チャンク削除して (削除した訪問数, 完了したか) を返す
+        self.total = total
+        self.deleted = 0
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._run_chunk)
+    
+    def start(self):
+        self._timer.start(0)
+    
+    def cancel(self):
+        """残りの削除を取りやめる（削除済みの分は戻らない）"""
+        if self._timer.isActive():
+            self._timer.stop()
+            self.finished.emit(self.deleted)
+    
+    def _run_chunk(self):
+        try:
+            deleted, done = self._step()
+        except sqlite3.Error as e:
+            print(f"[ERROR] History deletion failed: {e}")
+            done, deleted = True, 0
+        self.deleted += deleted
+        self.progress.emit(min(self.deleted, self.total), self.total)
+        if done:
+            print(f"[INFO] History deletion finished: {self.deleted} visits")
+            self.finished.emit(self.deleted)
+        else:
+            self._timer.start(self.CHUNK_INTERVAL_MS)
+
+
 class HistoryManager:
-    """履歴管理クラス"""
+    """
+    履歴管理クラス（WAL モードの長寿命接続を 1 本だけ保持する）
+
+    スキーマ:
+      urls   : URL ごとに 1 行（UNIQUE url と集計列）
+      visits : 訪問ごとに 1 行を追記（時刻・遷移種別・参照元の訪問）
+    旧スキーマの history テーブルが残っている DB は、起動後に
+    id 範囲ごとのバッチで urls / visits へ移行してから削除する。
+    URL は urlcanon の正規形で保存し、正規化前の行は同じく起動後のバッチで統合する。
+    保持ポリシー（期間・URL 数・ファイルサイズの上限）を設定すると、
+    アイドル時に古く frecency の低い行から少しずつ削除し、
+    auto_vacuum=INCREMENTAL で作成した DB なら空きページを段階的にファイルから返す
+    （それ以前の DB は空きページを再利用するだけで、VACUUM による変換はしない）。
+    """
+    
+    # FTS5 インデックスのバージョン（meta テーブルに記録し、未構築なら一度だけ再構築する）
+    _FTS_VERSION = "1"
+    _FTS_META_KEY = "urls_fts_version"
+    # bm25 の列ごとの重み（title, url）
+    _FTS_WEIGHTS = (4.0, 1.0)
+    # 補完候補として調べるブックマークの一致件数の上限（新しいものから）
+    _BOOKMARK_SUGGEST_SCAN = 200
+    # これより短い語の前方一致は FTS に渡さず、frecency の高い順にたどって照合する
+    # （"k"* のような語は展開される語が多く、FTS で一致を集めるだけで 100 ms を超える）
+    _SUGGEST_SHORT_TERM = 3
+    # 短い語だけの入力で frecency の高い順にたどる行数の上限
+    _SUGGEST_PROBE_ROWS = 5000
+    # frecency の減衰パス（1 日 1 回、アイドル時に id 範囲ごとに分割して実行）
+    _DECAY_META_KEY = "frecency_decay_date"
+    _DECAY_START_DELAY_MS = 30000
+    _DECAY_CHUNK_ROWS = 1000
+    _DECAY_CHUNK_INTERVAL_MS = 50
+    # 旧 history テーブルからの移行（最初のウィンドウ描画後に開始する）
+    _MIGRATION_META_KEY = "history_migration_last_id"
+    _MIGRATION_START_DELAY_MS = 1000
+    _MIGRATION_CHUNK_ROWS = 2000
+    _MIGRATION_CHUNK_INTERVAL_MS = 20
+    # 保持ポリシーによる期限切れ削除（起動後しばらくしてから開始し、以後は定期的に実行）
+    _RETENTION_START_DELAY_MS = 60000
+    _RETENTION_INTERVAL_MS = 30 * 60 * 1000
+    _RETENTION_CHUNK_ROWS = 500
+    _RETENTION_CHUNK_INTERVAL_MS = 100
+    _VACUUM_CHUNK_PAGES = 256
+    # URL 正規化（urlcanon）の適用済みバージョンと、既存行の正規化の進捗
+    _CANONICAL_META_KEY = "url_canonical_version"
+    _CANONICAL_PROGRESS_KEY = "url_canonical_last_id"
+    # hosts 集計のバージョン（未構築の DB は urls から一度だけ作る）
+    _HOSTS_VERSION = "1"
+    _HOSTS_META_KEY = "hosts_version"
+    # 履歴ビューで並べ替えに使える列 -> キーセット・ページングのキー式
+    PAGE_SORT_KEYS = {
+        "title": "COALESCE(title, '')",
+        "url": "url",
+        "last_visit_time": "last_visit_time",
+        "visit_count": "visit_count",
+    }
     
     def __init__(self):
         self.db_path = HISTORY_DB
+        self._conn = None
+        self._fts_enabled = False
+        self._decay_next_id = 0
+        self._decay_max_id = 0
+        self._migrating = False
+        self._legacy_history = False  # 旧 history テーブルからの移行が残っている
+        self._canonicalizing = False  # 既存の urls の正規化・統合が残っている
+        self._canonical_merged = 0
+        self._auto_vacuum = 0
+        # 保持ポリシー（0 は無制限）
+        self.max_age_days = 0
+        self.max_urls = 0
+        self.max_size_mb = 0
+        self._retention_removed_urls = 0
+        self._retention_removed_visits = 0
+        # URL 前方一致インデックス（load_url_index() で遅延構築）
+        self.url_index = None
+        self._url_index_loader = None
+        self._url_index_requested = False  # 移行中に構築を要求された
+        self._url_index_backlog = []  # 構築中に発生した訪問
+        self._url_index_discarded = False
+        # 補完候補に含めるブックマーク（attach_bookmarks() で検索ワーカーに添付する）
+        self._bookmarks_attached = False
+        self._bookmark_fts_enabled = False
+        self.bookmark_boost = BOOKMARK_SUGGEST_BOOST
         self.init_database()
+        self.writer = HistoryWriter(self._conn)
+        # 検索・補完候補の取得は専用スレッドで行う（GUI スレッドを止めない）
+        self.search_worker = HistorySearchWorker(self.db_path)
+        self.search_worker.results_ready.connect(self._on_search_worker_results)
+        self.search_worker.start()
+        
+        self._decay_timer = QTimer(self.writer)
+        self._decay_timer.setSingleShot(True)
+        self._decay_timer.timeout.connect(self._run_decay_chunk)
+        
+        self._migration_timer = QTimer(self.writer)
+        self._migration_timer.setSingleShot(True)
+        self._migration_timer.timeout.connect(self._run_migration_chunk)
+        if self._migrating:
+            self._migration_timer.start(self._MIGRATION_START_DELAY_MS)
+        else:
+            self.schedule_frecency_decay()
+        
+        self._retention_timer = QTimer(self.writer)
+        self._retention_timer.setSingleShot(True)
+        self._retention_timer.timeout.connect(self._run_retention_chunk)
     
     def init_database(self):
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
+            self._conn = sqlite3.connect(self.db_path)
+            # テーブル作成前にだけ有効（既存 DB の切り替えには VACUUM が要るため行わない）
+            self._conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.create_function('vela_host', 1, _url_host, deterministic=True)
+            self._conn.create_function('vela_canonical_url', 1, canonicalize_url, deterministic=True)
+            with self._conn:
+                cursor = self._conn.cursor()
                 cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS history (
+                    CREATE TABLE IF NOT EXISTS urls (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        url TEXT NOT NULL,
+                        url TEXT NOT NULL UNIQUE,
+                        host TEXT,
                         title TEXT,
-                        visit_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        visit_count INTEGER DEFAULT 1
+                        visit_count INTEGER DEFAULT 0,
+                        typed_count INTEGER DEFAULT 0,
+                        last_visit_time TIMESTAMP,
+                        frecency INTEGER DEFAULT 0
                     )
                 ''')
-                cursor.execute('CREATE INDEX IF NOT EXISTS idx_url ON history(url)')
-                cursor.execute('CREATE INDEX IF NOT EXISTS idx_visit_time ON history(visit_time DESC)')
-                set_db_vela_version(conn)
-                conn.commit()
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS visits (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        url_id INTEGER NOT NULL REFERENCES urls(id),
+                        visit_time TIMESTAMP NOT NULL,
+                        transition INTEGER DEFAULT 0,
+                        from_visit INTEGER DEFAULT 0
+                    )
+                ''')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_urls_last_visit ON urls(last_visit_time DESC)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_urls_frecency ON urls(frecency DESC)')
+                # 履歴ビューの並べ替え（fetch_history_page のキー式と同じ式にする）
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_urls_title ON urls(COALESCE(title, ''))")
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_urls_visit_count ON urls(visit_count)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_visits_time ON visits(visit_time)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_visits_url ON visits(url_id, visit_time)')
+                # ホスト単位の削除と、hosts.last_visit_time の再計算（MAX）に使う
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_urls_host ON urls(host, last_visit_time)')
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS hosts (
+                        host TEXT PRIMARY KEY,
+                        url TEXT,
+                        title TEXT,
+                        visit_count INTEGER DEFAULT 0,
+                        best_visit_count INTEGER DEFAULT 0,
+                        last_visit_time TIMESTAMP
+                    )
+                ''')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_hosts_visit_count ON hosts(visit_count DESC)')
+                # URL の削除（保持ポリシー・範囲削除など）を集計に反映する
+                cursor.execute('''
+                    CREATE TRIGGER IF NOT EXISTS hosts_urls_ad AFTER DELETE ON urls
+                    WHEN old.host != '' BEGIN
+                        UPDATE hosts SET
+                            visit_count = visit_count - old.visit_count,
+                            title = CASE WHEN url = old.url THEN NULL ELSE title END,
+                            best_visit_count = CASE WHEN url = old.url THEN 0 ELSE best_visit_count END,
+                            url = CASE WHEN url = old.url THEN NULL ELSE url END
+                        WHERE host = old.host;
+                        DELETE FROM hosts WHERE host = old.host AND visit_count <= 0;
+                    END
+                ''')
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'history'")
+                if cursor.fetchone():
+                    # 旧スキーマ（移行途中を含む）。typed_count が無い版にも対応する
+                    self._ensure_column(cursor, 'history', 'typed_count', 'INTEGER DEFAULT 0')
+                    self._legacy_history = True
+                    self._migrating = True
+                set_db_vela_version(self._conn)
+                cursor.execute("SELECT value FROM meta WHERE key = ?", (self._CANONICAL_META_KEY,))
+                row = cursor.fetchone()
+                if not row or row[0] != CANONICAL_VERSION:
+                    cursor.execute('SELECT 1 FROM urls LIMIT 1')
+                    if cursor.fetchone():
+                        # 正規化前に記録された行があれば、移行と同じく起動後に少しずつ統合する
+                        self._canonicalizing = True
+                        self._migrating = True
+                    else:
+                        self._mark_canonical(cursor)
+                cursor.execute("SELECT value FROM meta WHERE key = ?", (self._HOSTS_META_KEY,))
+                row = cursor.fetchone()
+                if not self._migrating and (not row or row[0] != self._HOSTS_VERSION):
+                    self._rebuild_hosts(cursor)
+            self._auto_vacuum = self._conn.execute('PRAGMA auto_vacuum').fetchone()[0]
             print("[INFO] History database initialized")
         except sqlite3.Error as e:
             print(f"[ERROR] History database init failed: {e}")
+            return
+        self._init_fts()
     
-    def add_history(self, url, title):
-        if not url or url.startswith("about:") or url.startswith("chrome:"):
+    def _rebuild_hosts(self, cursor):
+        """hosts 集計を urls から作り直す（トランザクション内で呼ぶ）"""
+        cursor.execute('DELETE FROM hosts')
+        cursor.execute('''
+            INSERT INTO hosts (host, url, title, visit_count, best_visit_count, last_visit_time)
+            SELECT host, url, title, total, visit_count, last_visit
+            FROM (
+                SELECT host, url, title, visit_count,
+                       SUM(visit_count) OVER per_host AS total,
+                       MAX(last_visit_time) OVER per_host AS last_visit,
+                       ROW_NUMBER() OVER (PARTITION BY host ORDER BY visit_count DESC) AS rank
+                FROM urls WHERE host != ''
+                WINDOW per_host AS (PARTITION BY host)
+            )
+            WHERE rank = 1
+        ''')
+        cursor.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            (self._HOSTS_META_KEY, self._HOSTS_VERSION)
+        )
+    
+    @staticmethod
+    def _refresh_hosts(cursor, hosts):
+        """指定したホストの hosts 行を urls から作り直す（トランザクション内で呼ぶ）"""
+        for host in set(hosts):
+            if not host:
+                continue
+            cursor.execute('DELETE FROM hosts WHERE host = ?', (host,))
+            cursor.execute('''
+                INSERT INTO hosts (host, url, title, visit_count, best_visit_count, last_visit_time)
+                SELECT host, url, title,
+                       (SELECT SUM(visit_count) FROM urls WHERE host = ?1),
+                       visit_count,
+                       (SELECT MAX(last_visit_time) FROM urls WHERE host = ?1)
+                FROM urls WHERE host = ?1
+                ORDER BY visit_count DESC
+                LIMIT 1
+            ''', (host,))
+    
+    @staticmethod
+    def _ensure_column(cursor, table, column, decl):
+        """列が無ければ追加する。追加した場合 True を返す。"""
+        cursor.execute(f'PRAGMA table_info({table})')
+        if any(row[1] == column for row in cursor.fetchall()):
+            return False
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+        return True
+    
+    def _init_fts(self):
+        """
+        title / url を対象とした FTS5 インデックスを作成する。
+        urls を外部コンテンツとし、トリガーで同期する。
+        既存 DB は meta のバージョンを見て一度だけ rebuild（バックフィル）する。
+        FTS5 が使えない SQLite では LIKE 検索のままにする。
+        """
+        try:
+            with self._conn:
+                cursor = self._conn.cursor()
+                cursor.execute('''
+                    CREATE VIRTUAL TABLE IF NOT EXISTS urls_fts USING fts5(
+                        title, url,
+                        content='urls', content_rowid='id',
+                        tokenize='unicode61 remove_diacritics 2'
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE TRIGGER IF NOT EXISTS urls_fts_ai AFTER INSERT ON urls BEGIN
+                        INSERT INTO urls_fts (rowid, title, url)
+                        VALUES (new.id, new.title, new.url);
+                    END
+                ''')
+                cursor.execute('''
+                    CREATE TRIGGER IF NOT EXISTS urls_fts_ad AFTER DELETE ON urls BEGIN
+                        INSERT INTO urls_fts (urls_fts, rowid, title, url)
+                        VALUES ('delete', old.id, old.title, old.url);
+                    END
+                ''')
+                cursor.execute('''
+                    CREATE TRIGGER IF NOT EXISTS urls_fts_au AFTER UPDATE OF title, url ON urls
+                    WHEN old.title IS NOT new.title OR old.url IS NOT new.url BEGIN
+                        INSERT INTO urls_fts (urls_fts, rowid, title, url)
+                        VALUES ('delete', old.id, old.title, old.url);
+                        INSERT INTO urls_fts (rowid, title, url)
+                        VALUES (new.id, new.title, new.url);
+                    END
+                ''')
+                cursor.execute("SELECT value FROM meta WHERE key = ?", (self._FTS_META_KEY,))
+                row = cursor.fetchone()
+                if not row or row[0] != self._FTS_VERSION:
+                    started = time.perf_counter()
+                    cursor.execute("INSERT INTO urls_fts (urls_fts) VALUES ('rebuild')")
+                    cursor.execute(
+                        "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                        (self._FTS_META_KEY, self._FTS_VERSION)
+                    )
+                    print(f"[INFO] History FTS index rebuilt "
+                          f"({(time.perf_counter() - started) * 1000:.0f} ms)")
+            self._fts_enabled = True
+        except sqlite3.Error as e:
+            print(f"[WARN] History FTS5 unavailable, falling back to LIKE search: {e}")
+    
+    def _run_migration_chunk(self):
+        """
+        旧 history テーブルの 1 チャンク分を urls / visits へ移す（URL は正規形にする）。
+        旧テーブルは URL ごとの最終訪問しか持たないため、1 行を 1 訪問として移す。
+        進捗は meta に記録し、途中で終了しても次回起動時に続きから再開する。
+        """
+        if not self._legacy_history:
+            self._run_canonical_chunk()
             return
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT id, visit_count FROM history WHERE url = ?', (url,))
-                result = cursor.fetchone()
-                if result:
-                    cursor.execute('''
-                        UPDATE history 
-                        SET title = ?, visit_time = CURRENT_TIMESTAMP, visit_count = ?
-                        WHERE id = ?
-                    ''', (title, result[1] + 1, result[0]))
-                else:
-                    cursor.execute('INSERT INTO history (url, title) VALUES (?, ?)', (url, title))
-                set_db_vela_version(conn)
-                conn.commit()
+            with self._conn:
+                cursor = self._conn.cursor()
+                cursor.execute("SELECT value FROM meta WHERE key = ?", (self._MIGRATION_META_KEY,))
+                row = cursor.fetchone()
+                last_id = int(row[0]) if row else 0
+                cursor.execute('''
+                    SELECT MAX(id) FROM (
+                        SELECT id FROM history WHERE id > ? ORDER BY id LIMIT ?
+                    )
+                ''', (last_id, self._MIGRATION_CHUNK_ROWS))
+                upto = cursor.fetchone()[0]
+                if upto is None:
+                    self._finish_migration(cursor)
+                    return
+                cursor.execute('''
+                    INSERT INTO urls (url, host, title, visit_count, typed_count, last_visit_time)
+                    SELECT vela_canonical_url(url), vela_host(url), title, COALESCE(visit_count, 1),
+                           COALESCE(typed_count, 0), visit_time
+                    FROM history WHERE id > ? AND id <= ?
+                    ON CONFLICT(url) DO UPDATE SET
+                        title = COALESCE(NULLIF(urls.title, ''), excluded.title),
+                        visit_count = urls.visit_count + excluded.visit_count,
+                        typed_count = urls.typed_count + excluded.typed_count,
+                        last_visit_time = MAX(COALESCE(urls.last_visit_time, ''),
+                                              excluded.last_visit_time)
+                ''', (last_id, upto))
+                cursor.execute(f'''
+                    INSERT INTO visits (url_id, visit_time, transition, from_visit)
+                    SELECT u.id, COALESCE(h.visit_time, CURRENT_TIMESTAMP), {TRANSITION_LINK}, 0
+                    FROM history h JOIN urls u ON u.url = vela_canonical_url(h.url)
+                    WHERE h.id > ? AND h.id <= ?
+                ''', (last_id, upto))
+                cursor.execute(f'''
+                    UPDATE urls SET frecency = {_frecency_sql()}
+                    WHERE url IN (SELECT vela_canonical_url(url) FROM history WHERE id > ? AND id <= ?)
+                ''', (last_id, upto))
+                cursor.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                    (self._MIGRATION_META_KEY, str(upto))
+                )
+        except sqlite3.Error as e:
+            print(f"[ERROR] History migration failed: {e}")
+            return
+        self._migration_timer.start(self._MIGRATION_CHUNK_INTERVAL_MS)
+    
+    def _finish_migration(self, cursor):
+        """
+        移行済みの旧テーブルを削除する（トランザクション内で呼ぶ）。
+        既存行の正規化が残っていれば続けてそちらを進め、全て終わってから集計等を再開する。
+        """
+        if self._legacy_history:
+            cursor.execute('DROP TABLE IF EXISTS history_fts')
+            cursor.execute('DROP TABLE IF EXISTS history')
+            cursor.execute(
+                "DELETE FROM meta WHERE key IN (?, ?)",
+                (self._MIGRATION_META_KEY, "history_fts_version")
+            )
+            self._legacy_history = False
+            print("[INFO] History migrated to urls/visits schema")
+        if self._canonicalizing:
+            self._migration_timer.start(self._MIGRATION_CHUNK_INTERVAL_MS)
+            return
+        self._rebuild_hosts(cursor)
+        self._migrating = False
+        if self._retention_enabled() and not self._retention_timer.isActive():
+            self._retention_timer.start(self._RETENTION_START_DELAY_MS)
+        self.schedule_frecency_decay()
+        if self._url_index_requested:
+            QTimer.singleShot(0, self.load_url_index)
+    
+    def _run_canonical_chunk(self):
+        """
+        既存の urls を id 順に 1 チャンク分正規化する。
+        正規形が既にある行は訪問をそちらへ付け替えて集計を足し込み、元の行を削除する。
+        hosts 集計は全チャンクの完了後に作り直す。
+        """
+        try:
+            with self._conn:
+                cursor = self._conn.cursor()
+                cursor.execute("SELECT value FROM meta WHERE key = ?", (self._CANONICAL_PROGRESS_KEY,))
+                row = cursor.fetchone()
+                last_id = int(row[0]) if row else 0
+                cursor.execute(
+                    'SELECT id, url FROM urls WHERE id > ? ORDER BY id LIMIT ?',
+                    (last_id, self._MIGRATION_CHUNK_ROWS)
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    self._canonicalizing = False
+                    self._mark_canonical(cursor)
+                    print(f"[INFO] History URLs canonicalized ({self._canonical_merged} duplicates merged)")
+                    self._finish_migration(cursor)
+                    return
+                for url_id, url in rows:
+                    canonical = canonicalize_url(url)
+                    if canonical == url:
+                        continue
+                    cursor.execute('SELECT id FROM urls WHERE url = ?', (canonical,))
+                    target = cursor.fetchone()
+                    if target is None:
+                        cursor.execute(
+                            'UPDATE urls SET url = ?, host = vela_host(?) WHERE id = ?',
+                            (canonical, canonical, url_id)
+                        )
+                        continue
+                    self._merge_url_rows(cursor, url_id, target[0])
+                cursor.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                    (self._CANONICAL_PROGRESS_KEY, str(rows[-1][0]))
+                )
+        except sqlite3.Error as e:
+            print(f"[ERROR] History URL canonicalization failed: {e}")
+            return
+        self._migration_timer.start(self._MIGRATION_CHUNK_INTERVAL_MS)
+    
+    def _merge_url_rows(self, cursor, source_id, target_id):
+        """urls の source_id の行を target_id の行へ統合する"""
+        cursor.execute('UPDATE visits SET url_id = ? WHERE url_id = ?', (target_id, source_id))
+        cursor.execute('''
+            UPDATE urls SET
+                title = COALESCE(NULLIF(urls.title, ''), src.title),
+                visit_count = urls.visit_count + src.visit_count,
+                typed_count = urls.typed_count + src.typed_count,
+                last_visit_time = NULLIF(MAX(COALESCE(urls.last_visit_time, ''),
+                                             COALESCE(src.last_visit_time, '')), '')
+            FROM (SELECT title, visit_count, typed_count, last_visit_time
+                  FROM urls WHERE id = ?) AS src
+            WHERE urls.id = ?
+        ''', (source_id, target_id))
+        cursor.execute('DELETE FROM urls WHERE id = ?', (source_id,))
+        cursor.execute(f'UPDATE urls SET frecency = {_frecency_sql()} WHERE id = ?', (target_id,))
+        self._canonical_merged += 1
+    
+    def _mark_canonical(self, cursor):
+        cursor.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            (self._CANONICAL_META_KEY, CANONICAL_VERSION)
+        )
+        cursor.execute("DELETE FROM meta WHERE key = ?", (self._CANONICAL_PROGRESS_KEY,))
+    
+    @staticmethod
+    def _build_fts_query(query):
+        """
+        入力文字列を FTS5 の MATCH 式に変換する。
+        各語を前方一致（"語"*）にし、複数語は AND で結ぶ。語が無ければ None。
+        """
+        terms = re.findall(r'\w+', query)
+        if not terms:
+            return None
+        return " AND ".join('"' + t.replace('"', '""') + '"*' for t in terms)
+    
+    def add_history(self, url, title, typed=False, referrer=None):
+        """
+        訪問を記録する（url と referrer は正規形にそろえてから書き込む）。
+        typed=True は URL バーへの入力による訪問（frecency でボーナスを与える）。
+        referrer は同じタブで直前に記録した URL（同じ URL なら再読み込みとして扱う）。
+        """
+        if not url or url.startswith(("about:", "chrome:", "vela:")):
+            return
+        url = canonicalize_url(url)
+        if referrer:
+            referrer = canonicalize_url(referrer)
+        if typed:
+            transition = TRANSITION_TYPED
+        elif referrer == url:
+            transition = TRANSITION_RELOAD
+        else:
+            transition = TRANSITION_LINK
+        self.writer.enqueue(url, title, transition, None if typed else referrer)
+        points = visit_points(transition)
+        if self.url_index is not None:
+            self.url_index.touch(url, points)
+        elif self._url_index_loader is not None:
+            self._url_index_backlog.append((url, points))
+    
+    def load_url_index(self):
+        """URL 前方一致インデックスをバックグラウンドで構築する（起動後に一度呼ぶ）"""
+        if self.url_index is not None or self._url_index_loader is not None:
+            return
+        if self._migrating:
+            # 移行が終わってから構築する
+            self._url_index_requested = True
+            return
+        self.writer.flush()
+        self._url_index_loader = UrlIndexLoader(self.db_path)
+        self._url_index_loader.loaded.connect(self._on_url_index_loaded)
+        self._url_index_loader.start()
+    
+    def _on_url_index_loaded(self, index):
+        if self._url_index_discarded:
+            # 構築中に履歴が全削除された
+            index = UrlPrefixIndex()
+        for url, points in self._url_index_backlog:
+            index.touch(url, points)
+        self._url_index_backlog = []
+        self.url_index = index
+    
+    def prefix_suggest(self, text, limit=10):
+        """URL の前方一致候補をメモリ内インデックスから返す（未構築なら空）"""
+        if self.url_index is None:
+            return []
+        return [url for url, _score in self.url_index.lookup(text, limit)]
+    
+    def autofill(self, text):
+        """URL バーのインライン補完文字列を返す（候補が無ければ None）"""
+        if self.url_index is None:
+            return None
+        return self.url_index.autofill(text)
+    
+    def flush(self):
+        """未書き込みの履歴を DB に反映する"""
+        self.writer.flush()
+    
+    def set_retention_policy(self, max_age_days=0, max_urls=0, max_size_mb=0):
+        """
+        履歴の保持ポリシーを設定する（各上限は 0 で無制限）。
+        いずれかが有効なら、起動後しばらくしてから期限切れの削除を始め、以後も定期的に実行する。
+        """
+        self.max_age_days = max(0, int(max_age_days))
+        self.max_urls = max(0, int(max_urls))
+        self.max_size_mb = max(0, int(max_size_mb))
+        if not self._retention_enabled():
+            self._retention_timer.stop()
+        elif not self._retention_timer.isActive() and not self._migrating:
+            self._retention_timer.start(self._RETENTION_START_DELAY_MS)
+    
+    def _retention_enabled(self):
+        return bool(self.max_age_days or self.max_urls or self.max_size_mb)
+    
+    def _run_retention_chunk(self):
+        """
+        保持ポリシーの 1 チャンク分を実行し、残りがあれば次を予約する。
+        1 チャンクは最大 _RETENTION_CHUNK_ROWS 行の削除と
+        _VACUUM_CHUNK_PAGES ページの incremental_vacuum だけなので UI を止めない。
+        """
+        if not self._retention_enabled():
+            return
+        try:
+            with self._conn:
+                removed = self._expire_chunk(self._conn.cursor())
+            freelist = self._conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if self._auto_vacuum == 2 and freelist:
+                # executescript でないと 1 ページしか解放されない
+                self._conn.executescript(f'PRAGMA incremental_vacuum({self._VACUUM_CHUNK_PAGES})')
+        except sqlite3.Error as e:
+            print(f"[ERROR] History retention failed: {e}")
+            self._retention_timer.start(self._RETENTION_INTERVAL_MS)
+            return
+        
+        if removed and self.url_index is not None:
+            for url in removed:
+                self.url_index.remove(url)
+        if removed is not None or (self._auto_vacuum == 2 and freelist):
+            self._retention_timer.start(self._RETENTION_CHUNK_INTERVAL_MS)
+            return
+        if self._retention_removed_urls or self._retention_removed_visits:
+            print(f"[INFO] History retention: {self._retention_removed_urls} urls, "
+                  f"{self._retention_removed_visits} visits expired")
+            self._retention_removed_urls = 0
+            self._retention_removed_visits = 0
+        self._retention_timer.start(self._RETENTION_INTERVAL_MS)
+    
+    def _expire_chunk(self, cursor):
+        """
+        上限を超えている分を 1 チャンクだけ削除する（トランザクション内で呼ぶ）。
+        削除した URL のリスト（訪問だけ削除した場合は空リスト）を返し、
+        どの上限にも掛からなければ None を返す。
+        """
+        limit = self._RETENTION_CHUNK_ROWS
+        if self.max_age_days:
+            cutoff = f'-{self.max_age_days} days'
+            cursor.execute('''
+                SELECT id, url FROM urls
+                WHERE last_visit_time < datetime('now', ?)
+                ORDER BY last_visit_time
+                LIMIT ?
+            ''', (cutoff, limit))
+            rows = cursor.fetchall()
+            if rows:
+                return self._delete_urls(cursor, rows)
+            # 最近も訪問している URL の古い訪問
+            cursor.execute('''
+                SELECT id, url_id, transition FROM visits
+                WHERE visit_time < datetime('now', ?)
+                ORDER BY visit_time
+                LIMIT ?
+            ''', (cutoff, limit))
+            visits = cursor.fetchall()
+            if visits:
+                cursor.executemany('DELETE FROM visits WHERE id = ?', [(visit_id,) for visit_id, _, _ in visits])
+                self._retention_removed_visits += len(visits)
+                self._forget_visits(cursor, visits)
+                return []
+        if self.max_urls:
+            cursor.execute('SELECT COUNT(*) FROM urls')
+            excess = cursor.fetchone()[0] - self.max_urls
+            if excess > 0:
+                return self._delete_urls(cursor, self._least_valuable_urls(cursor, min(excess, limit)))
+        if self.max_size_mb:
+            page_count = cursor.execute('PRAGMA page_count').fetchone()[0]
+            freelist = cursor.execute('PRAGMA freelist_count').fetchone()[0]
+            page_size = cursor.execute('PRAGMA page_size').fetchone()[0]
+            if (page_count - freelist) * page_size > self.max_size_mb * 1024 * 1024:
+                rows = self._least_valuable_urls(cursor, limit)
+                if rows:
+                    return self._delete_urls(cursor, rows)
+        return None
+    
+    def _forget_visits(self, cursor, visits):
+        """
+        削除した訪問 (id, url_id, 遷移種別) の分だけ urls の集計と frecency を戻し、
+        影響したホストの hosts 行を作り直す（トランザクション内で呼ぶ）。
+        """
+        per_url = Counter(url_id for _, url_id, _ in visits)
+        typed = Counter(url_id for _, url_id, transition in visits if transition == TRANSITION_TYPED)
+        cursor.executemany('''
+            UPDATE urls SET
+                visit_count = MAX(visit_count - ?, 0),
+                typed_count = MAX(typed_count - ?, 0)
+            WHERE id = ?
+        ''', [(count, typed[url_id], url_id) for url_id, count in per_url.items()])
+        cursor.executemany(
+            f'UPDATE urls SET frecency = {_frecency_sql()} WHERE id = ?',
+            [(url_id,) for url_id in per_url]
+        )
+        marks = ", ".join("?" * len(per_url))
+        cursor.execute(f'SELECT DISTINCT host FROM urls WHERE id IN ({marks})', list(per_url))
+        self._refresh_hosts(cursor, [row[0] for row in cursor.fetchall()])
+    
+    @staticmethod
+    def _least_valuable_urls(cursor, limit):
+        """frecency が低く最終訪問が古い順に (id, url) を返す"""
+        cursor.execute('''
+            SELECT id, url FROM urls
+            ORDER BY frecency, last_visit_time
+            LIMIT ?
+        ''', (limit,))
+        return cursor.fetchall()
+    
+    def _delete_urls(self, cursor, rows):
+        """URL とその訪問を削除し、削除した URL のリストを返す"""
+        ids = [(url_id,) for url_id, _url in rows]
+        cursor.executemany('DELETE FROM visits WHERE url_id = ?', ids)
+        self._retention_removed_visits += max(cursor.rowcount, 0)
+        cursor.executemany('DELETE FROM urls WHERE id = ?', ids)
+        self._retention_removed_urls += len(ids)
+        return [url for _url_id, url in rows]
+    
+    def close(self):
+        """キューをフラッシュして接続を閉じる（終了時に呼ぶ）"""
+        self._decay_timer.stop()
+        self._migration_timer.stop()
+        self._retention_timer.stop()
+        self.search_worker.stop()
+        if self._url_index_loader is not None:
+            self._url_index_loader.wait()
+        self.writer.flush()
+        stats = self.writer.stats()
+        print(f"[INFO] HistoryWriter: {stats['flush_count']} flushes, "
+              f"{stats['flushed_visits']} visits, "
+              f"avg {stats['avg_flush_ms']:.1f} ms, max {stats['max_flush_ms']:.1f} ms")
+        try:
+            self._conn.close()
+        except sqlite3.Error as e:
+            print(f"[ERROR] History database close failed: {e}")
+    
+    def top_sites(self, limit=12):
+        """
+        新しいタブページ用に訪問回数の多いホストを (host, url, title) で返す。
+        hosts は訪問のたびに増分更新されるため、idx_hosts_visit_count の走査 1 回で済む。
+        """
+        try:
+            cursor = self._conn.cursor()
+            cursor.execute('''
+                SELECT host, COALESCE(url, 'https://' || host || '/'), title
+                FROM hosts
+                ORDER BY visit_count DESC
+                LIMIT ?
+            ''', (limit,))
+            return cursor.fetchall()
         except sqlite3.Error as e:
-            print(f"[ERROR] add_history failed: {e}")
+            print(f"[ERROR] top_sites failed: {e}")
+            return []
     
     def get_history(self, limit=100):
+        self.writer.flush()
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT url, title, visit_time, visit_count 
-                    FROM history 
-                    ORDER BY visit_time DESC 
-                    LIMIT ?
-                ''', (limit,))
-                return cursor.fetchall()
+            cursor = self._conn.cursor()
+            cursor.execute('''
+                SELECT url, title, last_visit_time, visit_count 
+                FROM urls 
+                ORDER BY last_visit_time DESC 
+                LIMIT ?
+            ''', (limit,))
+            return cursor.fetchall()
         except sqlite3.Error as e:
             print(f"[ERROR] get_history failed: {e}")
             return []
     
+    def fetch_history_page(self, after=None, limit=200, sort_column="last_visit_time",
+                           descending=True, query=""):
+        """
+        履歴ビュー用に 1 ページ分を (id, url, title, last_visit_time, visit_count) で返す。
+        after は前ページ最終行の (並べ替えキーの値, id)。OFFSET を使わず
+        (key, id) < (?, ?) のキーセット条件で続きを読むため、深いページでもコストは一定。
+        query を与えると FTS（非 ASCII を含む入力は LIKE）で絞り込む。
+        """
+        if after is None:
+            self.writer.flush()
+        try:
+            return self._query_history_page(self._conn, after, limit, sort_column,
+                                            descending, query, self._fts_enabled)
+        except sqlite3.Error as e:
+            print(f"[ERROR] fetch_history_page failed: {e}")
+            return []
+    
+    @classmethod
+    def _query_history_page(cls, conn, after, limit, sort_column, descending, query, fts_enabled):
+        """fetch_history_page の本体（HistorySearchWorker の読み取り接続からも使う）"""
+        key = cls.PAGE_SORT_KEYS[sort_column]
+        direction = "DESC" if descending else "ASC"
+        conditions, params = [], []
+        if query:
+            fts_query = cls._build_fts_query(query) if fts_enabled else None
+            if fts_query and query.isascii():
+                conditions.append('id IN (SELECT rowid FROM urls_fts WHERE urls_fts MATCH ?)')
+                params.append(fts_query)
+            else:
+                conditions.append('(url LIKE ? OR title LIKE ?)')
+                params += [f'%{query}%', f'%{query}%']
+        if after is not None:
+            conditions.append(f'({key}, id) {"<" if descending else ">"} (?, ?)')
+            params += list(after)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT id, url, title, last_visit_time, visit_count
+            FROM urls
+            {where}
+            ORDER BY {key} {direction}, id {direction}
+            LIMIT ?
+        ''', (*params, limit))
+        return cursor.fetchall()
+    
+    def request_history_page(self, query, sort_column="last_visit_time", descending=True, limit=200):
+        """
+        fetch_history_page の先頭ページを検索ワーカーに依頼し、世代番号を返す。
+        結果は search_worker.results_ready("history_page", 世代番号, 行) で届く。
+        """
+        return self.search_worker.request(
+            "history_page", self._query_history_page,
+            (None, limit, sort_column, descending, query, self._fts_enabled)
+        )
+    
     def search_history(self, query, limit=50):
+        """
+        履歴を検索して関連度順に返す。
+        FTS5 が使える場合は前方一致・複数語 AND で検索し bm25 で順位付けする。
+        日本語など空白で区切られない語は途中一致できないため、
+        非 ASCII を含む入力で FTS に一致が無いときだけ LIKE 検索に切り替える。
+        """
+        fts_query = self._build_fts_query(query) if self._fts_enabled else None
+        if fts_query:
+            try:
+                cursor = self._conn.cursor()
+                cursor.execute('''
+                    SELECT u.url, u.title, u.last_visit_time, u.visit_count
+                    FROM urls_fts
+                    JOIN urls u ON u.id = urls_fts.rowid
+                    WHERE urls_fts MATCH ?
+                    ORDER BY bm25(urls_fts, ?, ?), u.last_visit_time DESC
+                    LIMIT ?
+                ''', (fts_query, *self._FTS_WEIGHTS, limit))
+                results = cursor.fetchall()
+                if results or query.isascii():
+                    return results
+            except sqlite3.Error as e:
+                print(f"[ERROR] search_history (FTS) failed: {e}")
+        return self._search_history_like(query, limit)
+    
+    def suggest(self, query, limit=10):
+        """
+        URL バーの補完候補を frecency 順に [(url, title, スコア, ブックマーク済みか), ...] で返す。
+        ORDER BY frecency LIMIT は idx_urls_frecency で解決できるため、
+        一致件数が多い短い入力でも全件ソートにならない。
+        （ブックマークは検索ワーカーの接続にだけ添付されるため、ここでは履歴のみ）
+        """
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
+            return self._query_suggestions(self._conn, query, limit, self._fts_enabled)
+        except sqlite3.Error as e:
+            print(f"[ERROR] suggest failed: {e}")
+            return []
+    
+    @classmethod
+    def _query_suggestions(cls, conn, query, limit, fts_enabled, bookmarks=None):
+        """
+        suggest の本体（HistorySearchWorker の読み取り接続からも使う）。
+        bookmarks が (ブックマークの FTS 使用可否, ブースト) なら、添付したブックマーク DB の
+        一致も候補にし、frecency にブーストを加えた点数で履歴の候補と合わせて並べる。
+        履歴の URL とブックマークの canonical_url は同じ正規形なので、同じ URL は 1 件にまとめる
+        （ブックマークは利用者が保存したままの URL で返す）。
+        """
+        fts_query = cls._build_fts_query(query) if fts_enabled else None
+        cursor = conn.cursor()
+        results = None
+        if fts_query:
+            results = cls._query_fts_suggestions(cursor, query, fts_query, limit)
+            if not results and not query.isascii():
+                results = None
+        if results is None:
+            cursor.execute('''
+                SELECT url, title, frecency, 0
+                FROM urls
+                WHERE url LIKE ? OR title LIKE ?
+                ORDER BY frecency DESC
+                LIMIT ?
+            ''', (f'%{query}%', f'%{query}%', limit))
+            results = cursor.fetchall()
+        if bookmarks is None:
+            return results
+        
+        bookmark_fts, boost = bookmarks
+        merged = {url: (url, title, score, 0) for url, title, score, _ in results}
+        for url, canonical, title, frecency in cls._query_bookmark_suggestions(cursor, query, bookmark_fts):
+            # 利用者が付けたブックマークのタイトルを優先する
+            merged[canonical] = (url, title, frecency + boost, 1)
+        return sorted(merged.values(), key=lambda item: item[2], reverse=True)[:limit]
+    
+    @classmethod
+    def _query_fts_suggestions(cls, cursor, query, fts_query, limit):
+        """
+        urls_fts に一致する URL を frecency 順に limit 件返す。
+        一致を FTS で集めてから frecency で並べると、"k"* のように展開される語が多い入力では
+        集めるだけで 100 ms を超える。そこでまず idx_urls_frecency を高い順に
+        _SUGGEST_PROBE_ROWS 行までたどって title / url を同じ条件で照合し、limit 件そろえば
+        そこで止める（一致が多い入力ほど早くそろう）。そろわない入力は一致が少ないので FTS で集める。
+        その際も _SUGGEST_SHORT_TERM 文字未満の語は FTS に渡さず、長い語の一致を照合して絞り込む。
+        """
+        if not query.isascii() or '_' in query:
+            terms = None
+        else:
+            terms = _FTS_TOKEN.findall(query.lower())
+        if terms:
+            short = [term for term in terms if len(term) < cls._SUGGEST_SHORT_TERM]
+            # 長い語だけなら FTS は速いので、"com" のようなどこにでもある語を拾う程度にたどる
+            probe_rows = cls._SUGGEST_PROBE_ROWS if short else cls._SUGGEST_PROBE_ROWS // 20
+            cursor.execute('''
+                SELECT url, title, frecency, 0
+                FROM urls
+                ORDER BY frecency DESC
+                LIMIT ?
+            ''', (probe_rows,))
+            results = list(islice(
+                (row for row in cursor if _fts_prefix_match(terms, _fts_fold(f"{row[1] or ''} {row[0]}"))),
+                limit))
+            if len(results) == limit:
+                return results
+            long_query = cls._build_fts_query(
+                ' '.join(term for term in terms if len(term) >= cls._SUGGEST_SHORT_TERM))
+            if short and long_query:
                 cursor.execute('''
-                    SELECT url, title, visit_time, visit_count 
-                    FROM history 
-                    WHERE url LIKE ? OR title LIKE ?
-                    ORDER BY visit_time DESC 
+                    SELECT url, title, frecency, 0
+                    FROM urls
+                    WHERE id IN (SELECT rowid FROM urls_fts WHERE urls_fts MATCH ?)
+                    ORDER BY frecency DESC
+                ''', (long_query,))
+                return list(islice(
+                    (row for row in cursor if _fts_prefix_match(short, _fts_fold(f"{row[1] or ''} {row[0]}"))),
+                    limit))
+        cursor.execute('''
+            SELECT url, title, frecency, 0
+            FROM urls
+            WHERE id IN (SELECT rowid FROM urls_fts WHERE urls_fts MATCH ?)
+            ORDER BY frecency DESC
+            LIMIT ?
+        ''', (fts_query, limit))
+        return cursor.fetchall()
+    
+    @classmethod
+    def _query_bookmark_suggestions(cls, cursor, query, fts_enabled):
+        """
+        添付したブックマーク DB から一致を (url, 正規形, title, 履歴の frecency) で返す。
+        一致が多い短い入力でも、新しいものから _BOOKMARK_SUGGEST_SCAN 件だけ調べる。
+        """
+        fts_query = cls._build_fts_query(query) if fts_enabled else None
+        if fts_query:
+            # FTS5 は rowid の降順に一致をたどれるので、全件を集めずに LIMIT で止まる
+            cursor.execute('''
+                SELECT b.url, b.canonical_url, b.title, COALESCE(u.frecency, 0)
+                FROM (
+                    SELECT rowid FROM bookmarks.bookmarks_fts
+                    WHERE bookmarks_fts MATCH ?
+                    ORDER BY rowid DESC
                     LIMIT ?
-                ''', (f'%{query}%', f'%{query}%', limit))
-                return cursor.fetchall()
+                ) f
+                JOIN bookmarks.bookmarks b ON b.id = f.rowid
+                LEFT JOIN main.urls u ON u.url = b.canonical_url
+            ''', (fts_query, cls._BOOKMARK_SUGGEST_SCAN))
+            rows = cursor.fetchall()
+            if rows or query.isascii():
+                return rows
+        cursor.execute('''
+            SELECT b.url, b.canonical_url, b.title, COALESCE(u.frecency, 0)
+            FROM (
+                SELECT url, canonical_url, title FROM bookmarks.bookmarks
+                WHERE url LIKE ? OR title LIKE ?
+                ORDER BY id DESC
+                LIMIT ?
+            ) b
+            LEFT JOIN main.urls u ON u.url = b.canonical_url
+        ''', (f'%{query}%', f'%{query}%', cls._BOOKMARK_SUGGEST_SCAN))
+        return cursor.fetchall()
+    
+    def request_suggestions(self, query, limit=10):
+        """
+        suggest を検索ワーカーに依頼し、世代番号を返す。
+        attach_bookmarks() 済みならブックマークの一致も含める。
+        結果は search_worker.results_ready("suggest", 世代番号, 行) で届く。
+        """
+        bookmarks = None
+        if self._bookmarks_attached:
+            bookmarks = (self._bookmark_fts_enabled, self.bookmark_boost)
+        return self.search_worker.request(
+            "suggest", self._query_suggestions, (query, limit, self._fts_enabled, bookmarks)
+        )
+    
+    def attach_bookmarks(self, db_path, fts_enabled):
+        """
+        ブックマーク DB を検索ワーカーの接続に読み取り専用で添付し、
+        以後の補完候補にブックマークを含める（添付に失敗したら履歴だけのまま）。
+        """
+        self._bookmark_fts_enabled = fts_enabled
+        self.search_worker.request(
+            "attach_bookmarks", self._attach_bookmarks, (str(db_path),), debounce_ms=0
+        )
+    
+    @staticmethod
+    def _attach_bookmarks(conn, db_path):
+        conn.execute("ATTACH DATABASE ? AS bookmarks", (f"file:{db_path}?mode=ro",))
+        return db_path
+    
+    def set_bookmark_boost(self, points):
+        """補完候補でブックマークの frecency に加える点数を設定する"""
+        self.bookmark_boost = max(0, int(points))
+    
+    def _on_search_worker_results(self, kind, generation, results):
+        if kind == "attach_bookmarks":
+            self._bookmarks_attached = True
+            print("[INFO] Bookmarks attached to URL bar suggestions")
+    
+    def schedule_frecency_decay(self):
+        """
+        frecency の減衰パスを予約する。
+        スコアは訪問時点の経過日数で計算されるため、時間が経った行は
+        1 日 1 回ここで再計算する。
+        起動直後を避けて開始し、id 範囲ごとの小さな UPDATE に分けて実行する。
+        """
+        today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+        try:
+            cursor = self._conn.cursor()
+            cursor.execute("SELECT value FROM meta WHERE key = ?", (self._DECAY_META_KEY,))
+            row = cursor.fetchone()
+            if row and row[0] == today:
+                return
+            cursor.execute('SELECT COALESCE(MAX(id), 0) FROM urls')
+            self._decay_max_id = cursor.fetchone()[0]
+        except sqlite3.Error as e:
+            print(f"[ERROR] schedule_frecency_decay failed: {e}")
+            return
+        self._decay_next_id = 0
+        self._decay_timer.start(self._DECAY_START_DELAY_MS)
+    
+    def _run_decay_chunk(self):
+        """減衰パスの 1 チャンク分を実行し、残りがあれば次を予約する"""
+        start = self._decay_next_id
+        end = start + self._DECAY_CHUNK_ROWS
+        try:
+            with self._conn:
+                cursor = self._conn.cursor()
+                if start <= self._decay_max_id:
+                    frecency = _frecency_sql()
+                    cursor.execute(f'''
+                        UPDATE urls SET frecency = {frecency}
+                        WHERE id > ? AND id <= ? AND frecency != {frecency}
+                    ''', (start, end))
+                else:
+                    today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+                    cursor.execute(
+                        "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                        (self._DECAY_META_KEY, today)
+                    )
+                    print("[INFO] Frecency decay pass finished")
+                    return
+        except sqlite3.Error as e:
+            print(f"[ERROR] frecency decay failed: {e}")
+            return
+        self._decay_next_id = end
+        self._decay_timer.start(self._DECAY_CHUNK_INTERVAL_MS)
+    
+    def _search_history_like(self, query, limit):
+        try:
+            cursor = self._conn.cursor()
+            cursor.execute('''
+                SELECT url, title, last_visit_time, visit_count 
+                FROM urls 
+                WHERE url LIKE ? OR title LIKE ?
+                ORDER BY last_visit_time DESC 
+                LIMIT ?
+            ''', (f'%{query}%', f'%{query}%', limit))
+            return cursor.fetchall()
         except sqlite3.Error as e:
             print(f"[ERROR] search_history failed: {e}")
             return []
     
+    # ------------------------------------------------------------------
+    # 期間・ホスト指定の削除
+    # ------------------------------------------------------------------
+    
+    _DELETE_CHUNK_ROWS = 500
+    
+    @staticmethod
+    def _db_time(value):
+        """datetime を visit_time と同じ UTC の文字列にする（naive は UTC とみなす）"""
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    
+    def delete_range(self, start, end, parent=None):
+        """
+        start 以上 end 未満に行った訪問を削除する HistoryDeletion を開始して返す。
+        idx_visits_time で対象を引き、_DELETE_CHUNK_ROWS 件ずつ削除する。
+        訪問が残らなくなった URL は urls からも削除する。
+        """
+        self.writer.flush()
+        start, end = self._db_time(start), self._db_time(end)
+        try:
+            cursor = self._conn.cursor()
+            cursor.execute(
+                'SELECT COUNT(*) FROM visits WHERE visit_time >= ? AND visit_time < ?',
+                (start, end)
+            )
+            total = cursor.fetchone()[0]
+        except sqlite3.Error as e:
+            print(f"[ERROR] delete_range failed: {e}")
+            total = 0
+        print(f"[INFO] History deletion started: {start} - {end} ({total} visits)")
+        task = HistoryDeletion(lambda: self._delete_range_chunk(start, end), total, parent)
+        task.start()
+        return task
+    
+    def _delete_range_chunk(self, start, end):
+        with self._conn:
+            cursor = self._conn.cursor()
+            cursor.execute('''
+                SELECT id, url_id FROM visits
+                WHERE visit_time >= ? AND visit_time < ?
+                ORDER BY visit_time
+                LIMIT ?
+            ''', (start, end, self._DELETE_CHUNK_ROWS))
+            rows = cursor.fetchall()
+            if not rows:
+                return 0, True
+            cursor.executemany('DELETE FROM visits WHERE id = ?', [(visit_id,) for visit_id, _ in rows])
+            per_url = Counter(url_id for _, url_id in rows)
+            marks = ", ".join("?" * len(per_url))
+            cursor.execute(f'SELECT DISTINCT host FROM urls WHERE id IN ({marks})', list(per_url))
+            hosts = [row[0] for row in cursor.fetchall()]
+            
+            # 訪問が残っていない URL は削除する
+            cursor.execute(f'''
+                SELECT id, url FROM urls
+                WHERE id IN ({marks})
+                  AND NOT EXISTS (SELECT 1 FROM visits WHERE url_id = urls.id)
+            ''', list(per_url))
+            removed = cursor.fetchall()
+            self._remove_urls(cursor, removed)
+            for url_id, _url in removed:
+                del per_url[url_id]
+            
+            # 残った URL は削除した訪問の分だけ集計を戻す
+            survivors = [(count, url_id) for url_id, count in per_url.items()]
+            cursor.executemany('''
+                UPDATE urls SET
+                    visit_count = MAX(visit_count - ?, 0),
+                    last_visit_time = (SELECT MAX(visit_time) FROM visits WHERE url_id = urls.id)
+                WHERE id = ?
+            ''', survivors)
+            cursor.executemany(
+                f'UPDATE urls SET frecency = {_frecency_sql()} WHERE id = ?',
+                [(url_id,) for url_id in per_url]
+            )
+            # 代表 URL（訪問数が最多）も入れ替わりうるため、影響したホストは作り直す
+            self._refresh_hosts(cursor, hosts)
+        return len(rows), False
+    
+    def _remove_urls(self, cursor, rows):
+        """(id, url) の URL を削除し、前方一致インデックスからも外す"""
+        cursor.executemany('DELETE FROM urls WHERE id = ?', [(url_id,) for url_id, _ in rows])
+        if self.url_index is not None:
+            for _url_id, url in rows:
+                self.url_index.remove(url)
+    
+    def delete_host(self, host, include_subdomains=True, parent=None):
+        """
+        ホスト（include_subdomains=True ならそのサブドメインも）の履歴を削除する
+        HistoryDeletion を開始して返す。対象ホストは hosts 集計から求め、
+        以後は idx_urls_host / idx_visits_url 経由で訪問、URL の順にチャンク削除する。
+        """
+        self.writer.flush()
+        host = canonicalize_host(host)
+        try:
+            cursor = self._conn.cursor()
+            if include_subdomains:
+                cursor.execute(
+                    'SELECT host FROM hosts WHERE host = ? OR substr(host, ?) = ?',
+                    (host, -(len(host) + 1), "." + host)
+                )
+                hosts = [row[0] for row in cursor.fetchall()]
+            else:
+                hosts = [host]
+            marks = ", ".join("?" * len(hosts))
+            cursor.execute(f'''
+                SELECT COUNT(*) FROM visits
+                WHERE url_id IN (SELECT id FROM urls WHERE host IN ({marks}))
+            ''', hosts)
+            total = cursor.fetchone()[0]
+        except sqlite3.Error as e:
+            print(f"[ERROR] delete_host failed: {e}")
+            hosts, total = [], 0
+        print(f"[INFO] History deletion started: {host} ({len(hosts)} hosts, {total} visits)")
+        task = HistoryDeletion(lambda: self._delete_host_chunk(hosts), total, parent)
+        task.start()
+        return task
+    
+    def _delete_host_chunk(self, hosts):
+        # URL 単位で訪問ごと消す（hosts の集計は urls の削除トリガーで減算される）
+        with self._conn:
+            cursor = self._conn.cursor()
+            while hosts:
+                cursor.execute(
+                    'SELECT id, url FROM urls WHERE host = ? LIMIT ?',
+                    (hosts[0], self._DELETE_CHUNK_ROWS)
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    hosts.pop(0)
+                    continue
+                cursor.executemany('DELETE FROM visits WHERE url_id = ?', [(url_id,) for url_id, _ in rows])
+                deleted = cursor.rowcount
+                self._remove_urls(cursor, rows)
+                return deleted, False
+        return 0, True
+    
     def clear_history(self):
+        self.writer.discard()
+        self._url_index_backlog = []
+        if self.url_index is not None:
+            self.url_index = UrlPrefixIndex()
+        elif self._url_index_loader is not None:
+            self._url_index_discarded = True
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('DELETE FROM history')
-                conn.commit()
+            with self._conn:
+                cursor = self._conn.cursor()
+                cursor.execute('DELETE FROM hosts')
+                cursor.execute('DELETE FROM visits')
+                cursor.execute('DELETE FROM urls')
+                if self._migrating:
+                    self._migration_timer.stop()
+                    if self._canonicalizing:
+                        self._canonicalizing = False
+                        self._mark_canonical(cursor)
+                    self._finish_migration(cursor)
             print("[INFO] History cleared")
         except sqlite3.Error as e:
             print(f"[ERROR] clear_history failed: {e}")
+    
+    # ------------------------------------------------------------------
+    # 他のブラウザからの取り込み
+    # ------------------------------------------------------------------
+    
+    _IMPORT_BATCH_VISITS = 5000
+    # Firefox の moz_historyvisits.visit_type
+    _FIREFOX_VISIT_TYPED = 2
+    _FIREFOX_VISIT_RELOAD = 9
+    # 埋め込み・ダウンロード・フレーム内のリンクは履歴に出さない（Firefox 自身と同じ）
+    _FIREFOX_SKIPPED_VISITS = (4, 7, 8)
+    
+    def import_firefox_history(self, places_path, progress=None):
+        """
+        Firefox の places.sqlite（moz_places / moz_historyvisits）から訪問履歴を取り込む。
+        ワーカースレッドから呼ぶ（GUI スレッドの接続は使わず、専用の接続で書き込む）。
+        訪問を id 順に _IMPORT_BATCH_VISITS 件ずつ読み、バッチごとに 1 トランザクションで
+        HistoryWriter と同じ手順（urls・visits・frecency・hosts）で書き込む。
+        URL は正規形にそろえ、同じ URL・同じ時刻の訪問が既にあれば飛ばす
+        （同じファイルを再度取り込んでも重複しない）。
+        progress(処理済みの訪問数, 対象の訪問数) をバッチごとに呼ぶ。
+        完了後に GUI スレッドで reload_url_index() を呼ぶこと。
+        """
+        where = f'''
+            p.hidden = 0
+            AND v.visit_type NOT IN ({", ".join(map(str, self._FIREFOX_SKIPPED_VISITS))})
+            AND (p.url LIKE 'http:%' OR p.url LIKE 'https:%' OR p.url LIKE 'file:%')
+        '''
+        try:
+            started = time.perf_counter()
+            source = open_firefox_places(places_path)
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            try:
+                conn.create_function('vela_host', 1, _url_host, deterministic=True)
+                total = source.execute(f'''
+                    SELECT COUNT(*) FROM moz_historyvisits v JOIN moz_places p ON p.id = v.place_id
+                    WHERE {where}
+                ''').fetchone()[0]
+                done = imported = 0
+                last_id = 0
+                while True:
+                    rows = source.execute(f'''
+                        SELECT v.id, p.url, p.title, v.visit_type,
+                               strftime('%Y-%m-%d %H:%M:%S', v.visit_date / 1000000, 'unixepoch')
+                        FROM moz_historyvisits v JOIN moz_places p ON p.id = v.place_id
+                        WHERE v.id > ? AND {where}
+                        ORDER BY v.id LIMIT ?
+                    ''', (last_id, self._IMPORT_BATCH_VISITS)).fetchall()
+                    if not rows:
+                        break
+                    last_id = rows[-1][0]
+                    done += len(rows)
+                    with conn:
+                        imported += self._import_visit_rows(conn.cursor(), rows)
+                    if progress:
+                        progress(done, total)
+            finally:
+                conn.close()
+                source.close()
+            print(f"[INFO] History imported from {places_path}: {imported} visits, "
+                  f"{(time.perf_counter() - started) * 1000:.0f} ms")
+            return True
+        except sqlite3.Error as e:
+            print(f"[ERROR] Failed to import history: {e}")
+            return False
+    
+    def _import_visit_rows(self, cursor, rows):
+        """moz_historyvisits の 1 バッチを書き込み、追加した訪問数を返す（トランザクション内で呼ぶ）"""
+        batch = {}
+        for _visit_id, url, title, visit_type, visit_time in rows:
+            if not visit_time:
+                continue
+            url = canonicalize_url(url)
+            if visit_type == self._FIREFOX_VISIT_TYPED:
+                transition = TRANSITION_TYPED
+            elif visit_type == self._FIREFOX_VISIT_RELOAD:
+                transition = TRANSITION_RELOAD
+            else:
+                transition = TRANSITION_LINK
+            entry = batch.setdefault(url, [None, []])
+            entry[0] = title or entry[0]
+            entry[1].append((visit_time, transition, None))
+        
+        # 取り込み済みの訪問（同じ URL・同じ時刻）を除く
+        for url in list(batch):
+            visits = batch[url]
+            seen = set()
+            kept = []
+            for visit in sorted(visits[1]):
+                if visit[0] in seen:
+                    continue
+                seen.add(visit[0])
+                cursor.execute('''
+                    SELECT 1 FROM visits WHERE visit_time = ?
+                      AND url_id = (SELECT id FROM urls WHERE url = ?)
+                ''', (visit[0], url))
+                if cursor.fetchone() is None:
+                    kept.append(visit)
+            if kept:
+                visits[1] = kept
+            else:
+                del batch[url]
+        if batch:
+            HistoryWriter.write_batch(cursor, batch)
+        return sum(len(visits) for _title, visits in batch.values())
+    
+    def reload_url_index(self):
+        """
+        別の接続で一括して書き込んだ後に、URL 前方一致インデックスを作り直す
+        （まだ構築を依頼されていなければ何もしない）。
+        """
+        if self._url_index_loader is None:
+            return
+        self._url_index_loader.loaded.disconnect(self._on_url_index_loaded)
+        self._url_index_loader.wait()
+        self._url_index_loader = None
+        self._url_index_backlog = []
+        self._url_index_discarded = False
+        self.url_index = None
+        self.load_url_index()
 
 
 # =====================================================================
@@ -121,161 +1802,984 @@ class HistoryManager:
 # =====================================================================
 
 class BookmarkManager:
-    """ブックマーク管理クラス"""
+    """
+    ブックマーク管理クラス（URL は保存したまま、重複の判定は正規形の canonical_url で行う）
+
+    スキーマ:
+      folders     : フォルダ（parent_id と親の中での並び順 position）。id=1 がルート
+      folder_tree : フォルダの閉包テーブル（祖先, 子孫, 深さ）。部分木の移動・削除・
+                    件数の集計を、部分木の大きさと深さに比例する手間で行う
+      bookmarks   : ブックマーク（folder_id と position）。url は利用者が保存したまま、
+                    canonical_url はその正規形。folder 列は旧版の名残で使わない
+    フォルダとブックマークは、親フォルダの中で 1 つの position の並びを共有する。
+    
+    ブックマーク済みの URL（正規形）はメモリ上の集合に持ち、is_bookmarked() は
+    DB を引かずに答える。件数が _BLOOM_THRESHOLD 以上なら Bloom フィルタに切り替え、
+    陽性のときだけ idx_bookmarks_canonical で確かめる。
+    """
+    
+    ROOT_FOLDER_ID = 1
+    _CANONICAL_META_KEY = "url_canonical_version"
+    # 旧版の folder 列（フォルダ名のみ）からフォルダツリーへの移行
+    _TREE_VERSION = "1"
+    _TREE_META_KEY = "bookmark_tree_version"
+    # ブックマーク済み URL の集合を Bloom フィルタに切り替える件数と、その誤判定率
+    _BLOOM_THRESHOLD = 100_000
+    _BLOOM_ERROR_RATE = 0.001
+    # URL バー補完用の FTS5 インデックス（HistoryManager の urls_fts と同じ作り）
+    _FTS_VERSION = "1"
+    _FTS_META_KEY = "bookmarks_fts_version"
+    
+    def __init__(self):
+        self.db_path = BOOKMARKS_DB
+        self._url_counts = Counter()  # 正規形 URL -> ブックマーク数
+        self._url_bloom = None
+        self.fts_enabled = False
+        self.init_database()
+    
+    def init_database(self):
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS bookmarks (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        title TEXT NOT NULL,
+                        url TEXT NOT NULL,
+                        folder TEXT DEFAULT 'root',
+                        created_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                # インポート元の ICON 属性（data: URI）
+                HistoryManager._ensure_column(cursor, 'bookmarks', 'icon', 'TEXT')
+                HistoryManager._ensure_column(cursor, 'bookmarks', 'folder_id', 'INTEGER REFERENCES folders(id)')
+                HistoryManager._ensure_column(cursor, 'bookmarks', 'position', 'INTEGER')
+                # 重複・ブックマーク済みの判定と補完の結合に使う正規形（url 自体は書き換えない）
+                HistoryManager._ensure_column(cursor, 'bookmarks', 'canonical_url', 'TEXT')
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS folders (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        parent_id INTEGER REFERENCES folders(id),
+                        title TEXT NOT NULL,
+                        position INTEGER NOT NULL DEFAULT 0,
+                        created_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS folder_tree (
+                        ancestor INTEGER NOT NULL,
+                        descendant INTEGER NOT NULL,
+                        depth INTEGER NOT NULL,
+                        PRIMARY KEY (ancestor, descendant)
+                    ) WITHOUT ROWID
+                ''')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_folder_tree_descendant ON folder_tree(descendant)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_folders_parent ON folders(parent_id, position)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_bookmarks_folder ON bookmarks(folder_id, position)')
+                cursor.execute('DROP INDEX IF EXISTS idx_bookmarks_url')
+                cursor.execute(
+                    'CREATE INDEX IF NOT EXISTS idx_bookmarks_canonical ON bookmarks(canonical_url, folder_id)')
+                cursor.execute(
+                    "INSERT OR IGNORE INTO folders (id, parent_id, title, position) VALUES (?, NULL, 'root', 0)",
+                    (self.ROOT_FOLDER_ID,)
+                )
+                cursor.execute(
+                    'INSERT OR IGNORE INTO folder_tree (ancestor, descendant, depth) VALUES (?, ?, 0)',
+                    (self.ROOT_FOLDER_ID, self.ROOT_FOLDER_ID)
+                )
+                set_db_vela_version(conn)
+                cursor.execute("SELECT value FROM meta WHERE key = ?", (self._TREE_META_KEY,))
+                row = cursor.fetchone()
+                if not row or row[0] != self._TREE_VERSION:
+                    self._migrate_flat_folders(cursor)
+                cursor.execute("SELECT value FROM meta WHERE key = ?", (self._CANONICAL_META_KEY,))
+                row = cursor.fetchone()
+                self._canonicalize_existing(cursor, not row or row[0] != CANONICAL_VERSION)
+                self._init_fts(cursor)
+                conn.commit()
+                self._load_url_set(cursor)
+            print("[INFO] Bookmarks database initialized")
+        except sqlite3.Error as e:
+            print(f"[ERROR] Bookmarks database init failed: {e}")
+    
+    def _migrate_flat_folders(self, cursor):
+        """
+        旧版の folder 列をフォルダツリーへ移す。
+        「親 / 子」形式の名前（入れ子のインポート）は階層に分け、並び順は id 順にする。
+        """
+        cursor.execute('SELECT DISTINCT folder FROM bookmarks WHERE folder_id IS NULL')
+        folders = [row[0] for row in cursor.fetchall()]
+        for folder in folders:
+            folder_id = self._ensure_folder_path(cursor, split_folder_path(folder))
+            cursor.execute(
+                'UPDATE bookmarks SET folder_id = ? WHERE folder_id IS NULL AND folder IS ?',
+                (folder_id, folder)
+            )
+        # 各フォルダの中では子フォルダを先に、続けてブックマークを並べる
+        cursor.execute('''
+            UPDATE bookmarks SET position = ordered.position
+            FROM (
+                SELECT b.id,
+                       (SELECT COUNT(*) FROM folders f WHERE f.parent_id = b.folder_id)
+                       + ROW_NUMBER() OVER (PARTITION BY b.folder_id ORDER BY b.id) - 1 AS position
+                FROM bookmarks b WHERE b.position IS NULL
+            ) AS ordered
+            WHERE bookmarks.id = ordered.id
+        ''')
+        cursor.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            (self._TREE_META_KEY, self._TREE_VERSION)
+        )
+        if folders:
+            print(f"[INFO] Bookmark folders migrated to tree ({len(folders)} folders)")
+    
+    def _init_fts(self, cursor):
+        """
+        title / url を対象とした FTS5 インデックスを作成する（URL バー補完で検索する）。
+        bookmarks を外部コンテンツとし、トリガーで同期する。
+        FTS5 が使えない SQLite では補完を LIKE 検索のままにする。
+        """
+        try:
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS bookmarks_fts USING fts5(
+                    title, url,
+                    content='bookmarks', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                )
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS bookmarks_fts_ai AFTER INSERT ON bookmarks BEGIN
+                    INSERT INTO bookmarks_fts (rowid, title, url)
+                    VALUES (new.id, new.title, new.url);
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS bookmarks_fts_ad AFTER DELETE ON bookmarks BEGIN
+                    INSERT INTO bookmarks_fts (bookmarks_fts, rowid, title, url)
+                    VALUES ('delete', old.id, old.title, old.url);
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS bookmarks_fts_au AFTER UPDATE OF title, url ON bookmarks
+                WHEN old.title IS NOT new.title OR old.url IS NOT new.url BEGIN
+                    INSERT INTO bookmarks_fts (bookmarks_fts, rowid, title, url)
+                    VALUES ('delete', old.id, old.title, old.url);
+                    INSERT INTO bookmarks_fts (rowid, title, url)
+                    VALUES (new.id, new.title, new.url);
+                END
+            ''')
+            cursor.execute("SELECT value FROM meta WHERE key = ?", (self._FTS_META_KEY,))
+            row = cursor.fetchone()
+            if not row or row[0] != self._FTS_VERSION:
+                started = time.perf_counter()
+                cursor.execute("INSERT INTO bookmarks_fts (bookmarks_fts) VALUES ('rebuild')")
+                cursor.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                    (self._FTS_META_KEY, self._FTS_VERSION)
+                )
+                print(f"[INFO] Bookmarks FTS index rebuilt "
+                      f"({(time.perf_counter() - started) * 1000:.0f} ms)")
+            self.fts_enabled = True
+        except sqlite3.Error as e:
+            print(f"[WARN] Bookmarks FTS5 unavailable, falling back to LIKE search: {e}")
+    
+    def _canonicalize_existing(self, cursor, all_rows):
+        """
+        canonical_url を埋める。all_rows なら（正規化の版が変わった）全行を計算し直し、
+        そうでなければ未設定の行（列を追加した直後・旧版で追加した行）だけを埋める。
+        url は書き換えず、正規形が同じブックマークも削除しない。
+        """
+        if all_rows:
+            cursor.execute('SELECT id, url FROM bookmarks')
+        else:
+            cursor.execute('SELECT id, url FROM bookmarks WHERE canonical_url IS NULL')
+        updates = [(canonicalize_url(url), bm_id) for bm_id, url in cursor.fetchall()]
+        cursor.executemany('UPDATE bookmarks SET canonical_url = ? WHERE id = ?', updates)
+        cursor.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            (self._CANONICAL_META_KEY, CANONICAL_VERSION)
+        )
+        if updates:
+            print(f"[INFO] Bookmark canonical URLs updated ({len(updates)} rows)")
+    
+    # ------------------------------------------------------------------
+    # ブックマーク済み URL の集合
+    # ------------------------------------------------------------------
+    
+    def _load_url_set(self, cursor):
+        cursor.execute('SELECT COUNT(*) FROM bookmarks')
+        total = cursor.fetchone()[0]
+        cursor.execute('SELECT canonical_url FROM bookmarks')
+        if total < self._BLOOM_THRESHOLD:
+            self._url_counts = Counter(url for (url,) in cursor)
+            self._url_bloom = None
+            return
+        # 追加の余地を見込んで 2 倍の容量で作る
+        bloom = BloomFilter(total * 2, self._BLOOM_ERROR_RATE)
+        bloom.update(url for (url,) in cursor)
+        self._url_bloom = bloom
+        self._url_counts = None
+        print(f"[INFO] Bookmarked URL set: Bloom filter ({total} urls, "
+              f"{bloom.memory_bytes() / 1024:.0f} KB)")
+    
+    def _reload_url_set(self):
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                self._load_url_set(conn.cursor())
+        except sqlite3.Error as e:
+            print(f"[ERROR] Bookmarked URL set reload failed: {e}")
+    
+    def _note_added(self, urls):
+        if self._url_bloom is not None:
+            for url in urls:
+                self._url_bloom.add(url)
+            if self._url_bloom.is_full():
+                self._reload_url_set()
+            return
+        self._url_counts.update(urls)
+        if len(self._url_counts) >= self._BLOOM_THRESHOLD:
+            self._reload_url_set()
+    
+    def _note_removed(self, urls):
+        # Bloom フィルタからは消せないため、削除済みの URL は陽性の確認で落とす
+        if self._url_counts is None:
+            return
+        self._url_counts.subtract(urls)
+        for url in set(urls):
+            if self._url_counts[url] <= 0:
+                del self._url_counts[url]
+    
+    def _maybe_bookmarked(self, canonical_url):
+        """メモリ上の集合だけで判定する（Bloom フィルタのときは偽陽性がありうる）"""
+        if self._url_bloom is not None:
+            return canonical_url in self._url_bloom
+        return canonical_url in self._url_counts
+    
+    def is_bookmarked(self, url):
+        """URL（正規化前でもよい）がいずれかのフォルダにブックマークされているか"""
+        canonical = canonicalize_url(url)
+        if not self._maybe_bookmarked(canonical):
+            return False
+        if self._url_bloom is None:
+            return True
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT 1 FROM bookmarks WHERE canonical_url = ? LIMIT 1', (canonical,))
+                return cursor.fetchone() is not None
+        except sqlite3.Error as e:
+            print(f"[ERROR] is_bookmarked failed: {e}")
+            return False
+    
+    @staticmethod
+    def _exists_in_folder(cursor, canonical_url, folder_id):
+        cursor.execute(
+            'SELECT 1 FROM bookmarks WHERE canonical_url = ? AND folder_id = ? LIMIT 1',
+            (canonical_url, folder_id)
+        )
+        return cursor.fetchone() is not None
+    
+    # ------------------------------------------------------------------
+    # フォルダ
+    # ------------------------------------------------------------------
+    
+    @staticmethod
+    def _next_position(cursor, folder_id):
+        """フォルダの末尾の position（子フォルダとブックマークで共有）"""
+        cursor.execute('''
+            SELECT MAX(COALESCE((SELECT MAX(position) FROM folders WHERE parent_id = ?), -1),
+                       COALESCE((SELECT MAX(position) FROM bookmarks WHERE folder_id = ?), -1)) + 1
+        ''', (folder_id, folder_id))
+        return cursor.fetchone()[0]
+    
+    def _create_folder(self, cursor, title, parent_id, positions=None):
+        """positions（フォルダ id -> 次の position）を渡すと、未挿入の分も含めて末尾を決める"""
+        if positions is None:
+            position = self._next_position(cursor, parent_id)
+        else:
+            position = positions.get(parent_id)
+            if position is None:
+                position = self._next_position(cursor, parent_id)
+            positions[parent_id] = position + 1
+        cursor.execute(
+            'INSERT INTO folders (parent_id, title, position) VALUES (?, ?, ?)',
+            (parent_id, title, position)
+        )
+        folder_id = cursor.lastrowid
+        # 親の祖先すべて + 自分自身への経路
+        cursor.execute('''
+            INSERT INTO folder_tree (ancestor, descendant, depth)
+            SELECT ancestor, ?, depth + 1 FROM folder_tree WHERE descendant = ?
+            UNION ALL SELECT ?, ?, 0
+        ''', (folder_id, parent_id, folder_id, folder_id))
+        return folder_id
+    
+    def _ensure_folder_path(self, cursor, names, cache=None, positions=None):
+        """ルートからのフォルダ名の並びに対応するフォルダ id を返す（無い階層は作る）"""
+        folder_id = self.ROOT_FOLDER_ID
+        for depth, name in enumerate(names, 1):
+            key = tuple(names[:depth])
+            if cache is not None and key in cache:
+                folder_id = cache[key]
+                continue
+            cursor.execute(
+                'SELECT id FROM folders WHERE parent_id = ? AND title = ? ORDER BY position LIMIT 1',
+                (folder_id, name)
+            )
+            row = cursor.fetchone()
+            folder_id = row[0] if row else self._create_folder(cursor, name, folder_id, positions)
+            if cache is not None:
+                cache[key] = folder_id
+        return folder_id
+    
+    def create_folder(self, title, parent_id=ROOT_FOLDER_ID):
+        """フォルダを parent_id の末尾に作成して id を返す"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                folder_id = self._create_folder(conn.cursor(), title, parent_id)
+                conn.commit()
+            return folder_id
+        except sqlite3.Error as e:
+            print(f"[ERROR] create_folder failed: {e}")
+            return None
+    
+    def get_folders(self):
+        """全フォルダを [(id, パス名), ...] としてツリーの表示順に返す（ルートは 'root'）"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT id, parent_id, title FROM folders ORDER BY parent_id, position')
+                children = {}
+                for folder_id, parent_id, title in cursor.fetchall():
+                    children.setdefault(parent_id, []).append((folder_id, title))
+        except sqlite3.Error as e:
+            print(f"[ERROR] get_folders failed: {e}")
+            return [(self.ROOT_FOLDER_ID, 'root')]
+        result = [(self.ROOT_FOLDER_ID, 'root')]
+        stack = [(folder_id, (title,)) for folder_id, title in reversed(children.get(self.ROOT_FOLDER_ID, []))]
+        while stack:
+            folder_id, path = stack.pop()
+            result.append((folder_id, folder_path_name(path)))
+            stack.extend((child_id, path + (title,))
+                         for child_id, title in reversed(children.get(folder_id, [])))
+        return result
+    
+    def get_children(self, folder_id=ROOT_FOLDER_ID):
+        """
+        フォルダ直下の要素を position 順に [(種類, id, タイトル, URL), ...] で返す。
+        種類は 'folder' か 'bookmark'（フォルダの URL は None）。
+        """
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT kind, id, title, url FROM (
+                        SELECT 'folder' AS kind, id, title, NULL AS url, position
+                        FROM folders WHERE parent_id = ?
+                        UNION ALL
+                        SELECT 'bookmark', id, title, url, position
+                        FROM bookmarks WHERE folder_id = ?
+                    )
+                    ORDER BY position
+                ''', (folder_id, folder_id))
+                return cursor.fetchall()
+        except sqlite3.Error as e:
+            print(f"[ERROR] get_children failed: {e}")
+            return []
+    
+    def fetch_children_page(self, folder_id, after_position=None, limit=200):
+        """
+        フォルダ直下の要素を position 順に 1 ページ分返す（ツリービューの遅延読み込み用）。
+        after_position は前ページ最終行の position（キーセット方式）。
+        行は (種類, id, タイトル, URL, position, 子の有無)。ブックマークの子の有無は常に 0。
+        """
+        if after_position is None:
+            after_position = -1
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                # それぞれ索引順に limit 件だけ取り出してから合わせる（全件の並べ替えを避ける）
+                cursor.execute('''
+                    SELECT kind, id, title, url, position, has_children FROM (
+                        SELECT * FROM (
+                            SELECT 'folder' AS kind, f.id, f.title, NULL AS url, f.position,
+                                   EXISTS (SELECT 1 FROM folders WHERE parent_id = f.id)
+                                   OR EXISTS (SELECT 1 FROM bookmarks WHERE folder_id = f.id)
+                                   AS has_children
+                            FROM folders f WHERE f.parent_id = ? AND f.position > ?
+                            ORDER BY f.position LIMIT ?
+                        )
+                        UNION ALL
+                        SELECT * FROM (
+                            SELECT 'bookmark', id, title, url, position, 0
+                            FROM bookmarks WHERE folder_id = ? AND position > ?
+                            ORDER BY position LIMIT ?
+                        )
+                    )
+                    ORDER BY position
+                    LIMIT ?
+                ''', (folder_id, after_position, limit, folder_id, after_position, limit, limit))
+                return cursor.fetchall()
+        except sqlite3.Error as e:
+            print(f"[ERROR] fetch_children_page failed: {e}")
+            return []
+    
+    def count_bookmarks(self, folder_id):
+        """フォルダ以下（サブフォルダを含む）のブックマーク数"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT COUNT(*) FROM bookmarks
+                    WHERE folder_id IN (SELECT descendant FROM folder_tree WHERE ancestor = ?)
+                ''', (folder_id,))
+                return cursor.fetchone()[0]
+        except sqlite3.Error as e:
+            print(f"[ERROR] count_bookmarks failed: {e}")
+            return 0
     
-    def __init__(self):
-        self.db_path = BOOKMARKS_DB
-        self.init_database()
+    def move_folder(self, folder_id, parent_id):
+        """フォルダを部分木ごと parent_id の末尾へ移動する（自分の子孫へは移動できない）"""
+        if folder_id == self.ROOT_FOLDER_ID:
+            return False
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    'SELECT 1 FROM folder_tree WHERE ancestor = ? AND descendant = ?',
+                    (folder_id, parent_id)
+                )
+                if cursor.fetchone():
+                    print("[WARN] move_folder: cannot move a folder into its own subtree")
+                    return False
+                # 部分木の外の祖先からの経路を外し、新しい親の祖先からの経路を張り直す
+                cursor.execute('''
+                    DELETE FROM folder_tree
+                    WHERE descendant IN (SELECT descendant FROM folder_tree WHERE ancestor = ?)
+                      AND ancestor NOT IN (SELECT descendant FROM folder_tree WHERE ancestor = ?)
+                ''', (folder_id, folder_id))
+                cursor.execute('''
+                    INSERT INTO folder_tree (ancestor, descendant, depth)
+                    SELECT above.ancestor, below.descendant, above.depth + below.depth + 1
+                    FROM folder_tree above, folder_tree below
+                    WHERE above.descendant = ? AND below.ancestor = ?
+                ''', (parent_id, folder_id))
+                cursor.execute(
+                    'UPDATE folders SET parent_id = ?, position = ? WHERE id = ?',
+                    (parent_id, self._next_position(cursor, parent_id), folder_id)
+                )
+                conn.commit()
+            return True
+        except sqlite3.Error as e:
+            print(f"[ERROR] move_folder failed: {e}")
+            return False
     
-    def init_database(self):
+    def delete_folder(self, folder_id):
+        """フォルダを部分木（サブフォルダとブックマーク）ごと削除する"""
+        if folder_id == self.ROOT_FOLDER_ID:
+            return
         try:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
+                cursor.execute('SELECT descendant FROM folder_tree WHERE ancestor = ?', (folder_id,))
+                subtree = cursor.fetchall()
                 cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS bookmarks (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        title TEXT NOT NULL,
-                        url TEXT NOT NULL,
-                        folder TEXT DEFAULT 'root',
-                        created_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-                set_db_vela_version(conn)
+                    SELECT canonical_url FROM bookmarks
+                    WHERE folder_id IN (SELECT descendant FROM folder_tree WHERE ancestor = ?)
+                ''', (folder_id,))
+                urls = [row[0] for row in cursor.fetchall()]
+                cursor.executemany('DELETE FROM bookmarks WHERE folder_id = ?', subtree)
+                cursor.executemany('DELETE FROM folders WHERE id = ?', subtree)
+                cursor.executemany('DELETE FROM folder_tree WHERE descendant = ?', subtree)
                 conn.commit()
-            print("[INFO] Bookmarks database initialized")
+            self._note_removed(urls)
+            print(f"[INFO] Bookmark folder deleted: {folder_id} ({len(subtree)} folders)")
         except sqlite3.Error as e:
-            print(f"[ERROR] Bookmarks database init failed: {e}")
+            print(f"[ERROR] delete_folder failed: {e}")
+    
+    # ------------------------------------------------------------------
+    # ブックマーク
+    # ------------------------------------------------------------------
     
-    def add_bookmark(self, title, url, folder='root'):
+    def add_bookmark(self, title, url, folder='root', folder_id=None):
+        """
+        ブックマークをフォルダの末尾に追加し、追加した行の id を返す。
+        folder_id が無ければ folder をルートからのパス名とみなし、無い階層は作る。
+        url は入力のまま保存する。同じフォルダに正規形が同じ URL が既にあれば追加せず None を返す。
+        """
+        canonical = canonicalize_url(url)
         try:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
-                cursor.execute('INSERT INTO bookmarks (title, url, folder) VALUES (?, ?, ?)', 
-                              (title, url, folder))
+                if folder_id is None:
+                    folder_id = self._ensure_folder_path(cursor, split_folder_path(folder))
+                if self._maybe_bookmarked(canonical) and self._exists_in_folder(cursor, canonical, folder_id):
+                    print(f"[INFO] Bookmark already exists: {url}")
+                    return None
+                cursor.execute(
+                    'INSERT INTO bookmarks (title, url, canonical_url, folder_id, position) VALUES (?, ?, ?, ?, ?)',
+                    (title, url, canonical, folder_id, self._next_position(cursor, folder_id))
+                )
+                bookmark_id = cursor.lastrowid
                 set_db_vela_version(conn)
                 conn.commit()
+            self._note_added([canonical])
             print(f"[INFO] Bookmark added: {title}")
+            return bookmark_id
         except sqlite3.Error as e:
             print(f"[ERROR] add_bookmark failed: {e}")
+            return None
     
-    def get_bookmarks(self, folder=None):
+    def get_bookmarks(self, folder_id=None):
+        """[(id, タイトル, URL, フォルダのパス名), ...] をフォルダ・並び順に返す"""
+        paths = dict(self.get_folders())
         try:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
-                if folder:
-                    cursor.execute('SELECT id, title, url, folder FROM bookmarks WHERE folder = ?', (folder,))
+                if folder_id is not None:
+                    cursor.execute(
+                        'SELECT id, title, url, folder_id FROM bookmarks WHERE folder_id = ? ORDER BY position',
+                        (folder_id,)
+                    )
                 else:
-                    cursor.execute('SELECT id, title, url, folder FROM bookmarks')
-                return cursor.fetchall()
+                    cursor.execute('SELECT id, title, url, folder_id FROM bookmarks ORDER BY folder_id, position')
+                return [(bm_id, title, url, paths.get(fid, 'root'))
+                        for bm_id, title, url, fid in cursor.fetchall()]
         except sqlite3.Error as e:
             print(f"[ERROR] get_bookmarks failed: {e}")
             return []
     
-    def get_folders(self):
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT DISTINCT folder FROM bookmarks')
-                results = [row[0] for row in cursor.fetchall()]
-            return results if results else ['root']
-        except sqlite3.Error as e:
-            print(f"[ERROR] get_folders failed: {e}")
-            return ['root']
-    
     def delete_bookmark(self, bookmark_id):
         try:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
+                cursor.execute('SELECT canonical_url FROM bookmarks WHERE id = ?', (bookmark_id,))
+                urls = [row[0] for row in cursor.fetchall()]
                 cursor.execute('DELETE FROM bookmarks WHERE id = ?', (bookmark_id,))
                 conn.commit()
+            self._note_removed(urls)
         except sqlite3.Error as e:
             print(f"[ERROR] delete_bookmark failed: {e}")
     
-    def export_html(self, filepath):
-        """HTML形式でエクスポート（Netscape Bookmark File Format）"""
-        bookmarks = self.get_bookmarks()
-        folders = {}
-        
-        for bm_id, title, url, folder in bookmarks:
-            if folder not in folders:
-                folders[folder] = []
-            folders[folder].append((title, url))
-        
-        html = [
-            '<!DOCTYPE NETSCAPE-Bookmark-file-1>',
-            '<!-- This is an automatically generated file.',
-            '     It will be read and overwritten.',
-            '     DO NOT EDIT! -->',
-            '<META HTTP-EQUIV="Content-Type" CONTENT="text/html; charset=UTF-8">',
-            f'<TITLE>Bookmarks - {BROWSER_FULL_NAME}</TITLE>',
-            '<H1>Bookmarks</H1>',
-            '<DL><p>'
-        ]
-        
-        for folder, items in folders.items():
-            if folder != 'root':
-                html.append(f'    <DT><H3>{escape(folder)}</H3>')
-                html.append('    <DL><p>')
-            
-            for title, url in items:
-                html.append(f'        <DT><A HREF="{escape(url)}">{escape(title)}</A>')
-            
-            if folder != 'root':
-                html.append('    </DL><p>')
-        
-        html.append('</DL><p>')
-        
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(html))
+    def _iter_tree(self, conn):
+        """
+        フォルダツリーを深さ優先・position 順に BookmarkNode としてたどる（ルート自体は含まない）。
+        各階層ではフォルダとブックマークの 2 本のカーソルを索引順に読んで併合するため、
+        メモリに載るのは階層の深さ分のカーソルだけになる。
+        """
+        def children(folder_id):
+            folders = conn.execute('''
+                SELECT position, 0, id, title, NULL, CAST(strftime('%s', created_time) AS INTEGER), NULL
+                FROM folders WHERE parent_id = ? ORDER BY position
+            ''', (folder_id,))
+            bookmarks = conn.execute('''
+                SELECT position, 1, id, title, url, CAST(strftime('%s', created_time) AS INTEGER), icon
+                FROM bookmarks WHERE folder_id = ? ORDER BY position
+            ''', (folder_id,))
+            return heapq.merge(folders, bookmarks)
         
-        print(f"[INFO] Bookmarks exported to {filepath}")
+        stack = [children(self.ROOT_FOLDER_ID)]
+        while stack:
+            row = next(stack[-1], None)
+            if row is None:
+                stack.pop()
+                if stack:
+                    yield BookmarkNode("end", None, None, None, None)
+                continue
+            _position, is_bookmark, item_id, title, url, add_date, icon = row
+            if is_bookmark:
+                yield BookmarkNode("bookmark", title, url, add_date, icon)
+            else:
+                yield BookmarkNode("folder", title, None, add_date, None)
+                stack.append(children(item_id))
     
-    def import_html(self, filepath):
-        """HTML形式でインポート"""
+    def _export(self, filepath, format_chunks, label):
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            current_folder = 'root'
-            h3_pattern = re.compile(r'<H3[^>]*>(.*?)</H3>', re.IGNORECASE)
-            a_pattern = re.compile(r'<A\s+HREF="([^"]+)"[^>]*>(.*?)</A>', re.IGNORECASE)
-            
-            lines = content.split('\n')
-            for line in lines:
-                h3_match = h3_pattern.search(line)
-                if h3_match:
-                    current_folder = unescape(h3_match.group(1))
+            started = time.perf_counter()
+            # 書き出し中に他の接続が書き込んでも、1 つの読み取りトランザクションの内容で書く
+            with sqlite3.connect(self.db_path, isolation_level=None) as conn:
+                conn.execute('BEGIN')
+                try:
+                    write_atomic(filepath, format_chunks(self._iter_tree(conn)))
+                finally:
+                    conn.execute('COMMIT')
+            print(f"[INFO] Bookmarks exported to {filepath} ({label}, "
+                  f"{(time.perf_counter() - started) * 1000:.0f} ms)")
+            return True
+        except (OSError, sqlite3.Error) as e:
+            print(f"[ERROR] Failed to export bookmarks: {e}")
+            return False
+    
+    def export_html(self, filepath):
+        """
+        HTML形式でエクスポート（Netscape Bookmark File Format、フォルダは入れ子の <DL>）。
+        DB から読みながら書き出し、完了してから filepath を置き換える。
+        """
+        return self._export(
+            filepath, lambda nodes: netscape_html_chunks(nodes, f"Bookmarks - {BROWSER_FULL_NAME}"), "HTML")
+    
+    def export_json(self, filepath):
+        """Chromium の Bookmarks（JSON）形式でエクスポート（ツリーはブックマーク バーの下に置く）"""
+        return self._export(filepath, chromium_json_chunks, "JSON")
+    
+    _IMPORT_BATCH_ROWS = 2000
+    
+    def import_records(self, records, progress=None):
+        """
+        BookmarkRecord の反復を 1 トランザクションでまとめて追加し、追加件数を返す。
+        records は逐次パーサーの出力をそのまま受け取り、_IMPORT_BATCH_ROWS 件ずつ
+        executemany で挿入する（全件をメモリに載せない）。progress(追加済み件数) をバッチごとに呼ぶ。
+        フォルダはパスごとに一度だけ解決（無ければ作成）し、各フォルダの末尾に順に追加する。
+        URL はレコードのまま保存し、同じフォルダに正規形が同じ URL が既にあるレコードは飛ばす。
+        失敗した場合は全件ロールバックして例外を送出する。
+        """
+        records = iter(records)
+        count = 0
+        folder_ids = {}   # フォルダ名の並び -> フォルダ id
+        positions = {}    # フォルダ id -> 次の position
+        # このインポートで追加した URL。陽性なら DB（同じトランザクション）で確かめる
+        # （_load_url_set と同じく、_BLOOM_THRESHOLD 件までは集合で持ち、超えたら Bloom フィルタにする）
+        seen = set()
+        added_urls = []   # 多すぎるときは None にして、コミット後に集合を読み直す
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            while True:
+                batch = list(islice(records, self._IMPORT_BATCH_ROWS))
+                if not batch:
+                    break
+                rows = []
+                batch_keys = set()  # まだ INSERT していない (フォルダ id, 正規形)
+                for record in batch:
+                    folder_id = self._ensure_folder_path(cursor, record.folders, folder_ids, positions)
+                    canonical = canonicalize_url(record.url)
+                    key = (folder_id, canonical)
+                    if key in batch_keys:
+                        continue
+                    if ((canonical in seen or self._maybe_bookmarked(canonical))
+                            and self._exists_in_folder(cursor, canonical, folder_id)):
+                        continue
+                    batch_keys.add(key)
+                    seen.add(canonical)
+                    if isinstance(seen, set) and len(seen) >= self._BLOOM_THRESHOLD:
+                        bloom = BloomFilter(self._BLOOM_THRESHOLD * 2, self._BLOOM_ERROR_RATE)
+                        bloom.update(seen)
+                        seen = bloom
+                    if added_urls is not None:
+                        added_urls.append(canonical)
+                        if len(added_urls) >= self._BLOOM_THRESHOLD:
+                            added_urls = None
+                    if folder_id not in positions:
+                        positions[folder_id] = self._next_position(cursor, folder_id)
+                    rows.append((
+                        record.title or record.url, record.url, canonical,
+                        folder_id, positions[folder_id], record.icon,
+                        datetime.fromtimestamp(record.add_date, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+                        if record.add_date else None
+                    ))
+                    positions[folder_id] += 1
+                if not rows:
                     continue
-                
-                a_match = a_pattern.search(line)
-                if a_match:
-                    url = unescape(a_match.group(1))
-                    title = unescape(a_match.group(2))
-                    self.add_bookmark(title, url, current_folder)
-            
-            print(f"[INFO] Bookmarks imported from {filepath}")
+                cursor.executemany('''
+                    INSERT INTO bookmarks (title, url, canonical_url, folder_id, position, icon, created_time)
+                    VALUES (?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+                ''', rows)
+                count += len(rows)
+                if progress:
+                    progress(count)
+            set_db_vela_version(conn)
+            conn.commit()
+        if added_urls is None:
+            self._reload_url_set()
+        else:
+            self._note_added(added_urls)
+        return count
+    
+    def _import(self, filepath, reader, progress, position, label):
+        """reader の BookmarkRecord を取り込む。position(reader) が progress に渡す (済, 全体)"""
+        try:
+            started = time.perf_counter()
+            report = None
+            if progress:
+                def report(_count):
+                    progress(*position(reader))
+            count = self.import_records(reader, report)
+            print(f"[INFO] Bookmarks imported from {filepath} ({label}): {count} entries, "
+                  f"{(time.perf_counter() - started) * 1000:.0f} ms")
             return True
         except Exception as e:
             print(f"[ERROR] Failed to import bookmarks: {e}")
             return False
+    
+    def import_html(self, filepath, progress=None):
+        """
+        HTML形式（Netscape Bookmark File Format）でインポート。
+        ファイルは逐次解析し、入れ子のフォルダはそのままフォルダツリーに取り込む。
+        progress(読み込み済み KiB, ファイルサイズ KiB) をバッチごとに呼ぶ。
+        """
+        try:
+            reader = NetscapeBookmarkReader(filepath)
+        except OSError as e:
+            print(f"[ERROR] Failed to import bookmarks: {e}")
+            return False
+        return self._import(
+            filepath, reader, progress,
+            lambda r: (r.bytes_read // 1024, r.total_bytes // 1024), "HTML")
+    
+    def import_chromium(self, filepath, progress=None):
+        """
+        Chromium 系のプロファイルの Bookmarks（JSON）を直接インポート。
+        progress(処理済みのブックマーク数, 全ブックマーク数) をバッチごとに呼ぶ。
+        """
+        return self._import(
+            filepath, ChromiumBookmarkReader(filepath), progress,
+            lambda r: (r.done, r.total), "Chromium")
+    
+    def import_firefox(self, filepath, progress=None):
+        """
+        Firefox の places.sqlite のブックマークを直接インポート（読み取り専用・immutable で開く）。
+        progress(処理済みのブックマーク数, 全ブックマーク数) をバッチごとに呼ぶ。
+        """
+        return self._import(
+            filepath, FirefoxBookmarkReader(filepath), progress,
+            lambda r: (r.done, r.total), "Firefox")
+    
+    def import_file(self, filepath, progress=None):
+        """ファイルの中身から形式（HTML / Chromium / Firefox）を判別してインポート"""
+        try:
+            kind = detect_bookmark_format(filepath)
+        except OSError as e:
+            print(f"[ERROR] Failed to import bookmarks: {e}")
+            return False
+        importer = {
+            "firefox": self.import_firefox,
+            "chromium": self.import_chromium,
+        }.get(kind, self.import_html)
+        return importer(filepath, progress)
+
+
+class BookmarkImportWorker(QThread):
+    """
+    ブックマークのインポートを行うスレッド。
+    解析から一括挿入までを GUI スレッドの外で行い、進捗をシグナルで通知する。
+    history_manager を渡すと、Firefox の places.sqlite からは訪問履歴も続けて取り込む
+    （このとき imported_history が True になる）。
+    """
+    progress = Signal(int, int)  # (処理済み, 全体)。単位は形式と段階による
+    imported = Signal(bool)      # 成功したか
+    
+    def __init__(self, bookmark_manager, filepath, parent=None, history_manager=None):
+        super().__init__(parent)
+        self.bookmark_manager = bookmark_manager
+        self.history_manager = history_manager
+        self.filepath = filepath
+        self.imported_history = False
+    
+    def run(self):
+        ok = self.bookmark_manager.import_file(self.filepath, self.progress.emit)
+        if ok and self.history_manager is not None and detect_bookmark_format(self.filepath) == "firefox":
+            ok = self.history_manager.import_firefox_history(self.filepath, self.progress.emit)
+            self.imported_history = True
+        self.imported.emit(ok)
 
 
 # =====================================================================
 # ダウンロード管理
 # =====================================================================
 
-class DownloadManager:
-    """ダウンロード管理クラス（永続化対応）"""
+class DownloadResumeWorker(QThread):
+    """
+    中断したダウンロードを 1 回だけ取り直すスレッド（downloadresume.fetch_resume）。
+    DownloadManager に再ダウンロードの手段（set_redownloader()）が無いときだけ使う。
+    進捗は PROGRESS_INTERVAL 秒ごとに progress で知らせ、終わったら done を送る。
+    結果は received / total / error に入る（error が None なら完了）。
+    requestInterruption() で止めると cancelled が True になり、途中までのファイルは残る。
+    """
+    progress = Signal(int)  # ダウンロード id
+    done = Signal(int)      # ダウンロード id
     
-    def __init__(self):
+    PROGRESS_INTERVAL = 0.1
+    
+    def __init__(self, download_id, url, path, parent=None):
+        super().__init__(parent)
+        self.download_id = download_id
+        self.url = url
+        self.path = path
+        self.received = 0
+        self.total = -1
+        self.error = None
+        self.retryable = True
+        self.cancelled = False
+        self._last_emit = 0.0
+    
+    def _on_progress(self, received, total):
+        self.received, self.total = received, total
+        now = time.monotonic()
+        if now - self._last_emit >= self.PROGRESS_INTERVAL:
+            self._last_emit = now
+            self.progress.emit(self.download_id)
+    
+    def run(self):
+        try:
+            self.received, self.total = fetch_resume(
+                self.url, self.path, self._on_progress, self.isInterruptionRequested)
+        except ResumeCancelled:
+            self.cancelled = True
+        except Exception as e:
+            self.error = str(e) or type(e).__name__
+            self.retryable = is_retryable(e)
+        self.done.emit(self.download_id)
+
+
+class ChecksumSignals(QObject):
+    """ChecksumTask の通知（QRunnable はシグナルを持てないため別に用意する）"""
+    progress = Signal(int, int)            # (ダウンロード id, 0-100)
+    finished = Signal(int, str, str, str)  # (ダウンロード id, SHA-256, 期待値, エラー)。無い値は ""
+
+
+class ChecksumTask(QRunnable):
+    """
+    完了したダウンロードの SHA-256 を計算する（DownloadManager の QThreadPool で実行）。
+    期待値（URL のフラグメントや同じフォルダの .sha256）もここで探す。
+    should_stop() が True になったら途中でやめ、finished は送らない。
+    """
+    
+    def __init__(self, download_id, path, url, signals, should_stop):
+        super().__init__()
+        self.download_id = download_id
+        self.path = path
+        self.url = url
+        self.signals = signals
+        self.should_stop = should_stop
+        self._percent = -1
+    
+    def _on_progress(self, done, total):
+        percent = done * 100 // total if total > 0 else 100
+        if percent != self._percent:
+            self._percent = percent
+            self.signals.progress.emit(self.download_id, percent)
+    
+    def run(self):
+        sha256 = expected = error = ""
+        try:
+            expected, source = find_expected_sha256(self.path, self.url)
+            if expected is not None:
+                print(f"[INFO] Expected SHA-256 for download {self.download_id} from {source}")
+            sha256 = sha256_file(self.path, self._on_progress, self.should_stop)
+        except ChecksumCancelled:
+            return
+        except OSError as e:
+            error = str(e)
+        self.signals.finished.emit(self.download_id, sha256, expected or "", error)
+
+
+class DownloadManager(QObject):
+    """
+    ダウンロード管理クラス（永続化対応）
+
+    DB への接続は 1 本を使い回す。進捗（receivedBytesChanged）は数 KB ごとに届くため、
+    メモリ上にまとめておき、PROGRESS_FLUSH_INTERVAL_MS ごと、または前回の書き込みから
+    PROGRESS_FLUSH_STEP 以上進んだときにまとめて 1 トランザクションで書き込む。
+    状態の変化（完了・キャンセル・中断など）はその時点の進捗と一緒にすぐ書き込む。
+    表示側（DownloadTableModel）には、各ダウンロードの進捗・状態の変化を
+    ダウンロード id 付きのシグナルで知らせる。
+    進行中のダウンロードごとに ThroughputSampler で速度を計測し、
+    終了時に最高速度と平均速度（バイト/秒）を downloads に記録する。
+    
+    同時に転送するのは max_active 件まで。QtWebEngine は downloadRequested の
+    処理中に accept() しなかったダウンロードを取り消すため、要求はすぐに accept() し、
+    枠が空いていなければ pause() して優先度付きの待ち行列（heapq）に入れる。
+    転送が終わるたびに、待ち行列の先頭から resume() する。
+    
+    ネットワークの切断などで中断したダウンロードは、retry_policy の指数バックオフで
+    待ってから同じ QWebEngineDownloadRequest を resume() する。前回の起動時に
+    終わらなかったダウンロード（resume_interrupted()）は、set_redownloader() で渡された
+    関数でプロファイルから同じ URL を取り直し、adopt_redownload() でその要求を
+    元の行に結び付ける（DB の行はそのまま使う）。どちらもプロファイルの Cookie・認証・
+    プロキシ・証明書の設定で通信する。再ダウンロードの手段が無ければ（検証用の
+    スクリプトなど）DownloadResumeWorker が Range 要求で続きを取る。
+    これらも同じ待ち行列と同時転送数の上限に従う。
+    
+    verify_checksums が True なら、完了したダウンロードの SHA-256 を QThreadPool
+    （ChecksumTask）で計算して記録し、期待値が見つかれば照らし合わせる。
+    """
+    download_added = Signal(int)    # ダウンロード id
+    progress_changed = Signal(int)  # ダウンロード id（receivedBytesChanged ごと）
+    state_changed = Signal(int)     # ダウンロード id
+    checksum_changed = Signal(int)  # ダウンロード id（SHA-256 の計算の進み具合・結果）
+    
+    PROGRESS_FLUSH_INTERVAL_MS = 1000
+    PROGRESS_FLUSH_STEP = 0.05  # 全体に対する割合
+    
+    # 優先度（大きいほど先に始める）
+    PRIORITY_LOW, PRIORITY_NORMAL, PRIORITY_HIGH = 0, 1, 2
+    
+    # QWebEngineDownloadRequest.DownloadState
+    _STATE_IN_PROGRESS = 1
+    _STATE_COMPLETED = 2
+    _STATE_INTERRUPTED = 4
+    _FINISHED_STATES = (2, 3, 4)  # 完了・キャンセル・中断
+    _UNFINISHED_STATES = (0, 1, 4)  # 起動時に再開する候補
+    # 取り直す中断理由（QWebEngineDownloadRequest.DownloadInterruptReason）:
+    # 一時的なファイルエラー、ネットワークの失敗・タイムアウト・切断・サーバー停止、
+    # サーバーエラー、サーバーに到達できない
+    _RETRYABLE_INTERRUPTS = (10, 20, 21, 22, 23, 30, 37)
+    # 起動時に取り直すのは、この日数以内に始めたダウンロードだけ
+    RESUME_MAX_AGE_DAYS = 7
+    # プロファイルに再ダウンロードを要求してから downloadRequested を待つ秒数
+    REDOWNLOAD_TIMEOUT = 60
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
         self.db_path = DOWNLOADS_DB
         self.downloads = []
+        self._live = {}  # このセッションのダウンロード {download_id: QWebEngineDownloadRequest}
+        self._conn = None
+        # 未書き込みの進捗 {download_id: (受信済みバイト数, 全体のバイト数)}
+        self._pending_progress = {}
+        # 最後に書き込んだ進捗の割合 {download_id: 0.0-1.0}（終了したダウンロードは消す）
+        self._flushed_fraction = {}
+        # 進行中のダウンロードの速度計測 {download_id: ThroughputSampler}（終了したら消す）
+        self._samplers = {}
+        # 待ち行列。_queue は [(-優先度, 順番), download_id] のヒープで、
+        # 外した項目は download_id を None にして残す（_queued が有効な項目を指す）
+        self.max_active = DOWNLOAD_MAX_ACTIVE
+        self._active = set()   # 転送中
+        self._paused = set()   # 利用者が一時停止した
+        self._queue = []
+        self._queued = {}
+        self._priority = {}
+        self._queue_seq = 0
+        self._front_seq = 0
+        # 取り直しているダウンロード {download_id: ResumeJob}
+        self.retry_policy = RetryPolicy()
+        self._resumes = {}
+        self._redownloader = None  # (url, ファイル名) でプロファイルからダウンロードを始める関数
+        self._retry_timer = QTimer(self)
+        self._retry_timer.setSingleShot(True)
+        self._retry_timer.timeout.connect(self._retry_due)
+        # SHA-256 を計算中のダウンロード {download_id: 進み具合 0-100}
+        self.verify_checksums = True
+        self._checksums = {}
+        self._closing = False
+        self._checksum_pool = QThreadPool(self)
+        self._checksum_pool.setMaxThreadCount(CHECKSUM_WORKERS)
+        self._checksum_signals = ChecksumSignals(self)
+        self._checksum_signals.progress.connect(self._on_checksum_progress)
+        self._checksum_signals.finished.connect(self._on_checksum_finished)
+        self.progress_flush_count = 0
+        self._progress_timer = QTimer(self)
+        self._progress_timer.setSingleShot(True)
+        self._progress_timer.setInterval(self.PROGRESS_FLUSH_INTERVAL_MS)
+        self._progress_timer.timeout.connect(self.flush_progress)
         self.init_database()
     
     def init_database(self):
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
+            self._conn = sqlite3.connect(self.db_path)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            with self._conn:
+                cursor = self._conn.cursor()
                 cursor.execute('''
                     CREATE TABLE IF NOT EXISTS downloads (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -289,14 +2793,22 @@ class DownloadManager:
                         finish_time TIMESTAMP
                     )
                 ''')
-                set_db_vela_version(conn)
-                conn.commit()
+                HistoryManager._ensure_column(cursor, 'downloads', 'peak_bytes_per_sec', 'REAL')
+                HistoryManager._ensure_column(cursor, 'downloads', 'avg_bytes_per_sec', 'REAL')
+                # 0: 中断しても取り直さない（試し直しても同じ結果になる中断）
+                HistoryManager._ensure_column(cursor, 'downloads', 'resumable', 'INTEGER DEFAULT 1')
+                HistoryManager._ensure_column(cursor, 'downloads', 'sha256', 'TEXT')
+                HistoryManager._ensure_column(cursor, 'downloads', 'expected_sha256', 'TEXT')
+                set_db_vela_version(self._conn)
             print("[INFO] Downloads database initialized")
         except sqlite3.Error as e:
             print(f"[ERROR] Downloads database init failed: {e}")
     
-    def add_download(self, download_item):
-        """ダウンロードをメモリとDBに追加"""
+    def add_download(self, download_item, priority=PRIORITY_NORMAL):
+        """
+        ダウンロードをメモリとDBに追加（accept() 済みのものを渡す）。
+        同時に転送する数が上限に達していれば一時停止して待ち行列に入れる。
+        """
         self.downloads.append(download_item)
         
         download_path = download_item.downloadDirectory()
@@ -304,8 +2816,8 @@ class DownloadManager:
         download_id = None
         
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
+            with self._conn:
+                cursor = self._conn.cursor()
                 cursor.execute('''
                     INSERT INTO downloads (filename, url, download_path, total_bytes, received_bytes, state)
                     VALUES (?, ?, ?, ?, ?, ?)
@@ -318,74 +2830,652 @@ class DownloadManager:
                     download_item.state().value
                 ))
                 download_id = cursor.lastrowid
-                conn.commit()
             print(f"[INFO] Download added to DB with ID {download_id}: {filename}")
         except sqlite3.Error as e:
             print(f"[ERROR] add_download DB insert failed: {e}")
         
         if download_id is not None:
-            download_item.receivedBytesChanged.connect(
-                lambda: self.update_download_progress(download_id, download_item)
-            )
-            download_item.stateChanged.connect(
-                lambda state: self.update_download_state(download_id, download_item, state)
-            )
+            self._track(download_id, download_item)
+            self._priority[download_id] = priority
+            if len(self._active) < self.max_active:
+                self._active.add(download_id)
+            else:
+                download_item.pause()
+                self._push(download_id)
+                print(f"[INFO] Download queued ({len(self._queued)} waiting): {filename}")
+            self.download_added.emit(download_id)
         
         print(f"[INFO] Download started: {filename}")
     
+    def _track(self, download_id, download_item):
+        """このセッションのダウンロードとして進捗・状態の変化を受け取る"""
+        self._live[download_id] = download_item
+        download_item.receivedBytesChanged.connect(
+            lambda: self.update_download_progress(download_id, download_item)
+        )
+        download_item.stateChanged.connect(
+            lambda state: self.update_download_state(download_id, download_item, state)
+        )
+    
     def update_download_progress(self, download_id, download_item):
-        """ダウンロード進捗をDBに更新"""
+        """
+        ダウンロード進捗を記録する（DB へはまとめて書き込む）。
+        前回の書き込みから PROGRESS_FLUSH_STEP 以上進んでいればすぐに、
+        そうでなければ PROGRESS_FLUSH_INTERVAL_MS 以内に書き込む。
+        """
+        self._record_progress(download_id, download_item.receivedBytes(), download_item.totalBytes())
+    
+    def _record_progress(self, download_id, received, total):
+        sampler = self._samplers.get(download_id)
+        if sampler is None:
+            sampler = self._samplers[download_id] = ThroughputSampler()
+        sampler.add(received)
+        self.progress_changed.emit(download_id)
+        self._pending_progress[download_id] = (received, total)
+        if total > 0:
+            fraction = received / total
+            if fraction - self._flushed_fraction.get(download_id, 0.0) >= self.PROGRESS_FLUSH_STEP:
+                self.flush_progress()
+                return
+        if not self._progress_timer.isActive():
+            self._progress_timer.start()
+    
+    def flush_progress(self):
+        """未書き込みの進捗を 1 トランザクションで DB に書き出す"""
+        self._progress_timer.stop()
+        if not self._pending_progress:
+            return
+        pending, self._pending_progress = self._pending_progress, {}
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
+            with self._conn:
+                self._conn.executemany('''
                     UPDATE downloads 
                     SET received_bytes = ?, total_bytes = ?
                     WHERE id = ?
-                ''', (download_item.receivedBytes(), download_item.totalBytes(), download_id))
-                conn.commit()
+                ''', [(received, total, download_id)
+                      for download_id, (received, total) in pending.items()])
         except sqlite3.Error as e:
             print(f"[ERROR] Failed to update download progress: {e}")
+            return
+        self.progress_flush_count += 1
+        for download_id, (received, total) in pending.items():
+            self._flushed_fraction[download_id] = received / total if total > 0 else 0.0
     
     def update_download_state(self, download_id, download_item, state):
-        """ダウンロード状態をDBに更新"""
+        """
+        ダウンロード状態をDBに更新（その時点の進捗もあわせてすぐに書き込む）。
+        終了した場合は最高・平均速度も記録する。
+        """
+        state_value = state.value if hasattr(state, 'value') else int(state)
+        received, total = download_item.receivedBytes(), download_item.totalBytes()
+        resumable = None
+        if state_value == self._STATE_INTERRUPTED:
+            reason = download_item.interruptReason()
+            reason = reason.value if hasattr(reason, 'value') else int(reason)
+            if reason in self._RETRYABLE_INTERRUPTS and download_item.url().scheme() in ('http', 'https'):
+                self._hand_over(download_id, download_item, reason)
+                return
+            resumable = 0
+        if state_value in self._FINISHED_STATES:
+            self._resumes.pop(download_id, None)
+            self._schedule_retry()
+        self._record_state(download_id, state_value, received, total, resumable)
+    
+    def _record_state(self, download_id, state_value, received, total, resumable=None):
+        """状態と進捗をすぐに書き込む。resumable を渡すと再開してよいかも記録する"""
+        # 溜めていた進捗は状態と一緒に現在値で書き込むので捨てる
+        self._pending_progress.pop(download_id, None)
+        peak = average = None
+        if state_value in self._FINISHED_STATES:
+            self._flushed_fraction.pop(download_id, None)
+            sampler = self._samplers.pop(download_id, None)
+            if sampler is not None:
+                sampler.add(received, force=True)
+                peak, average = sampler.peak, sampler.average()
+            self._forget(download_id)
         try:
-            state_value = state.value if hasattr(state, 'value') else int(state)
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                if state_value == 2:  # DownloadCompleted
-                    cursor.execute('''
-                        UPDATE downloads 
-                        SET state = ?, received_bytes = ?, finish_time = CURRENT_TIMESTAMP
-                        WHERE id = ?
-                    ''', (state_value, download_item.receivedBytes(), download_id))
-                    print(f"[INFO] Download completed: {download_id}")
-                else:
-                    cursor.execute('''
-                        UPDATE downloads 
-                        SET state = ?
-                        WHERE id = ?
-                    ''', (state_value, download_id))
-                conn.commit()
+            with self._conn:
+                cursor = self._conn.cursor()
+                cursor.execute(f'''
+                    UPDATE downloads 
+                    SET state = ?, received_bytes = ?, total_bytes = ?,
+                        peak_bytes_per_sec = COALESCE(?, peak_bytes_per_sec),
+                        avg_bytes_per_sec = COALESCE(?, avg_bytes_per_sec),
+                        resumable = COALESCE(?, resumable)
+                        {", finish_time = CURRENT_TIMESTAMP" if state_value == self._STATE_COMPLETED else ""}
+                    WHERE id = ?
+                ''', (state_value, received, total, peak, average, resumable, download_id))
+        except sqlite3.Error as e:
+            print(f"[ERROR] Failed to update download state: {e}")
+        if state_value == self._STATE_COMPLETED:
+            print(f"[INFO] Download completed: {download_id}")
+        if peak is not None:
+            print(f"[INFO] Download {download_id}: peak {peak / 1024:.0f} KB/s, "
+                  f"avg {average / 1024:.0f} KB/s")
+        self.state_changed.emit(download_id)
+        if state_value == self._STATE_COMPLETED and self.verify_checksums:
+            self.verify_download(download_id)
+    
+    # ------------------------------------------------------------------
+    # 完了したダウンロードの SHA-256
+    # ------------------------------------------------------------------
+    
+    def set_verify_checksums(self, enabled):
+        """完了したダウンロードの SHA-256 を自動で計算するか"""
+        self.verify_checksums = bool(enabled)
+    
+    def verify_download(self, download_id):
+        """
+        完了したダウンロードの SHA-256 の計算を始める（計算中なら何もしない）。
+        結果は downloads.sha256 / expected_sha256 に記録し、checksum_changed で知らせる
+        """
+        if download_id in self._checksums or self._closing:
+            return
+        try:
+            row = self._conn.execute(
+                'SELECT filename, download_path, url FROM downloads WHERE id = ? AND state = ?',
+                (download_id, self._STATE_COMPLETED)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"[ERROR] verify_download failed: {e}")
+            return
+        if row is None:
+            return
+        filename, download_path, url = row
+        path = os.path.join(download_path or "", filename)
+        if not os.path.isfile(path):
+            print(f"[WARN] Cannot verify download {download_id}: file not found ({path})")
+            return
+        self._checksums[download_id] = 0
+        self._checksum_pool.start(ChecksumTask(
+            download_id, path, url, self._checksum_signals, self._is_closing))
+        self.checksum_changed.emit(download_id)
+    
+    def _is_closing(self):
+        return self._closing
+    
+    def checksum_progress(self, download_id):
+        """SHA-256 を計算中なら進み具合（0-100）、そうでなければ None"""
+        return self._checksums.get(download_id)
+    
+    def _on_checksum_progress(self, download_id, percent):
+        if download_id in self._checksums:
+            self._checksums[download_id] = percent
+            self.checksum_changed.emit(download_id)
+    
+    def _on_checksum_finished(self, download_id, sha256, expected, error):
+        self._checksums.pop(download_id, None)
+        if error:
+            print(f"[ERROR] SHA-256 of download {download_id} failed: {error}")
+        elif self._conn is not None:
+            try:
+                with self._conn:
+                    self._conn.execute(
+                        'UPDATE downloads SET sha256 = ?, expected_sha256 = ? WHERE id = ?',
+                        (sha256, expected or None, download_id))
+            except sqlite3.Error as e:
+                print(f"[ERROR] Failed to save SHA-256: {e}")
+            if not expected:
+                print(f"[INFO] Download {download_id} SHA-256: {sha256}")
+            elif sha256 == expected:
+                print(f"[INFO] Download {download_id} SHA-256 verified: {sha256}")
+            else:
+                print(f"[WARN] Download {download_id} SHA-256 mismatch: {sha256} (expected {expected})")
+        self.checksum_changed.emit(download_id)
+    
+    # ------------------------------------------------------------------
+    # 中断したダウンロードの取り直し
+    # ------------------------------------------------------------------
+    
+    def resume_interrupted(self):
+        """
+        前回までに終わらなかったダウンロード（要求中・進行中・中断のまま残った行のうち
+        RESUME_MAX_AGE_DAYS 日以内のもの）を取り直す（起動時に呼ぶ）
+        """
+        try:
+            rows = self._conn.execute(f'''
+                SELECT id, filename, url, download_path, total_bytes
+                FROM downloads
+                WHERE state IN {self._UNFINISHED_STATES} AND resumable != 0
+                  AND (url LIKE 'http://%' OR url LIKE 'https://%')
+                  AND start_time >= datetime('now', ?)
+                ORDER BY id
+            ''', (f'-{self.RESUME_MAX_AGE_DAYS} days',)).fetchall()
+        except sqlite3.Error as e:
+            print(f"[ERROR] resume_interrupted failed: {e}")
+            return 0
+        count = 0
+        for download_id, filename, url, download_path, total in rows:
+            if download_id in self._live or download_id in self._resumes:
+                continue
+            self._add_resume(download_id, url, os.path.join(download_path or "", filename), total)
+            count += 1
+        if count:
+            print(f"[INFO] Resuming {count} interrupted downloads")
+            self._start_next()
+        return count
+    
+    def can_retry(self, download_id):
+        """終わらなかったダウンロードで、取り直しを始められるか"""
+        if self.queue_status(download_id) is not None or download_id in self._resumes:
+            return False
+        record = self.get_download_record(download_id)
+        return record is not None and record[2] in self._UNFINISHED_STATES
+    
+    def retry_download(self, download_id):
+        """中断したダウンロードを取り直す（取り直さない中断として記録したものも対象）"""
+        if not self.can_retry(download_id):
+            return
+        try:
+            row = self._conn.execute(
+                'SELECT filename, url, download_path, total_bytes FROM downloads WHERE id = ?',
+                (download_id,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"[ERROR] retry_download failed: {e}")
+            return
+        filename, url, download_path, total = row
+        if not url.startswith(('http://', 'https://')):
+            print(f"[WARN] Download {download_id} cannot be retried: {url}")
+            return
+        # このセッションのダウンロードなら QtWebEngine に続きから再開させる
+        self._add_resume(download_id, url, os.path.join(download_path or "", filename), total,
+                         self._live.get(download_id))
+        self._start_next()
+    
+    def set_redownloader(self, redownload):
+        """
+        前回の起動時のダウンロードを取り直す関数 redownload(url, ファイル名) を設定する。
+        プロファイル（QWebEnginePage.download()）でダウンロードを始め、その downloadRequested を
+        adopt_redownload() に渡すこと
+        """
+        self._redownloader = redownload
+    
+    def adopt_redownload(self, download_item):
+        """
+        download_item が取り直しを要求したダウンロードなら、元の行の保存先で accept() して
+        その行のダウンロードとして受け持ち、True を返す（そうでなければ何もせず False）
+        """
+        url = download_item.url().toString()
+        for download_id, job in self._resumes.items():
+            if job.requested and job.url == url:
+                break
+        else:
+            return False
+        job.requested = False
+        job.deadline = None
+        job.download = download_item
+        # プロファイルからの取り直しは最初から受信し直す
+        job.received = job.start_received = 0
+        directory, filename = os.path.split(job.path)
+        download_item.setDownloadDirectory(directory)
+        download_item.setDownloadFileName(filename)
+        download_item.accept()
+        self.downloads.append(download_item)
+        self._track(download_id, download_item)
+        if download_id in self._paused:
+            download_item.pause()
+        self._schedule_retry()
+        print(f"[INFO] Download {download_id} restarted by the profile: {filename}")
+        self.state_changed.emit(download_id)
+        return True
+    
+    def _add_resume(self, download_id, url, path, total, download=None):
+        """
+        取り直すダウンロードとして登録し、待ち行列に入れる（DB の行は進行中に戻す）。
+        download はこのセッションの QWebEngineDownloadRequest（あれば resume() で再開する）
+        """
+        received = download.receivedBytes() if download is not None else partial_size(path)
+        job = self._resumes[download_id] = ResumeJob(url, path, received, total)
+        job.download = download
+        self._priority.setdefault(download_id, self.PRIORITY_NORMAL)
+        try:
+            with self._conn:
+                self._conn.execute(
+                    'UPDATE downloads SET state = ?, resumable = 1 WHERE id = ?',
+                    (self._STATE_IN_PROGRESS, download_id))
         except sqlite3.Error as e:
             print(f"[ERROR] Failed to update download state: {e}")
+        self._push(download_id)
+        self.state_changed.emit(download_id)
+        return job
+    
+    def _hand_over(self, download_id, download_item, reason):
+        """
+        QtWebEngine のダウンロードが一時的な理由で中断した。retry_policy の待ち時間の後で
+        同じ QWebEngineDownloadRequest を resume() する（QtWebEngine 自身の途中までの
+        ファイルと、プロファイルの Cookie・認証・プロキシ・証明書をそのまま使う）
+        """
+        received, total = download_item.receivedBytes(), download_item.totalBytes()
+        job = self._resumes.get(download_id)
+        if job is None:
+            path = os.path.join(download_item.downloadDirectory(), download_item.downloadFileName())
+            job = self._resumes[download_id] = ResumeJob(
+                download_item.url().toString(), path, received, total)
+            job.download = download_item
+        progressed = received > job.start_received
+        job.received, job.total = received, total
+        job.attempts = 1 if progressed else job.attempts + 1
+        error = download_item.interruptReasonString() or f"interrupted (reason {reason})"
+        self._resume_failed(download_id, job, error, True)
+    
+    def _run_resume(self, download_id, job):
+        """待ち行列から出た取り直しを始める（_active には入れてある）"""
+        job.retry_at = None
+        if job.download is not None:
+            job.start_received = job.received = job.download.receivedBytes()
+            job.download.resume()
+            print(f"[INFO] Download {download_id} resuming from {job.received} bytes: {job.url}")
+            return
+        if job.requested:
+            # 再ダウンロードの downloadRequested を待っている（一時停止で待つのをやめていれば待ち直す）
+            if job.deadline is None:
+                job.deadline = time.monotonic() + self.REDOWNLOAD_TIMEOUT
+                self._schedule_retry()
+            return
+        if self._redownloader is not None:
+            job.requested = True
+            job.deadline = time.monotonic() + self.REDOWNLOAD_TIMEOUT
+            self._schedule_retry()
+            print(f"[INFO] Download {download_id} requested again: {job.url}")
+            self._redownloader(job.url, os.path.basename(job.path))
+            return
+        if job.worker is not None:
+            # 一時停止で止めている途中。止まったら始め直す
+            job.restart = True
+            return
+        worker = DownloadResumeWorker(download_id, job.url, job.path, self)
+        worker.received, worker.total = job.received, job.total
+        job.start_received = job.received
+        worker.progress.connect(self._on_resume_progress)
+        worker.done.connect(self._on_resume_done)
+        job.worker = worker
+        worker.start()
+        print(f"[INFO] Download {download_id} resuming from {job.received} bytes: {job.url}")
+    
+    def _on_resume_progress(self, download_id):
+        job = self._resumes.get(download_id)
+        if job is None or job.worker is None:
+            return
+        job.received, job.total = job.worker.received, job.worker.total
+        self._record_progress(download_id, job.received, job.total)
+    
+    def _on_resume_done(self, download_id):
+        job = self._resumes.get(download_id)
+        if job is None or job.worker is None:
+            return
+        worker, job.worker = job.worker, None
+        worker.wait()
+        progressed = worker.received > job.start_received
+        job.received, job.total = worker.received, worker.total
+        if worker.cancelled:
+            if job.restart:
+                job.restart = False
+                self._run_resume(download_id, job)
+            return
+        if worker.error is None:
+            del self._resumes[download_id]
+            self._record_state(download_id, self._STATE_COMPLETED, job.received, job.total, 1)
+            return
+        
+        job.attempts = 1 if progressed else job.attempts + 1
+        self._resume_failed(download_id, job, worker.error, worker.retryable)
+    
+    def _resume_failed(self, download_id, job, error, retryable):
+        """
+        取り直しの 1 回が失敗した。試し直せて回数も残っていれば待ち時間の後で待ち行列に戻し、
+        そうでなければ中断として記録する
+        """
+        job.last_error = error
+        self._active.discard(download_id)
+        self._unqueue(download_id)
+        sampler = self._samplers.get(download_id)
+        if sampler is not None:
+            sampler.add(job.received, force=True)
+            sampler.pause()
+        if retryable and not self.retry_policy.exhausted(job.attempts):
+            delay = self.retry_policy.delay(job.attempts)
+            job.retry_at = time.monotonic() + delay
+            print(f"[WARN] Download {download_id} failed ({error}); "
+                  f"retry {job.attempts}/{self.retry_policy.max_attempts} in {delay:.1f} s")
+            self._pending_progress[download_id] = (job.received, job.total)
+            self._schedule_retry()
+            self._start_next()
+            self.state_changed.emit(download_id)
+            return
+        print(f"[ERROR] Download {download_id} could not be resumed: {error}")
+        del self._resumes[download_id]
+        self._schedule_retry()
+        # 試し直しても無駄なものは次の起動時にも取り直さない（回数を使い切ったものは取り直す）
+        self._record_state(download_id, self._STATE_INTERRUPTED, job.received, job.total,
+                           1 if retryable else 0)
+    
+    def _schedule_retry(self):
+        """再試行・再ダウンロードの待ちのうち、最も早いものの時刻にタイマーを合わせる"""
+        due = [when for job in self._resumes.values()
+               for when in (job.retry_at, job.deadline) if when is not None]
+        if not due:
+            self._retry_timer.stop()
+            return
+        self._retry_timer.start(max(0, int((min(due) - time.monotonic()) * 1000)))
+    
+    def _retry_due(self):
+        """待ち時間が過ぎた取り直しを待ち行列に戻し、始まらなかった再ダウンロードを失敗にする"""
+        now = time.monotonic()
+        for download_id, job in list(self._resumes.items()):
+            if job.deadline is not None and job.deadline <= now:
+                job.requested = False
+                job.deadline = None
+                job.attempts += 1
+                self._resume_failed(download_id, job, "download was not started", True)
+            elif job.retry_at is not None and job.retry_at <= now:
+                job.retry_at = None
+                self._push(download_id)
+        self._schedule_retry()
+        self._start_next()
+    
+    # ------------------------------------------------------------------
+    # 待ち行列（同時に転送する数の上限と優先度）
+    # ------------------------------------------------------------------
+    
+    def _push(self, download_id, front=False):
+        """待ち行列に入れる（入っていれば入れ直す）。front=True は先頭へ"""
+        self._unqueue(download_id)
+        priority = self._priority.get(download_id, self.PRIORITY_NORMAL)
+        if front:
+            # 待っているどの項目より先に出るよう、優先度を最高にそろえて負の順番を使う
+            priority = max([priority] + [-entry[0][0] for entry in self._queued.values()])
+            self._priority[download_id] = priority
+            self._front_seq -= 1
+            seq = self._front_seq
+        else:
+            self._queue_seq += 1
+            seq = self._queue_seq
+        entry = [(-priority, seq), download_id]
+        self._queued[download_id] = entry
+        heapq.heappush(self._queue, entry)
+    
+    def _unqueue(self, download_id):
+        """待ち行列から外す（ヒープの項目は id を None にして、取り出すときに読み飛ばす）"""
+        entry = self._queued.pop(download_id, None)
+        if entry is not None:
+            entry[1] = None
+    
+    def _start_next(self):
+        """空きがある分だけ、待ち行列の先頭から再開する"""
+        while len(self._active) < self.max_active and self._queue:
+            _key, download_id = heapq.heappop(self._queue)
+            if download_id is None:
+                continue
+            del self._queued[download_id]
+            job = self._resumes.get(download_id)
+            item = self._live.get(download_id)
+            if job is None and item is None:
+                continue
+            self._active.add(download_id)
+            if job is not None:
+                self._run_resume(download_id, job)
+            else:
+                item.resume()
+                print(f"[INFO] Download resumed from queue: {download_id}")
+            self.state_changed.emit(download_id)
+    
+    def _forget(self, download_id):
+        """終了したダウンロードを待ち行列の管理から外し、空いた枠で次を始める"""
+        self._active.discard(download_id)
+        self._unqueue(download_id)
+        self._paused.discard(download_id)
+        self._priority.pop(download_id, None)
+        self._start_next()
+    
+    def set_max_active(self, count):
+        """
+        同時に転送する数の上限を設定する。
+        下げても転送中のものは止めず、終わった分から上限に合わせる。
+        """
+        self.max_active = max(1, int(count))
+        self._start_next()
+    
+    def queue_status(self, download_id):
+        """
+        "active"（転送中）/ "queued"（待機中）/ "paused"（一時停止）/
+        "retrying"（失敗して再試行を待っている）。管理外なら None
+        """
+        if download_id in self._active:
+            return "active"
+        if download_id in self._queued:
+            return "queued"
+        if download_id in self._paused:
+            return "paused"
+        job = self._resumes.get(download_id)
+        if job is not None and job.retry_at is not None:
+            return "retrying"
+        return None
+    
+    def priority(self, download_id):
+        return self._priority.get(download_id, self.PRIORITY_NORMAL)
+    
+    def pause_download(self, download_id):
+        """転送中・待機中のダウンロードを一時停止する（再開するまで待ち行列から外す）"""
+        job = self._resumes.get(download_id)
+        item = self._live.get(download_id)
+        if (job is None and item is None) or download_id in self._paused \
+                or self.queue_status(download_id) is None:
+            return
+        if download_id in self._active:
+            self._active.discard(download_id)
+            if job is None:
+                item.pause()
+            elif job.worker is not None:
+                job.restart = False
+                job.worker.requestInterruption()
+            elif job.download is not None:
+                job.download.pause()
+        if job is not None:
+            # 要求済みの再ダウンロードは、届いたら一時停止した状態で受け持つ
+            job.retry_at = job.deadline = None
+        self._unqueue(download_id)
+        self._paused.add(download_id)
+        sampler = self._samplers.get(download_id)
+        if sampler is not None:
+            sampler.add(self.current_values(download_id)[1], force=True)
+            sampler.pause()
+        self._start_next()
+        self.state_changed.emit(download_id)
+    
+    def resume_download(self, download_id):
+        """一時停止したダウンロードを待ち行列に戻す（空きがあればすぐ再開する）"""
+        if download_id not in self._paused:
+            return
+        self._paused.discard(download_id)
+        self._push(download_id)
+        self._start_next()
+        self.state_changed.emit(download_id)
+    
+    def set_priority(self, download_id, priority):
+        """優先度を変える（待機中なら並び直す）"""
+        if self.queue_status(download_id) is None:
+            return
+        self._priority[download_id] = priority
+        if download_id in self._queued:
+            self._push(download_id)
+        self.state_changed.emit(download_id)
+    
+    def move_to_front(self, download_id):
+        """待機中・一時停止中・再試行待ちのダウンロードを待ち行列の先頭へ移す"""
+        job = self._resumes.get(download_id)
+        if download_id in self._paused:
+            self._paused.discard(download_id)
+        elif job is not None and job.retry_at is not None:
+            job.retry_at = None
+        elif download_id not in self._queued:
+            return
+        self._push(download_id, front=True)
+        self._start_next()
+        self.state_changed.emit(download_id)
+    
+    def get_download_record(self, download_id):
+        """
+        記録済みの (total_bytes, received_bytes, state, 平均速度, 最高速度, SHA-256, 期待値)。
+        行が無ければ None
+        """
+        try:
+            return self._conn.execute('''
+                SELECT total_bytes, received_bytes, state, avg_bytes_per_sec, peak_bytes_per_sec,
+                       sha256, expected_sha256
+                FROM downloads WHERE id = ?
+            ''', (download_id,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"[ERROR] get_download_record failed: {e}")
+            return None
+    
+    def sampler(self, download_id):
+        """進行中のダウンロードの ThroughputSampler（計測していなければ None）"""
+        return self._samplers.get(download_id)
     
     def get_downloads(self):
         """現在のダウンロードリストを取得"""
         return self.downloads
     
+    def live_downloads(self):
+        """このセッションで DB に記録したダウンロード {download_id: QWebEngineDownloadRequest}"""
+        return self._live
+    
+    def live_download(self, download_id):
+        """このセッションのダウンロードなら QWebEngineDownloadRequest、そうでなければ None"""
+        return self._live.get(download_id)
+    
+    def resume_error(self, download_id):
+        """取り直し中のダウンロードの直前の失敗理由（無ければ None）"""
+        job = self._resumes.get(download_id)
+        return job.last_error if job is not None else None
+    
+    def current_values(self, download_id):
+        """進行中なら現在の (total_bytes, received_bytes, state)、そうでなければ None"""
+        job = self._resumes.get(download_id)
+        if job is not None and job.download is None:
+            return job.total, job.received, self._STATE_IN_PROGRESS
+        item = self._live.get(download_id)
+        if item is not None:
+            # 再開を待っている間（QtWebEngine では中断）も進行中として扱う
+            state = self._STATE_IN_PROGRESS if job is not None else item.state().value
+            return item.totalBytes(), item.receivedBytes(), state
+        return None
+    
     def get_download_history(self, limit=100):
-        """ダウンロード履歴をDBから取得"""
+        """ダウンロード履歴をDBから取得（未書き込みの進捗は先に書き出す）"""
+        self.flush_progress()
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT filename, url, download_path, total_bytes, received_bytes, state, start_time, finish_time
-                    FROM downloads
-                    ORDER BY start_time DESC
-                    LIMIT ?
-                ''', (limit,))
-                return cursor.fetchall()
+            cursor = self._conn.cursor()
+            cursor.execute('''
+                SELECT id, filename, url, download_path, total_bytes, received_bytes, state,
+                       avg_bytes_per_sec, peak_bytes_per_sec, start_time, finish_time,
+                       sha256, expected_sha256
+                FROM downloads
+                ORDER BY start_time DESC, id DESC
+                LIMIT ?
+            ''', (limit,))
+            return cursor.fetchall()
         except sqlite3.Error as e:
             print(f"[ERROR] get_download_history failed: {e}")
             return []
@@ -393,16 +3483,38 @@ class DownloadManager:
     def clear_download_history(self):
         """ダウンロード履歴をクリア（進行中・要求中は除外）"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
+            with self._conn:
+                cursor = self._conn.cursor()
                 # state: 0=要求中, 1=進行中, 2=完了, 3=キャンセル, 4=中断
                 # 進行中(0,1)は残し、終了済み(2,3,4)のみ削除
                 cursor.execute('DELETE FROM downloads WHERE state NOT IN (0, 1)')
                 deleted = cursor.rowcount
-                conn.commit()
             print(f"[INFO] Download history cleared ({deleted} entries removed, in-progress preserved)")
         except sqlite3.Error as e:
             print(f"[ERROR] clear_download_history failed: {e}")
+    
+    def close(self):
+        """
+        取り直しを止め、未書き込みの進捗を書き出して接続を閉じる（終了時に呼ぶ）。
+        途中までのファイルは残し、次の起動時に resume_interrupted() で続きから取る。
+        計算中の SHA-256 は記録せずにやめる。
+        """
+        self._closing = True
+        self._checksum_pool.waitForDone()
+        self._retry_timer.stop()
+        workers = [job.worker for job in self._resumes.values() if job.worker is not None]
+        for worker in workers:
+            worker.requestInterruption()
+        for worker in workers:
+            worker.wait()
+        for download_id, job in self._resumes.items():
+            if job.worker is not None:
+                self._pending_progress[download_id] = (job.worker.received, job.worker.total)
+        self.flush_progress()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        print(f"[INFO] Download progress: {self.progress_flush_count} flushes")
 
 
 # =====================================================================
@@ -0,0 +1,557 @@
+"""
+VELA Browser - Qt モデル類
+履歴・ブックマークなど、大量の行を必要な分だけ読み込むビュー用モデルと、
+ダウンロードの進捗をシグナルで反映する一覧モデル
+"""
+
+from PySide6.QtCore import Qt, QAbstractItemModel, QAbstractTableModel, QModelIndex
+from PySide6.QtGui import QColor
+
+
+# =====================================================================
+# 履歴モデル
+# =====================================================================
+
+class HistoryTableModel(QAbstractTableModel):
+    """
+    履歴テーブルのモデル。
+    行はビューがスクロールで要求した分だけ fetchMore() でページ単位に読み込み、
+    並べ替えと絞り込みは SQL に任せる（HistoryManager.fetch_history_page）。
+    絞り込み中の先頭ページは検索ワーカーで取得し、最新の世代の結果だけを反映する。
+    """
+
+    PAGE_SIZE = 200
+    # (見出し, 並べ替えキー名, 行タプル内の位置)
+    COLUMNS = (
+        ("タイトル", "title", 2),
+        ("URL", "url", 1),
+        ("訪問日時", "last_visit_time", 3),
+        ("訪問回数", "visit_count", 4),
+    )
+
+    def __init__(self, history_manager, parent=None):
+        super().__init__(parent)
+        self.history_manager = history_manager
+        # (id, url, title, last_visit_time, visit_count)
+        self._rows = []
+        self._has_more = True
+        self._sort_column = 2
+        self._descending = True
+        self._query = ""
+        self._pending_generation = 0  # 検索ワーカーに依頼中の先頭ページ
+        history_manager.search_worker.results_ready.connect(self._on_search_results)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self._rows[index.row()]
+        value = row[self.COLUMNS[index.column()][2]]
+        if role == Qt.DisplayRole:
+            return "" if value is None else str(value)
+        if role == Qt.ToolTipRole and index.column() in (0, 1):
+            return value
+        if role == Qt.TextAlignmentRole and index.column() == 3:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.COLUMNS[section][0]
+        return super().headerData(section, orientation, role)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._has_more and not self._pending_generation
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or not self._has_more:
+            return
+        _label, sort_key, position = self.COLUMNS[self._sort_column]
+        after = None
+        if self._rows:
+            # キーセット: 前ページ最終行の (並べ替えキー, id)。title の NULL は '' として並ぶ
+            last = self._rows[-1]
+            value = last[position]
+            if sort_key == "title":
+                value = value or ""
+            after = (value, last[0])
+        rows = self.history_manager.fetch_history_page(
+            after=after, limit=self.PAGE_SIZE, sort_column=sort_key,
+            descending=self._descending, query=self._query
+        )
+        self._has_more = len(rows) == self.PAGE_SIZE
+        if not rows:
+            return
+        start = len(self._rows)
+        self.beginInsertRows(QModelIndex(), start, start + len(rows) - 1)
+        self._rows.extend(rows)
+        self.endInsertRows()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        """ヘッダークリックでの並べ替え（SQL の ORDER BY で読み直す）"""
+        self._sort_column = column
+        self._descending = order == Qt.DescendingOrder
+        self.refresh()
+
+    def set_filter(self, query):
+        """絞り込み文字列を設定して読み直す"""
+        query = query.strip()
+        if query == self._query:
+            return
+        self._query = query
+        self.refresh()
+
+    def refresh(self):
+        """読み込み済みの行を捨てて先頭ページから読み直す"""
+        if self._query:
+            # 絞り込みはワーカーで実行し、結果が届くまで今の行を表示しておく
+            self.history_manager.flush()
+            _label, sort_key, _position = self.COLUMNS[self._sort_column]
+            self._pending_generation = self.history_manager.request_history_page(
+                self._query, sort_key, self._descending, self.PAGE_SIZE)
+            return
+        self._pending_generation = 0
+        self.beginResetModel()
+        self._rows = []
+        self._has_more = True
+        self.endResetModel()
+        self.fetchMore()
+
+    def _on_search_results(self, kind, generation, rows):
+        if kind != "history_page" or generation != self._pending_generation:
+            return
+        self._pending_generation = 0
+        self.beginResetModel()
+        self._rows = list(rows)
+        self._has_more = len(rows) == self.PAGE_SIZE
+        self.endResetModel()
+
+    def url_at(self, row):
+        return self._rows[row][1] if 0 <= row < len(self._rows) else None
+
+
+# =====================================================================
+# ブックマークモデル
+# =====================================================================
+
+class _BookmarkNode:
+    """ブックマークツリーの 1 要素（フォルダの children は展開されるまで読み込まない）"""
+
+    __slots__ = ("kind", "id", "title", "url", "position", "parent",
+                 "children", "has_children", "has_more", "_row")
+
+    def __init__(self, kind, node_id, title, url=None, position=-1, parent=None, has_children=False):
+        self.kind = kind
+        self.id = node_id
+        self.title = title
+        self.url = url
+        self.position = position
+        self.parent = parent
+        self.children = []
+        self.has_children = has_children
+        self.has_more = kind == "folder" and has_children  # 未読み込みの子が残っている
+        # 親の children での位置。Qt は parent() のたびに row() を呼ぶため、
+        # children.index() で探さずに追加・削除のときに更新しておく
+        self._row = 0
+
+    def row(self):
+        return self._row
+
+    def append(self, child):
+        child._row = len(self.children)
+        self.children.append(child)
+
+    def remove_child(self, row):
+        del self.children[row]
+        for i in range(row, len(self.children)):
+            self.children[i]._row = i
+
+
+class BookmarkTreeModel(QAbstractItemModel):
+    """
+    ブックマークツリーのモデル。
+    フォルダの子はビューが展開したときに fetchMore() でページ単位に読み込む
+    （BookmarkManager.fetch_children_page）。ダイアログを開いた時点で読むのは
+    ルート直下の先頭ページだけなので、件数によらずすぐに表示できる。
+    追加・削除は読み込み済みの部分にだけ行の挿入・削除として反映する。
+    """
+
+    PAGE_SIZE = 200
+    COLUMNS = ("タイトル", "URL")
+
+    def __init__(self, bookmark_manager, parent=None):
+        super().__init__(parent)
+        self.bookmark_manager = bookmark_manager
+        self._folders = {}  # フォルダ id -> 読み込み済みのノード
+        self._root = self._new_root()
+
+    def _new_root(self):
+        root = _BookmarkNode("folder", self.bookmark_manager.ROOT_FOLDER_ID, "", has_children=True)
+        self._folders = {root.id: root}
+        return root
+
+    def _node(self, index):
+        return index.internalPointer() if index.isValid() else self._root
+
+    def _index_of(self, node):
+        if node is self._root:
+            return QModelIndex()
+        return self.createIndex(node.row(), 0, node)
+
+    def index(self, row, column, parent=QModelIndex()):
+        node = self._node(parent)
+        if not (0 <= row < len(node.children) and 0 <= column < len(self.COLUMNS)):
+            return QModelIndex()
+        return self.createIndex(row, column, node.children[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        return self._index_of(index.internalPointer().parent)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid() and parent.column() != 0:
+            return 0
+        return len(self._node(parent).children)
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(self.COLUMNS)
+
+    def hasChildren(self, parent=QModelIndex()):
+        node = self._node(parent)
+        return node.kind == "folder" and (node.has_children or bool(node.children))
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        if role == Qt.DisplayRole:
+            if index.column() == 0:
+                return node.title
+            return node.url or ""
+        if role == Qt.ToolTipRole and node.kind == "bookmark":
+            return node.url if index.column() == 1 else node.title
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.COLUMNS[section]
+        return super().headerData(section, orientation, role)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return self._node(parent).has_more
+
+    def fetchMore(self, parent=QModelIndex()):
+        node = self._node(parent)
+        if not node.has_more:
+            return
+        after = node.children[-1].position if node.children else None
+        rows = self.bookmark_manager.fetch_children_page(node.id, after, self.PAGE_SIZE)
+        node.has_more = len(rows) == self.PAGE_SIZE
+        if not rows:
+            node.has_children = bool(node.children)
+            return
+        start = len(node.children)
+        self.beginInsertRows(parent, start, start + len(rows) - 1)
+        for kind, item_id, title, url, position, has_children in rows:
+            child = _BookmarkNode(kind, item_id, title, url, position, node, bool(has_children))
+            node.append(child)
+            if kind == "folder":
+                self._folders[item_id] = child
+        self.endInsertRows()
+
+    def refresh(self):
+        """読み込み済みの行を捨ててルート直下から読み直す（インポート後など）"""
+        self.beginResetModel()
+        self._root = self._new_root()
+        self.endResetModel()
+        self.fetchMore()
+
+    def item_data(self, index):
+        """選択行の情報（{"type", "id", "name" / "url"}）。無効な index なら None"""
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        if node.kind == "folder":
+            return {"type": "folder", "id": node.id, "name": node.title}
+        return {"type": "bookmark", "id": node.id, "url": node.url}
+
+    def insert_bookmark(self, folder_id, bookmark_id, title, url):
+        """追加したブックマークを、子を読み込み済みのフォルダの末尾に反映する"""
+        folder = self._folders.get(folder_id)
+        if folder is None:
+            return
+        if folder.has_more:
+            # 未読み込みの子がある。末尾のページを読むときに DB から取得される
+            return
+        position = folder.children[-1].position + 1 if folder.children else 0
+        row = len(folder.children)
+        self.beginInsertRows(self._index_of(folder), row, row)
+        folder.append(_BookmarkNode("bookmark", bookmark_id, title, url, position, folder))
+        folder.has_children = True
+        self.endInsertRows()
+
+    def remove_index(self, index):
+        """行（フォルダなら部分木ごと）を取り除く"""
+        if not index.isValid():
+            return
+        node = index.internalPointer()
+        parent = node.parent
+        row = node.row()
+        self.beginRemoveRows(self._index_of(parent), row, row)
+        parent.remove_child(row)
+        self.endRemoveRows()
+        if not parent.children and not parent.has_more:
+            parent.has_children = False
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if current.kind == "folder":
+                self._folders.pop(current.id, None)
+                stack.extend(current.children)
+
+
+# =====================================================================
+# ダウンロードモデル
+# =====================================================================
+
+# ダウンロードの状態（QWebEngineDownloadRequest.DownloadState の値）
+DOWNLOAD_STATE_LABELS = {
+    0: "要求中",
+    1: "ダウンロード中",
+    2: "完了",
+    3: "キャンセル",
+    4: "中断",
+}
+DOWNLOAD_IN_PROGRESS = 1
+DOWNLOAD_COMPLETED = 2
+# DownloadManager.queue_status() の表示名（転送中は DOWNLOAD_STATE_LABELS のまま）
+DOWNLOAD_QUEUE_LABELS = {"queued": "待機中", "paused": "一時停止", "retrying": "再試行待ち"}
+DOWNLOAD_PRIORITY_LABELS = {0: "低", 1: "通常", 2: "高"}
+
+# 進捗バーを描く割合（0-100）。描かない行は None（DownloadProgressDelegate が参照する）
+DOWNLOAD_PROGRESS_ROLE = Qt.UserRole + 1
+
+
+def format_speed(bytes_per_sec):
+    """速度（バイト/秒）を表示用の文字列にする"""
+    if bytes_per_sec >= 1024 * 1024:
+        return f"{bytes_per_sec / (1024 * 1024):.1f} MB/s"
+    return f"{bytes_per_sec / 1024:.0f} KB/s"
+
+
+def format_duration(seconds):
+    """秒数を h:mm:ss（1 時間未満は m:ss）にする"""
+    seconds = int(seconds + 0.5)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+class DownloadTableModel(QAbstractTableModel):
+    """
+    ダウンロード一覧のモデル。
+    DB の履歴を一度だけ読み込み、このセッションのダウンロードは DownloadManager の
+    progress_changed / state_changed を受けて、変わったセルだけ dataChanged で知らせる
+    （定期的な読み直しはしない）。進行中の値は DownloadManager.current_values() から読む。
+    速度は進行中なら平滑化した現在の速度、終了後は DB に記録した平均速度を表示する。
+    SHA-256 は計算中なら進み具合、計算後は先頭の 16 桁と期待値との照合結果を表示する。
+    session_only=True ではこのセッションのダウンロードだけを表示する。
+    """
+
+    (COLUMN_FILENAME, COLUMN_URL, COLUMN_PATH, COLUMN_SIZE, COLUMN_PROGRESS,
+     COLUMN_SPEED, COLUMN_ETA, COLUMN_STATE, COLUMN_SHA256) = range(9)
+    HEADERS = ("ファイル名", "URL", "保存先", "サイズ", "進捗", "速度", "残り時間", "状態", "SHA-256")
+    HISTORY_LIMIT = 100
+
+    def __init__(self, download_manager, session_only=False, parent=None):
+        super().__init__(parent)
+        self.download_manager = download_manager
+        self.session_only = session_only
+        # [id, filename, url, download_path, total_bytes, received_bytes, state,
+        #  avg_bytes_per_sec, peak_bytes_per_sec, sha256, expected_sha256]
+        self._rows = []
+        self._row_of = {}  # ダウンロード id -> 行番号
+        download_manager.download_added.connect(self._on_download_added)
+        download_manager.progress_changed.connect(self._on_progress_changed)
+        download_manager.state_changed.connect(self._on_state_changed)
+        download_manager.checksum_changed.connect(self._on_checksum_changed)
+        self.refresh()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def _values(self, row):
+        """(total_bytes, received_bytes, state)。進行中のダウンロードは現在値"""
+        values = self.download_manager.current_values(row[0])
+        return values if values is not None else (row[4], row[5], row[6])
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self._rows[index.row()]
+        column = index.column()
+        if column in (self.COLUMN_FILENAME, self.COLUMN_URL, self.COLUMN_PATH):
+            if role in (Qt.DisplayRole, Qt.ToolTipRole):
+                return row[column + 1] or ""
+            return None
+
+        total, received, state = self._values(row)
+        if total and total > 0:
+            percent = min(int((received or 0) / total * 100), 100)
+        else:
+            percent = 100 if state == DOWNLOAD_COMPLETED else 0
+        if column == self.COLUMN_SIZE:
+            if role == Qt.DisplayRole:
+                return f"{total / (1024 * 1024):.2f} MB" if total and total > 0 else "不明"
+            if role == Qt.TextAlignmentRole:
+                return int(Qt.AlignRight | Qt.AlignVCenter)
+        elif column == self.COLUMN_PROGRESS:
+            finished = state == DOWNLOAD_COMPLETED or (state != DOWNLOAD_IN_PROGRESS and percent >= 100)
+            if role == DOWNLOAD_PROGRESS_ROLE:
+                return percent if state == DOWNLOAD_IN_PROGRESS else None
+            if role == Qt.DisplayRole:
+                return "完了" if finished else f"{percent}%"
+            if role == Qt.ForegroundRole and finished:
+                return QColor("#2e7d32")
+        elif column in (self.COLUMN_SPEED, self.COLUMN_ETA):
+            if role == Qt.TextAlignmentRole:
+                return int(Qt.AlignRight | Qt.AlignVCenter)
+            if role not in (Qt.DisplayRole, Qt.ToolTipRole):
+                return None
+            sampler = self.download_manager.sampler(row[0])
+            if (state == DOWNLOAD_IN_PROGRESS and sampler is not None
+                    and self.download_manager.queue_status(row[0]) == "active"):
+                if column == self.COLUMN_ETA:
+                    eta = sampler.eta(total)
+                    return "不明" if eta is None else format_duration(eta)
+                if role == Qt.ToolTipRole:
+                    return (f"現在 {format_speed(sampler.instantaneous())} / "
+                            f"最高 {format_speed(sampler.peak)}")
+                return format_speed(sampler.smoothed())
+            average, peak = row[7], row[8]
+            if column == self.COLUMN_ETA or average is None:
+                return ""
+            if role == Qt.ToolTipRole:
+                return f"平均 {format_speed(average)} / 最高 {format_speed(peak or 0)}"
+            return format_speed(average)
+        elif column == self.COLUMN_STATE:
+            status = self.download_manager.queue_status(row[0])
+            if role == Qt.DisplayRole:
+                if status in DOWNLOAD_QUEUE_LABELS:
+                    return DOWNLOAD_QUEUE_LABELS[status]
+                return DOWNLOAD_STATE_LABELS.get(state, "不明")
+            if role == Qt.ToolTipRole and status is not None:
+                priority = self.download_manager.priority(row[0])
+                tooltip = f"優先度: {DOWNLOAD_PRIORITY_LABELS.get(priority, priority)}"
+                error = self.download_manager.resume_error(row[0])
+                return f"{tooltip}\n前回の失敗: {error}" if error else tooltip
+        elif column == self.COLUMN_SHA256:
+            sha256, expected = row[9], row[10]
+            if role == Qt.DisplayRole:
+                percent = self.download_manager.checksum_progress(row[0])
+                if percent is not None:
+                    return f"計算中 {percent}%"
+                if not sha256:
+                    return ""
+                if expected:
+                    return f"{'一致' if sha256 == expected else '不一致'} {sha256[:16]}…"
+                return f"{sha256[:16]}…"
+            if role == Qt.ToolTipRole and sha256:
+                return f"SHA-256: {sha256}" + (f"\n期待値: {expected}" if expected else "")
+            if role == Qt.ForegroundRole and sha256 and expected:
+                return QColor("#2e7d32") if sha256 == expected else QColor("#c62828")
+        return None
+
+    def refresh(self):
+        """DB（session_only ならこのセッションの一覧）から読み直す"""
+        self.beginResetModel()
+        if self.session_only:
+            self._rows = [
+                [download_id, item.downloadFileName(), item.url().toString(),
+                 item.downloadDirectory(), 0, 0, 0, None, None, None, None]
+                for download_id, item in reversed(self.download_manager.live_downloads().items())
+            ]
+        else:
+            self._rows = [
+                list(row[:9]) + list(row[11:13])
+                for row in self.download_manager.get_download_history(self.HISTORY_LIMIT)
+            ]
+        self._reindex()
+        self.endResetModel()
+
+    def row_data(self, row):
+        """(ファイル名, URL, 保存先)。範囲外なら None"""
+        if 0 <= row < len(self._rows):
+            _id, filename, url, download_path = self._rows[row][:4]
+            return filename or "", url or "", download_path or ""
+        return None
+
+    def state(self, row):
+        """行のダウンロードの状態（進行中なら現在の値）。範囲外なら None"""
+        if 0 <= row < len(self._rows):
+            return self._values(self._rows[row])[2]
+        return None
+
+    def checksum(self, row):
+        """(SHA-256, 期待値)。計算していない値は None。範囲外なら None"""
+        if 0 <= row < len(self._rows):
+            return self._rows[row][9], self._rows[row][10]
+        return None
+
+    def download_id(self, row):
+        """行のダウンロード id（範囲外なら None）"""
+        if 0 <= row < len(self._rows):
+            return self._rows[row][0]
+        return None
+
+    def _reindex(self):
+        self._row_of = {row[0]: i for i, row in enumerate(self._rows)}
+
+    def _on_download_added(self, download_id):
+        item = self.download_manager.live_download(download_id)
+        if item is None or download_id in self._row_of:
+            return
+        self.beginInsertRows(QModelIndex(), 0, 0)
+        self._rows.insert(0, [download_id, item.downloadFileName(), item.url().toString(),
+                              item.downloadDirectory(), 0, 0, 0, None, None, None, None])
+        self._reindex()
+        self.endInsertRows()
+
+    def _on_progress_changed(self, download_id):
+        row = self._row_of.get(download_id)
+        if row is not None:
+            self.dataChanged.emit(self.index(row, self.COLUMN_PROGRESS), self.index(row, self.COLUMN_ETA))
+
+    def _on_state_changed(self, download_id):
+        row = self._row_of.get(download_id)
+        if row is None:
+            return
+        record = self.download_manager.get_download_record(download_id)
+        if record is not None:
+            self._rows[row][4:11] = record
+        self.dataChanged.emit(self.index(row, self.COLUMN_SIZE), self.index(row, self.COLUMN_SHA256))
+
+    def _on_checksum_changed(self, download_id):
+        row = self._row_of.get(download_id)
+        if row is None:
+            return
+        if self.download_manager.checksum_progress(download_id) is None:
+            record = self.download_manager.get_download_record(download_id)
+            if record is not None:
+                self._rows[row][4:11] = record
+        index = self.index(row, self.COLUMN_SHA256)
+        self.dataChanged.emit(index, index)
@@ -0,0 +1,132 @@
+"""
+VELA Browser - URL バー補完（履歴 + ブックマーク）のベンチマーク
+
+一時ディレクトリに合成した履歴（既定 20 万 URL）とブックマーク（既定 2 万件、
+半分は履歴にもある URL）を作り、検索ワーカーと同じ読み取り専用の接続で
+HistoryManager._query_suggestions() のレイテンシ（p50 / p99）を
+「履歴のみ」と「ブックマークを添付した場合」で比べる。
+目標: ブックマークを含めても p99 が履歴のみの p99 + 許容差 以内。
+
+使い方:
+    uv run python scripts/bench-suggest.py [履歴の URL 数] [ブックマーク数]
+"""
+
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# 利用者のデータを触らないよう、ホームを一時ディレクトリに向けてから読み込む
+_TEMP_HOME = tempfile.mkdtemp(prefix="vela-bench-")
+for _var in ("HOME", "USERPROFILE", "XDG_CONFIG_HOME", "XDG_DATA_HOME",
+             "XDG_CACHE_HOME", "XDG_STATE_HOME"):
+    os.environ.pop(_var, None)
+os.environ["HOME"] = os.environ["USERPROFILE"] = _TEMP_HOME
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import VELABrowser  # noqa: E402,F401  constants を登録する
+from PySide6.QtCore import QCoreApplication  # noqa: E402
+from managers import HistoryManager, BookmarkManager, BOOKMARK_SUGGEST_BOOST  # noqa: E402
+
+# ブックマークを含めたときに履歴のみの p99 から増えてよい時間
+P99_OVERHEAD_BUDGET_MS = 2.0
+
+_SYLLABLES = ["ka", "ri", "to", "na", "me", "so", "lu", "pe", "gi", "do",
+              "an", "el", "or", "us", "ix", "ba", "ne", "ko", "mi", "ta"]
+_TLDS = [".com", ".net", ".org", ".co.jp", ".io", ".jp"]
+# 2〜3 音節の語（約 8000 語）。実際の履歴のようにタイトル・URL の語彙を散らす
+_WORDS = sorted({a + b + c for a in _SYLLABLES for b in _SYLLABLES for c in _SYLLABLES + [""]})
+
+
+def _random_url(rng):
+    host = "".join(rng.choice(_WORDS) for _ in range(rng.randint(1, 2)))
+    host += str(rng.randint(0, 3000)) + rng.choice(_TLDS)
+    path = "/".join(rng.choice(_WORDS) + str(rng.randint(0, 999))
+                    for _ in range(rng.randint(0, 3)))
+    return rng.choice(["https://", "http://", "https://www."]) + host + "/" + path
+
+
+def _random_title(rng):
+    return " ".join(rng.choice(_WORDS).capitalize() for _ in range(rng.randint(2, 5)))
+
+
+def _percentile(sorted_values, ratio):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * ratio))]
+
+
+def _measure(conn, queries, fts_enabled, bookmarks):
+    latencies = []
+    for query in queries:
+        t0 = time.perf_counter()
+        HistoryManager._query_suggestions(conn, query, 10, fts_enabled, bookmarks)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    latencies.sort()
+    return _percentile(latencies, 0.50), _percentile(latencies, 0.99)
+
+
+def main():
+    url_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    bookmark_count = int(sys.argv[2]) if len(sys.argv) > 2 else 20_000
+    rng = random.Random(2025)
+    app = QCoreApplication([])  # noqa: F841  QTimer を使うマネージャーのため
+
+    history = HistoryManager()
+    history.search_worker.stop()
+    bookmarks = BookmarkManager()
+
+    urls = list({_random_url(rng) for _ in range(url_count)})
+    started = time.perf_counter()
+    with history._conn:
+        history._conn.executemany(
+            "INSERT INTO urls (url, title, visit_count, last_visit_time, frecency) "
+            "VALUES (?, ?, 1, CURRENT_TIMESTAMP, ?)",
+            ((url, _random_title(rng), rng.randint(0, 5000)) for url in urls)
+        )
+    history.flush()
+    marked = rng.sample(urls, min(len(urls), bookmark_count // 2))
+    marked += [_random_url(rng) for _ in range(bookmark_count - len(marked))]
+    with sqlite3.connect(bookmarks.db_path) as conn:
+        conn.executemany(
+            "INSERT INTO bookmarks (title, url, canonical_url, folder_id, position) VALUES (?, ?, ?, ?, ?)",
+            ((_random_title(rng), url, url, bookmarks.ROOT_FOLDER_ID, i) for i, url in enumerate(marked))
+        )
+    print(f"[INFO] setup     : {time.perf_counter() - started:.1f} s")
+
+    # 検索ワーカーと同じ読み取り専用接続（ブックマーク DB を添付する）
+    conn = sqlite3.connect(f"file:{history.db_path}?mode=ro", uri=True)
+    HistoryManager._attach_bookmarks(conn, str(bookmarks.db_path))
+
+    # 語の先頭 1〜6 文字と、2 語の組み合わせを入力として使う
+    queries = []
+    for _ in range(1000):
+        word = rng.choice(_WORDS)
+        query = word[:rng.randint(1, len(word))]
+        if rng.random() < 0.3:
+            query += " " + rng.choice(_WORDS)[:3]
+        queries.append(query)
+
+    _measure(conn, queries[:100], history._fts_enabled, None)  # ページキャッシュを温める
+    base_p50, base_p99 = _measure(conn, queries, history._fts_enabled, None)
+    both = (bookmarks.fts_enabled, BOOKMARK_SUGGEST_BOOST)
+    _measure(conn, queries[:100], history._fts_enabled, both)
+    p50, p99 = _measure(conn, queries, history._fts_enabled, both)
+    conn.close()
+    history.close()
+
+    print(f"[INFO] urls      : {len(urls)}, bookmarks: {len(marked)}")
+    print(f"[INFO] history   : p50 {base_p50:.3f} ms, p99 {base_p99:.3f} ms")
+    print(f"[INFO] +bookmarks: p50 {p50:.3f} ms, p99 {p99:.3f} ms "
+          f"(budget {base_p99 + P99_OVERHEAD_BUDGET_MS:.3f} ms)")
+
+    ok = p99 <= base_p99 + P99_OVERHEAD_BUDGET_MS
+    print("[INFO] Result    : OK" if ok else "[ERROR] Result    : budget exceeded")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""
+VELA Browser - URL 前方一致インデックスのベンチマーク
+
+合成した URL（既定 50 万件）で UrlPrefixIndex を構築し、
+メモリ使用量と lookup() のレイテンシ（p50 / p99）を計測する。
+目標: 50 万件で 30 MB 以下、p99 < 1 ms。
+
+使い方:
+    uv run python scripts/bench-url-index.py [件数]
+"""
+
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from urlindex import UrlPrefixIndex, split_url_key  # noqa: E402
+
+MEMORY_BUDGET_MB = 30
+P99_BUDGET_MS = 1.0
+
+_WORDS = ["git", "google", "news", "mail", "docs", "wiki", "shop", "blog",
+          "api", "dev", "cloud", "app", "data", "hub", "media", "video"]
+_TLDS = [".com", ".net", ".org", ".co.jp", ".io", ".jp"]
+
+
+def _random_url(rng):
+    host = "".join(rng.choice(_WORDS) for _ in range(rng.randint(1, 2)))
+    host += str(rng.randint(0, 3000)) + rng.choice(_TLDS)
+    path = "/".join(rng.choice(_WORDS) + str(rng.randint(0, 999))
+                    for _ in range(rng.randint(0, 3)))
+    return rng.choice(["https://", "http://", "https://www."]) + host + "/" + path
+
+
+def _percentile(sorted_values, ratio):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * ratio))]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    rng = random.Random(2025)
+    rows = [(_random_url(rng), rng.randint(0, 5000)) for _ in range(count)]
+
+    started = time.perf_counter()
+    index = UrlPrefixIndex.build(rows)
+    build_s = time.perf_counter() - started
+    memory_mb = index.memory_bytes() / (1024 * 1024)
+
+    # 実在する URL のキー先頭 1〜15 文字を入力として使う
+    queries = []
+    for _ in range(10_000):
+        key, _flags = split_url_key(rng.choice(rows)[0])
+        queries.append(key[:rng.randint(1, min(len(key), 15))])
+
+    latencies = []
+    for query in queries:
+        t0 = time.perf_counter()
+        index.lookup(query, 10)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    latencies.sort()
+    p50 = _percentile(latencies, 0.50)
+    p99 = _percentile(latencies, 0.99)
+
+    print(f"[INFO] urls      : {len(index)}")
+    print(f"[INFO] build     : {build_s:.2f} s")
+    print(f"[INFO] memory    : {memory_mb:.1f} MB (budget {MEMORY_BUDGET_MB} MB)")
+    print(f"[INFO] lookup p50: {p50:.3f} ms")
+    print(f"[INFO] lookup p99: {p99:.3f} ms (budget {P99_BUDGET_MS} ms)")
+
+    ok = memory_mb <= MEMORY_BUDGET_MB and p99 < P99_BUDGET_MS
+    print("[INFO] Result    : OK" if ok else "[ERROR] Result    : budget exceeded")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+"""
+VELA Browser - 接続をわざと切る HTTP サーバー（中断したダウンロードの再開の確認用）
+
+/file.bin で決まった内容の合成データを返す。Range 要求に応じ（--no-range で無視）、
+1 回の応答で --drop-after KB 送るたびに接続を切る。--fail-first 回目までの要求には
+503 を返し、--rate で送信速度を絞れる。ブラウザで http://127.0.0.1:<port>/file.bin を開けば、切断からの取り直しを
+手で確かめられる。
+
+--check を付けると、サーバーを立てたうえで「前回の起動時に途中まで受信して中断した」
+ダウンロードを一時ディレクトリの downloads.db に作り、DownloadManager.resume_interrupted()
+で最後まで取り直せるか（DB の行がそのまま使われ、途中までのファイル <保存先>.download の
+続きから取って保存先へ移し、内容と記録した SHA-256 が一致するか）を確かめる。
+再ダウンロードの手段（プロファイル）が無いので、DownloadResumeWorker の Range 要求で取り直す。
+
+使い方:
+    uv run python scripts/flaky-download-server.py [--size MB] [--drop-after KB] [--check]
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    payload = b""
+    drop_after = 0
+    honour_range = True
+    fail_first = 0
+    rate = 0  # バイト/秒（0 なら制限しない）
+    requests = 0
+    drops = 0
+    _lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path != "/file.bin":
+            self.send_error(404)
+            return
+        cls = type(self)
+        with cls._lock:
+            cls.requests += 1
+            number = cls.requests
+        if number <= cls.fail_first:
+            self.send_error(503)
+            return
+
+        size = len(cls.payload)
+        start = 0
+        range_header = self.headers.get("Range")
+        if cls.honour_range and range_header and range_header.startswith("bytes="):
+            start = int(range_header[6:].split("-")[0])
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{size - 1}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(size - start))
+        self.send_header("Accept-Ranges", "bytes" if cls.honour_range else "none")
+        self.end_headers()
+
+        end = size if cls.drop_after <= 0 else min(size, start + cls.drop_after)
+        try:
+            view = memoryview(cls.payload)
+            for offset in range(start, end, 64 * 1024):
+                self.wfile.write(view[offset:min(offset + 64 * 1024, end)])
+                if cls.rate > 0:
+                    time.sleep(64 * 1024 / cls.rate)
+            self.wfile.flush()
+            if end < size:
+                # 残りを送らずに切る（クライアントには途中で切れた応答に見える）
+                with cls._lock:
+                    cls.drops += 1
+                self.connection.shutdown(socket.SHUT_RDWR)
+                self.close_connection = True
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+
+def start_server(size, drop_after, honour_range, fail_first, port=0, rate=0):
+    FlakyHandler.payload = random.Random(2468).randbytes(size)
+    FlakyHandler.drop_after = drop_after
+    FlakyHandler.honour_range = honour_range
+    FlakyHandler.fail_first = fail_first
+    FlakyHandler.rate = rate
+    server = ThreadingHTTPServer(("127.0.0.1", port), FlakyHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_check(server, partial_bytes, timeout):
+    # 利用者のデータを触らないよう、ホームを一時ディレクトリに向けてから読み込む
+    temp_home = tempfile.mkdtemp(prefix="vela-resume-")
+    for var in ("HOME", "USERPROFILE", "XDG_CONFIG_HOME", "XDG_DATA_HOME",
+                "XDG_CACHE_HOME", "XDG_STATE_HOME"):
+        os.environ.pop(var, None)
+    os.environ["HOME"] = os.environ["USERPROFILE"] = temp_home
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+    import VELABrowser  # noqa: F401  constants を登録する
+    from PySide6.QtCore import QCoreApplication, QTimer
+    from downloadresume import RetryPolicy, partial_path
+    from managers import DownloadManager
+
+    app = QCoreApplication.instance() or QCoreApplication([])
+    payload = FlakyHandler.payload
+    url = f"http://127.0.0.1:{server.server_address[1]}/file.bin"
+    download_dir = Path(temp_home) / "Downloads"
+    download_dir.mkdir()
+    target = download_dir / "file.bin"
+    partial = Path(partial_path(str(target)))
+    partial.write_bytes(payload[:partial_bytes])
+
+    # 前回の起動時に中断したダウンロード（DB の行と途中までのファイル）を用意する
+    manager = DownloadManager()
+    with manager._conn:
+        download_id = manager._conn.execute(
+            'INSERT INTO downloads (filename, url, download_path, total_bytes, received_bytes, state) '
+            'VALUES (?, ?, ?, ?, ?, 4)',
+            ("file.bin", url, str(download_dir), len(payload), partial_bytes)
+        ).lastrowid
+    manager.retry_policy = RetryPolicy(max_attempts=6, base_delay=0.2, max_delay=2.0)
+
+    deadline = time.monotonic() + timeout
+
+    def poll():
+        # 取り直しが終わり（完了か、あきらめて中断に戻る）、SHA-256 も計算し終わるまで待つ
+        finished = manager.get_download_record(download_id)[2] != 1
+        if (finished and manager.checksum_progress(download_id) is None) or time.monotonic() > deadline:
+            app.quit()
+
+    timer = QTimer()
+    timer.timeout.connect(poll)
+    timer.start(20)
+    started = time.perf_counter()
+    manager.resume_interrupted()
+    app.exec()
+    elapsed = time.perf_counter() - started
+
+    total, received, state, average, peak, sha256, _expected = manager.get_download_record(download_id)
+    rows = manager._conn.execute('SELECT COUNT(*) FROM downloads').fetchone()[0]
+    manager.close()
+    data = target.read_bytes() if target.exists() else b""
+    expected = hashlib.sha256(payload).hexdigest()
+    ok = (state == 2 and rows == 1 and received == len(payload) and not partial.exists()
+          and hashlib.sha256(data).hexdigest() == expected and sha256 == expected)
+    print(f"[INFO] requests  : {FlakyHandler.requests} ({FlakyHandler.drops} dropped)")
+    print(f"[INFO] state     : {state}, {received} / {total} bytes in {elapsed:.1f} s, "
+          f"rows {rows}")
+    print(f"[INFO] avg speed : {(average or 0) / 1024:.0f} KB/s, peak {(peak or 0) / 1024:.0f} KB/s")
+    print(f"[{'INFO' if ok else 'ERROR'}] Result    : {'ok' if ok else 'mismatch'}")
+    return 0 if ok else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--size", type=float, default=20.0, help="ファイルの大きさ（MB）")
+    parser.add_argument("--drop-after", type=int, default=3072,
+                        help="1 回の応答で送る量（KB）。0 なら切らない")
+    parser.add_argument("--no-range", action="store_true", help="Range 要求を無視する")
+    parser.add_argument("--fail-first", type=int, default=1, help="最初に 503 を返す回数")
+    parser.add_argument("--rate", type=int, default=0, help="送信速度の上限（KB/s）。0 なら制限しない")
+    parser.add_argument("--check", action="store_true",
+                        help="DownloadManager で中断したダウンロードを取り直して確かめる")
+    parser.add_argument("--partial", type=int, default=1024,
+                        help="--check で前回受信済みとする量（KB）")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    server = start_server(int(args.size * 1024 * 1024), args.drop_after * 1024,
+                          not args.no_range, args.fail_first, args.port, args.rate * 1024)
+    if args.check:
+        return run_check(server, args.partial * 1024, args.timeout)
+    print(f"[INFO] Serving http://127.0.0.1:{server.server_address[1]}/file.bin "
+          f"(Ctrl+C で終了)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""
+テスト共通の準備
+利用者のデータを触らないよう、ホームを一時ディレクトリに向けてから VELABrowser を読み込む
+（VELABrowser は自分自身を constants として登録し、managers / models はそれを import する）。
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+_TEMP_HOME = tempfile.mkdtemp(prefix="vela-tests-")
+for _var in ("USERPROFILE", "XDG_CONFIG_HOME", "XDG_DATA_HOME",
+             "XDG_CACHE_HOME", "XDG_STATE_HOME"):
+    os.environ.pop(_var, None)
+os.environ["HOME"] = os.environ["USERPROFILE"] = _TEMP_HOME
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pytest  # noqa: E402
+from PySide6.QtCore import QUrl  # noqa: E402
+
+import VELABrowser  # noqa: E402,F401  constants を登録する
+
+
+@pytest.fixture(scope="session")
+def qt_app():
+    from PySide6.QtCore import QCoreApplication
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+@pytest.fixture
+def history_manager(qt_app, tmp_path, monkeypatch):
+    """一時ディレクトリの history.db を使う HistoryManager"""
+    import managers
+    monkeypatch.setattr(managers, "HISTORY_DB", tmp_path / "history.db")
+    manager = managers.HistoryManager()
+    yield manager
+    manager.close()
+
+
+@pytest.fixture
+def bookmark_manager(tmp_path, monkeypatch):
+    """一時ディレクトリの bookmarks.db を使う BookmarkManager"""
+    import managers
+    monkeypatch.setattr(managers, "BOOKMARKS_DB", tmp_path / "bookmarks.db")
+    return managers.BookmarkManager()
+
+
+@pytest.fixture
+def download_manager(qt_app, tmp_path, monkeypatch):
+    """一時ディレクトリの downloads.db を使う DownloadManager（SHA-256 は計算しない）"""
+    import managers
+    monkeypatch.setattr(managers, "DOWNLOADS_DB", tmp_path / "downloads.db")
+    manager = managers.DownloadManager()
+    manager.verify_checksums = False
+    yield manager
+    manager.close()
+
+
+def make_legacy_history_db(path, rows):
+    """
+    旧版（history テーブル 1 つ、auto_vacuum なし）の history.db を作る。
+    rows は (url, title, visit_time, visit_count)
+    """
+    with sqlite3.connect(path) as conn:
+        conn.execute('''
+            CREATE TABLE history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                title TEXT,
+                visit_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                visit_count INTEGER DEFAULT 1
+            )
+        ''')
+        conn.execute('CREATE INDEX idx_url ON history(url)')
+        conn.executemany(
+            'INSERT INTO history (url, title, visit_time, visit_count) VALUES (?, ?, ?, ?)', rows)
+    conn.close()
+
+
+def finish_history_migration(manager):
+    """起動後のタイマーで進む移行・正規化を、イベントループを回さずに最後まで進める"""
+    while manager._migrating:
+        manager._migration_timer.stop()
+        manager._run_migration_chunk()
+    manager._migration_timer.stop()
+
+
+def make_legacy_bookmarks_db(path, rows):
+    """旧版（bookmarks テーブル 1 つ、フォルダは名前だけ）の bookmarks.db を作る。rows は (title, url, folder)"""
+    with sqlite3.connect(path) as conn:
+        conn.execute('''
+            CREATE TABLE bookmarks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                url TEXT NOT NULL,
+                folder TEXT DEFAULT 'root',
+                created_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.executemany('INSERT INTO bookmarks (title, url, folder) VALUES (?, ?, ?)', rows)
+    conn.close()
+
+
+class _FakeSignal:
+    def __init__(self):
+        self.slots = []
+
+    def connect(self, slot):
+        self.slots.append(slot)
+
+
+class _Value:
+    def __init__(self, value):
+        self.value = value
+
+
+class FakeDownload:
+    """QWebEngineDownloadRequest の代わり（DownloadManager が使う分だけ）"""
+
+    def __init__(self, url, directory="", filename="file.bin", total=-1):
+        self._url = QUrl(url)
+        self.directory = directory
+        self.filename = filename
+        self.received = 0
+        self.total = total
+        self.state_value = 1
+        self.reason = 0
+        self.accepted = False
+        self.calls = []
+        self.receivedBytesChanged = _FakeSignal()
+        self.stateChanged = _FakeSignal()
+
+    def url(self):
+        return self._url
+
+    def downloadDirectory(self):
+        return self.directory
+
+    def downloadFileName(self):
+        return self.filename
+
+    def setDownloadDirectory(self, directory):
+        self.directory = directory
+
+    def setDownloadFileName(self, filename):
+        self.filename = filename
+
+    def accept(self):
+        self.accepted = True
+
+    def receivedBytes(self):
+        return self.received
+
+    def totalBytes(self):
+        return self.total
+
+    def state(self):
+        return _Value(self.state_value)
+
+    def interruptReason(self):
+        return _Value(self.reason)
+
+    def interruptReasonString(self):
+        return "Network disconnected"
+
+    def pause(self):
+        self.calls.append("pause")
+
+    def resume(self):
+        self.calls.append("resume")
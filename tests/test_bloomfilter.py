@@ -0,0 +1,47 @@
+"""bloomfilter（ブックマーク済み URL の集合）"""
+
+import managers
+from bloomfilter import BloomFilter
+
+
+def test_no_false_negatives():
+    bloom = BloomFilter(1000)
+    urls = [f"https://example.com/{i}" for i in range(1000)]
+    for url in urls[:500]:
+        bloom.add(url)
+    bloom.update(urls[500:])
+    assert bloom.count == 1000
+    assert all(url in bloom for url in urls)
+    assert not bloom.is_full()
+    bloom.add("https://example.com/extra")
+    assert bloom.is_full()
+
+
+def test_update_matches_add():
+    one, other = BloomFilter(100), BloomFilter(100)
+    urls = [f"https://例え.jp/{i}" for i in range(100)]
+    for url in urls:
+        one.add(url)
+    other.update(urls)
+    assert one._bits == other._bits
+
+
+def test_false_positive_rate_close_to_design():
+    bloom = BloomFilter(10_000, error_rate=0.01)
+    bloom.update(f"https://in.example/{i}" for i in range(10_000))
+    hits = sum(f"https://out.example/{i}" in bloom for i in range(20_000))
+    assert hits / 20_000 < 0.02
+    # 0.01 で 1 件あたり約 9.6 ビット
+    assert 11_000 <= bloom.memory_bytes() <= 13_000
+
+
+def test_bookmark_manager_confirms_bloom_hits(bookmark_manager, monkeypatch):
+    monkeypatch.setattr(managers.BookmarkManager, "_BLOOM_THRESHOLD", 2)
+    first = bookmark_manager.add_bookmark("A", "https://a.com/")
+    bookmark_manager.add_bookmark("B", "https://b.com/")
+    assert bookmark_manager._url_bloom is not None
+    assert bookmark_manager.is_bookmarked("https://a.com/?utm_source=x")
+    # Bloom フィルタからは消えないが、DB で確かめて落とす
+    bookmark_manager.delete_bookmark(first)
+    assert not bookmark_manager.is_bookmarked("https://a.com/")
+    assert bookmark_manager.is_bookmarked("https://b.com/")
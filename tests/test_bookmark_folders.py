@@ -0,0 +1,150 @@
+"""ブックマークのフォルダツリー（parent_id と閉包テーブル folder_tree）"""
+
+import sqlite3
+
+import managers
+from bookmarkio import NetscapeBookmarkReader
+from conftest import make_legacy_bookmarks_db
+
+ROOT = managers.BookmarkManager.ROOT_FOLDER_ID
+
+
+def _tree(manager):
+    with sqlite3.connect(manager.db_path) as conn:
+        rows = set(conn.execute('SELECT ancestor, descendant, depth FROM folder_tree'))
+    conn.close()
+    return rows
+
+
+def _expected_tree(manager):
+    """folders の parent_id から閉包テーブルの期待値を作る"""
+    with sqlite3.connect(manager.db_path) as conn:
+        parents = dict(conn.execute('SELECT id, parent_id FROM folders'))
+    conn.close()
+    rows = set()
+    for folder_id in parents:
+        ancestor, depth = folder_id, 0
+        while ancestor is not None:
+            rows.add((ancestor, folder_id, depth))
+            ancestor, depth = parents[ancestor], depth + 1
+    return rows
+
+
+def test_create_folder_builds_closure_and_order(bookmark_manager):
+    manager = bookmark_manager
+    work = manager.create_folder('Work')
+    news = manager.create_folder('News', work)
+    manager.add_bookmark('Mail', 'https://mail.example/', folder_id=work)
+    docs = manager.create_folder('Docs', work)
+
+    assert _tree(manager) == _expected_tree(manager)
+    assert (ROOT, news, 2) in _tree(manager)
+    # フォルダとブックマークは 1 つの position の並びを共有する
+    assert manager.get_children(work) == [
+        ('folder', news, 'News', None),
+        ('bookmark', 1, 'Mail', 'https://mail.example/'),
+        ('folder', docs, 'Docs', None),
+    ]
+    assert manager.get_folders() == [
+        (ROOT, 'root'), (work, 'Work'), (news, 'Work / News'), (docs, 'Work / Docs')]
+
+
+def test_add_bookmark_creates_folder_path(bookmark_manager):
+    manager = bookmark_manager
+    manager.add_bookmark('A', 'https://a.example/', folder='X / Y')
+    manager.add_bookmark('B', 'https://b.example/', folder='X / Y')
+
+    folders = dict((path, folder_id) for folder_id, path in manager.get_folders())
+    assert list(folders) == ['root', 'X', 'X / Y']
+    assert [row[2] for row in manager.get_children(folders['X / Y'])] == ['A', 'B']
+
+
+def test_move_folder_moves_subtree(bookmark_manager):
+    manager = bookmark_manager
+    a = manager.create_folder('A')
+    b = manager.create_folder('B', a)
+    c = manager.create_folder('C', b)
+    d = manager.create_folder('D')
+    manager.add_bookmark('Leaf', 'https://leaf.example/', folder_id=c)
+
+    assert manager.move_folder(b, d)
+
+    assert _tree(manager) == _expected_tree(manager)
+    assert dict(manager.get_folders())[c] == 'D / B / C'
+    assert manager.count_bookmarks(a) == 0
+    assert manager.count_bookmarks(d) == 1
+
+
+def test_move_folder_rejects_own_subtree(bookmark_manager):
+    manager = bookmark_manager
+    a = manager.create_folder('A')
+    b = manager.create_folder('B', a)
+    before = _tree(manager)
+
+    assert not manager.move_folder(a, b)
+    assert not manager.move_folder(a, a)
+    assert not manager.move_folder(ROOT, a)
+    assert _tree(manager) == before
+
+
+def test_count_and_delete_folder_cover_descendants(bookmark_manager):
+    manager = bookmark_manager
+    a = manager.create_folder('A')
+    b = manager.create_folder('B', a)
+    keep = manager.create_folder('Keep')
+    manager.add_bookmark('1', 'https://one.example/', folder_id=a)
+    manager.add_bookmark('2', 'https://two.example/', folder_id=b)
+    manager.add_bookmark('3', 'https://three.example/', folder_id=keep)
+
+    assert manager.count_bookmarks(a) == 2
+    assert manager.count_bookmarks(ROOT) == 3
+
+    manager.delete_folder(a)
+
+    assert manager.get_folders() == [(ROOT, 'root'), (keep, 'Keep')]
+    assert _tree(manager) == _expected_tree(manager)
+    assert [row[1] for row in manager.get_bookmarks()] == ['3']
+    assert not manager.is_bookmarked('https://two.example/')
+    assert manager.is_bookmarked('https://three.example/')
+
+
+def test_legacy_folder_names_migrate_to_tree(tmp_path, monkeypatch):
+    path = tmp_path / 'bookmarks.db'
+    make_legacy_bookmarks_db(path, [
+        ('Top', 'https://top.example/', 'root'),
+        ('Feed', 'https://feed.example/', 'Work / News'),
+        ('Mail', 'https://mail.example/', 'Work'),
+        ('Old', 'https://old.example/', 'Work / News'),
+    ])
+    monkeypatch.setattr(managers, 'BOOKMARKS_DB', path)
+    manager = managers.BookmarkManager()
+
+    folders = {name: folder_id for folder_id, name in manager.get_folders()}
+    assert list(folders) == ['root', 'Work', 'Work / News']
+    assert _tree(manager) == _expected_tree(manager)
+    # 各フォルダでは子フォルダが先、ブックマークは元の id 順
+    assert [(row[0], row[2]) for row in manager.get_children(ROOT)] == [('folder', 'Work'), ('bookmark', 'Top')]
+    assert [row[2] for row in manager.get_children(folders['Work'])] == ['News', 'Mail']
+    assert [row[2] for row in manager.get_children(folders['Work / News'])] == ['Feed', 'Old']
+
+    # 2 回目の起動でフォルダが増えない
+    assert managers.BookmarkManager().get_folders() == manager.get_folders()
+
+
+def test_export_html_writes_nested_folders(bookmark_manager, tmp_path):
+    manager = bookmark_manager
+    work = manager.create_folder('Work')
+    news = manager.create_folder('News', work)
+    manager.create_folder('Empty')
+    manager.add_bookmark('Feed', 'https://feed.example/', folder_id=news)
+    manager.add_bookmark('Mail', 'https://mail.example/', folder_id=work)
+    manager.add_bookmark('Top', 'https://top.example/')
+
+    out = tmp_path / 'export.html'
+    assert manager.export_html(out)
+
+    assert [(r.title, r.folders) for r in NetscapeBookmarkReader(out)] == [
+        ('Feed', ('Work', 'News')),
+        ('Mail', ('Work',)),
+        ('Top', ()),
+    ]
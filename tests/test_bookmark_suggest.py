@@ -0,0 +1,118 @@
+"""URL バー補完の候補としてのブックマーク（bookmarks_fts・ブースト・正規形での統合）"""
+
+import sqlite3
+
+import pytest
+
+import managers
+
+
+@pytest.fixture
+def suggest(history_manager, bookmark_manager):
+    """ブックマーク DB を添付した読み取り接続で _query_suggestions を呼ぶ関数"""
+    connections = []
+
+    def run(query, boost=100, limit=10, bookmark_fts=None):
+        history_manager.flush()
+        conn = sqlite3.connect(f"file:{history_manager.db_path}?mode=ro", uri=True)
+        connections.append(conn)
+        managers.HistoryManager._attach_bookmarks(conn, str(bookmark_manager.db_path))
+        if bookmark_fts is None:
+            bookmark_fts = bookmark_manager.fts_enabled
+        return managers.HistoryManager._query_suggestions(
+            conn, query, limit, history_manager._fts_enabled, (bookmark_fts, boost))
+
+    yield run
+    for conn in connections:
+        conn.close()
+
+
+def _frecency(history_manager, url):
+    return history_manager._conn.execute('SELECT frecency FROM urls WHERE url = ?', (url,)).fetchone()[0]
+
+
+def test_bookmark_without_history_scores_boost(history_manager, bookmark_manager, suggest):
+    bookmark_manager.add_bookmark('Kappa manual', 'https://kappa.example/manual')
+
+    assert suggest('kappa', boost=150) == [('https://kappa.example/manual', 'Kappa manual', 150, 1)]
+
+
+def test_boost_reorders_bookmarks_against_history(history_manager, bookmark_manager, suggest):
+    history_manager.add_history('https://kappa.example/visited', 'Kappa visited')
+    bookmark_manager.add_bookmark('Kappa saved', 'https://kappa.example/saved')
+    history_manager.flush()
+    visited = _frecency(history_manager, 'https://kappa.example/visited')
+
+    assert [row[3] for row in suggest('kappa', boost=0)] == [0, 1]
+    assert [row[3] for row in suggest('kappa', boost=visited + 1)] == [1, 0]
+
+
+def test_same_canonical_url_is_one_candidate(history_manager, bookmark_manager, suggest):
+    history_manager.add_history('https://kappa.example/page?utm_source=feed', 'History title')
+    history_manager.add_history('https://kappa.example/other', 'Kappa other')
+    bookmark_manager.add_bookmark('Bookmark title', 'https://kappa.example/page#top')
+    bookmark_manager.add_bookmark('Kappa elsewhere', 'https://kappa.example/page#top', folder='Work')
+    history_manager.flush()
+    frecency = _frecency(history_manager, managers.canonicalize_url('https://kappa.example/page'))
+
+    rows = suggest('kappa', boost=10)
+
+    assert len(rows) == 2
+    # 利用者が保存した URL とタイトルで、点数は履歴の frecency + ブースト
+    assert rows[0][2:] == (frecency + 10, 1)
+    assert rows[0][0] == 'https://kappa.example/page#top'
+    assert rows[1][0] == 'https://kappa.example/other'
+
+
+def test_bookmarks_fts_follows_edits(bookmark_manager, suggest):
+    bookmark_id = bookmark_manager.add_bookmark('Lumen docs', 'https://lumen.example/')
+    assert [row[1] for row in suggest('lum')] == ['Lumen docs']
+
+    with sqlite3.connect(bookmark_manager.db_path) as conn:
+        conn.execute("UPDATE bookmarks SET title = 'Renamed' WHERE id = ?", (bookmark_id,))
+    conn.close()
+    assert [row[1] for row in suggest('renam')] == ['Renamed']
+
+    bookmark_manager.delete_bookmark(bookmark_id)
+    assert suggest('renam') == []
+
+
+def test_bookmarks_fts_rebuilt_when_version_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(managers, 'BOOKMARKS_DB', tmp_path / 'bookmarks.db')
+    manager = managers.BookmarkManager()
+    manager.add_bookmark('Lumen docs', 'https://lumen.example/')
+    with sqlite3.connect(manager.db_path) as conn:
+        conn.execute("INSERT INTO bookmarks_fts (bookmarks_fts) VALUES ('delete-all')")
+        conn.execute("DELETE FROM meta WHERE key = ?", (manager._FTS_META_KEY,))
+    conn.close()
+
+    managers.BookmarkManager()
+
+    with sqlite3.connect(manager.db_path) as conn:
+        rows = conn.execute("SELECT rowid FROM bookmarks_fts WHERE bookmarks_fts MATCH 'lumen*'").fetchall()
+    conn.close()
+    assert rows == [(1,)]
+
+
+def test_like_fallback_without_bookmarks_fts(bookmark_manager, suggest):
+    bookmark_manager.add_bookmark('日本語のページ', 'https://jp.example/')
+
+    assert [row[1] for row in suggest('本語', bookmark_fts=False)] == ['日本語のページ']
+    # FTS で一致しない ASCII 以外の部分文字列も LIKE で拾う
+    assert [row[1] for row in suggest('本語')] == ['日本語のページ']
+
+
+def test_bookmark_scan_stops_at_newest_matches(bookmark_manager, suggest, monkeypatch):
+    monkeypatch.setattr(managers.HistoryManager, '_BOOKMARK_SUGGEST_SCAN', 2)
+    for i in range(5):
+        bookmark_manager.add_bookmark(f'Lumen {i}', f'https://lumen{i}.example/')
+
+    assert sorted(row[1] for row in suggest('lumen')) == ['Lumen 3', 'Lumen 4']
+    assert sorted(row[1] for row in suggest('lumen', bookmark_fts=False)) == ['Lumen 3', 'Lumen 4']
+
+
+def test_set_bookmark_boost_clamps_to_zero(history_manager):
+    history_manager.set_bookmark_boost('-5')
+    assert history_manager.bookmark_boost == 0
+    history_manager.set_bookmark_boost(250)
+    assert history_manager.bookmark_boost == 250
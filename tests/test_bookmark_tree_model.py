@@ -0,0 +1,66 @@
+"""BookmarkTreeModel（ブックマークツリーの遅延読み込みモデル）"""
+
+import pytest
+
+from bookmarkio import BookmarkRecord
+from models import BookmarkTreeModel
+
+
+@pytest.fixture
+def model(qt_app, bookmark_manager):
+    records = [BookmarkRecord(f"Page {i}", f"https://example.com/{i}", ("Big",), 0, None)
+               for i in range(450)]
+    records.append(BookmarkRecord("Top", "https://top.example/", (), 0, None))
+    bookmark_manager.import_records(records)
+    model = BookmarkTreeModel(bookmark_manager)
+    model.PAGE_SIZE = 200
+    model.refresh()
+    return model
+
+
+def _folder_index(model, title):
+    for row in range(model.rowCount()):
+        index = model.index(row, 0)
+        if model.data(index) == title:
+            return index
+    raise AssertionError(title)
+
+
+def test_folder_children_are_fetched_in_pages(model):
+    assert model.rowCount() == 2
+    big = _folder_index(model, "Big")
+    assert model.hasChildren(big)
+    assert model.rowCount(big) == 0
+    pages = 0
+    while model.canFetchMore(big):
+        model.fetchMore(big)
+        pages += 1
+    assert pages == 3
+    assert model.rowCount(big) == 450
+    assert model.data(model.index(449, 1, big)) == "https://example.com/449"
+
+
+def test_parent_rows_stay_correct_after_removal(model):
+    big = _folder_index(model, "Big")
+    while model.canFetchMore(big):
+        model.fetchMore(big)
+    for row in (0, 199, 200, 449):
+        child = model.index(row, 0, big)
+        assert child.internalPointer().row() == row
+        assert model.parent(child) == big
+    model.remove_index(model.index(10, 0, big))
+    assert model.rowCount(big) == 449
+    for row in (9, 10, 448):
+        assert model.index(row, 0, big).internalPointer().row() == row
+    assert model.data(model.index(10, 0, big)) == "Page 11"
+
+
+def test_insert_bookmark_appends_to_loaded_folder(model, bookmark_manager):
+    top_row = next(row for row in range(model.rowCount()) if model.data(model.index(row, 0)) == "Top")
+    root_id = bookmark_manager.ROOT_FOLDER_ID
+    bookmark_id = bookmark_manager.add_bookmark("New", "https://new.example/")
+    model.insert_bookmark(root_id, bookmark_id, "New", "https://new.example/")
+    new = model.index(model.rowCount() - 1, 0)
+    assert model.data(new) == "New"
+    assert new.internalPointer().row() == model.rowCount() - 1
+    assert model.index(top_row, 0).internalPointer().row() == top_row
@@ -0,0 +1,177 @@
+"""bookmarkio（ブックマークファイルの読み書き）"""
+
+import codecs
+import json
+import os
+import stat
+
+import pytest
+
+from bookmarkio import (
+    READ_CHUNK_BYTES, BookmarkNode, BookmarkRecord, ChromiumBookmarkReader,
+    NetscapeBookmarkParser, NetscapeBookmarkReader, chromium_json_chunks,
+    detect_bookmark_format, folder_path_name, netscape_html_chunks, split_folder_path,
+    write_atomic,
+)
+
+NODES = [
+    BookmarkNode("bookmark", "Top", "https://a.com/#x", 1_700_000_000, None),
+    BookmarkNode("folder", "Work", None, 1_700_000_000, None),
+    BookmarkNode("folder", "News & <Blogs>", None, None, None),
+    BookmarkNode("bookmark", "Feed", "https://b.com/?q=1&utm_source=x", None, None),
+    BookmarkNode("end", None, None, None, None),
+    BookmarkNode("bookmark", "日本語", "https://例え.jp/", None, None),
+    BookmarkNode("end", None, None, None, None),
+]
+
+EXPECTED = [
+    ("Top", "https://a.com/#x", ()),
+    ("Feed", "https://b.com/?q=1&utm_source=x", ("Work", "News & <Blogs>")),
+    ("日本語", "https://例え.jp/", ("Work",)),
+]
+
+
+def test_folder_path_round_trip():
+    assert folder_path_name(()) == "root"
+    assert split_folder_path("root") == ()
+    assert split_folder_path(folder_path_name(("A", "B"))) == ("A", "B")
+
+
+def test_netscape_html_round_trip(tmp_path):
+    path = tmp_path / "bookmarks.html"
+    write_atomic(path, netscape_html_chunks(NODES))
+    assert detect_bookmark_format(path) == "html"
+    # チャンクの境界で文字やタグが切れても同じ結果になる
+    records = list(NetscapeBookmarkReader(path, chunk_bytes=7))
+    assert [(r.title, r.url, r.folders) for r in records] == EXPECTED
+    assert records[0].add_date == 1_700_000_000
+
+
+def test_chromium_json_round_trip(tmp_path):
+    path = tmp_path / "Bookmarks"
+    write_atomic(path, chromium_json_chunks(NODES))
+    assert detect_bookmark_format(path) == "chromium"
+    json.loads(path.read_text(encoding="utf-8"))
+    reader = ChromiumBookmarkReader(path)
+    records = list(reader)
+    assert [(r.title, r.url, r.folders) for r in records] == EXPECTED
+    assert records[0].add_date == 1_700_000_000
+    assert (reader.done, reader.total) == (3, 3)
+
+
+def test_write_atomic_keeps_existing_file_on_error(tmp_path):
+    path = tmp_path / "out.html"
+    path.write_text("old", encoding="utf-8")
+
+    def chunks():
+        yield "new"
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        write_atomic(path, chunks())
+    assert path.read_text(encoding="utf-8") == "old"
+    assert os.listdir(tmp_path) == ["out.html"]
+
+
+@pytest.mark.skipif(os.name != "posix", reason="POSIX のパーミッション")
+def test_write_atomic_keeps_existing_mode(tmp_path):
+    path = tmp_path / "out.html"
+    path.write_text("old", encoding="utf-8")
+    os.chmod(path, 0o644)
+    write_atomic(path, ["new"])
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o644
+    assert path.read_text(encoding="utf-8") == "new"
+
+
+@pytest.mark.skipif(os.name != "posix", reason="POSIX のパーミッション")
+def test_write_atomic_new_file_follows_umask(tmp_path):
+    old_umask = os.umask(0o022)
+    try:
+        write_atomic(tmp_path / "new.json", ["{}"])
+    finally:
+        os.umask(old_umask)
+    assert stat.S_IMODE(os.stat(tmp_path / "new.json").st_mode) == 0o644
+
+
+def _parse(html):
+    parser = NetscapeBookmarkParser()
+    parser.feed(html)
+    parser.close()
+    return parser.records
+
+
+def test_netscape_parser_handles_multiple_tags_per_line():
+    # 改行も閉じタグ（</DT>・</p>）も無い 1 行の出力
+    html = ('<DL><p><DT><H3>Outer</H3><DL><p><DT><A HREF="https://a.com/">A</A>'
+            '<DT><H3 ADD_DATE="1">Inner</H3><DL><p><DT><A HREF="https://b.com/">B</A></DL><p>'
+            '<DT><A HREF="https://c.com/">C</A></DL><p><DT><A HREF="https://d.com/">D</A></DL>')
+    assert [(r.title, r.folders) for r in _parse(html)] == [
+        ("A", ("Outer",)),
+        ("B", ("Outer", "Inner")),
+        ("C", ("Outer",)),
+        ("D", ()),
+    ]
+
+
+def test_netscape_parser_nesting_edge_cases():
+    html = """<DL><p>
+    <DT><H3></H3>
+    <DL><p>
+        <DT><A HREF="https://a.com/" ADD_DATE="1700000000123" ICON="https://a.com/favicon.ico">
+        <DT><A HREF="javascript:alert(1)">Bookmarklet</A>
+        <DT><A HREF="place:sort=8">Recent</A>
+    </DL><p>
+    <DT><H3>Unused</H3>
+    <HR>
+    <DL><p>
+        <DT><A HREF="https://b.com/">B</A>
+    </DL><p>
+    </DL><p>
+    </DL><p>
+    <DT><A HREF="https://c.com/">C</A>
+"""
+    records = _parse(html)
+    # 閉じていない <A> は次のタグで閉じ、タイトルが無ければ URL を使う
+    assert records[0] == BookmarkRecord("https://a.com/", "https://a.com/", ("無題のフォルダ",),
+                                        1_700_000_000, None)
+    # <H3> と <DL> の間に別のタグがあればフォルダの中身とみなさない。余分な </DL> は無視する
+    assert [(r.url, r.folders) for r in records[1:]] == [
+        ("https://b.com/", ()),
+        ("https://c.com/", ()),
+    ]
+
+
+NESTED_NODES = [
+    BookmarkNode("folder", "Bar", None, 1_600_000_000, None),
+    BookmarkNode("bookmark", "Icon", "https://i.com/", 1_600_000_001,
+                 "data:image/png;base64," + "QUJD" * 40),
+    BookmarkNode("folder", "深い", None, None, None),
+    BookmarkNode("folder", "Deeper", None, 1_600_000_002, None),
+    BookmarkNode("bookmark", "ロング・タイトル", "https://j.com/?a=1&b=2", 1_600_000_003, None),
+    BookmarkNode("end", None, None, None, None),
+    BookmarkNode("end", None, None, None, None),
+    BookmarkNode("bookmark", "After", "https://k.com/", None, None),
+    BookmarkNode("end", None, None, None, None),
+    BookmarkNode("bookmark", "Top", "https://l.com/", 1_600_000_004, None),
+]
+
+
+@pytest.mark.parametrize("chunk_bytes", [1, 2, 3, 5, 64, READ_CHUNK_BYTES])
+def test_netscape_nested_round_trip_across_chunk_boundaries(tmp_path, chunk_bytes):
+    path = tmp_path / "bookmarks.html"
+    write_atomic(path, netscape_html_chunks(NESTED_NODES))
+    # BOM 付きで保存するエディタもある
+    path.write_bytes(codecs.BOM_UTF8 + path.read_bytes())
+
+    reader = NetscapeBookmarkReader(path, chunk_bytes=chunk_bytes)
+    records = list(reader)
+
+    icon = NESTED_NODES[1].icon
+    assert records == [
+        BookmarkRecord("Icon", "https://i.com/", ("Bar",), 1_600_000_001, icon),
+        BookmarkRecord("ロング・タイトル", "https://j.com/?a=1&b=2", ("Bar", "深い", "Deeper"),
+                       1_600_000_003, None),
+        BookmarkRecord("After", "https://k.com/", ("Bar",), None, None),
+        BookmarkRecord("Top", "https://l.com/", (), 1_600_000_004, None),
+    ]
+    assert reader.bytes_read == reader.total_bytes
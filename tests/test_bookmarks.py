@@ -0,0 +1,126 @@
+"""ブックマーク（元の URL の保存、正規形での重複判定、旧版 DB の移行）"""
+
+import sqlite3
+
+import managers
+from bookmarkio import BookmarkRecord
+from conftest import make_legacy_bookmarks_db
+
+
+def _rows(manager):
+    with sqlite3.connect(manager.db_path) as conn:
+        rows = conn.execute('SELECT url, canonical_url FROM bookmarks ORDER BY id').fetchall()
+    conn.close()
+    return rows
+
+
+def test_add_bookmark_keeps_original_url(bookmark_manager):
+    url = 'https://a.com/page?b=2&a=1&utm_source=mail#section'
+    bookmark_id = bookmark_manager.add_bookmark('Page', url)
+    assert bookmark_id is not None
+    assert bookmark_manager.get_bookmarks()[0][2] == url
+    assert _rows(bookmark_manager) == [(url, managers.canonicalize_url(url))]
+    assert bookmark_manager.is_bookmarked(url)
+    assert bookmark_manager.is_bookmarked(managers.canonicalize_url(url))
+
+
+def test_add_bookmark_deduplicates_by_canonical_url(bookmark_manager):
+    assert bookmark_manager.add_bookmark('A', 'https://a.com/?utm_source=x') is not None
+    assert bookmark_manager.add_bookmark('A', 'https://a.com/') is None
+    # 別のフォルダには追加できる
+    assert bookmark_manager.add_bookmark('A', 'https://a.com/', 'Other') is not None
+
+
+def test_delete_updates_bookmarked_set(bookmark_manager):
+    bookmark_id = bookmark_manager.add_bookmark('A', 'https://a.com/x?utm_medium=y')
+    bookmark_manager.delete_bookmark(bookmark_id)
+    assert not bookmark_manager.is_bookmarked('https://a.com/x')
+
+
+def test_import_keeps_original_urls(bookmark_manager):
+    records = [
+        BookmarkRecord('One', 'https://a.com/one#frag', ('Bar',), 0, None),
+        BookmarkRecord('One again', 'https://a.com/one?utm_source=z#frag', ('Bar',), 0, None),
+        BookmarkRecord('Two', 'https://a.com/two?z=1&a=2', ('Bar',), 0, None),
+    ]
+    assert bookmark_manager.import_records(records) == 2
+    assert [url for url, _ in _rows(bookmark_manager)] == [
+        'https://a.com/one#frag', 'https://a.com/two?z=1&a=2']
+    assert bookmark_manager.is_bookmarked('https://a.com/two?a=2&z=1')
+
+
+def test_legacy_migration_never_deletes_rows(tmp_path, monkeypatch):
+    path = tmp_path / 'bookmarks.db'
+    make_legacy_bookmarks_db(path, [
+        ('Anchor', 'https://a.com/#x', 'root'),
+        ('Top', 'https://a.com/', 'root'),
+        ('Tracked', 'https://b.com/?utm_source=feed&q=1', 'Work / News'),
+    ])
+    monkeypatch.setattr(managers, 'BOOKMARKS_DB', path)
+    manager = managers.BookmarkManager()
+
+    assert [(title, url, folder) for _id, title, url, folder in manager.get_bookmarks()] == [
+        ('Anchor', 'https://a.com/#x', 'root'),
+        ('Top', 'https://a.com/', 'root'),
+        ('Tracked', 'https://b.com/?utm_source=feed&q=1', 'Work / News'),
+    ]
+    rows = _rows(manager)
+    assert rows[0][1] == rows[1][1] == managers.canonicalize_url('https://a.com/')
+    assert manager.is_bookmarked('https://b.com/?q=1')
+
+    # 2 回目の起動でも何も変わらない
+    managers.BookmarkManager()
+    assert _rows(manager) == rows
+
+
+def test_canonical_url_filled_for_rows_without_it(tmp_path, monkeypatch):
+    """canonical_url 列の無い版で追加された行も、次の起動で埋める"""
+    path = tmp_path / 'bookmarks.db'
+    monkeypatch.setattr(managers, 'BOOKMARKS_DB', path)
+    manager = managers.BookmarkManager()
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "INSERT INTO bookmarks (title, url, folder_id, position) VALUES ('X', 'https://x.com/#y', 1, 0)")
+    conn.close()
+    manager = managers.BookmarkManager()
+    assert _rows(manager) == [('https://x.com/#y', managers.canonicalize_url('https://x.com/'))]
+    assert manager.is_bookmarked('https://x.com/')
+
+
+def test_suggestions_join_bookmarks_on_canonical_url(history_manager, bookmark_manager):
+    history_manager.add_history('https://a.com/docs?utm_source=x', 'Docs')
+    history_manager.flush()
+    bookmark_manager.add_bookmark('My docs', 'https://a.com/docs#install')
+    conn = sqlite3.connect(f"file:{history_manager.db_path}?mode=ro", uri=True)
+    managers.HistoryManager._attach_bookmarks(conn, str(bookmark_manager.db_path))
+    results = managers.HistoryManager._query_suggestions(
+        conn, 'docs', 10, history_manager._fts_enabled, (bookmark_manager.fts_enabled, 100))
+    conn.close()
+    # 履歴とブックマークは 1 件にまとまり、ブックマークの URL・タイトルと履歴の frecency を使う
+    assert len(results) == 1
+    url, title, score, bookmarked = results[0]
+    assert (url, title, bookmarked) == ('https://a.com/docs#install', 'My docs', 1)
+    frecency = history_manager._conn.execute('SELECT frecency FROM urls').fetchone()[0]
+    assert score == frecency + 100
+
+
+def test_import_switches_to_bloom_filter_only_past_threshold(bookmark_manager, monkeypatch):
+    created = []
+
+    class CountingBloomFilter(managers.BloomFilter):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            created.append(self)
+
+    monkeypatch.setattr(managers, 'BloomFilter', CountingBloomFilter)
+    small = [BookmarkRecord(f'P{i}', f'https://a.com/{i}', (), 0, None) for i in range(3)]
+    assert bookmark_manager.import_records(small) == 3
+    assert created == []
+
+    monkeypatch.setattr(managers.BookmarkManager, '_BLOOM_THRESHOLD', 4)
+    large = [BookmarkRecord(f'Q{i}', f'https://b.com/{i}', ('Big',), 0, None) for i in range(6)]
+    # 切り替えた後も、同じインポート内の重複は飛ばす
+    large.append(BookmarkRecord('Again', 'https://b.com/1?utm_source=x', ('Big',), 0, None))
+    assert bookmark_manager.import_records(large) == 6
+    # インポート中の集合は 4 件目で Bloom フィルタに移り、残りの 2 件もそこへ入る
+    assert created[0].count == 6
@@ -0,0 +1,66 @@
+"""checksum（ダウンロードしたファイルの SHA-256）"""
+
+import hashlib
+
+import pytest
+
+from checksum import (
+    ChecksumCancelled, expected_from_url, find_expected_sha256,
+    parse_checksum_text, sha256_file,
+)
+
+DATA = bytes(range(256)) * 100
+DIGEST = hashlib.sha256(DATA).hexdigest()
+OTHER = "0" * 64
+
+
+@pytest.fixture
+def download(tmp_path):
+    path = tmp_path / "file.bin"
+    path.write_bytes(DATA)
+    return path
+
+
+def test_sha256_file_reports_progress(download):
+    progress = []
+    assert sha256_file(download, lambda *a: progress.append(a), chunk_size=10_000) == DIGEST
+    assert progress[0] == (10_000, len(DATA))
+    assert progress[-1] == (len(DATA), len(DATA))
+
+
+def test_sha256_file_can_be_cancelled(download):
+    with pytest.raises(ChecksumCancelled):
+        sha256_file(download, should_stop=lambda: True)
+
+
+def test_parse_checksum_text():
+    text = f"# comment\n{OTHER}  other.bin\n{DIGEST.upper()} *dist/file.bin\n"
+    assert parse_checksum_text(text, "file.bin") == DIGEST
+    assert parse_checksum_text(f"SHA256 (file.bin) = {DIGEST}", "file.bin") == DIGEST
+    assert parse_checksum_text(DIGEST, "file.bin") == DIGEST
+    assert parse_checksum_text(DIGEST, "file.bin", require_name=True) is None
+    assert parse_checksum_text(text, "missing.bin") is None
+
+
+def test_expected_from_url():
+    assert expected_from_url(f"https://a.com/file.bin#sha256={DIGEST.upper()}") == DIGEST
+    assert expected_from_url(f"https://a.com/file.bin#x=1&sha256:{DIGEST}") == DIGEST
+    assert expected_from_url("https://a.com/file.bin#sha256=abc") is None
+    assert expected_from_url(None) is None
+
+
+def test_find_expected_sha256_order(download, tmp_path):
+    assert find_expected_sha256(str(download)) == (None, None)
+    sums = tmp_path / "SHA256SUMS"
+    sums.write_text(f"{OTHER}  other.bin\n{DIGEST}  file.bin\n")
+    assert find_expected_sha256(str(download)) == (DIGEST, str(sums))
+    sidecar = tmp_path / "file.bin.sha256"
+    sidecar.write_text(OTHER)
+    assert find_expected_sha256(str(download)) == (OTHER, str(sidecar))
+    url = f"https://a.com/file.bin#sha256={DIGEST}"
+    assert find_expected_sha256(str(download), url) == (DIGEST, "url")
+
+
+def test_sums_file_without_matching_name_is_ignored(download, tmp_path):
+    (tmp_path / "sha256sums.txt").write_text(DIGEST + "\n")
+    assert find_expected_sha256(str(download)) == (None, None)
@@ -0,0 +1,151 @@
+"""ダウンロード一覧のモデル（DownloadManager のシグナルで変わったセルだけ更新する）"""
+
+import pytest
+from PySide6.QtCore import Qt
+
+from conftest import FakeDownload
+from models import DOWNLOAD_PROGRESS_ROLE, DOWNLOAD_STATE_LABELS, DownloadTableModel
+
+Model = DownloadTableModel
+
+
+def _add(manager, tmp_path, name, total=1_000_000):
+    item = FakeDownload(f"https://example.com/{name}", str(tmp_path), name, total)
+    item.accept()
+    manager.add_download(item)
+    return max(manager._live), item
+
+
+def _text(model, row, column, role=Qt.DisplayRole):
+    return model.data(model.index(row, column), role)
+
+
+class _ChangeRecorder:
+    """
+    dataChanged の代わり。このビルドの PySide は Python から emit するたびに
+    True の参照カウントを 1 つ減らし、終了時に落ちるため、テストでは送出しない。
+    """
+
+    def __init__(self):
+        self.ranges = []
+
+    def emit(self, top_left, bottom_right, roles=()):
+        self.ranges.append((top_left.row(), top_left.column(), bottom_right.column()))
+
+
+def _record_changes(model, monkeypatch):
+    recorder = _ChangeRecorder()
+    monkeypatch.setattr(model, "dataChanged", recorder)
+    return recorder
+
+
+@pytest.fixture
+def history(download_manager, tmp_path):
+    """前回までに完了した 1 件と中断した 1 件がある DownloadManager"""
+    manager = download_manager
+    done_id, done = _add(manager, tmp_path, "done.bin", 2 * 1024 * 1024)
+    done.received, done.state_value = done.total, 2
+    manager.update_download_state(done_id, done, 2)
+    failed_id, failed = _add(manager, tmp_path, "failed.bin")
+    failed.received, failed.reason = 300_000, 1
+    manager.update_download_state(failed_id, failed, 4)
+    # 前回の起動のダウンロードとして DB の値だけを表示させる
+    manager._live.clear()
+    return manager
+
+
+def test_loads_history_newest_first(history, tmp_path):
+    model = Model(history)
+
+    assert model.rowCount() == 2
+    assert model.columnCount() == len(Model.HEADERS)
+    assert model.headerData(Model.COLUMN_STATE, Qt.Horizontal) == "状態"
+    assert model.row_data(0) == ("failed.bin", "https://example.com/failed.bin", str(tmp_path))
+    assert _text(model, 0, Model.COLUMN_PROGRESS) == "30%"
+    assert _text(model, 0, Model.COLUMN_PROGRESS, DOWNLOAD_PROGRESS_ROLE) is None
+    assert _text(model, 1, Model.COLUMN_SIZE) == "2.00 MB"
+    assert _text(model, 1, Model.COLUMN_PROGRESS) == "完了"
+    assert model.state(1) == 2
+    assert model.row_data(2) is None and model.download_id(-1) is None
+
+
+def test_session_only_lists_live_downloads(history, tmp_path):
+    first_id, _ = _add(history, tmp_path, "a.bin")
+    second_id, _ = _add(history, tmp_path, "b.bin")
+
+    model = Model(history, session_only=True)
+
+    assert [model.download_id(row) for row in range(model.rowCount())] == [second_id, first_id]
+
+
+def test_new_download_inserted_at_top(history, tmp_path):
+    model = Model(history)
+    previous_top = model.download_id(0)
+
+    download_id, item = _add(history, tmp_path, "new.bin")
+
+    assert model.rowCount() == 3
+    assert [model.download_id(0), model.download_id(1)] == [download_id, previous_top]
+    assert _text(model, 0, Model.COLUMN_FILENAME) == "new.bin"
+    # 追加を 2 回知らせても行は増えない
+    model._on_download_added(download_id)
+    assert model.rowCount() == 3
+
+
+def test_progress_updates_only_progress_cells(history, tmp_path, monkeypatch):
+    model = Model(history)
+    download_id, item = _add(history, tmp_path, "new.bin")
+    changes = _record_changes(model, monkeypatch)
+
+    item.received = 250_000
+    history.update_download_progress(download_id, item)
+
+    assert changes.ranges == [(0, Model.COLUMN_PROGRESS, Model.COLUMN_ETA)]
+    # 進行中の値は DB を待たずにダウンロード自体から読む
+    assert _text(model, 0, Model.COLUMN_PROGRESS) == "25%"
+    assert _text(model, 0, Model.COLUMN_PROGRESS, DOWNLOAD_PROGRESS_ROLE) == 25
+
+
+def test_state_change_reloads_record(history, tmp_path, monkeypatch):
+    model = Model(history)
+    download_id, item = _add(history, tmp_path, "new.bin")
+    changes = _record_changes(model, monkeypatch)
+
+    item.received, item.state_value = item.total, 2
+    history.update_download_state(download_id, item, 2)
+
+    assert changes.ranges == [(0, Model.COLUMN_SIZE, Model.COLUMN_SHA256)]
+    assert _text(model, 0, Model.COLUMN_PROGRESS) == "完了"
+    assert _text(model, 0, Model.COLUMN_PROGRESS, DOWNLOAD_PROGRESS_ROLE) is None
+    # 終了後は DB から読み直した値を表示する
+    assert model._rows[0][4:7] == [1_000_000, 1_000_000, 2]
+    assert _text(model, 0, Model.COLUMN_STATE) == DOWNLOAD_STATE_LABELS[2]
+
+
+def test_signals_for_unknown_rows_are_ignored(history, monkeypatch):
+    model = Model(history)
+    changes = _record_changes(model, monkeypatch)
+
+    model._on_progress_changed(999)
+    model._on_state_changed(999)
+    model._on_checksum_changed(999)
+
+    assert changes.ranges == []
+
+
+def test_checksum_column(history, monkeypatch):
+    model = Model(history)
+    changes = _record_changes(model, monkeypatch)
+    download_id = model.download_id(1)
+    digest = "ab" * 32
+    with history._conn:
+        history._conn.execute(
+            'UPDATE downloads SET sha256 = ?, expected_sha256 = ? WHERE id = ?',
+            (digest, "cd" * 32, download_id))
+
+    model._on_checksum_changed(download_id)
+
+    assert changes.ranges == [(1, Model.COLUMN_SHA256, Model.COLUMN_SHA256)]
+    assert model.checksum(1) == (digest, "cd" * 32)
+    assert _text(model, 1, Model.COLUMN_SHA256) == f"不一致 {digest[:16]}…"
+    assert _text(model, 1, Model.COLUMN_SHA256, Qt.ToolTipRole).startswith(f"SHA-256: {digest}")
@@ -0,0 +1,148 @@
+"""ダウンロード進捗の書き込みの集約（1 秒ごと、または 5% 進んだらすぐ）"""
+
+import sqlite3
+
+import pytest
+
+from conftest import FakeDownload
+
+
+@pytest.fixture
+def started(download_manager, tmp_path):
+    """1 MB のダウンロードを 1 件追加した DownloadManager と (id, item)"""
+    item = FakeDownload("https://example.com/big.bin", str(tmp_path), "big.bin", 1_000_000)
+    item.accept()
+    download_manager.add_download(item)
+    return download_manager, max(download_manager._live), item
+
+
+def _row(manager, download_id):
+    return manager._conn.execute(
+        'SELECT received_bytes, total_bytes, state FROM downloads WHERE id = ?', (download_id,)
+    ).fetchone()
+
+
+def _progress(manager, download_id, item, received):
+    item.received = received
+    manager.update_download_progress(download_id, item)
+
+
+def test_small_steps_wait_for_timer(started):
+    manager, download_id, item = started
+    for received in (10_000, 20_000, 40_000):
+        _progress(manager, download_id, item, received)
+
+    assert _row(manager, download_id)[0] == 0
+    assert manager.progress_flush_count == 0
+    timer = manager._progress_timer
+    assert timer.isActive() and timer.isSingleShot()
+    assert timer.interval() == manager.PROGRESS_FLUSH_INTERVAL_MS == 1000
+
+    # タイマーの timeout で書き込まれるのは最後の値だけ
+    manager.flush_progress()
+    assert _row(manager, download_id)[0] == 40_000
+    assert manager.progress_flush_count == 1
+    assert not timer.isActive()
+
+
+def test_timer_flushes_within_interval(qt_app, started):
+    from PySide6.QtTest import QTest
+
+    manager, download_id, item = started
+    _progress(manager, download_id, item, 10_000)
+    QTest.qWait(manager.PROGRESS_FLUSH_INTERVAL_MS + 200)
+
+    assert _row(manager, download_id)[0] == 10_000
+    assert manager.progress_flush_count == 1
+
+
+def test_step_of_five_percent_flushes_immediately(started):
+    manager, download_id, item = started
+    _progress(manager, download_id, item, 49_999)
+    assert manager.progress_flush_count == 0
+
+    _progress(manager, download_id, item, 50_000)
+    assert manager.progress_flush_count == 1
+    assert _row(manager, download_id)[0] == 50_000
+    assert not manager._progress_timer.isActive()
+
+    # 次の 5% は前回書き込んだ位置から数える
+    _progress(manager, download_id, item, 99_999)
+    assert manager.progress_flush_count == 1
+    _progress(manager, download_id, item, 100_000)
+    assert manager.progress_flush_count == 2
+
+
+def test_unknown_size_only_uses_timer(download_manager, tmp_path):
+    manager = download_manager
+    item = FakeDownload("https://example.com/stream", str(tmp_path), "stream", -1)
+    manager.add_download(item)
+    download_id = max(manager._live)
+
+    _progress(manager, download_id, item, 10_000_000)
+
+    assert manager.progress_flush_count == 0
+    assert manager._progress_timer.isActive()
+
+
+def test_pending_progress_of_several_downloads_share_one_flush(started, tmp_path):
+    manager, first_id, first = started
+    second = FakeDownload("https://example.com/other.bin", str(tmp_path), "other.bin", 1_000_000)
+    manager.add_download(second)
+    second_id = max(manager._live)
+
+    _progress(manager, first_id, first, 1_000)
+    _progress(manager, second_id, second, 2_000)
+    manager.flush_progress()
+
+    assert manager.progress_flush_count == 1
+    assert _row(manager, first_id)[0] == 1_000
+    assert _row(manager, second_id)[0] == 2_000
+
+
+def test_state_change_is_written_immediately(started):
+    manager, download_id, item = started
+    _progress(manager, download_id, item, 10_000)
+    item.received = 12_000
+
+    manager.update_download_state(download_id, item, 1)
+
+    # 状態の書き込みはタイマーを待たず、溜めていた進捗の代わりに現在値を書く
+    assert _row(manager, download_id) == (12_000, 1_000_000, 1)
+    assert download_id not in manager._pending_progress
+    assert manager.progress_flush_count == 0
+
+
+def test_finished_download_drops_pending_state(started):
+    manager, download_id, item = started
+    _progress(manager, download_id, item, 60_000)
+    _progress(manager, download_id, item, 70_000)
+    assert manager._flushed_fraction[download_id] == pytest.approx(0.06)
+
+    item.received, item.state_value = item.total, 2
+    manager.update_download_state(download_id, item, 2)
+
+    assert _row(manager, download_id) == (1_000_000, 1_000_000, 2)
+    assert download_id not in manager._pending_progress
+    assert download_id not in manager._flushed_fraction
+    assert download_id not in manager._samplers
+    # 遅れて届いたタイマーが古い進捗で上書きしない
+    manager.flush_progress()
+    assert _row(manager, download_id) == (1_000_000, 1_000_000, 2)
+    assert manager.progress_flush_count == 1
+
+
+def test_history_and_close_flush_pending(started):
+    manager, download_id, item = started
+    _progress(manager, download_id, item, 10_000)
+
+    history = manager.get_download_history()
+    assert history[0][5] == 10_000
+
+    _progress(manager, download_id, item, 20_000)
+    path = manager.db_path
+    manager.close()
+
+    with sqlite3.connect(path) as conn:
+        assert conn.execute('SELECT received_bytes FROM downloads').fetchone() == (20_000,)
+    conn.close()
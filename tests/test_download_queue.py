@@ -0,0 +1,78 @@
+"""ダウンロードの待ち行列（同時転送数の上限と優先度）"""
+
+import pytest
+
+from conftest import FakeDownload
+
+
+@pytest.fixture
+def queue(download_manager, tmp_path):
+    """同時転送数 1 で 4 件を追加した DownloadManager と、各ダウンロードの (id, item)"""
+    download_manager.set_max_active(1)
+    items = []
+    for i, priority in enumerate((1, 0, 1, 2)):
+        item = FakeDownload(f"https://example.com/{i}.bin", str(tmp_path), f"{i}.bin", 100)
+        item.accept()
+        download_manager.add_download(item, priority)
+        items.append((max(download_manager._live), item))
+    return download_manager, items
+
+
+def _finish(manager, download_id, item):
+    item.received, item.state_value = item.total, 2
+    manager.update_download_state(download_id, item, 2)
+
+
+def test_limit_pauses_extra_downloads(queue):
+    manager, items = queue
+    assert [manager.queue_status(i) for i, _ in items] == ["active", "queued", "queued", "queued"]
+    assert [item.calls for _, item in items] == [[], ["pause"], ["pause"], ["pause"]]
+
+
+def test_next_download_by_priority_then_order(queue):
+    manager, items = queue
+    order = []
+    current = 0
+    for _ in range(3):
+        _finish(manager, *items[current])
+        current = next(n for n, (i, _) in enumerate(items) if manager.queue_status(i) == "active")
+        assert items[current][1].calls[-1] == "resume"
+        order.append(current)
+    assert order == [3, 2, 1]
+
+
+def test_pause_frees_slot_and_resume_requeues(queue):
+    manager, items = queue
+    first, high = items[0], items[3]
+    manager.pause_download(first[0])
+    assert manager.queue_status(first[0]) == "paused"
+    assert first[1].calls == ["pause"]
+    assert manager.queue_status(high[0]) == "active"
+    manager.resume_download(first[0])
+    assert manager.queue_status(first[0]) == "queued"
+
+
+def test_move_to_front(queue):
+    manager, items = queue
+    low = items[1]
+    manager.move_to_front(low[0])
+    _finish(manager, *items[0])
+    assert manager.queue_status(low[0]) == "active"
+
+
+def test_set_priority_reorders_queue(queue):
+    manager, items = queue
+    low = items[1]
+    manager.set_priority(low[0], manager.PRIORITY_HIGH)
+    _finish(manager, *items[0])
+    # 同じ優先度なら先に待っていたものから
+    assert manager.queue_status(items[3][0]) == "active"
+    _finish(manager, *items[3])
+    assert manager.queue_status(low[0]) == "active"
+    assert manager.queue_status(items[2][0]) == "queued"
+
+
+def test_raising_limit_starts_queued(queue):
+    manager, items = queue
+    manager.set_max_active(3)
+    assert [manager.queue_status(i) for i, _ in items] == ["active", "queued", "active", "active"]
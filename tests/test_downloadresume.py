@@ -0,0 +1,207 @@
+"""downloadresume（中断したダウンロードの再開）と DownloadManager の取り直し"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from downloadresume import (
+    ResumeError, RetryPolicy, _parse_content_range, fetch_resume, is_retryable,
+    partial_path, partial_size,
+)
+from conftest import FakeDownload
+
+PAYLOAD = bytes(range(256)) * 64
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """PAYLOAD を返す。mode で Range への応じ方を変える"""
+    mode = "range"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        size = len(PAYLOAD)
+        range_header = self.headers.get("Range")
+        start = int(range_header[6:].split("-")[0]) if range_header else 0
+        if self.mode == "ignore-range" or not range_header:
+            start = 0
+            self.send_response(200)
+        elif start >= size:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        else:
+            if self.mode == "wrong-start":
+                start = 0
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{size - 1}/{size}")
+        self.send_header("Content-Length", str(size - start))
+        self.end_headers()
+        end = start + 100 if self.mode == "drop" else size
+        self.wfile.write(PAYLOAD[start:end])
+        self.close_connection = True
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd, f"http://127.0.0.1:{httpd.server_address[1]}/file.bin"
+    httpd.shutdown()
+    httpd.server_close()
+    _Handler.mode = "range"
+
+
+def _write_partial(tmp_path, data):
+    target = str(tmp_path / "file.bin")
+    with open(partial_path(target), "wb") as f:
+        f.write(data)
+    return target
+
+
+def test_retry_policy_backoff():
+    policy = RetryPolicy(max_attempts=3, base_delay=2.0, factor=2.0, max_delay=5.0, jitter=0.2)
+    assert 1.6 <= policy.delay(1) <= 2.4
+    assert 3.2 <= policy.delay(2) <= 4.8
+    assert 4.0 <= policy.delay(10) <= 6.0
+    assert not policy.exhausted(2)
+    assert policy.exhausted(3)
+
+
+def test_is_retryable():
+    from urllib.error import HTTPError
+    assert is_retryable(ConnectionResetError())
+    assert is_retryable(HTTPError("http://a/", 503, "", {}, None))
+    assert is_retryable(HTTPError("http://a/", 429, "", {}, None))
+    assert not is_retryable(HTTPError("http://a/", 404, "", {}, None))
+    assert not is_retryable(ResumeError("bad", retryable=False))
+    assert not is_retryable(ValueError())
+
+
+def test_parse_content_range():
+    assert _parse_content_range("bytes 100-199/200") == (100, 200)
+    assert _parse_content_range("bytes 0-9/*") == (0, -1)
+    assert _parse_content_range("items 0-9/10") is None
+    assert _parse_content_range(None) is None
+
+
+def test_fetch_resume_continues_partial_file(server, tmp_path):
+    _httpd, url = server
+    target = _write_partial(tmp_path, PAYLOAD[:1000])
+    progress = []
+    assert fetch_resume(url, target, on_progress=lambda *a: progress.append(a)) \
+        == (len(PAYLOAD), len(PAYLOAD))
+    assert open(target, "rb").read() == PAYLOAD
+    assert partial_size(target) == 0
+    assert progress[-1] == (len(PAYLOAD), len(PAYLOAD))
+
+
+def test_fetch_resume_rewrites_when_range_is_ignored(server, tmp_path):
+    _httpd, url = server
+    _Handler.mode = "ignore-range"
+    target = _write_partial(tmp_path, b"x" * 1000)
+    fetch_resume(url, target)
+    assert open(target, "rb").read() == PAYLOAD
+
+
+def test_fetch_resume_rejects_wrong_content_range_start(server, tmp_path):
+    _httpd, url = server
+    _Handler.mode = "wrong-start"
+    target = _write_partial(tmp_path, PAYLOAD[:1000])
+    with pytest.raises(ResumeError):
+        fetch_resume(url, target)
+    # 書き足さずに残す
+    assert open(partial_path(target), "rb").read() == PAYLOAD[:1000]
+
+
+def test_fetch_resume_finishes_complete_partial_on_416(server, tmp_path):
+    _httpd, url = server
+    target = _write_partial(tmp_path, PAYLOAD)
+    assert fetch_resume(url, target) == (len(PAYLOAD), len(PAYLOAD))
+    assert open(target, "rb").read() == PAYLOAD
+    assert partial_size(target) == 0
+
+
+def test_fetch_resume_keeps_partial_when_connection_drops(server, tmp_path):
+    _httpd, url = server
+    _Handler.mode = "drop"
+    target = _write_partial(tmp_path, PAYLOAD[:1000])
+    with pytest.raises(Exception) as info:
+        fetch_resume(url, target)
+    assert is_retryable(info.value)
+    assert open(partial_path(target), "rb").read() == PAYLOAD[:1100]
+
+
+def _row_count(manager):
+    return manager._conn.execute('SELECT COUNT(*) FROM downloads').fetchone()[0]
+
+
+def test_interrupted_download_is_resumed_in_session(download_manager, tmp_path):
+    item = FakeDownload("https://example.com/file.bin", str(tmp_path), total=len(PAYLOAD))
+    item.accept()
+    download_manager.add_download(item)
+    download_id = next(iter(download_manager._live))
+    item.received, item.state_value, item.reason = 1000, 4, 20
+    download_manager.update_download_state(download_id, item, 4)
+    assert download_manager.queue_status(download_id) == "retrying"
+    assert download_manager.current_values(download_id)[2] == 1
+    assert item.calls == []
+
+    download_manager._resumes[download_id].retry_at = 0
+    download_manager._retry_due()
+    assert item.calls == ["resume"]
+    assert download_manager.queue_status(download_id) == "active"
+
+    item.received, item.state_value = item.total, 2
+    download_manager.update_download_state(download_id, item, 2)
+    assert download_id not in download_manager._resumes
+    assert download_manager.get_download_record(download_id)[:3] == (item.total, item.total, 2)
+    assert _row_count(download_manager) == 1
+
+
+def test_previous_download_is_requested_from_profile(download_manager, tmp_path):
+    url = "https://example.com/file.bin"
+    with download_manager._conn:
+        download_id = download_manager._conn.execute(
+            'INSERT INTO downloads (filename, url, download_path, total_bytes, received_bytes, state) '
+            'VALUES (?, ?, ?, ?, ?, 4)', ("file.bin", url, str(tmp_path), len(PAYLOAD), 1000)
+        ).lastrowid
+    requested = []
+    download_manager.set_redownloader(lambda *args: requested.append(args))
+    assert download_manager.resume_interrupted() == 1
+    assert requested == [(url, "file.bin")]
+
+    assert not download_manager.adopt_redownload(FakeDownload("https://example.com/other"))
+    item = FakeDownload(url, "/elsewhere", "file (1).bin")
+    assert download_manager.adopt_redownload(item)
+    assert item.accepted
+    assert (item.directory, item.filename) == (str(tmp_path), "file.bin")
+    assert download_manager._live[download_id] is item
+    assert _row_count(download_manager) == 1
+    # 受け持った後で同じ URL の別の要求は横取りしない
+    assert not download_manager.adopt_redownload(FakeDownload(url))
+
+
+def test_redownload_that_never_starts_is_retried(download_manager, tmp_path):
+    url = "https://example.com/file.bin"
+    with download_manager._conn:
+        download_id = download_manager._conn.execute(
+            'INSERT INTO downloads (filename, url, download_path, state) VALUES (?, ?, ?, 4)',
+            ("file.bin", url, str(tmp_path))
+        ).lastrowid
+    requested = []
+    download_manager.set_redownloader(lambda *args: requested.append(args))
+    download_manager.resume_interrupted()
+    job = download_manager._resumes[download_id]
+    job.deadline = 0
+    download_manager._retry_due()
+    assert download_manager.queue_status(download_id) == "retrying"
+    assert download_manager.resume_error(download_id) == "download was not started"
+    job.retry_at = 0
+    download_manager._retry_due()
+    assert len(requested) == 2
@@ -0,0 +1,60 @@
+"""履歴の期間指定削除（訪問・URL・hosts 集計の整合）"""
+
+import managers
+
+
+def _record(manager, url, visit_times):
+    with manager._conn:
+        managers.HistoryWriter.write_batch(
+            manager._conn.cursor(),
+            {url: [url, [(when, managers.TRANSITION_LINK, None) for when in visit_times]]})
+
+
+def _delete_range(manager, start, end):
+    deleted, done = 0, False
+    while not done:
+        count, done = manager._delete_range_chunk(start, end)
+        deleted += count
+    return deleted
+
+
+def test_delete_range_rebuilds_host_aggregates(history_manager, monkeypatch):
+    manager = history_manager
+    monkeypatch.setattr(manager, '_DELETE_CHUNK_ROWS', 2)
+    _record(manager, 'https://a.example/popular', [
+        '2024-01-01 10:00:00', '2024-01-01 11:00:00', '2024-01-01 12:00:00', '2024-02-01 10:00:00'])
+    _record(manager, 'https://a.example/other', ['2024-01-05 10:00:00', '2024-01-20 10:00:00'])
+    _record(manager, 'https://a.example/gone', ['2024-01-03 10:00:00'])
+    _record(manager, 'https://b.example/', ['2024-01-02 10:00:00'])
+
+    deleted = _delete_range(manager, '2024-01-01 00:00:00', '2024-01-10 00:00:00')
+
+    assert deleted == 6
+    urls = {row[0]: row[1:] for row in manager._conn.execute(
+        'SELECT url, visit_count, last_visit_time FROM urls')}
+    assert urls == {
+        'https://a.example/popular': (1, '2024-02-01 10:00:00'),
+        'https://a.example/other': (1, '2024-01-20 10:00:00'),
+    }
+    hosts = {row[0]: row[1:] for row in manager._conn.execute(
+        'SELECT host, url, visit_count, best_visit_count, last_visit_time FROM hosts')}
+    assert set(hosts) == {'a.example'}
+    host_url, visit_count, best, last_visit = hosts['a.example']
+    assert host_url in urls and best == 1
+    assert visit_count == 2
+    assert last_visit == '2024-02-01 10:00:00'
+
+
+def test_delete_range_promotes_new_best_url(history_manager):
+    manager = history_manager
+    _record(manager, 'https://a.example/old-favourite', [
+        '2024-01-01 10:00:00', '2024-01-01 11:00:00', '2024-01-01 12:00:00'])
+    _record(manager, 'https://a.example/now', ['2024-03-01 10:00:00', '2024-03-02 10:00:00'])
+    _record(manager, 'https://a.example/old-favourite', ['2024-03-03 10:00:00'])
+    assert manager._conn.execute("SELECT url FROM hosts").fetchone()[0] == 'https://a.example/old-favourite'
+
+    _delete_range(manager, '2024-01-01 00:00:00', '2024-02-01 00:00:00')
+
+    row = manager._conn.execute(
+        "SELECT url, visit_count, best_visit_count FROM hosts WHERE host = 'a.example'").fetchone()
+    assert row == ('https://a.example/now', 3, 2)
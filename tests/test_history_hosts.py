@@ -0,0 +1,96 @@
+"""hosts 集計（ホスト単位の訪問回数）と新しいタブのトップサイト"""
+
+import managers
+
+
+def _record(manager, url, visit_times, title=None):
+    with manager._conn:
+        managers.HistoryWriter.write_batch(
+            manager._conn.cursor(),
+            {url: [title, [(when, managers.TRANSITION_LINK, None) for when in visit_times]]})
+
+
+def _hosts(manager):
+    return {row[0]: row[1:] for row in manager._conn.execute(
+        'SELECT host, url, title, visit_count, best_visit_count, last_visit_time FROM hosts')}
+
+
+def test_visits_update_host_aggregate_incrementally(history_manager):
+    manager = history_manager
+    _record(manager, 'https://a.example/one', ['2024-01-01 10:00:00'], 'One')
+    _record(manager, 'https://a.example/two', ['2024-01-02 10:00:00', '2024-01-03 10:00:00'], 'Two')
+    _record(manager, 'https://a.example/one', ['2024-01-04 10:00:00'])
+    _record(manager, 'https://b.example/', ['2024-01-05 10:00:00'], 'B')
+
+    hosts = _hosts(manager)
+    # 訪問回数が並んだら後から追いついた URL を代表にする（タイトルは空で上書きしない）
+    assert hosts['a.example'] == ('https://a.example/one', 'One', 4, 2, '2024-01-04 10:00:00')
+    assert hosts['b.example'] == ('https://b.example/', 'B', 1, 1, '2024-01-05 10:00:00')
+
+
+def test_incremental_aggregate_matches_rebuild(history_manager):
+    manager = history_manager
+    _record(manager, 'https://a.example/x', ['2024-01-01 10:00:00', '2024-01-02 10:00:00'], 'X')
+    _record(manager, 'https://a.example/y', ['2024-01-03 10:00:00'], 'Y')
+    _record(manager, 'https://a.example/y', ['2024-01-04 10:00:00', '2024-01-05 10:00:00'])
+    _record(manager, 'https://c.example/', ['2024-01-06 10:00:00'], 'C')
+    incremental = _hosts(manager)
+
+    with manager._conn:
+        manager._rebuild_hosts(manager._conn.cursor())
+
+    assert _hosts(manager) == incremental
+    assert incremental['a.example'][:4] == ('https://a.example/y', 'Y', 5, 3)
+
+
+def test_url_delete_trigger_subtracts_and_drops_empty_hosts(history_manager):
+    manager = history_manager
+    _record(manager, 'https://a.example/best', ['2024-01-01 10:00:00', '2024-01-02 10:00:00'], 'Best')
+    _record(manager, 'https://a.example/rest', ['2024-01-03 10:00:00'], 'Rest')
+    _record(manager, 'https://b.example/', ['2024-01-04 10:00:00'])
+
+    with manager._conn:
+        manager._conn.execute("DELETE FROM urls WHERE url = 'https://a.example/best'")
+        manager._conn.execute("DELETE FROM urls WHERE url = 'https://b.example/'")
+
+    hosts = _hosts(manager)
+    assert set(hosts) == {'a.example'}
+    # 代表 URL が消えたら空にして、次の訪問で選び直す
+    assert hosts['a.example'][:4] == (None, None, 1, 0)
+    _record(manager, 'https://a.example/rest', ['2024-01-05 10:00:00'])
+    assert _hosts(manager)['a.example'][:4] == ('https://a.example/rest', 'Rest', 2, 2)
+
+
+def test_top_sites_orders_by_host_visits(history_manager):
+    manager = history_manager
+    _record(manager, 'https://few.example/', ['2024-01-01 10:00:00'], 'Few')
+    _record(manager, 'https://many.example/a', ['2024-01-01 10:00:00', '2024-01-02 10:00:00'], 'A')
+    _record(manager, 'https://many.example/b', ['2024-01-03 10:00:00'], 'B')
+    _record(manager, 'https://some.example/', ['2024-01-01 10:00:00', '2024-01-02 10:00:00'], 'Some')
+
+    assert manager.top_sites() == [
+        ('many.example', 'https://many.example/a', 'A'),
+        ('some.example', 'https://some.example/', 'Some'),
+        ('few.example', 'https://few.example/', 'Few'),
+    ]
+    assert [row[0] for row in manager.top_sites(limit=2)] == ['many.example', 'some.example']
+
+
+def test_top_sites_falls_back_to_host_root(history_manager):
+    manager = history_manager
+    _record(manager, 'https://a.example/best', ['2024-01-01 10:00:00', '2024-01-02 10:00:00'])
+    _record(manager, 'https://a.example/rest', ['2024-01-03 10:00:00'])
+    with manager._conn:
+        manager._conn.execute("DELETE FROM urls WHERE url = 'https://a.example/best'")
+
+    assert manager.top_sites() == [('a.example', 'https://a.example/', None)]
+
+
+def test_add_history_feeds_top_sites(history_manager):
+    manager = history_manager
+    manager.add_history('https://a.example/page', 'Page')
+    manager.add_history('https://a.example/page', 'Page')
+    manager.flush()
+
+    assert manager.top_sites() == [('a.example', 'https://a.example/page', 'Page')]
+    assert _hosts(manager)['a.example'][2] == 2
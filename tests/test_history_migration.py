@@ -0,0 +1,70 @@
+"""旧版 history.db（history テーブル 1 つ）から urls / visits への移行"""
+
+import managers
+from conftest import finish_history_migration, make_legacy_history_db
+
+LEGACY_ROWS = [
+    ('https://Example.com/a?utm_source=x', 'Alpha page', '2024-01-01 00:00:00', 3),
+    ('https://example.com/a#top', None, '2024-01-03 00:00:00', 2),
+    ('https://example.com/b', 'Beta page', '2024-01-02 00:00:00', 1),
+    ('https://example.org:443/', 'Org', '2024-01-04 00:00:00', 5),
+    ('about:blank', '', '2024-01-05 00:00:00', 1),
+]
+
+
+def _open(tmp_path, monkeypatch, chunk_rows=2):
+    path = tmp_path / 'history.db'
+    if not path.exists():
+        make_legacy_history_db(path, LEGACY_ROWS)
+    monkeypatch.setattr(managers, 'HISTORY_DB', path)
+    monkeypatch.setattr(managers.HistoryManager, '_MIGRATION_CHUNK_ROWS', chunk_rows)
+    return managers.HistoryManager()
+
+
+def _assert_migrated(manager):
+    conn = manager._conn
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert 'history' not in tables
+    urls = {url: (title, count, last) for url, title, count, last in conn.execute(
+        'SELECT url, title, visit_count, last_visit_time FROM urls')}
+    assert urls == {
+        'https://example.com/a': ('Alpha page', 5, '2024-01-03 00:00:00'),
+        'https://example.com/b': ('Beta page', 1, '2024-01-02 00:00:00'),
+        'https://example.org/': ('Org', 5, '2024-01-04 00:00:00'),
+        'about:blank': ('', 1, '2024-01-05 00:00:00'),
+    }
+    # 旧テーブルの 1 行が 1 訪問になる
+    assert conn.execute('SELECT COUNT(*) FROM visits').fetchone()[0] == len(LEGACY_ROWS)
+    assert conn.execute('SELECT COUNT(*) FROM urls WHERE frecency <= 0').fetchone()[0] == 0
+    hosts = dict(conn.execute('SELECT host, visit_count FROM hosts'))
+    assert hosts['example.com'] == 6
+    assert hosts['example.org'] == 5
+
+
+def test_legacy_history_is_migrated_in_chunks(tmp_path, monkeypatch):
+    manager = _open(tmp_path, monkeypatch)
+    assert manager._migrating
+    finish_history_migration(manager)
+    _assert_migrated(manager)
+    assert [row[0] for row in manager.search_history('beta')] == ['https://example.com/b']
+    manager.close()
+
+
+def test_interrupted_migration_continues_without_double_counting(tmp_path, monkeypatch):
+    manager = _open(tmp_path, monkeypatch)
+    manager._migration_timer.stop()
+    manager._run_migration_chunk()
+    manager._migration_timer.stop()
+    manager.close()
+
+    manager = _open(tmp_path, monkeypatch)
+    finish_history_migration(manager)
+    _assert_migrated(manager)
+    manager.close()
+
+    # 移行済みの DB を開き直しても何も変わらない
+    manager = _open(tmp_path, monkeypatch)
+    finish_history_migration(manager)
+    _assert_migrated(manager)
+    manager.close()
+
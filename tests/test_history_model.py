@@ -0,0 +1,70 @@
+"""HistoryTableModel（履歴タブのページ単位の読み込み）"""
+
+import pytest
+from PySide6.QtCore import Qt
+
+from models import HistoryTableModel
+
+
+@pytest.fixture
+def model(history_manager):
+    rows = [(f"https://site{i:03d}.example/", None if i % 50 == 0 else f"Title {i % 7}",
+             f"2024-01-01 00:{i // 60:02d}:{i % 60:02d}", i % 5 + 1) for i in range(450)]
+    with history_manager._conn:
+        history_manager._conn.executemany(
+            'INSERT INTO urls (url, title, last_visit_time, visit_count) VALUES (?, ?, ?, ?)', rows)
+    model = HistoryTableModel(history_manager)
+    model.refresh()
+    return model
+
+
+def _load_all(model):
+    pages = 1
+    while model.canFetchMore():
+        model.fetchMore()
+        pages += 1
+    return pages
+
+
+def _column(model, column):
+    return [model._rows[row][model.COLUMNS[column][2]] for row in range(model.rowCount())]
+
+
+def test_rows_are_fetched_in_pages(model):
+    assert model.rowCount() == model.PAGE_SIZE
+    assert _load_all(model) == 3
+    assert model.rowCount() == 450
+    times = _column(model, 2)
+    assert times == sorted(times, reverse=True)
+    assert len({row[0] for row in model._rows}) == 450
+    assert model.data(model.index(0, 1)) == "https://site449.example/"
+
+
+@pytest.mark.parametrize("column", [0, 1, 3])
+@pytest.mark.parametrize("order", [Qt.AscendingOrder, Qt.DescendingOrder])
+def test_sort_pages_with_keyset(model, column, order):
+    model.sort(column, order)
+    _load_all(model)
+    assert model.rowCount() == 450
+    assert len({row[0] for row in model._rows}) == 450
+    values = _column(model, column)
+    if column == 0:
+        values = [value or "" for value in values]
+    assert values == sorted(values, reverse=order == Qt.DescendingOrder)
+
+
+def test_filter_keeps_rows_until_worker_results_arrive(model, history_manager, monkeypatch):
+    requested = []
+    monkeypatch.setattr(history_manager, "request_history_page",
+                        lambda *args: requested.append(args) or 7)
+    model.set_filter("  site01 ")
+    assert requested[0][0] == "site01"
+    assert model.rowCount() == model.PAGE_SIZE
+    assert not model.canFetchMore()
+    rows = history_manager.fetch_history_page(query="site01")
+    # 古い世代の結果は捨てる
+    model._on_search_results("history_page", 6, [])
+    assert model.rowCount() == model.PAGE_SIZE
+    model._on_search_results("history_page", 7, rows)
+    assert [model.url_at(row) for row in range(model.rowCount())] == [row[1] for row in rows]
+    assert model.rowCount() == 10
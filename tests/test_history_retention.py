@@ -0,0 +1,90 @@
+"""履歴の保持ポリシー（期限切れの削除と集計の整合、旧版 DB の扱い）"""
+
+import sqlite3
+
+import managers
+from conftest import finish_history_migration, make_legacy_history_db
+
+
+def _visit(manager, url, days_ago, transition=managers.TRANSITION_LINK):
+    """days_ago 日前の訪問を 1 件記録する（writer と同じ集計の仕方で書き込む）"""
+    when = manager._conn.execute(
+        "SELECT datetime('now', ?)", (f'-{days_ago} days',)).fetchone()[0]
+    with manager._conn:
+        managers.HistoryWriter.write_batch(
+            manager._conn.cursor(), {url: [url, [(when, transition, None)]]})
+
+
+def _hosts(manager):
+    return {row[0]: row[1:] for row in manager._conn.execute(
+        'SELECT host, url, visit_count, best_visit_count FROM hosts')}
+
+
+def _expire_all(manager):
+    for _ in range(100):
+        with manager._conn:
+            if manager._expire_chunk(manager._conn.cursor()) is None:
+                return
+    raise AssertionError("retention did not converge")
+
+
+def test_expiring_old_visits_updates_counts_and_hosts(history_manager):
+    manager = history_manager
+    for days_ago in (40, 40, 40, 1):
+        _visit(manager, 'https://a.example/popular', days_ago, managers.TRANSITION_TYPED)
+    for days_ago in (2, 1):
+        _visit(manager, 'https://a.example/recent', days_ago)
+    assert _hosts(manager)['a.example'] == ('https://a.example/popular', 6, 4)
+
+    manager.max_age_days = 30
+    _expire_all(manager)
+
+    counts = dict(manager._conn.execute('SELECT url, visit_count FROM urls'))
+    assert counts == {'https://a.example/popular': 1, 'https://a.example/recent': 2}
+    typed = manager._conn.execute(
+        "SELECT typed_count FROM urls WHERE url = 'https://a.example/popular'").fetchone()[0]
+    assert typed == 1
+    # 訪問数の多い URL が入れ替わったので、代表 URL も変わる
+    assert _hosts(manager)['a.example'] == ('https://a.example/recent', 3, 2)
+    for url, frecency in manager._conn.execute('SELECT url, frecency FROM urls'):
+        expected = manager._conn.execute(
+            f'SELECT {managers._frecency_sql()} FROM urls WHERE url = ?', (url,)).fetchone()[0]
+        assert frecency == expected
+
+
+def test_expiring_whole_urls(history_manager):
+    manager = history_manager
+    _visit(manager, 'https://old.example/', 90)
+    _visit(manager, 'https://new.example/', 1)
+    manager.max_age_days = 30
+    _expire_all(manager)
+    assert [row[0] for row in manager._conn.execute('SELECT url FROM urls')] == ['https://new.example/']
+    assert set(_hosts(manager)) == {'new.example'}
+
+
+def test_legacy_db_keeps_auto_vacuum_mode_on_close(qt_app, tmp_path, monkeypatch):
+    path = tmp_path / 'history.db'
+    make_legacy_history_db(path, [
+        ('https://example.com/', 'Example', '2020-01-01 00:00:00', 3),
+        ('https://example.com/#top', 'Example', '2020-01-02 00:00:00', 1),
+        ('https://example.org/', 'Org', '2020-01-03 00:00:00', 1),
+    ])
+    monkeypatch.setattr(managers, 'HISTORY_DB', path)
+    manager = managers.HistoryManager()
+    assert manager._auto_vacuum == 0
+    finish_history_migration(manager)
+    counts = dict(manager._conn.execute('SELECT url, visit_count FROM urls'))
+    assert counts == {'https://example.com/': 4, 'https://example.org/': 1}
+    manager.set_retention_policy(max_age_days=30)
+    _expire_all(manager)
+    manager.close()
+
+    # 終了時に VACUUM で auto_vacuum を切り替えない
+    with sqlite3.connect(path) as conn:
+        assert conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 0
+        assert conn.execute('SELECT COUNT(*) FROM urls').fetchone()[0] == 0
+    conn.close()
+
+
+def test_new_db_uses_incremental_auto_vacuum(history_manager):
+    assert history_manager._auto_vacuum == 2
@@ -0,0 +1,80 @@
+"""履歴の全文検索（urls_fts と LIKE への切り替え）"""
+
+import sqlite3
+
+import managers
+
+
+def _insert(manager, rows):
+    """rows は (url, title, last_visit_time)"""
+    with manager._conn:
+        manager._conn.executemany(
+            'INSERT INTO urls (url, title, visit_count, last_visit_time) VALUES (?, ?, 1, ?)', rows)
+
+
+def _urls(rows):
+    return [row[0] for row in rows]
+
+
+def test_build_fts_query():
+    build = managers.HistoryManager._build_fts_query
+    assert build('foo bar') == '"foo"* AND "bar"*'
+    assert build('say "hi"') == '"say"* AND "hi"*'
+    assert build(' - ') is None
+
+
+def test_search_prefix_and_all_terms(history_manager):
+    assert history_manager._fts_enabled
+    _insert(history_manager, [
+        ('https://a.example/', 'Python tutorial', '2024-01-01 00:00:00'),
+        ('https://b.example/', 'Python news', '2024-01-02 00:00:00'),
+        ('https://c.example/', 'Rust tutorial', '2024-01-03 00:00:00'),
+    ])
+    assert set(_urls(history_manager.search_history('pyth'))) == {
+        'https://a.example/', 'https://b.example/'}
+    assert _urls(history_manager.search_history('python tut')) == ['https://a.example/']
+    assert history_manager.search_history('golang') == []
+
+
+def test_title_match_ranks_above_url_match(history_manager):
+    _insert(history_manager, [
+        ('https://widget.example/', 'Something else', '2024-01-02 00:00:00'),
+        ('https://other.example/', 'Widget catalogue', '2024-01-01 00:00:00'),
+    ])
+    assert _urls(history_manager.search_history('widget')) == [
+        'https://other.example/', 'https://widget.example/']
+
+
+def test_index_follows_title_updates_and_deletes(history_manager):
+    _insert(history_manager, [('https://a.example/', 'Old title', '2024-01-01 00:00:00')])
+    with history_manager._conn:
+        history_manager._conn.execute("UPDATE urls SET title = 'New title' WHERE url = 'https://a.example/'")
+    assert history_manager.search_history('old') == []
+    assert _urls(history_manager.search_history('new')) == ['https://a.example/']
+    with history_manager._conn:
+        history_manager._conn.execute("DELETE FROM urls")
+    assert history_manager.search_history('new') == []
+
+
+def test_non_ascii_falls_back_to_like(history_manager):
+    _insert(history_manager, [('https://jp.example/', '日本語のページ', '2024-01-01 00:00:00')])
+    # 空白で区切られない語の途中は FTS では一致しない
+    assert _urls(history_manager.search_history('本語')) == ['https://jp.example/']
+
+
+def test_existing_db_is_backfilled_once(qt_app, tmp_path, monkeypatch):
+    path = tmp_path / 'history.db'
+    monkeypatch.setattr(managers, 'HISTORY_DB', path)
+    manager = managers.HistoryManager()
+    manager.close()
+    # FTS を持たない版で書き込まれた行（トリガーを通らない）
+    with sqlite3.connect(path) as conn:
+        for trigger in ('urls_fts_ai', 'urls_fts_ad', 'urls_fts_au'):
+            conn.execute(f'DROP TRIGGER {trigger}')
+        conn.execute('DROP TABLE urls_fts')
+        conn.execute("DELETE FROM meta WHERE key = 'urls_fts_version'")
+        conn.execute("INSERT INTO urls (url, title, visit_count) VALUES ('https://x.example/', 'Backfill me', 1)")
+    conn.close()
+    manager = managers.HistoryManager()
+    assert _urls(manager.search_history('backfill')) == ['https://x.example/']
+    manager.close()
@@ -0,0 +1,63 @@
+"""URL バー補完（frecency 順、FTS の一致を frecency の高い順にたどって照合）"""
+
+import random
+
+import pytest
+
+import managers
+
+WORDS = ["kari", "kato", "nami", "soko", "mera", "doku", "ixel", "tora", "lupa", "gino"]
+
+
+@pytest.fixture
+def history(history_manager):
+    rng = random.Random(7)
+    rows = []
+    for i in range(600):
+        title = " ".join(rng.choice(WORDS).capitalize() for _ in range(3))
+        url = f"https://{rng.choice(WORDS)}{i}.example/{rng.choice(WORDS)}"
+        rows.append((url, title, rng.randint(0, 10_000)))
+    rows.append(("https://cafe.example/", "Café Crème", 5))
+    with history_manager._conn:
+        history_manager._conn.executemany(
+            'INSERT INTO urls (url, title, visit_count, last_visit_time, frecency) '
+            'VALUES (?, ?, 1, CURRENT_TIMESTAMP, ?)', rows)
+    return history_manager
+
+
+def _fts_reference(manager, query, limit=10):
+    """一致を FTS で全部集めて frecency で並べた結果（照合の正解）"""
+    return manager._conn.execute('''
+        SELECT url, title, frecency, 0 FROM urls
+        WHERE id IN (SELECT rowid FROM urls_fts WHERE urls_fts MATCH ?)
+        ORDER BY frecency DESC, id LIMIT ?
+    ''', (manager._build_fts_query(query), limit)).fetchall()
+
+
+def _scores(rows):
+    return [row[2] for row in rows]
+
+
+@pytest.mark.parametrize("query", [
+    "k", "ka", "kar", "kari", "example", "ka to", "k tora", "n lup", "ixel gino", "zz", "cre",
+])
+def test_suggest_matches_fts_ordered_by_frecency(history, query):
+    assert _scores(history.suggest(query)) == _scores(_fts_reference(history, query))
+
+
+@pytest.mark.parametrize("query", ["k", "ka to", "lupa", "n lup"])
+def test_suggest_falls_back_to_fts_when_probe_runs_out(history, monkeypatch, query):
+    monkeypatch.setattr(managers.HistoryManager, "_SUGGEST_PROBE_ROWS", 20)
+    assert _scores(history.suggest(query)) == _scores(_fts_reference(history, query))
+
+
+def test_suggest_probe_folds_diacritics_like_fts(history):
+    assert [row[0] for row in history.suggest("creme")] == ["https://cafe.example/"]
+
+
+def test_suggest_uses_like_for_non_ascii(history):
+    with history._conn:
+        history._conn.execute(
+            "INSERT INTO urls (url, title, visit_count, frecency) VALUES (?, ?, 1, 1)",
+            ("https://jp.example/", "日本語のページ"))
+    assert [row[0] for row in history.suggest("本語")] == ["https://jp.example/"]
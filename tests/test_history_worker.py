@@ -0,0 +1,65 @@
+"""HistorySearchWorker（検索・補完を専用スレッドの読み取り接続で実行する）"""
+
+import sqlite3
+
+import pytest
+
+from managers import HistoryManager, HistorySearchWorker
+
+
+@pytest.fixture
+def worker(history_manager):
+    worker = HistorySearchWorker(history_manager.db_path)
+    yield worker
+    for timer in worker._debounce_timers.values():
+        timer.stop()
+
+
+def _drain(worker):
+    """スレッドを起こさずに、待ち行列が空になるまで run() を回す"""
+    worker.request("stop", lambda conn: setattr(worker, "_stopping", True), (), debounce_ms=0)
+    worker.run()
+
+
+def test_newer_request_replaces_queued_one_of_same_kind(worker):
+    calls = []
+    first = worker.request("suggest", lambda conn, q: calls.append(q), ("a",), debounce_ms=0)
+    page = worker.request("history_page", lambda conn, q: calls.append(q), ("page",), debounce_ms=0)
+    second = worker.request("suggest", lambda conn, q: calls.append(q), ("ab",), debounce_ms=0)
+    assert first < page < second
+    assert worker.latest_generation("suggest") == second
+    _drain(worker)
+    assert calls == ["ab", "page"]
+
+
+def test_debounce_keeps_only_last_request(worker):
+    worker.request("suggest", HistoryManager._query_suggestions, ("a", 10, True), debounce_ms=50)
+    generation = worker.request("suggest", HistoryManager._query_suggestions, ("ab", 10, True),
+                                debounce_ms=50)
+    assert worker._debounce_timers["suggest"].isActive()
+    assert not worker._queue
+    job = worker._debounced.pop("suggest")
+    assert job[0] == generation and job[2][0] == "ab"
+
+
+def test_worker_uses_read_only_connection_and_survives_errors(worker, history_manager):
+    history_manager.add_history("https://example.com/", "Example")
+    history_manager.flush()
+    results = []
+
+    def failing(conn):
+        raise sqlite3.OperationalError("no such table: nothing")
+
+    def write(conn):
+        try:
+            conn.execute("DELETE FROM urls")
+        except sqlite3.OperationalError as e:
+            results.append(str(e))
+
+    worker.request("broken", failing, (), debounce_ms=0)
+    worker.request("write", write, (), debounce_ms=0)
+    worker.request("suggest", lambda conn: results.append(
+        HistoryManager._query_suggestions(conn, "exam", 10, True)), (), debounce_ms=0)
+    _drain(worker)
+    assert "readonly" in results[0]
+    assert [row[0] for row in results[1]] == ["https://example.com/"]
@@ -0,0 +1,80 @@
+"""HistoryWriter の遅延書き込みと、DB がロック中のときの試し直し"""
+
+import sqlite3
+
+from managers import HistoryWriter
+
+
+def _visit_counts(manager):
+    return dict(manager._conn.execute('SELECT url, visit_count FROM urls'))
+
+
+def _lock(manager):
+    """別の接続で書き込みロックを取る（解放するまで writer は SQLITE_BUSY になる）"""
+    other = sqlite3.connect(manager.db_path, isolation_level=None)
+    other.execute('BEGIN IMMEDIATE')
+    manager._conn.execute('PRAGMA busy_timeout=0')
+    return other
+
+
+def test_flush_writes_batch(history_manager):
+    writer = history_manager.writer
+    writer.enqueue('https://example.com/', 'Example')
+    writer.enqueue('https://example.com/', 'Example')
+    writer.enqueue('https://example.org/', 'Org')
+    writer.flush()
+    assert writer.queue_depth() == 0
+    assert _visit_counts(history_manager) == {'https://example.com/': 2, 'https://example.org/': 1}
+    assert writer.stats()['flushed_visits'] == 3
+
+
+def test_busy_flush_keeps_batch_and_retries(history_manager):
+    writer = history_manager.writer
+    other = _lock(history_manager)
+    writer.enqueue('https://example.com/', 'Old title')
+    writer.flush()
+    # 書けなかった訪問はキューに戻り、タイマーで試し直す
+    assert writer.queue_depth() == 1
+    assert writer._flush_timer.isActive()
+    writer.enqueue('https://example.com/', 'New title')
+    writer.enqueue('https://example.org/', 'Org')
+    assert list(writer._pending) == ['https://example.com/', 'https://example.org/']
+    assert writer._pending['https://example.com/'][0] == 'New title'
+    assert len(writer._pending['https://example.com/'][1]) == 2
+
+    other.execute('ROLLBACK')
+    other.close()
+    writer.flush()
+    assert writer.queue_depth() == 0
+    assert _visit_counts(history_manager) == {'https://example.com/': 2, 'https://example.org/': 1}
+    title = history_manager._conn.execute(
+        "SELECT title FROM urls WHERE url = 'https://example.com/'").fetchone()[0]
+    assert title == 'New title'
+
+
+def test_busy_flush_stops_retrying_after_cap(history_manager):
+    writer = history_manager.writer
+    other = _lock(history_manager)
+    writer.enqueue('https://example.com/', 'Example')
+    for _ in range(HistoryWriter.MAX_FLUSH_RETRIES):
+        writer.flush()
+        assert writer._flush_timer.isActive()
+    writer.flush()
+    # 自動の試し直しはやめるが、訪問は捨てない
+    assert not writer._flush_timer.isActive()
+    assert writer.queue_depth() == 1
+    other.execute('ROLLBACK')
+    other.close()
+    writer.flush()
+    assert _visit_counts(history_manager) == {'https://example.com/': 1}
+
+
+def test_non_transient_error_drops_batch(history_manager):
+    writer = history_manager.writer
+    history_manager._conn.execute('DROP TRIGGER hosts_urls_ad')
+    history_manager._conn.execute('DROP TABLE hosts')
+    writer.enqueue('https://example.com/', 'Example')
+    writer.flush()
+    assert writer.queue_depth() == 0
+    assert not writer._flush_timer.isActive()
+    assert _visit_counts(history_manager) == {}
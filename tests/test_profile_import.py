@@ -0,0 +1,217 @@
+"""Chromium / Firefox のプロファイルからの直接の取り込み（ブックマークと履歴）"""
+
+import json
+import sqlite3
+
+import pytest
+
+import managers
+from bookmarkio import (
+    BookmarkRecord, ChromiumBookmarkReader, FirefoxBookmarkReader, detect_bookmark_format,
+)
+
+# 2023-11-14 22:13:20 UTC
+STAMP = 1_700_000_000
+
+
+def _chromium_time(seconds):
+    return str((seconds + 11644473600) * 1_000_000)
+
+
+def _chromium_url(name, url, seconds=STAMP):
+    return {"type": "url", "name": name, "url": url, "date_added": _chromium_time(seconds)}
+
+
+def _chromium_folder(name, children):
+    return {"type": "folder", "name": name, "children": children}
+
+
+def make_chromium_bookmarks(path):
+    roots = {
+        "bookmark_bar": _chromium_folder("Bookmarks bar", [
+            _chromium_url("Top", "https://top.example/"),
+            _chromium_folder("Work", [
+                _chromium_url("", "https://untitled.example/"),
+                _chromium_folder("", [_chromium_url("Deep", "https://deep.example/")]),
+                _chromium_url("Bookmarklet", "javascript:void(0)"),
+            ]),
+        ]),
+        "other": _chromium_folder("Other bookmarks", [
+            {"type": "url", "name": "No date", "url": "https://nodate.example/"},
+        ]),
+        "synced": _chromium_folder("Mobile bookmarks", []),
+    }
+    path.write_text(json.dumps({"roots": roots, "version": 1}), encoding="utf-8-sig")
+
+
+def make_places_db(path, places, visits=(), bookmarks=()):
+    """
+    places は (id, url, title, hidden)、visits は (place_id, UNIX 秒, visit_type)、
+    bookmarks は (id, type, fk, parent, position, title, guid)
+    """
+    with sqlite3.connect(path) as conn:
+        conn.execute('CREATE TABLE moz_places (id INTEGER PRIMARY KEY, url TEXT, title TEXT, hidden INTEGER)')
+        conn.execute('''
+            CREATE TABLE moz_historyvisits (
+                id INTEGER PRIMARY KEY, place_id INTEGER, visit_date INTEGER, visit_type INTEGER)
+        ''')
+        conn.execute('''
+            CREATE TABLE moz_bookmarks (
+                id INTEGER PRIMARY KEY, type INTEGER, fk INTEGER, parent INTEGER,
+                position INTEGER, title TEXT, dateAdded INTEGER, guid TEXT)
+        ''')
+        conn.executemany('INSERT INTO moz_places VALUES (?, ?, ?, ?)', places)
+        conn.executemany(
+            'INSERT INTO moz_historyvisits (place_id, visit_date, visit_type) VALUES (?, ?, ?)',
+            [(place_id, seconds * 1_000_000, visit_type) for place_id, seconds, visit_type in visits])
+        conn.executemany(
+            'INSERT INTO moz_bookmarks VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            [row[:6] + (STAMP * 1_000_000, row[6]) for row in bookmarks])
+    conn.close()
+
+
+FIREFOX_PLACES = [
+    (1, 'https://top.example/', 'Top page', 0),
+    (2, 'https://menu.example/', 'Menu page', 0),
+    (3, 'place:sort=8', None, 0),
+    (4, 'https://tagged.example/', 'Tagged', 0),
+]
+
+FIREFOX_BOOKMARKS = [
+    (1, 2, None, 0, 0, '', 'root________'),
+    (2, 2, None, 1, 0, 'menu', 'menu________'),
+    (3, 2, None, 1, 1, 'toolbar', 'toolbar_____'),
+    (4, 2, None, 1, 2, 'tags', 'tags________'),
+    (5, 2, None, 1, 3, 'unfiled', 'unfiled_____'),
+    # ツールバー（ルート直下に取り込む）
+    (10, 1, 1, 3, 1, 'Top', 'a'),
+    (11, 2, None, 3, 0, 'Folder', 'b'),
+    (12, 1, 4, 11, 0, None, 'c'),
+    (13, 3, None, 11, 1, None, 'd'),  # 区切り線
+    # メニュー
+    (20, 1, 2, 2, 0, 'Menu', 'e'),
+    (21, 1, 3, 2, 1, 'Recent', 'f'),
+    # タグ「news」は取り込まない
+    (30, 2, None, 4, 0, 'news', 'g'),
+    (31, 1, 4, 30, 0, None, 'h'),
+]
+
+
+def test_detect_bookmark_format(tmp_path):
+    chromium = tmp_path / 'Bookmarks'
+    make_chromium_bookmarks(chromium)
+    places = tmp_path / 'places.sqlite'
+    make_places_db(places, [])
+    html = tmp_path / 'bookmarks.html'
+    html.write_text('<!DOCTYPE NETSCAPE-Bookmark-file-1>', encoding='utf-8')
+
+    assert detect_bookmark_format(chromium) == 'chromium'
+    assert detect_bookmark_format(places) == 'firefox'
+    assert detect_bookmark_format(html) == 'html'
+
+
+def test_chromium_reader_maps_roots_and_folders(tmp_path):
+    path = tmp_path / 'Bookmarks'
+    make_chromium_bookmarks(path)
+    reader = ChromiumBookmarkReader(path)
+
+    records = list(reader)
+
+    assert records == [
+        BookmarkRecord('Top', 'https://top.example/', (), STAMP, None),
+        BookmarkRecord('https://untitled.example/', 'https://untitled.example/', ('Work',), STAMP, None),
+        BookmarkRecord('Deep', 'https://deep.example/', ('Work', '無題のフォルダ'), STAMP, None),
+        BookmarkRecord('No date', 'https://nodate.example/', ('Other bookmarks',), None, None),
+    ]
+    # ブックマークレットも数には含める（進み具合の分母と揃える）
+    assert (reader.done, reader.total) == (5, 5)
+
+
+def test_firefox_reader_walks_roots_by_position(tmp_path):
+    path = tmp_path / 'places.sqlite'
+    make_places_db(path, FIREFOX_PLACES, bookmarks=FIREFOX_BOOKMARKS)
+    reader = FirefoxBookmarkReader(path)
+
+    records = list(reader)
+
+    assert [(r.title, r.url, r.folders) for r in records] == [
+        ('https://tagged.example/', 'https://tagged.example/', ('Folder',)),
+        ('Top', 'https://top.example/', ()),
+        ('Menu', 'https://menu.example/', ('Bookmarks Menu',)),
+    ]
+    assert records[0].add_date == STAMP
+    assert (reader.done, reader.total) == (4, 4)
+
+
+def test_import_file_dispatches_by_format(bookmark_manager, tmp_path):
+    chromium = tmp_path / 'Bookmarks'
+    make_chromium_bookmarks(chromium)
+    places = tmp_path / 'places.sqlite'
+    make_places_db(places, FIREFOX_PLACES, bookmarks=FIREFOX_BOOKMARKS)
+    calls = []
+
+    assert bookmark_manager.import_file(chromium, lambda done, total: calls.append((done, total)))
+    assert bookmark_manager.import_file(places)
+
+    assert calls[-1] == (5, 5)
+    urls = {url: folder for _id, _title, url, folder in bookmark_manager.get_bookmarks()}
+    assert urls['https://deep.example/'] == 'Work / 無題のフォルダ'
+    assert urls['https://menu.example/'] == 'Bookmarks Menu'
+    # 両方にある URL は同じフォルダ（ルート）なので 1 件
+    assert list(urls).count('https://top.example/') == 1
+    assert len(bookmark_manager.get_bookmarks()) == 6
+
+
+@pytest.fixture
+def places(tmp_path):
+    path = tmp_path / 'places.sqlite'
+    make_places_db(path, [
+        (1, 'https://a.example/?utm_source=feed', 'A', 0),
+        (2, 'https://b.example/', 'B', 0),
+        (3, 'https://hidden.example/', 'Hidden', 1),
+        (4, 'about:config', None, 0),
+    ], visits=[
+        (1, STAMP, 1),
+        (1, STAMP + 60, 2),      # 入力
+        (2, STAMP + 120, 9),     # 再読み込み
+        (2, STAMP + 180, 4),     # 埋め込み（取り込まない）
+        (3, STAMP, 1),
+        (4, STAMP, 1),
+    ])
+    return path
+
+
+def test_import_firefox_history(history_manager, places, monkeypatch):
+    monkeypatch.setattr(history_manager, '_IMPORT_BATCH_VISITS', 2)
+    calls = []
+
+    assert history_manager.import_firefox_history(places, lambda done, total: calls.append((done, total)))
+
+    assert calls == [(2, 3), (3, 3)]
+    conn = history_manager._conn
+    urls = {row[0]: row[1:] for row in conn.execute(
+        'SELECT url, title, visit_count, typed_count, last_visit_time FROM urls')}
+    assert urls == {
+        'https://a.example/': ('A', 2, 1, '2023-11-14 22:14:20'),
+        'https://b.example/': ('B', 1, 0, '2023-11-14 22:15:20'),
+    }
+    transitions = [row[0] for row in conn.execute('SELECT transition FROM visits ORDER BY visit_time')]
+    assert transitions == [managers.TRANSITION_LINK, managers.TRANSITION_TYPED, managers.TRANSITION_RELOAD]
+    assert conn.execute("SELECT visit_count FROM hosts WHERE host = 'a.example'").fetchone() == (2,)
+    assert all(row[0] > 0 for row in conn.execute('SELECT frecency FROM urls'))
+
+
+def test_import_firefox_history_twice_adds_nothing(history_manager, places):
+    assert history_manager.import_firefox_history(places)
+    before = history_manager._conn.execute('SELECT url, visit_count FROM urls ORDER BY url').fetchall()
+
+    assert history_manager.import_firefox_history(places)
+
+    assert history_manager._conn.execute('SELECT COUNT(*) FROM visits').fetchone() == (3,)
+    assert history_manager._conn.execute('SELECT url, visit_count FROM urls ORDER BY url').fetchall() == before
+
+
+def test_import_firefox_history_reports_bad_file(history_manager, tmp_path):
+    path = tmp_path / 'places.sqlite'
+    path.write_bytes(b'not a database')
+    assert not history_manager.import_firefox_history(path)
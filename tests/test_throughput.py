@@ -0,0 +1,58 @@
+"""throughput（ダウンロード速度と残り時間）"""
+
+import pytest
+
+from throughput import ThroughputSampler
+
+
+def test_rates_and_eta():
+    sampler = ThroughputSampler(capacity=4, sample_interval=0.25)
+    assert sampler.eta(1000) is None
+    for second, received in enumerate((0, 100, 200, 400)):
+        sampler.add(received, now=float(second))
+    assert sampler.instantaneous() == 200
+    assert sampler.smoothed() == pytest.approx(400 / 3)
+    assert sampler.average() == pytest.approx(400 / 3)
+    assert sampler.peak == 200
+    assert sampler.eta(1000) == pytest.approx(600 / (400 / 3))
+    assert sampler.eta(-1) is None
+
+
+def test_samples_closer_than_interval_are_skipped_unless_forced():
+    sampler = ThroughputSampler(sample_interval=1.0)
+    sampler.add(0, now=0.0)
+    sampler.add(50, now=0.5)
+    assert sampler.instantaneous() == 0.0
+    sampler.add(50, now=0.5, force=True)
+    assert sampler.instantaneous() == 100
+
+
+def test_ring_buffer_keeps_only_recent_window():
+    sampler = ThroughputSampler(capacity=3, sample_interval=0)
+    # 最初はゆっくり、後から速くなる
+    for second, received in enumerate((0, 10, 20, 1020, 2020)):
+        sampler.add(received, now=float(second))
+    assert sampler.smoothed() == 1000
+    assert sampler.average() == pytest.approx(2020 / 4)
+
+
+def test_paused_time_is_excluded_from_average():
+    sampler = ThroughputSampler(sample_interval=0)
+    sampler.add(0, now=0.0)
+    sampler.add(100, now=1.0)
+    sampler.pause()
+    assert sampler.smoothed() == 0.0
+    # 100 秒止めてから再開
+    sampler.add(100, now=101.0)
+    sampler.add(200, now=102.0)
+    assert sampler.average() == 100
+    assert sampler.smoothed() == 100
+
+
+def test_forced_sample_right_after_regular_one_does_not_inflate_peak():
+    sampler = ThroughputSampler(sample_interval=0.25)
+    sampler.add(0, now=0.0)
+    sampler.add(1000, now=1.0)
+    sampler.add(1500, now=1.001, force=True)
+    assert sampler.peak == 1000
+    assert sampler.average() == pytest.approx(1500 / 1.001)
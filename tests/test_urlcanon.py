@@ -0,0 +1,53 @@
+"""urlcanon（URL 正規化）"""
+
+import pytest
+
+from urlcanon import (
+    DEFAULT_TRACKING_PARAMS, canonicalize_host, canonicalize_url,
+    parse_tracking_params, set_tracking_params,
+)
+
+
+@pytest.fixture
+def tracking_params():
+    yield set_tracking_params
+    set_tracking_params(DEFAULT_TRACKING_PARAMS)
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("HTTPS://Example.COM", "https://example.com/"),
+    ("http://example.com:80/a", "http://example.com/a"),
+    ("https://example.com:443/a", "https://example.com/a"),
+    ("https://example.com:8443/a", "https://example.com:8443/a"),
+    ("https://example.com./a#section", "https://example.com/a"),
+    ("https://例え.jp/パス", "https://xn--r8jz45g.jp/パス"),
+    ("https://user:pw@Example.com/", "https://user:pw@example.com/"),
+    ("http://[::1]:8080/", "http://[::1]:8080/"),
+])
+def test_canonicalize_url(url, expected):
+    assert canonicalize_url(url) == expected
+
+
+def test_query_drops_tracking_and_sorts_keys():
+    url = "https://example.com/?b=2&utm_source=x&a=1&fbclid=y&a=0&UTM_Medium=z"
+    assert canonicalize_url(url) == "https://example.com/?a=1&a=0&b=2"
+    # 値のエンコードは変えない
+    assert canonicalize_url("https://example.com/?q=a%20b+c") == "https://example.com/?q=a%20b+c"
+
+
+@pytest.mark.parametrize("url", [
+    "", None, "about:blank", "file:///tmp/a.html", "vela://newtab", "https://example.com:99999/",
+])
+def test_other_urls_are_unchanged(url):
+    assert canonicalize_url(url) == url
+
+
+def test_canonicalize_host():
+    assert canonicalize_host(" WWW.Example.COM. ") == "www.example.com"
+    assert canonicalize_host("bücher.de") == "xn--bcher-kva.de"
+
+
+def test_custom_tracking_params(tracking_params):
+    tracking_params(parse_tracking_params("ref, sess_*  "))
+    url = "https://example.com/?ref=1&sess_id=2&utm_source=3"
+    assert canonicalize_url(url) == "https://example.com/?utm_source=3"
@@ -0,0 +1,81 @@
+"""urlindex（URL 前方一致インデックス）"""
+
+from urlindex import UrlPrefixIndex, join_url_key, normalize_prefix, split_url_key
+
+
+def test_split_and_join_url_key_round_trip():
+    for url in ("https://www.example.com/a", "http://example.com/", "file:///tmp/x"):
+        assert join_url_key(*split_url_key(url)) == url
+
+
+def test_normalize_prefix():
+    assert normalize_prefix("https://www.Example.com") == b"example.com"
+    assert normalize_prefix("www.github") == b"github"
+    assert normalize_prefix("Ünicode") == "Ünicode".encode("utf-8")
+    # スキームの入力途中は検索しない
+    assert normalize_prefix("http") is None
+    assert normalize_prefix("https:/") is None
+
+
+def test_lookup_orders_by_frecency_and_merges_delta():
+    index = UrlPrefixIndex.build([
+        ("https://example.com/", 10),
+        ("https://example.com/docs", 50),
+        ("https://other.org/", 99),
+    ])
+    index.touch("https://example.com/new", 20)
+    assert [url for url, _ in index.lookup("exa")] == [
+        "https://example.com/docs", "https://example.com/new", "https://example.com/"]
+    index.merge()
+    assert index.lookup("example.com/n") == [("https://example.com/new", 20)]
+    assert len(index) == 4
+
+
+def test_remove():
+    index = UrlPrefixIndex.build([("https://example.com/", 10), ("https://example.com/a", 5)])
+    index.touch("https://example.com/b", 1)
+    index.remove("https://example.com/")
+    index.remove("https://example.com/b")
+    assert index.lookup("example") == [("https://example.com/a", 5)]
+    index.touch("https://example.com/", 3)
+    assert index.lookup("example.com/")[-1] == ("https://example.com/", 3)
+
+
+def test_autofill_completes_host():
+    index = UrlPrefixIndex.build([("https://www.github.com/foo", 10)])
+    assert index.autofill("git") == "github.com/"
+    assert index.autofill("GitH") == "GitHub.com/"
+    assert index.autofill("github.com/") is None
+    assert index.autofill("nothing") is None
+
+
+def test_autofill_non_ascii_host():
+    index = UrlPrefixIndex.build([
+        ("https://bücher.example/", 10),
+        ("https://日本語.jp/page", 5),
+    ])
+    # 入力とホストの残りは同じ単位（文字）で連結する
+    assert index.autofill("bü") == "bücher.example/"
+    assert index.autofill("日本") == "日本語.jp/"
+    assert index.autofill("https://日") == "https://日本語.jp/"
+
+
+def test_autofill_ignores_surrounding_whitespace():
+    index = UrlPrefixIndex.build([("https://github.com/", 10)])
+    assert index.autofill("  git") == "github.com/"
+    assert index.autofill("git  ") == "github.com/"
+
+
+def test_lookup_ranks_whole_prefix_range_without_top_list():
+    rows = [(f"https://a.example/{i:03d}", i % 7) for i in range(200)]
+    rows += [("https://ab.example/", 100), ("https://b.example/", 1000)]
+    index = UrlPrefixIndex.build(rows)
+    # 上位リストに頼らず、前方一致範囲の frecency だけで選ばれることを確かめる
+    index._top = {}
+    index.remove("https://ab.example/")
+    index.touch("https://a.example/new", 6)
+    result = index.lookup("a", 3)
+    assert [score for _, score in result] == [6, 6, 6]
+    assert "https://b.example/" not in dict(index.lookup("a", 300))
+    assert "https://ab.example/" not in dict(index.lookup("a", 300))
+    assert dict(index.lookup("a.example/new")) == {"https://a.example/new": 6}
@@ -441,18 +441,18 @@ class ThemeEngine:
                 background-color: {c('accent_primary')};
             }}
 
-            QTableWidget, QTreeWidget {{
+            QTableWidget, QTreeView {{
                 border: 1px solid {c('border_default')};
                 alternate-background-color: {c('bg_surface_alt')};
                 gridline-color: {c('border_grid')};
                 background-color: {c('bg_surface')};
                 color: {c('text_primary')};
             }}
-            QTableWidget::item:selected, QTreeWidget::item:selected {{
+            QTableWidget::item:selected, QTreeView::item:selected {{
                 background-color: {c('accent_primary')};
                 color: {c('bg_surface')};
             }}
-            QTableWidget::item:hover, QTreeWidget::item:hover {{
+            QTableWidget::item:hover, QTreeView::item:hover {{
                 background-color: {c('accent_light')};
             }}
 
@@ -0,0 +1,105 @@
+"""
+VELA Browser - ダウンロード速度の計測
+ダウンロードごとに (時刻, 受信済みバイト数) の標本を固定長のリングバッファに持ち、
+瞬間速度・平滑化した速度・残り時間を計算する
+
+受信の通知は数 KB ごとに届くため、標本は SAMPLE_INTERVAL 秒以上あけて記録する。
+平滑化した速度はバッファ内の最古と最新の標本の差から求める（直近 数秒の平均）。
+バッファの外に出た標本は捨てるので、ダウンロードが長くてもメモリは一定。
+"""
+
+import time
+
+# 標本の数と間隔（CAPACITY × SAMPLE_INTERVAL 秒が平滑化の窓になる）
+CAPACITY = 32
+SAMPLE_INTERVAL = 0.25
+
+
+class ThroughputSampler:
+    """1 つのダウンロードの速度計測（速度はバイト/秒）"""
+
+    def __init__(self, capacity=CAPACITY, sample_interval=SAMPLE_INTERVAL):
+        self.capacity = capacity
+        self.sample_interval = sample_interval
+        self._times = [0.0] * capacity
+        self._bytes = [0] * capacity
+        self._head = 0    # 次に書き込む位置
+        self._count = 0
+        self._first = None  # 最初の標本 (時刻, バイト数)。平均速度に使う
+        self._paused_at = None
+        self.peak = 0.0
+
+    def add(self, received_bytes, now=None, force=False):
+        """
+        受信済みバイト数を記録する（前の標本から SAMPLE_INTERVAL 未満なら記録しない）。
+        force=True は間隔にかかわらず記録する（止まった・終わった時点の標本に使う）
+        """
+        if now is None:
+            now = time.monotonic()
+        if self._first is None:
+            self._first = (now, received_bytes)
+        elif self._paused_at is not None:
+            # 止まっていた時間は平均速度に含めない
+            first_time, first_bytes = self._first
+            self._first = (first_time + now - self._paused_at, first_bytes)
+            self._paused_at = None
+        elif now - self._times[self._head - 1] < self.sample_interval:
+            if not force:
+                return
+            # 直前の標本との間隔が短すぎて、その間の速度は当てにならない（最高速度に含めない）
+            self._append(now, received_bytes)
+            return
+        self._append(now, received_bytes)
+        self.peak = max(self.peak, self.instantaneous())
+
+    def _append(self, now, received_bytes):
+        self._times[self._head] = now
+        self._bytes[self._head] = received_bytes
+        self._head = (self._head + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def pause(self, now=None):
+        """一時停止した。窓を空にし、次の標本までの時間を平均速度から除く"""
+        if self._count == 0 or self._paused_at is not None:
+            return
+        self._paused_at = self._sample(0)[0] if now is None else now
+        self._count = 0
+
+    def _sample(self, age):
+        """age 個前の標本（0 が最新）"""
+        i = (self._head - 1 - age) % self.capacity
+        return self._times[i], self._bytes[i]
+
+    @staticmethod
+    def _rate(older, newer):
+        elapsed = newer[0] - older[0]
+        if elapsed <= 0:
+            return 0.0
+        return max(newer[1] - older[1], 0) / elapsed
+
+    def instantaneous(self):
+        """直近 2 つの標本の間の速度"""
+        if self._count < 2:
+            return 0.0
+        return self._rate(self._sample(1), self._sample(0))
+
+    def smoothed(self):
+        """バッファ内の最古と最新の標本の間の速度"""
+        if self._count < 2:
+            return 0.0
+        return self._rate(self._sample(self._count - 1), self._sample(0))
+
+    def average(self):
+        """最初の標本から最新の標本までの平均速度"""
+        if self._count == 0 or self._first is None:
+            return 0.0
+        return self._rate(self._first, self._sample(0))
+
+    def eta(self, total_bytes):
+        """残り時間（秒）。全体のサイズが不明か、まだ速度が出ていなければ None"""
+        if self._count < 2 or total_bytes <= 0:
+            return None
+        rate = self.smoothed()
+        if rate <= 0:
+            return None
+        return max(total_bytes - self._sample(0)[1], 0) / rate
@@ -0,0 +1,117 @@
+"""
+VELA Browser - URL 正規化
+履歴・ブックマークへ書き込む前に URL を正規形にそろえる
+
+正規形（http / https のみ。その他のスキームはそのまま返す）:
+  - スキームとホストを小文字にし、IDN は punycode（xn--）にする
+  - 既定のポート（http:80, https:443）と末尾の "." を除く
+  - フラグメント（#...）を除く
+  - トラッキング用のクエリパラメータ（utm_* など）を除き、残りをキー順に並べる
+    （値のエンコードには手を加えない）
+  - 空のパスは "/" にする
+
+同じ URL が何度も書き込まれるため、結果は LRU キャッシュに載せる。
+"""
+
+from functools import lru_cache
+from urllib.parse import urlsplit, urlunsplit, unquote_plus
+
+# 正規化の規則を変えたら上げる（HistoryManager が既存の行を正規化し直す）
+CANONICAL_VERSION = "1"
+
+CACHE_SIZE = 4096
+
+# 除去するクエリパラメータの既定値。末尾が "*" のものは前方一致
+DEFAULT_TRACKING_PARAMS = (
+    "utm_*", "fbclid", "gclid", "dclid", "gbraid", "wbraid", "msclkid",
+    "yclid", "mc_cid", "mc_eid", "_ga", "_gl", "igshid", "ref_src",
+)
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+_tracking_names = frozenset()
+_tracking_prefixes = ()
+
+
+def set_tracking_params(params):
+    """除去するクエリパラメータ名を設定する（末尾 "*" は前方一致）"""
+    global _tracking_names, _tracking_prefixes
+    names, prefixes = set(), []
+    for param in params:
+        param = param.strip().lower()
+        if not param:
+            continue
+        if param.endswith("*"):
+            if param[:-1]:
+                prefixes.append(param[:-1])
+        else:
+            names.add(param)
+    _tracking_names = frozenset(names)
+    _tracking_prefixes = tuple(prefixes)
+    _canonicalize.cache_clear()
+
+
+def parse_tracking_params(text):
+    """設定値（カンマ・空白区切り）をパラメータ名のリストにする"""
+    return [param for param in text.replace(",", " ").split() if param]
+
+
+def canonicalize_host(host):
+    """ホスト名を小文字・punycode にする（変換できない IDN は小文字のまま）"""
+    host = host.strip().lower().rstrip(".")
+    if host.isascii():
+        return host
+    try:
+        return host.encode("idna").decode("ascii")
+    except UnicodeError:
+        return host
+
+
+def canonicalize_url(url):
+    """URL を正規形にする。http(s) 以外と解釈できない URL はそのまま返す"""
+    if not url:
+        return url
+    return _canonicalize(url)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _canonicalize(url):
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    if scheme not in _DEFAULT_PORTS or not parts.hostname:
+        return url
+
+    host = canonicalize_host(parts.hostname)
+    netloc = f"[{host}]" if ":" in host else host
+    if port is not None and port != _DEFAULT_PORTS[scheme]:
+        netloc += f":{port}"
+    userinfo, at, _hostport = parts.netloc.rpartition("@")
+    if at:
+        netloc = f"{userinfo}@{netloc}"
+    return urlunsplit((scheme, netloc, parts.path or "/", _clean_query(parts.query), ""))
+
+
+def _is_tracking(name):
+    return name in _tracking_names or (bool(_tracking_prefixes) and name.startswith(_tracking_prefixes))
+
+
+def _clean_query(query):
+    """トラッキング用パラメータを除き、残りをキー順に並べる（同じキーの順序は保つ）"""
+    if not query:
+        return ""
+    kept = []
+    for pair in query.split("&"):
+        if not pair:
+            continue
+        key = pair.split("=", 1)[0]
+        if not _is_tracking(unquote_plus(key).lower()):
+            kept.append((key, pair))
+    kept.sort(key=lambda item: item[0])
+    return "&".join(pair for _key, pair in kept)
+
+
+set_tracking_params(DEFAULT_TRACKING_PARAMS)
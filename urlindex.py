@@ -0,0 +1,331 @@
+"""
+VELA Browser - URL 前方一致インデックス
+URLバー補完用のメモリ内インデックス（ホスト・パスの前方一致、インライン補完）
+
+キーは URL から "http(s)://" と "www." を除いた host + path で、
+ASCII 小文字化したバイト列の順に整列して二分探索する。
+スキームと www. の有無は 1 バイトのフラグに分けて持つ。
+
+メモリ予算:
+  本体は全キーを連結した 1 本の bytes と、オフセット (4B)・frecency (4B)・
+  フラグ (1B) の array だけで持つため、1 件あたり「キー長 + 約 9 バイト」。
+  平均キー長 50 バイトなら 50 万件で約 30 MB に収まる。
+  起動後に追加された URL は小さな差分リストに入り、一定数を超えたら本体に併合する。
+  削除された URL は frecency を -1 にして読み飛ばし、本体の一定割合を超えたら
+  作り直して取り除く。
+"""
+
+import heapq
+from array import array
+from bisect import bisect_left, insort
+
+# キー外に持つ情報のフラグ
+_FLAG_HTTPS = 1
+_FLAG_WWW = 2
+_FLAG_RAW = 4  # http(s) 以外のスキーム。キーに URL 全体をそのまま持つ
+
+_SCHEMES = (("https://", _FLAG_HTTPS), ("http://", 0))
+
+
+def split_url_key(url):
+    """URL を (キー, フラグ) に分解する"""
+    head = url[:12].lower()
+    for scheme, flag in _SCHEMES:
+        if head.startswith(scheme):
+            rest = url[len(scheme):]
+            if head[len(scheme):len(scheme) + 4] == "www.":
+                return rest[4:], flag | _FLAG_WWW
+            return rest, flag
+    return url, _FLAG_RAW
+
+
+def join_url_key(key, flags):
+    """split_url_key の逆変換"""
+    if flags & _FLAG_RAW:
+        return key
+    scheme = "https://" if flags & _FLAG_HTTPS else "http://"
+    return scheme + ("www." if flags & _FLAG_WWW else "") + key
+
+
+def prefix_end(prefix):
+    """prefix で始まるどのバイト列よりも大きい最小のバイト列（無ければ None）"""
+    stripped = prefix.rstrip(b"\xff")
+    if not stripped:
+        return None
+    return stripped[:-1] + bytes([stripped[-1] + 1])
+
+
+def normalize_prefix(text):
+    """
+    入力文字列を検索用の小文字キー（bytes）に変換する。
+    スキームを途中まで入力している段階（"http", "https:/" など）は None を返す。
+    """
+    text = text.strip()
+    lower = text.lower()
+    if len(lower) >= 4 and any(s.startswith(lower) for s, _ in _SCHEMES):
+        return None
+    key, flags = split_url_key(text)
+    if flags & _FLAG_RAW and "://" not in key:
+        # スキームなしの入力（"github.com/..." など）は先頭の www. だけ除く
+        if lower.startswith("www."):
+            key = key[4:]
+    return key.encode("utf-8").lower()
+
+
+class UrlPrefixIndex:
+    """
+    URL の前方一致インデックス。
+    lookup() は前方一致する URL を frecency 順に返し、
+    autofill() はインライン補完用のホスト名を返す。
+    """
+
+    # 1 回の lookup で frecency を比べる前方一致範囲の上限（p99 < 1ms を保つため）
+    SCAN_LIMIT = 256
+    # 短い入力でも人気サイトを拾うため、frecency 上位をこの件数だけ別に持つ
+    TOP_SIZE = 1024
+    # 差分リストがこの件数を超えたら本体に併合する
+    MERGE_THRESHOLD = 20000
+    # 削除済み（frecency = -1）の行が本体のこの割合を超えたら作り直す
+    COMPACT_RATIO = 0.25
+
+    def __init__(self):
+        self._blob = b""
+        self._offsets = array('I', [0])
+        self._frecency = array('i')
+        self._flags = array('B')
+        self._removed = 0
+        # 差分: (小文字キー, キー, フラグ) の整列リストと (キー, フラグ) -> frecency
+        self._delta_keys = []
+        self._delta_frecency = {}
+        # frecency 上位: url -> (小文字キー, frecency)
+        self._top = {}
+
+    # ------------------------------------------------------------------
+    # 構築
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def build(cls, rows):
+        """(url, frecency) の反復から構築する"""
+        entries = []
+        for url, frecency in rows:
+            key, flags = split_url_key(url)
+            key_bytes = key.encode("utf-8")
+            entries.append((key_bytes.lower(), key_bytes, flags, frecency or 0))
+        entries.sort()
+        index = cls()
+        index._load_sorted(entries)
+        return index
+
+    def _load_sorted(self, entries):
+        """整列済みの (小文字キー, キー, フラグ, frecency) から本体を作り直す"""
+        offsets = array('I', [0])
+        frecency = array('i')
+        flags = array('B')
+        chunks = []
+        pos = 0
+        for _lower, key_bytes, flag, score in entries:
+            chunks.append(key_bytes)
+            pos += len(key_bytes)
+            offsets.append(pos)
+            frecency.append(score)
+            flags.append(flag)
+        self._blob = b"".join(chunks)
+        self._offsets = offsets
+        self._frecency = frecency
+        self._flags = flags
+        self._removed = 0
+        self._delta_keys = []
+        self._delta_frecency = {}
+        self._rebuild_top()
+
+    def _iter_entries(self):
+        """本体と差分を整列順に (小文字キー, キー, フラグ, frecency) で列挙する"""
+        blob, offsets = self._blob, self._offsets
+
+        def base():
+            for i in range(len(self._frecency)):
+                if self._frecency[i] < 0:
+                    continue
+                key_bytes = blob[offsets[i]:offsets[i + 1]]
+                yield key_bytes.lower(), key_bytes, self._flags[i], self._frecency[i]
+
+        def delta():
+            for lower, key_bytes, flag in self._delta_keys:
+                yield lower, key_bytes, flag, self._delta_frecency[(key_bytes, flag)]
+
+        return heapq.merge(base(), delta())
+
+    def merge(self):
+        """差分リストを本体に併合する（削除済みの行もここで取り除く）"""
+        if self._delta_keys or self._removed:
+            self._load_sorted(list(self._iter_entries()))
+
+    def _rebuild_top(self):
+        best = heapq.nlargest(
+            self.TOP_SIZE, self._iter_entries(), key=lambda entry: entry[3])
+        self._top = {
+            join_url_key(key_bytes.decode("utf-8", "replace"), flag): (lower, score)
+            for lower, key_bytes, flag, score in best
+        }
+
+    # ------------------------------------------------------------------
+    # 更新
+    # ------------------------------------------------------------------
+
+    def _find_base(self, lower, key_bytes, flag):
+        """本体内の完全一致位置を返す（無ければ -1）"""
+        i = self._bisect(lower)
+        blob, offsets, n = self._blob, self._offsets, len(self._frecency)
+        while i < n:
+            candidate = blob[offsets[i]:offsets[i + 1]]
+            if candidate.lower() != lower:
+                break
+            if candidate == key_bytes and self._flags[i] == flag:
+                return i
+            i += 1
+        return -1
+
+    def touch(self, url, points):
+        """訪問を反映する（既存なら frecency を加算、無ければ追加）"""
+        key, flag = split_url_key(url)
+        key_bytes = key.encode("utf-8")
+        lower = key_bytes.lower()
+        i = self._find_base(lower, key_bytes, flag)
+        if i >= 0:
+            if self._frecency[i] < 0:
+                self._frecency[i] = 0
+                self._removed -= 1
+            self._frecency[i] += points
+            score = self._frecency[i]
+        elif (key_bytes, flag) in self._delta_frecency:
+            self._delta_frecency[(key_bytes, flag)] += points
+            score = self._delta_frecency[(key_bytes, flag)]
+        else:
+            insort(self._delta_keys, (lower, key_bytes, flag))
+            self._delta_frecency[(key_bytes, flag)] = points
+            score = points
+        self._update_top(url, lower, score)
+        if len(self._delta_keys) > self.MERGE_THRESHOLD:
+            self.merge()
+
+    def remove(self, url):
+        """URL を候補から外す（履歴の期限切れ・削除時）"""
+        key, flag = split_url_key(url)
+        key_bytes = key.encode("utf-8")
+        lower = key_bytes.lower()
+        i = self._find_base(lower, key_bytes, flag)
+        if i >= 0:
+            if self._frecency[i] >= 0:
+                self._frecency[i] = -1
+                self._removed += 1
+        elif (key_bytes, flag) in self._delta_frecency:
+            del self._delta_frecency[(key_bytes, flag)]
+            self._delta_keys.remove((lower, key_bytes, flag))
+        self._top.pop(url, None)
+        if self._removed > len(self._frecency) * self.COMPACT_RATIO:
+            self.merge()
+
+    def _update_top(self, url, lower, score):
+        if url in self._top or len(self._top) < self.TOP_SIZE:
+            self._top[url] = (lower, score)
+            return
+        if score <= min(s for _, s in self._top.values()):
+            return
+        self._top[url] = (lower, score)
+        if len(self._top) > self.TOP_SIZE * 2:
+            kept = heapq.nlargest(self.TOP_SIZE, self._top.items(), key=lambda kv: kv[1][1])
+            self._top = dict(kept)
+
+    # ------------------------------------------------------------------
+    # 検索
+    # ------------------------------------------------------------------
+
+    def _bisect(self, lower, lo=0):
+        """本体で小文字キーが lower 以上になる最初の位置（lo 以降を探す）"""
+        blob, offsets = self._blob, self._offsets
+        hi = len(self._frecency)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if blob[offsets[mid]:offsets[mid + 1]].lower() < lower:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def lookup(self, text, limit=10):
+        """
+        前方一致する URL を frecency 降順で [(url, frecency), ...] として返す。
+        前方一致範囲は二分探索で両端を求め、frecency の配列だけで上位を選んでから
+        その limit 件だけをデコードする（範囲内の行の URL は組み立てない）。
+        """
+        prefix = normalize_prefix(text)
+        if not prefix:
+            return []
+        end_key = prefix_end(prefix)
+
+        found = {}
+        # frecency 上位からの候補（範囲が広い短い入力でも人気サイトを落とさない）
+        for url, (lower, score) in self._top.items():
+            if lower.startswith(prefix):
+                found[url] = score
+
+        # 本体の前方一致範囲 [i, end) の先頭 SCAN_LIMIT 行（削除済みの行は frecency が負）
+        frecency = self._frecency
+        i = self._bisect(prefix)
+        end = len(frecency) if end_key is None else self._bisect(end_key, i)
+        rows = [r for r in range(i, min(end, i + self.SCAN_LIMIT)) if frecency[r] >= 0]
+        blob, offsets, flags = self._blob, self._offsets, self._flags
+        for r in heapq.nlargest(limit, rows, key=frecency.__getitem__):
+            key_bytes = blob[offsets[r]:offsets[r + 1]]
+            found[join_url_key(key_bytes.decode("utf-8", "replace"), flags[r])] = frecency[r]
+
+        # 差分の前方一致範囲
+        delta_keys, delta_frecency = self._delta_keys, self._delta_frecency
+        j = bisect_left(delta_keys, (prefix,))
+        delta_end = len(delta_keys) if end_key is None else bisect_left(delta_keys, (end_key,), j)
+        entries = delta_keys[j:min(delta_end, j + self.SCAN_LIMIT)]
+        best = heapq.nlargest(limit, entries, key=lambda entry: delta_frecency[entry[1:]])
+        for _lower, key_bytes, flag in best:
+            found[join_url_key(key_bytes.decode("utf-8", "replace"), flag)] = \
+                delta_frecency[(key_bytes, flag)]
+
+        return heapq.nlargest(limit, found.items(), key=lambda kv: kv[1])
+
+    def autofill(self, text):
+        """
+        インライン補完の文字列を返す。
+        入力がホスト名の途中（"/" を含まない）のとき、frecency 最上位で
+        ホストが前方一致する URL のホスト名まで補完する。無ければ None。
+        """
+        # 照合と補完後の文字列に同じ入力を使う（前後の空白は含めない）
+        text = text.strip()
+        prefix = normalize_prefix(text)
+        if not prefix or b"/" in prefix:
+            return None
+        for url, _score in self.lookup(text, limit=16):
+            key, _flags = split_url_key(url)
+            host = key.split("/", 1)[0].encode("utf-8")
+            # prefix は UTF-8 のバイト列なので、残りもバイト単位で切り出してから戻す
+            # （bytes.lower() は ASCII しか変えないため、一致した位置は文字の境界になる）
+            if host.lower().startswith(prefix):
+                return text + host[len(prefix):].decode("utf-8") + "/"
+        return None
+
+    # ------------------------------------------------------------------
+    # 統計
+    # ------------------------------------------------------------------
+
+    def __len__(self):
+        return len(self._frecency) - self._removed + len(self._delta_keys)
+
+    def memory_bytes(self):
+        """インデックス本体の概算メモリ使用量（バイト）"""
+        base = (len(self._blob)
+                + self._offsets.itemsize * len(self._offsets)
+                + self._frecency.itemsize * len(self._frecency)
+                + self._flags.itemsize * len(self._flags))
+        # 差分・上位リストは 1 件あたりタプル・辞書エントリ込みで概算する
+        extra = sum(64 + 2 * len(k) for _, k, _ in self._delta_keys) * 2
+        extra += sum(120 + len(url) for url in self._top)
+        return base + extra